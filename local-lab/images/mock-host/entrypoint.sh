@@ -19,4 +19,16 @@ fi
 
 touch /var/mock/kamcmd.log
 
+# PBX roles expose a mock FreeSWITCH event socket for event-driven drain checks
+# and a mock SIP endpoint for the readiness gate's OPTIONS/INVITE probe.
+if [[ "${ROLE:-mock}" == *pbx* ]]; then
+  /usr/local/bin/mock_esl_server 127.0.0.1 8021 >/var/mock/esl.log 2>&1 &
+  /usr/local/bin/mock_sip_responder 0.0.0.0 5060 >/var/mock/sip.log 2>&1 &
+fi
+
+# The Kamailio role exposes a mock ctl (BINRPC) socket for --ctl-socket reloads.
+if [[ "${ROLE:-mock}" == "kamailio" ]]; then
+  /usr/local/bin/mock_kamailio_ctl /run/kamailio/kamailio_ctl >/var/mock/ctl.log 2>&1 &
+fi
+
 exec /usr/sbin/sshd -D -e
@@ -4,6 +4,7 @@ set -euo pipefail
 ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
 LAB_DIR="${ROOT_DIR}/local-lab/real-services"
 SIM_SCRIPT="${LAB_DIR}/run_call_cutover_sim.sh"
+COLLECTOR="${ROOT_DIR}/tooling/scripts/sip_log_collector.py"
 
 DASH_INTERVAL_SECONDS="${DASH_INTERVAL_SECONDS:-1}"
 DASH_NO_CLEAR="${DASH_NO_CLEAR:-0}"
@@ -12,6 +13,10 @@ CSV_FILE="${ART_DIR}/live-metrics.csv"
 SIM_LOG_FILE="${ART_DIR}/simulation.stdout.log"
 PHASE_FILE="${ART_DIR}/current_phase.txt"
 STATUS_FILE="${ART_DIR}/status.txt"
+MODE_FILE="${ART_DIR}/dispatcher_mode.txt"
+OLD_STATE="${ART_DIR}/uas-old.messages.state"
+NEW_STATE="${ART_DIR}/uas-new.messages.state"
+LAB_PREFIX="${LAB_PREFIX:-real}"
 
 DOCKER_PATH="PATH=/tmp/fakebin:/opt/homebrew/bin:/usr/bin:/bin:/usr/sbin:/sbin"
 
@@ -47,34 +52,57 @@ safe_int() {
   fi
 }
 
-count_invites() {
+# One sip_log_collector.py per UAS follows its message log from the last
+# consumed offset and keeps INVITE/response counts in a small state file, so a
+# tick reads two local files instead of re-grepping the full logs in the
+# containers. It starts before the stack and retries until the log exists.
+COLLECTOR_PIDS=()
+
+start_collector() {
   local container="$1"
   local logfile="$2"
-  local n
-  n="$(env ${DOCKER_PATH} docker exec "$container" /bin/sh -c "grep -c '^INVITE ' '$logfile' 2>/dev/null || true" 2>/dev/null || true)"
-  safe_int "$n"
+  local state="$3"
+  env ${DOCKER_PATH} python3 "$COLLECTOR" --docker "$container" --log "$logfile" --state "$state" \
+    > /dev/null 2>&1 &
+  COLLECTOR_PIDS+=("$!")
+}
+
+stop_collectors() {
+  local pid
+  for pid in "${COLLECTOR_PIDS[@]}"; do
+    kill "$pid" 2>/dev/null || true
+  done
+  for pid in "${COLLECTOR_PIDS[@]}"; do
+    wait "$pid" 2>/dev/null || true
+  done
+  COLLECTOR_PIDS=()
 }
 
-infer_dispatcher_mode() {
-  env ${DOCKER_PATH} docker exec real-kamailio /bin/sh -c '
-    if [ ! -f /etc/kamailio/dispatcher.list ]; then
-      echo unknown
-      exit 0
-    fi
-    old=0
-    new=0
-    grep -q "sipp-uas-old:5060" /etc/kamailio/dispatcher.list && old=1
-    grep -q "sipp-uas-new:5060" /etc/kamailio/dispatcher.list && new=1
-    if [ "$old" -eq 1 ] && [ "$new" -eq 1 ]; then
-      echo both
-    elif [ "$old" -eq 1 ]; then
-      echo old
-    elif [ "$new" -eq 1 ]; then
-      echo new
-    else
-      echo empty
-    fi
-  ' 2>/dev/null || echo n/a
+trap stop_collectors EXIT
+
+# read_counts STATE prints "<invites> <failed responses (4xx-6xx)>".
+read_counts() {
+  local state="$1"
+  local key value invites=0 failed=0
+  if [[ -f "$state" ]]; then
+    while IFS='=' read -r key value; do
+      case "$key" in
+        invites) invites="$(safe_int "$value")" ;;
+        responses_4xx|responses_5xx|responses_6xx) failed=$((failed + $(safe_int "$value"))) ;;
+      esac
+    done < "$state"
+  fi
+  echo "$invites $failed"
+}
+
+# The simulation writes dispatcher_mode.txt whenever a profile is applied and
+# verified, so the dashboard never execs into Kamailio to infer it.
+read_dispatcher_mode() {
+  local mode=""
+  if [[ -f "$MODE_FILE" ]]; then
+    mode="$(<"$MODE_FILE")"
+  fi
+  echo "${mode:-unknown}"
 }
 
 bar() {
@@ -109,6 +137,8 @@ render() {
   local new_total="$5"
   local old_delta="$6"
   local new_delta="$7"
+  local old_failed="$8"
+  local new_failed="$9"
   local ts
   ts="$(date '+%Y-%m-%d %H:%M:%S')"
 
@@ -127,12 +157,16 @@ render() {
   printf 'OLD: %6s | %-40s\n' "$old_total" "$(bar "$old_total")"
   printf 'NEW: %6s | %-40s\n\n' "$new_total" "$(bar "$new_total")"
 
-  printf 'Delta (last %ss): OLD +%s | NEW +%s\n\n' "$DASH_INTERVAL_SECONDS" "$old_delta" "$new_delta"
+  printf 'Delta (last %ss): OLD +%s | NEW +%s\n' "$DASH_INTERVAL_SECONDS" "$old_delta" "$new_delta"
+  printf 'Failed responses (4xx-6xx): OLD %s | NEW %s\n\n' "$old_failed" "$new_failed"
   printf 'Simulation Log: %s\n' "$SIM_LOG_FILE"
   printf 'Timeline CSV:   %s\n' "$CSV_FILE"
 }
 
-echo 'timestamp,phase,status,dispatcher_mode,old_total,new_total,old_delta,new_delta' > "$CSV_FILE"
+echo 'timestamp,phase,status,dispatcher_mode,old_total,new_total,old_delta,new_delta,old_failed,new_failed' > "$CSV_FILE"
+
+start_collector "${LAB_PREFIX}-sipp-uas-old" /tmp/old_messages.log "$OLD_STATE"
+start_collector "${LAB_PREFIX}-sipp-uas-new" /tmp/new_messages.log "$NEW_STATE"
 
 ART_DIR_OVERRIDE="$ART_DIR" "$SIM_SCRIPT" > "$SIM_LOG_FILE" 2>&1 &
 SIM_PID=$!
@@ -144,15 +178,15 @@ while kill -0 "$SIM_PID" 2>/dev/null; do
   phase="$(cat "$PHASE_FILE" 2>/dev/null || echo starting)"
   status="$(cat "$STATUS_FILE" 2>/dev/null || echo running)"
 
-  old_total="$(count_invites real-sipp-uas-old /tmp/old_messages.log)"
-  new_total="$(count_invites real-sipp-uas-new /tmp/new_messages.log)"
-  dispatcher_mode="$(infer_dispatcher_mode)"
+  read -r old_total old_failed < <(read_counts "$OLD_STATE")
+  read -r new_total new_failed < <(read_counts "$NEW_STATE")
+  dispatcher_mode="$(read_dispatcher_mode)"
 
   old_delta=$((old_total - prev_old))
   new_delta=$((new_total - prev_new))
 
-  render "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta"
-  printf '%s,%s,%s,%s,%s,%s,%s,%s\n' "$(date -u +'%Y-%m-%dT%H:%M:%SZ')" "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" >> "$CSV_FILE"
+  render "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" "$old_failed" "$new_failed"
+  printf '%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n' "$(date -u +'%Y-%m-%dT%H:%M:%SZ')" "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" "$old_failed" "$new_failed" >> "$CSV_FILE"
 
   prev_old="$old_total"
   prev_new="$new_total"
@@ -167,14 +201,18 @@ set -e
 
 phase="$(cat "$PHASE_FILE" 2>/dev/null || echo done)"
 status="$(cat "$STATUS_FILE" 2>/dev/null || echo finished)"
-old_total="$(count_invites real-sipp-uas-old /tmp/old_messages.log)"
-new_total="$(count_invites real-sipp-uas-new /tmp/new_messages.log)"
-dispatcher_mode="$(infer_dispatcher_mode)"
+# Give the collectors one flush interval to drain the tail streams, then stop
+# them; they write their final counts on exit.
+sleep 1
+stop_collectors
+read -r old_total old_failed < <(read_counts "$OLD_STATE")
+read -r new_total new_failed < <(read_counts "$NEW_STATE")
+dispatcher_mode="$(read_dispatcher_mode)"
 
 old_delta=$((old_total - prev_old))
 new_delta=$((new_total - prev_new))
-render "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta"
-printf '%s,%s,%s,%s,%s,%s,%s,%s\n' "$(date -u +'%Y-%m-%dT%H:%M:%SZ')" "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" >> "$CSV_FILE"
+render "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" "$old_failed" "$new_failed"
+printf '%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n' "$(date -u +'%Y-%m-%dT%H:%M:%SZ')" "$phase" "$status" "$dispatcher_mode" "$old_total" "$new_total" "$old_delta" "$new_delta" "$old_failed" "$new_failed" >> "$CSV_FILE"
 
 if (( SIM_RC != 0 )); then
   echo
@@ -10,17 +10,64 @@ ART_DIR="${ART_DIR_OVERRIDE:-${LAB_DIR}/artifacts/call-cutover-$(date +%Y%m%d_%H
 PHASE_FILE=""
 STATUS_FILE=""
 
+# shellcheck source=../../tooling/scripts/trace_events.sh
+source "${SCRIPTS_DIR}/trace_events.sh"
+
 CALLS_PER_PHASE="${CALLS_PER_PHASE:-10}"
 CALL_RATE="${CALL_RATE:-5}"
 CALL_DURATION_MS="${CALL_DURATION_MS:-1200}"
-LONG_CALL_MS="${LONG_CALL_MS:-25000}"
+LONG_CALL_MS="${LONG_CALL_MS:-12000}"
 POST_CUTOVER_CALLS="${POST_CUTOVER_CALLS:-8}"
-PHASE_GAP_SECONDS="${PHASE_GAP_SECONDS:-35}"
+# Every SIPp run gets its own Call-IDs and local port (see sipp_uac), so
+# phases no longer need a cooldown for the UAS dead-call window to expire.
+PHASE_GAP_SECONDS="${PHASE_GAP_SECONDS:-0}"
+# Comma-separated subset of old,both,new,inflight, or ramp on its own.
+# Scenarios are independent; run_call_cutover_suite.sh runs them in parallel
+# on separate stacks.
+SCENARIOS="${SCENARIOS:-old,both,new,inflight}"
+# ramp: a weighted canary profile (RAMP_NEW_WEIGHT percent to new) under
+# dispatcher algorithm 9, with RAMP_CALLS calls whose new-backend share must
+# be within RAMP_TOLERANCE_PCT points of the weight.
+RAMP_NEW_WEIGHT="${RAMP_NEW_WEIGHT:-25}"
+RAMP_CALLS="${RAMP_CALLS:-40}"
+RAMP_TOLERANCE_PCT="${RAMP_TOLERANCE_PCT:-15}"
+# Stack identity, so several stacks can run side by side: compose project,
+# container name prefix, and published host ports.
+COMPOSE_PROJECT="${COMPOSE_PROJECT:-}"
+LAB_PREFIX="${LAB_PREFIX:-real}"
+export LAB_PREFIX KAM_SIP_PORT="${KAM_SIP_PORT:-15060}" KAM_CTL_PORT="${KAM_CTL_PORT:-12046}"
+KAM_CTL_SOCKET="${KAM_CTL_SOCKET:-tcp:127.0.0.1:${KAM_CTL_PORT}}"
+# Services to start; empty starts the whole lab. Only kamailio-real and the
+# UAS containers are on the call path.
+SIM_SERVICES="${SIM_SERVICES:-}"
+KAM_CONTAINER="${LAB_PREFIX}-kamailio"
+UAS_OLD_CONTAINER="${LAB_PREFIX}-sipp-uas-old"
+UAS_NEW_CONTAINER="${LAB_PREFIX}-sipp-uas-new"
+UAC_PORT_BASE="${UAC_PORT_BASE:-5070}"
+UAC_RUNS=0
+UAC_PORT=""
+CALL_ID_TAG="$(date +%s)-$$"
+
+# LOAD_MODE=1 replaces the short call bursts with one sustained SIPp load that
+# spans the old -> both -> new changes and gates on setup-time percentiles and
+# failed calls (sipp_load_report.py).
+LOAD_MODE="${LOAD_MODE:-0}"
+LOAD_RATE="${LOAD_RATE:-200}"
+LOAD_CALL_MS="${LOAD_CALL_MS:-10000}"
+LOAD_PHASE_SECONDS="${LOAD_PHASE_SECONDS:-60}"
+LOAD_MAX_CONCURRENT="${LOAD_MAX_CONCURRENT:-5000}"
+LOAD_WINDOW_SECONDS="${LOAD_WINDOW_SECONDS:-5}"
+LOAD_MAX_P95_MS="${LOAD_MAX_P95_MS:-250}"
+LOAD_MAX_P99_MS="${LOAD_MAX_P99_MS:-1000}"
+LOAD_ERROR_BUDGET="${LOAD_ERROR_BUDGET:-0.001}"
+LOAD_SPIKE_RATIO="${LOAD_SPIKE_RATIO:-2}"
+LOAD_MAX_FAILED_CALLS="${LOAD_MAX_FAILED_CALLS:-0}"
 
 DOCKER_PATH="PATH=/tmp/fakebin:/opt/homebrew/bin:/usr/bin:/bin:/usr/sbin:/sbin"
 
 mkdir -p /tmp/fakebin
-cat > /tmp/fakebin/docker-credential-desktop <<'HELPER'
+# Written via a temp file and rename: parallel suite runs share this helper.
+cat > "/tmp/fakebin/.docker-credential-desktop.$$" <<'HELPER'
 #!/usr/bin/env bash
 set -euo pipefail
 case "${1:-}" in
@@ -38,11 +85,13 @@ case "${1:-}" in
     ;;
 esac
 HELPER
-chmod +x /tmp/fakebin/docker-credential-desktop
+chmod +x "/tmp/fakebin/.docker-credential-desktop.$$"
+mv -f "/tmp/fakebin/.docker-credential-desktop.$$" /tmp/fakebin/docker-credential-desktop
 
 mkdir -p "$ART_DIR"
 PHASE_FILE="${ART_DIR}/current_phase.txt"
 STATUS_FILE="${ART_DIR}/status.txt"
+MODE_FILE="${ART_DIR}/dispatcher_mode.txt"
 
 set_phase() {
   printf '%s\n' "$1" > "$PHASE_FILE"
@@ -52,27 +101,78 @@ set_status() {
   printf '%s\n' "$1" > "$STATUS_FILE"
 }
 
+# dispatcher_mode.txt is the dashboard's view of Kamailio routing: written once
+# from the live list at startup and again after every verified apply.
+set_dispatcher_mode() {
+  printf '%s\n' "$1" > "${MODE_FILE}.tmp"
+  mv -f "${MODE_FILE}.tmp" "$MODE_FILE"
+}
+
 set_status "running"
 set_phase "init"
+SIM_START_TS="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 trap 'set_status "failed"' ERR
 
 dc() {
-  env ${DOCKER_PATH} docker compose -f "$COMPOSE_BASE" -f "$COMPOSE_CALLS" "$@"
+  env ${DOCKER_PATH} docker compose ${COMPOSE_PROJECT:+-p "$COMPOSE_PROJECT"} -f "$COMPOSE_BASE" -f "$COMPOSE_CALLS" "$@"
+}
+
+# reserve_uac_port picks the local port for the next SIPp UAC run. SIPp
+# derives Via branches from its pid, which repeats in every fresh container,
+# so a new port keeps Kamailio from matching a previous run's transactions.
+# Call it in the parent shell, also before backgrounding sipp_uac.
+reserve_uac_port() {
+  UAC_PORT=$((UAC_PORT_BASE + UAC_RUNS))
+  UAC_RUNS=$((UAC_RUNS + 1))
+}
+
+# SIPP_CMD=... sipp_uac LOG [docker compose run args...] runs one SIPp UAC
+# against Kamailio on the reserved port, with Call-IDs unique to this run and
+# log label.
+sipp_uac() {
+  local log="$1"
+  shift
+  local label
+  label="$(basename "$log" .uac.log)"
+  dc run --rm --no-deps "$@" sipp-uac \
+    "${SIPP_CMD} -p ${UAC_PORT} -cid_str '%u-%p-${CALL_ID_TAG}-${label}@%s'" > "$log" 2>&1
+}
+
+kam_ctl() {
+  python3 "${SCRIPTS_DIR}/kamailio_ctl.py" --socket "$KAM_CTL_SOCKET" "$@"
 }
 
 wait_for_kamailio() {
-  for i in {1..45}; do
-    if env ${DOCKER_PATH} docker exec real-kamailio /bin/sh -c 'kamcmd -s unix:/run/kamailio/kamailio_ctl core.uptime >/dev/null 2>&1'; then
-      return 0
+  if ! kam_ctl --ready-timeout 45 wait-ready; then
+    echo "Kamailio control socket not ready" >&2
+    return 1
+  fi
+}
+
+infer_dispatcher_mode() {
+  env ${DOCKER_PATH} docker exec "$KAM_CONTAINER" /bin/sh -c '
+    if [ ! -f /etc/kamailio/dispatcher.list ]; then
+      echo unknown
+      exit 0
     fi
-    sleep 1
-  done
-  echo "Kamailio control socket not ready" >&2
-  return 1
+    old=0
+    new=0
+    grep -q "sipp-uas-old:5060" /etc/kamailio/dispatcher.list && old=1
+    grep -q "sipp-uas-new:5060" /etc/kamailio/dispatcher.list && new=1
+    if [ "$old" -eq 1 ] && [ "$new" -eq 1 ]; then
+      echo both
+    elif [ "$old" -eq 1 ]; then
+      echo old
+    elif [ "$new" -eq 1 ]; then
+      echo new
+    else
+      echo empty
+    fi
+  ' 2>/dev/null || echo n/a
 }
 
 wait_for_uas() {
-  for svc in real-sipp-uas-old real-sipp-uas-new; do
+  for svc in "$UAS_OLD_CONTAINER" "$UAS_NEW_CONTAINER"; do
     for i in {1..30}; do
       if [[ "$(env ${DOCKER_PATH} docker inspect -f '{{.State.Running}}' "$svc" 2>/dev/null || echo false)" == "true" ]]; then
         break
@@ -87,34 +187,33 @@ wait_for_uas() {
   done
 }
 
+# apply_profile MODE [build_dispatcher_list.sh args...]
 apply_profile() {
   local mode="$1"
+  shift
   local profile="${ART_DIR}/dispatcher.${mode}.list"
 
   "${SCRIPTS_DIR}/build_dispatcher_list.sh" \
     --mode "$mode" \
     --old "sip:sipp-uas-old:5060" \
     --new "sip:sipp-uas-new:5060" \
-    --output "$profile"
+    --output "$profile" "$@"
 
-  env ${DOCKER_PATH} docker cp "$profile" "real-kamailio:/tmp/pbx-migration/dispatcher.${mode}.list"
-  env ${DOCKER_PATH} docker exec real-kamailio /bin/sh -c "cp -f /tmp/pbx-migration/dispatcher.${mode}.list /etc/kamailio/dispatcher.list"
-
-  local reloaded=0
-  for _ in {1..8}; do
-    if env ${DOCKER_PATH} docker exec real-kamailio /bin/sh -c "kamcmd -s unix:/run/kamailio/kamailio_ctl dispatcher.reload >/dev/null 2>&1"; then
-      reloaded=1
-      break
-    fi
-    sleep 1
-  done
+  env ${DOCKER_PATH} docker cp "$profile" "${KAM_CONTAINER}:/tmp/pbx-migration/dispatcher.${mode}.list"
+  env ${DOCKER_PATH} docker exec "$KAM_CONTAINER" /bin/sh -c "cp -f /tmp/pbx-migration/dispatcher.${mode}.list /etc/kamailio/dispatcher.list"
 
-  if (( reloaded == 0 )); then
+  # One ctl session: readiness check, dispatcher.reload, then dispatcher.list
+  # compared with the profile so the phase only starts once routing changed.
+  if ! kam_ctl --ready-timeout 10 reload-verify --list-file "$profile" > "${ART_DIR}/reload-${mode}.txt" 2>&1; then
+    cat "${ART_DIR}/reload-${mode}.txt" >&2
     echo "Failed to reload dispatcher for mode=${mode}" >&2
     return 1
   fi
+  head -n 1 "${ART_DIR}/reload-${mode}.txt"
+  set_dispatcher_mode "$mode"
+  echo "$(now_ms),${mode}" >> "${ART_DIR}/profile-events.csv"
 
-  env ${DOCKER_PATH} docker exec real-kamailio /bin/sh -c 'cat /etc/kamailio/dispatcher.list' > "${ART_DIR}/applied-${mode}.list"
+  env ${DOCKER_PATH} docker exec "$KAM_CONTAINER" /bin/sh -c 'cat /etc/kamailio/dispatcher.list' > "${ART_DIR}/applied-${mode}.list"
 }
 
 run_short_calls() {
@@ -122,8 +221,9 @@ run_short_calls() {
   local count="$2"
   local called_user="$3"
 
-  if ! dc run --rm --no-deps sipp-uac "sipp -sn uac real-kamailio:5060 -s ${called_user} -m ${count} -r ${CALL_RATE} -d ${CALL_DURATION_MS} -trace_err" \
-    > "${ART_DIR}/${label}.uac.log" 2>&1; then
+  reserve_uac_port
+  if ! SIPP_CMD="sipp -sn uac kamailio-real:5060 -s ${called_user} -m ${count} -r ${CALL_RATE} -d ${CALL_DURATION_MS} -trace_err" \
+    sipp_uac "${ART_DIR}/${label}.uac.log"; then
     # SIPp can return non-zero for partial call failures; assertions still validate backend routing.
     echo "Warning: SIPp returned non-zero for phase '${label}'. Continuing; inspect ${ART_DIR}/${label}.uac.log" >&2
   fi
@@ -132,7 +232,7 @@ run_short_calls() {
 capture_kam_logs_since() {
   local label="$1"
   local since_ts="$2"
-  env ${DOCKER_PATH} docker logs --since "$since_ts" real-kamailio > "${ART_DIR}/${label}.kamailio.log" 2>&1 || true
+  env ${DOCKER_PATH} docker logs --since "$since_ts" "$KAM_CONTAINER" > "${ART_DIR}/${label}.kamailio.log" 2>&1 || true
 }
 
 capture_uas_invite_totals() {
@@ -140,8 +240,8 @@ capture_uas_invite_totals() {
   local old_log="${ART_DIR}/${label}.uas-old.messages.log"
   local new_log="${ART_DIR}/${label}.uas-new.messages.log"
 
-  env ${DOCKER_PATH} docker exec real-sipp-uas-old /bin/sh -c 'cat /tmp/old_messages.log 2>/dev/null || true' > "$old_log"
-  env ${DOCKER_PATH} docker exec real-sipp-uas-new /bin/sh -c 'cat /tmp/new_messages.log 2>/dev/null || true' > "$new_log"
+  env ${DOCKER_PATH} docker exec "$UAS_OLD_CONTAINER" /bin/sh -c 'cat /tmp/old_messages.log 2>/dev/null || true' > "$old_log"
+  env ${DOCKER_PATH} docker exec "$UAS_NEW_CONTAINER" /bin/sh -c 'cat /tmp/new_messages.log 2>/dev/null || true' > "$new_log"
 
   local old_total new_total
   old_total="$(grep -c '^INVITE ' "$old_log" || true)"
@@ -150,6 +250,107 @@ capture_uas_invite_totals() {
   echo "${old_total:-0} ${new_total:-0}"
 }
 
+# uas_invite_counts prints "<old> <new>" INVITE totals counted inside the UAS
+# containers; under load the message logs are too large to copy every phase.
+uas_invite_counts() {
+  local old_total new_total
+  old_total="$(env ${DOCKER_PATH} docker exec "$UAS_OLD_CONTAINER" /bin/sh -c "grep -c '^INVITE ' /tmp/old_messages.log 2>/dev/null || true")"
+  new_total="$(env ${DOCKER_PATH} docker exec "$UAS_NEW_CONTAINER" /bin/sh -c "grep -c '^INVITE ' /tmp/new_messages.log 2>/dev/null || true")"
+  echo "${old_total:-0} ${new_total:-0}"
+}
+
+record_load_event() {
+  echo "$(now_ms),$1" >> "${ART_DIR}/load-events.csv"
+}
+
+# run_load_cutover drives LOAD_RATE cps of LOAD_CALL_MS calls through
+# Kamailio for three LOAD_PHASE_SECONDS phases (old, both, new), applying
+# each profile while calls are in flight. The UAC scenario honours
+# Record-Route, so calls set up before a change are torn down on their
+# original backend; any call the reload drops shows up as a failed call.
+run_load_cutover() {
+  local load_dir="${ART_DIR}/load"
+  local total_calls=$((LOAD_RATE * LOAD_PHASE_SECONDS * 3))
+  local expected=$((LOAD_RATE * LOAD_PHASE_SECONDS / 4))
+  local load_pid load_rc=0 rtt_file
+  mkdir -p "$load_dir"
+  : > "${ART_DIR}/load-events.csv"
+
+  set_phase "load-old"
+  apply_profile old
+  read -r c_old_start c_new_start < <(uas_invite_counts)
+  echo "Starting SIPp load: ${LOAD_RATE} cps, ${LOAD_CALL_MS} ms calls (~$((LOAD_RATE * LOAD_CALL_MS / 1000)) concurrent), ${total_calls} calls..."
+  reserve_uac_port
+  SIPP_CMD="cd /out && sipp -sf /scenarios/uac_load.xml -s 6000 kamailio-real:5060 -m ${total_calls} -r ${LOAD_RATE} -l ${LOAD_MAX_CONCURRENT} -d ${LOAD_CALL_MS} -trace_stat -stf /out/load.stat.csv -fd 1 -trace_rtt -rtt_freq 1 -trace_err" \
+    sipp_uac "${ART_DIR}/load.uac.log" -v "${load_dir}:/out" &
+  load_pid=$!
+  record_load_event old
+  sleep "$LOAD_PHASE_SECONDS"
+
+  read -r c_old_both c_new_both < <(uas_invite_counts)
+  set_phase "load-both"
+  apply_profile both
+  record_load_event both
+  sleep "$LOAD_PHASE_SECONDS"
+
+  read -r c_old_new c_new_new < <(uas_invite_counts)
+  set_phase "load-new"
+  apply_profile new
+  record_load_event new
+  sleep "$LOAD_WINDOW_SECONDS"
+  read -r c_old_settled c_new_settled < <(uas_invite_counts)
+
+  wait "$load_pid" || load_rc=$?
+  record_load_event end
+  read -r c_old_end c_new_end < <(uas_invite_counts)
+  # SIPp exits 1 when some calls failed; the report gates on those. Anything
+  # else means the load itself did not run.
+  if (( load_rc != 0 && load_rc != 1 )); then
+    tail -n 40 "${ART_DIR}/load.uac.log" >&2 || true
+    echo "SIPp load failed to run (exit ${load_rc})" >&2
+    return 1
+  fi
+
+  set_phase "load-report"
+  assert_phase_deltas old "$expected" "$c_old_start" "$c_new_start" "$c_old_both" "$c_new_both"
+  assert_phase_deltas both "$expected" "$c_old_both" "$c_new_both" "$c_old_new" "$c_new_new"
+  # In-flight calls still send ACK/BYE to old after the change, but no new
+  # INVITEs may reach it once the settle window has passed.
+  assert_phase_deltas new "$expected" "$c_old_settled" "$c_new_settled" "$c_old_end" "$c_new_end"
+
+  rtt_file="$(ls "${load_dir}"/*_rtt.csv 2>/dev/null | head -n 1 || true)"
+  if [[ -z "$rtt_file" || ! -f "${load_dir}/load.stat.csv" ]]; then
+    echo "SIPp load produced no rtt/stat files in ${load_dir}" >&2
+    return 1
+  fi
+  python3 "${SCRIPTS_DIR}/sipp_load_report.py" \
+    --rtt "$rtt_file" \
+    --stat "${load_dir}/load.stat.csv" \
+    --events "${ART_DIR}/load-events.csv" \
+    --window "$LOAD_WINDOW_SECONDS" \
+    --max-p95-ms "$LOAD_MAX_P95_MS" \
+    --max-p99-ms "$LOAD_MAX_P99_MS" \
+    --error-budget "$LOAD_ERROR_BUDGET" \
+    --spike-ratio "$LOAD_SPIKE_RATIO" \
+    --max-failed-calls "$LOAD_MAX_FAILED_CALLS" \
+    --output "${ART_DIR}/load-report.json" 2>&1 | tee "${ART_DIR}/load-report.txt"
+}
+
+# index_routing_log [moved args...] streams this run's Kamailio log into a
+# CUTOVER_DST index, writes the per-second INVITE destination split around
+# each profile apply, and lists calls whose requests changed destination.
+index_routing_log() {
+  local store="${ART_DIR}/cutover-index"
+  rm -rf "$store"
+  env ${DOCKER_PATH} docker logs --since "$SIM_START_TS" "$KAM_CONTAINER" 2>&1 \
+    | python3 "${SCRIPTS_DIR}/cutover_log_index.py" index - --store "$store"
+  python3 "${SCRIPTS_DIR}/cutover_log_index.py" split "$store" \
+    --events "${ART_DIR}/profile-events.csv" --method INVITE --before 5 --after 5 \
+    --output "${ART_DIR}/cutover-split.json" > "${ART_DIR}/cutover-split.txt"
+  python3 "${SCRIPTS_DIR}/cutover_log_index.py" moved "$store" \
+    --output "${ART_DIR}/cutover-moved.json" "$@" 2>&1 | tee "${ART_DIR}/cutover-moved.txt"
+}
+
 assert_phase_deltas() {
   local phase="$1"
   local expected_calls="$2"
@@ -206,127 +407,234 @@ assert_phase_deltas() {
   esac
 }
 
+# run_routing_phase MODE CALLED_USER applies MODE, sends a call burst, and
+# asserts backend INVITE deltas against the running old_total/new_total.
+run_routing_phase() {
+  local mode="$1"
+  local called_user="$2"
+  local phase_start next_old next_new
+
+  set_phase "$mode"
+  apply_profile "$mode"
+  phase_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
+  run_short_calls "$mode" "$CALLS_PER_PHASE" "$called_user"
+  capture_kam_logs_since "$mode" "$phase_start"
+  read next_old next_new < <(capture_uas_invite_totals "$mode")
+  assert_phase_deltas "$mode" "$CALLS_PER_PHASE" "$old_total" "$new_total" "$next_old" "$next_new"
+  old_total="$next_old"
+  new_total="$next_new"
+}
+
+run_inflight_check() {
+  local inflight_start inflight_old_base inflight_new_base inflight_old_ready inflight_new_ready
+  local inflight_old_mid inflight_new_mid inflight_old_final inflight_new_final
+  local long_pid cutover_ts post_old_delta post_new_delta
+
+  set_phase "inflight"
+  apply_profile old
+  inflight_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
+  read inflight_old_base inflight_new_base < <(capture_uas_invite_totals inflight-pre)
+
+  run_short_calls inflight-precutover 1 "4100"
+  read inflight_old_ready inflight_new_ready < <(capture_uas_invite_totals inflight-ready)
+
+  if (( inflight_old_ready - inflight_old_base < 1 )); then
+    echo "In-flight test failed: old-mode precheck did not reach old backend" >&2
+    return 1
+  fi
+  if (( inflight_new_ready - inflight_new_base != 0 )); then
+    echo "In-flight test failed: old-mode precheck unexpectedly reached new backend" >&2
+    return 1
+  fi
+
+  reserve_uac_port
+  SIPP_CMD="sipp -sn uac kamailio-real:5060 -s 4000 -m 1 -r 1 -d ${LONG_CALL_MS} -trace_err" \
+    sipp_uac "${ART_DIR}/inflight-long.uac.log" &
+  long_pid=$!
+
+  sleep 2
+  inflight_old_mid="$inflight_old_ready"
+  inflight_new_mid="$inflight_new_ready"
+
+  cutover_ts="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
+  apply_profile new
+  run_short_calls inflight-post-cutover "$POST_CUTOVER_CALLS" "5000"
+
+  if ! wait "$long_pid"; then
+    echo "In-flight test failed: long call did not complete successfully" >&2
+    return 1
+  fi
+
+  capture_kam_logs_since inflight-total "$inflight_start"
+  capture_kam_logs_since inflight-post-cutover "$cutover_ts"
+  read inflight_old_final inflight_new_final < <(capture_uas_invite_totals inflight-final)
+
+  post_old_delta=$((inflight_old_final - inflight_old_mid))
+  post_new_delta=$((inflight_new_final - inflight_new_mid))
+
+  {
+    echo "inflight_old_base=${inflight_old_base}"
+    echo "inflight_new_base=${inflight_new_base}"
+    echo "inflight_old_mid=${inflight_old_mid}"
+    echo "inflight_new_mid=${inflight_new_mid}"
+    echo "inflight_old_final=${inflight_old_final}"
+    echo "inflight_new_final=${inflight_new_final}"
+    echo "post_cutover_old_delta=${post_old_delta}"
+    echo "post_cutover_new_delta=${post_new_delta}"
+  } > "${ART_DIR}/inflight.assertions.txt"
+
+  if (( post_new_delta < POST_CUTOVER_CALLS )); then
+    echo "In-flight test failed: expected at least ${POST_CUTOVER_CALLS} new-backend INVITEs after cutover, got ${post_new_delta}" >&2
+    return 1
+  fi
+  if (( post_old_delta != 0 )); then
+    echo "In-flight test failed: observed old-backend INVITEs after cutover (${post_old_delta})" >&2
+    return 1
+  fi
+}
+
+# run_ramp_check applies a RAMP_NEW_WEIGHT percent ramp profile, sends
+# RAMP_CALLS calls, and asserts the new backend's share of their INVITEs.
+# Needs Kamailio started with WITH_WEIGHTED_DISPATCH (algorithm 9).
+run_ramp_check() {
+  local base_old base_new end_old end_new delta_old delta_new share
+
+  set_phase "ramp"
+  apply_profile ramp --new-weight "$RAMP_NEW_WEIGHT"
+  read base_old base_new < <(capture_uas_invite_totals ramp-pre)
+  run_short_calls ramp "$RAMP_CALLS" "7000"
+  read end_old end_new < <(capture_uas_invite_totals ramp)
+  delta_old=$((end_old - base_old))
+  delta_new=$((end_new - base_new))
+  share=0
+  if (( delta_old + delta_new > 0 )); then
+    share=$(( delta_new * 100 / (delta_old + delta_new) ))
+  fi
+
+  {
+    echo "phase=ramp"
+    echo "new_weight=${RAMP_NEW_WEIGHT}"
+    echo "calls=${RAMP_CALLS}"
+    echo "delta_old=${delta_old}"
+    echo "delta_new=${delta_new}"
+    echo "new_share_pct=${share}"
+    echo "tolerance_pct=${RAMP_TOLERANCE_PCT}"
+  } > "${ART_DIR}/ramp.assertions.txt"
+
+  if (( delta_old + delta_new < RAMP_CALLS )); then
+    echo "Ramp check failed: expected at least ${RAMP_CALLS} INVITEs, got old=${delta_old} new=${delta_new}" >&2
+    return 1
+  fi
+  if (( share < RAMP_NEW_WEIGHT - RAMP_TOLERANCE_PCT || share > RAMP_NEW_WEIGHT + RAMP_TOLERANCE_PCT )); then
+    echo "Ramp check failed: new backend got ${share}% of INVITEs, weight ${RAMP_NEW_WEIGHT}% +/- ${RAMP_TOLERANCE_PCT} (old=${delta_old} new=${delta_new})" >&2
+    return 1
+  fi
+  echo "Ramp check: new backend got ${share}% of ${RAMP_CALLS} calls (weight ${RAMP_NEW_WEIGHT}%)."
+}
+
+has_scenario() {
+  [[ ",${SCENARIOS}," == *",$1,"* ]]
+}
+
+SCENARIOS_RUN=0
+
+# before_scenario NAME sleeps PHASE_GAP_SECONDS between scenarios when a
+# cooldown is still wanted (e.g. an external UAC without unique Call-IDs).
+before_scenario() {
+  if (( SCENARIOS_RUN > 0 && PHASE_GAP_SECONDS > 0 )); then
+    echo "Cooling down ${PHASE_GAP_SECONDS}s before ${1}..."
+    set_phase "cooldown-before-${1}"
+    sleep "$PHASE_GAP_SECONDS"
+  fi
+  SCENARIOS_RUN=$((SCENARIOS_RUN + 1))
+}
+
+for scenario in ${SCENARIOS//,/ }; do
+  case "$scenario" in
+    old|both|new|inflight|ramp) ;;
+    *)
+      echo "Unknown scenario in SCENARIOS: ${scenario} (expected old,both,new,inflight,ramp)" >&2
+      exit 1
+      ;;
+  esac
+done
+
+# Weights need algorithm 9, under which the unweighted scenarios' lists
+# would send everything to one backend: ramp gets a stack of its own.
+if has_scenario ramp; then
+  if [[ "$SCENARIOS" != "ramp" || "$LOAD_MODE" == "1" ]]; then
+    echo "SCENARIOS=ramp must run on its own (run_call_cutover_suite.sh gives it a separate stack)" >&2
+    exit 1
+  fi
+  export KAM_EXTRA_DEFINES="-A WITH_WEIGHTED_DISPATCH"
+fi
+
 echo "[1/7] Starting real-services lab + SIP call simulators..."
 set_phase "stack-start"
-dc up -d --build
+dc up -d --build ${SIM_SERVICES}
 
 echo "[2/7] Waiting for Kamailio and SIP endpoints..."
 set_phase "wait-ready"
 wait_for_kamailio
 wait_for_uas
+set_dispatcher_mode "$(infer_dispatcher_mode)"
+
+STOP_HINT="env ${DOCKER_PATH} docker compose${COMPOSE_PROJECT:+ -p ${COMPOSE_PROJECT}} -f ${COMPOSE_BASE} -f ${COMPOSE_CALLS} down -v"
+
+if [[ "$LOAD_MODE" == "1" ]]; then
+  echo "[3/7] Load mode: old -> both -> new under sustained SIPp load..."
+  run_load_cutover
+  # The load scenario follows Record-Route, so every dialog must stay on the
+  # backend that answered its INVITE.
+  index_routing_log --fail-on-moved
+  echo "[7/7] Load cutover simulation succeeded."
+  set_phase "done"
+  set_status "success"
+  echo "Artifacts: ${ART_DIR}"
+  echo "Lab still running for inspection."
+  echo "Stop with: ${STOP_HINT}"
+  exit 0
+fi
 
 read old_total new_total < <(capture_uas_invite_totals baseline)
 
-echo "[3/7] Old-phase call routing check..."
-set_phase "old"
-apply_profile old
-phase_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
-run_short_calls old "$CALLS_PER_PHASE" "1000"
-capture_kam_logs_since old "$phase_start"
-read next_old next_new < <(capture_uas_invite_totals old)
-assert_phase_deltas old "$CALLS_PER_PHASE" "$old_total" "$new_total" "$next_old" "$next_new"
-old_total="$next_old"
-new_total="$next_new"
-
-echo "Cooling down ${PHASE_GAP_SECONDS}s before both-phase to avoid transaction-id reuse artifacts..."
-set_phase "cooldown-before-both"
-sleep "$PHASE_GAP_SECONDS"
-
-echo "[4/7] Both-phase call routing check..."
-set_phase "both"
-apply_profile both
-phase_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
-run_short_calls both "$CALLS_PER_PHASE" "2000"
-capture_kam_logs_since both "$phase_start"
-read next_old next_new < <(capture_uas_invite_totals both)
-assert_phase_deltas both "$CALLS_PER_PHASE" "$old_total" "$new_total" "$next_old" "$next_new"
-old_total="$next_old"
-new_total="$next_new"
-
-echo "Cooling down ${PHASE_GAP_SECONDS}s before new-phase to avoid transaction-id reuse artifacts..."
-set_phase "cooldown-before-new"
-sleep "$PHASE_GAP_SECONDS"
-
-echo "[5/7] New-phase call routing check..."
-set_phase "new"
-apply_profile new
-phase_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
-run_short_calls new "$CALLS_PER_PHASE" "3000"
-capture_kam_logs_since new "$phase_start"
-read next_old next_new < <(capture_uas_invite_totals new)
-assert_phase_deltas new "$CALLS_PER_PHASE" "$old_total" "$new_total" "$next_old" "$next_new"
-old_total="$next_old"
-new_total="$next_new"
-
-echo "Cooling down ${PHASE_GAP_SECONDS}s before in-flight check to avoid transaction-id reuse artifacts..."
-set_phase "cooldown-before-inflight"
-sleep "$PHASE_GAP_SECONDS"
-
-echo "[6/7] In-flight cutover behavior check (long call survives cutover)..."
-set_phase "inflight"
-apply_profile old
-sleep 2
-inflight_start="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
-read inflight_old_base inflight_new_base < <(capture_uas_invite_totals inflight-pre)
-
-run_short_calls inflight-precutover 1 "4100"
-read inflight_old_ready inflight_new_ready < <(capture_uas_invite_totals inflight-ready)
-
-if (( inflight_old_ready - inflight_old_base < 1 )); then
-  echo "In-flight test failed: old-mode precheck did not reach old backend" >&2
-  exit 1
-fi
-if (( inflight_new_ready - inflight_new_base != 0 )); then
-  echo "In-flight test failed: old-mode precheck unexpectedly reached new backend" >&2
-  exit 1
+if has_scenario old; then
+  before_scenario old
+  echo "[3/7] Old-phase call routing check..."
+  run_routing_phase old "1000"
 fi
 
-dc run --rm --no-deps sipp-uac "sipp -sn uac real-kamailio:5060 -s 4000 -m 1 -r 1 -d ${LONG_CALL_MS} -trace_err" > "${ART_DIR}/inflight-long.uac.log" 2>&1 &
-long_pid=$!
-
-sleep 2
-inflight_old_mid="$inflight_old_ready"
-inflight_new_mid="$inflight_new_ready"
-
-cutover_ts="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
-apply_profile new
-run_short_calls inflight-post-cutover "$POST_CUTOVER_CALLS" "5000"
+if has_scenario both; then
+  before_scenario both
+  echo "[4/7] Both-phase call routing check..."
+  run_routing_phase both "2000"
+fi
 
-if ! wait "$long_pid"; then
-  echo "In-flight test failed: long call did not complete successfully" >&2
-  exit 1
+if has_scenario new; then
+  before_scenario new
+  echo "[5/7] New-phase call routing check..."
+  run_routing_phase new "3000"
 fi
 
-capture_kam_logs_since inflight-total "$inflight_start"
-capture_kam_logs_since inflight-post-cutover "$cutover_ts"
-read inflight_old_final inflight_new_final < <(capture_uas_invite_totals inflight-final)
-
-post_old_delta=$((inflight_old_final - inflight_old_mid))
-post_new_delta=$((inflight_new_final - inflight_new_mid))
-
-{
-  echo "inflight_old_base=${inflight_old_base}"
-  echo "inflight_new_base=${inflight_new_base}"
-  echo "inflight_old_mid=${inflight_old_mid}"
-  echo "inflight_new_mid=${inflight_new_mid}"
-  echo "inflight_old_final=${inflight_old_final}"
-  echo "inflight_new_final=${inflight_new_final}"
-  echo "post_cutover_old_delta=${post_old_delta}"
-  echo "post_cutover_new_delta=${post_new_delta}"
-} > "${ART_DIR}/inflight.assertions.txt"
-
-if (( post_new_delta < POST_CUTOVER_CALLS )); then
-  echo "In-flight test failed: expected at least ${POST_CUTOVER_CALLS} new-backend INVITEs after cutover, got ${post_new_delta}" >&2
-  exit 1
+if has_scenario inflight; then
+  before_scenario inflight
+  echo "[6/7] In-flight cutover behavior check (long call survives cutover)..."
+  run_inflight_check
 fi
-if (( post_old_delta != 0 )); then
-  echo "In-flight test failed: observed old-backend INVITEs after cutover (${post_old_delta})" >&2
-  exit 1
+
+if has_scenario ramp; then
+  before_scenario ramp
+  echo "[6/7] Weighted ramp check (${RAMP_NEW_WEIGHT}% to new, dispatcher algorithm 9)..."
+  run_ramp_check
 fi
 
-echo "[7/7] Call cutover simulation succeeded."
+# Report only: the built-in uac scenario ignores Record-Route, so in-dialog
+# requests are re-dispatched and the in-flight call's BYE follows the cutover.
+index_routing_log
+
+echo "[7/7] Call cutover simulation succeeded (scenarios: ${SCENARIOS})."
 set_phase "done"
 set_status "success"
 echo "Artifacts: ${ART_DIR}"
 echo "Lab still running for inspection."
-echo "Stop with: env ${DOCKER_PATH} docker compose -f ${COMPOSE_BASE} -f ${COMPOSE_CALLS} down -v"
+echo "Stop with: ${STOP_HINT}"
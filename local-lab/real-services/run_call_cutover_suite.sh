@@ -0,0 +1,118 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Runs the call-cutover scenarios in parallel, each against its own Kamailio
+# and UAS stack (compose project, container prefix, and host ports), then
+# fails if any scenario failed. Stacks are removed afterwards unless
+# KEEP_STACKS=1.
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
+LAB_DIR="${ROOT_DIR}/local-lab/real-services"
+COMPOSE_BASE="${LAB_DIR}/docker-compose.real.yml"
+COMPOSE_CALLS="${LAB_DIR}/docker-compose.calls.yml"
+SIM_SCRIPT="${LAB_DIR}/run_call_cutover_sim.sh"
+SUITE_DIR="${ART_DIR_OVERRIDE:-${LAB_DIR}/artifacts/call-cutover-suite-$(date +%Y%m%d_%H%M%S)}"
+
+SUITE_SCENARIOS="${SUITE_SCENARIOS:-old,both,new,inflight,ramp}"
+SUITE_PROJECT_PREFIX="${SUITE_PROJECT_PREFIX:-pbx-cutover}"
+SUITE_SIP_PORT_BASE="${SUITE_SIP_PORT_BASE:-25060}"
+SUITE_CTL_PORT_BASE="${SUITE_CTL_PORT_BASE:-22046}"
+# The call path only: the seed dispatcher list names freeswitch-old, so
+# FreeSWITCH stays in; the FusionPBX image builds are skipped.
+SUITE_SERVICES="${SUITE_SERVICES:-kamailio-real freeswitch-old freeswitch-new sipp-uas-old sipp-uas-new}"
+KEEP_STACKS="${KEEP_STACKS:-0}"
+
+DOCKER_PATH="PATH=/tmp/fakebin:/opt/homebrew/bin:/usr/bin:/bin:/usr/sbin:/sbin"
+
+dc_project() {
+  local project="$1"
+  shift
+  env ${DOCKER_PATH} docker compose -p "$project" -f "$COMPOSE_BASE" -f "$COMPOSE_CALLS" "$@"
+}
+
+scenarios=(${SUITE_SCENARIOS//,/ })
+if (( ${#scenarios[@]} == 0 )); then
+  echo "SUITE_SCENARIOS is empty" >&2
+  exit 1
+fi
+
+teardown() {
+  if [[ "$KEEP_STACKS" == "1" ]]; then
+    echo "Stacks kept for inspection (projects ${SUITE_PROJECT_PREFIX}-<scenario>)."
+    return 0
+  fi
+  local scenario
+  for scenario in "${scenarios[@]}"; do
+    dc_project "${SUITE_PROJECT_PREFIX}-${scenario}" down -v --remove-orphans > /dev/null 2>&1 &
+  done
+  wait || true
+}
+
+mkdir -p "$SUITE_DIR"
+trap teardown EXIT
+
+echo "[1/3] Pulling call-path images once..."
+if ! dc_project "${SUITE_PROJECT_PREFIX}-pull" pull --quiet ${SUITE_SERVICES} sipp-uac; then
+  echo "Warning: image pull failed; continuing with local images" >&2
+fi
+
+echo "[2/3] Running scenarios in parallel: ${scenarios[*]}..."
+suite_start="$(date +%s)"
+for i in "${!scenarios[@]}"; do
+  scenario="${scenarios[$i]}"
+  project="${SUITE_PROJECT_PREFIX}-${scenario}"
+  dir="${SUITE_DIR}/${scenario}"
+  mkdir -p "$dir"
+  (
+    start="$(date +%s)"
+    rc=0
+    COMPOSE_PROJECT="$project" \
+      LAB_PREFIX="$project" \
+      KAM_SIP_PORT="$((SUITE_SIP_PORT_BASE + i))" \
+      KAM_CTL_PORT="$((SUITE_CTL_PORT_BASE + i))" \
+      KAM_CTL_SOCKET="tcp:127.0.0.1:$((SUITE_CTL_PORT_BASE + i))" \
+      SCENARIOS="$scenario" \
+      SIM_SERVICES="$SUITE_SERVICES" \
+      LOAD_MODE=0 \
+      ART_DIR_OVERRIDE="$dir" \
+      "$SIM_SCRIPT" > "${dir}/simulation.stdout.log" 2>&1 || rc=$?
+    echo "${rc} $(( $(date +%s) - start ))" > "${dir}/suite-result.txt"
+  ) &
+done
+wait || true
+suite_seconds=$(( $(date +%s) - suite_start ))
+
+echo "[3/3] Results"
+failed=0
+echo "scenario,rc,seconds,artifacts" > "${SUITE_DIR}/suite-summary.csv"
+printf '%-10s %-7s %8s  %s\n' "scenario" "result" "seconds" "artifacts"
+for scenario in "${scenarios[@]}"; do
+  dir="${SUITE_DIR}/${scenario}"
+  rc=1
+  seconds="-"
+  if [[ -f "${dir}/suite-result.txt" ]]; then
+    read -r rc seconds < "${dir}/suite-result.txt"
+  fi
+  echo "${scenario},${rc},${seconds},${dir}" >> "${SUITE_DIR}/suite-summary.csv"
+  if [[ "$rc" == "0" ]]; then
+    printf '%-10s %-7s %8s  %s\n' "$scenario" "ok" "$seconds" "$dir"
+  else
+    printf '%-10s %-7s %8s  %s\n' "$scenario" "FAILED" "$seconds" "$dir"
+    failed=$((failed + 1))
+  fi
+done
+echo "Suite wall time: ${suite_seconds}s"
+
+for scenario in "${scenarios[@]}"; do
+  dir="${SUITE_DIR}/${scenario}"
+  if [[ "$(cat "${dir}/suite-result.txt" 2>/dev/null | cut -d' ' -f1)" != "0" ]]; then
+    echo "--- ${scenario}: last lines of ${dir}/simulation.stdout.log" >&2
+    tail -n 20 "${dir}/simulation.stdout.log" >&2 || true
+  fi
+done
+
+if (( failed > 0 )); then
+  echo "${failed} of ${#scenarios[@]} scenario(s) failed. Artifacts: ${SUITE_DIR}" >&2
+  exit 1
+fi
+echo "All scenarios passed. Artifacts: ${SUITE_DIR}"
@@ -0,0 +1,259 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Dispatcher failover benchmark. For each OPTIONS probing interval in
+# FAILOVER_INTERVALS, Kamailio is recreated with kamailio.failover.cfg
+# (new preferred, old as backup), SIPp load runs through it, and
+# sipp-uas-new is paused (or killed) mid-load. failover_report.py then
+# measures time to detect, time to reroute, calls sent to the dead backend,
+# and calls lost; with FAILOVER_BASELINE set the run fails if failover got
+# slower than the baseline report.
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
+LAB_DIR="${ROOT_DIR}/local-lab/real-services"
+COMPOSE_BASE="${LAB_DIR}/docker-compose.real.yml"
+COMPOSE_CALLS="${LAB_DIR}/docker-compose.calls.yml"
+COMPOSE_FAILOVER="${LAB_DIR}/docker-compose.failover.yml"
+SCRIPTS_DIR="${ROOT_DIR}/tooling/scripts"
+ART_DIR="${ART_DIR_OVERRIDE:-${LAB_DIR}/artifacts/failover-$(date +%Y%m%d_%H%M%S)}"
+
+# shellcheck source=../../tooling/scripts/trace_events.sh
+source "${SCRIPTS_DIR}/trace_events.sh"
+
+# Comma-separated ds_ping_interval values (seconds), one run each.
+FAILOVER_INTERVALS="${FAILOVER_INTERVALS:-1,2,5,10}"
+# pause: packets to the backend are silently dropped (host hang, network
+# partition). kill: the SIPp process is gone (crash).
+FAILOVER_MODE="${FAILOVER_MODE:-pause}"
+FAILOVER_RATE="${FAILOVER_RATE:-50}"
+FAILOVER_CALL_MS="${FAILOVER_CALL_MS:-5000}"
+FAILOVER_WARMUP_SECONDS="${FAILOVER_WARMUP_SECONDS:-15}"
+FAILOVER_DOWN_SECONDS="${FAILOVER_DOWN_SECONDS:-30}"
+FAILOVER_MAX_CONCURRENT="${FAILOVER_MAX_CONCURRENT:-5000}"
+# Passed to kamailio.failover.cfg as preprocessor defines.
+export FR_TIMER_MS="${FAILOVER_FR_TIMER_MS:-1000}"
+export DS_PROBING_THRESHOLD="${FAILOVER_PROBING_THRESHOLD:-1}"
+# 1 also marks a backend down on the first timed-out call (ds_mark_dst), so
+# detection no longer waits for probing.
+FAILOVER_MARK_ON_FAILURE="${FAILOVER_MARK_ON_FAILURE:-0}"
+FAILOVER_LABEL="${FAILOVER_LABEL:-${FAILOVER_MODE}}"
+# Baseline failover-report.json; empty reports without gating.
+FAILOVER_BASELINE="${FAILOVER_BASELINE:-}"
+FAILOVER_MAX_REGRESSION="${FAILOVER_MAX_REGRESSION:-20}"
+FAILOVER_MIN_DELTA_MS="${FAILOVER_MIN_DELTA_MS:-250}"
+FAILOVER_MIN_DELTA_CALLS="${FAILOVER_MIN_DELTA_CALLS:-5}"
+
+COMPOSE_PROJECT="${COMPOSE_PROJECT:-}"
+LAB_PREFIX="${LAB_PREFIX:-real}"
+export LAB_PREFIX KAM_SIP_PORT="${KAM_SIP_PORT:-15060}" KAM_CTL_PORT="${KAM_CTL_PORT:-12046}"
+KAM_CTL_SOCKET="${KAM_CTL_SOCKET:-tcp:127.0.0.1:${KAM_CTL_PORT}}"
+KAM_CONTAINER="${LAB_PREFIX}-kamailio"
+UAS_OLD_CONTAINER="${LAB_PREFIX}-sipp-uas-old"
+UAS_NEW_CONTAINER="${LAB_PREFIX}-sipp-uas-new"
+DOWN_DST="sipp-uas-new:5060"
+UAC_PORT_BASE="${UAC_PORT_BASE:-5070}"
+UAC_RUNS=0
+UAC_PORT=""
+CALL_ID_TAG="$(date +%s)-$$"
+
+DOCKER_PATH="PATH=/tmp/fakebin:/opt/homebrew/bin:/usr/bin:/bin:/usr/sbin:/sbin"
+
+mkdir -p /tmp/fakebin
+# Written via a temp file and rename: parallel lab runs share this helper.
+cat > "/tmp/fakebin/.docker-credential-desktop.$$" <<'HELPER'
+#!/usr/bin/env bash
+set -euo pipefail
+case "${1:-}" in
+  get)
+    echo '{"Username":"","Secret":""}'
+    ;;
+  list)
+    echo '{}'
+    ;;
+  *)
+    exit 0
+    ;;
+esac
+HELPER
+chmod +x "/tmp/fakebin/.docker-credential-desktop.$$"
+mv -f "/tmp/fakebin/.docker-credential-desktop.$$" /tmp/fakebin/docker-credential-desktop
+
+case "$FAILOVER_MODE" in
+  pause|kill) ;;
+  *)
+    echo "FAILOVER_MODE must be pause or kill (got ${FAILOVER_MODE})" >&2
+    exit 1
+    ;;
+esac
+KAM_EXTRA_DEFINES=""
+if [[ "$FAILOVER_MARK_ON_FAILURE" == "1" ]]; then
+  KAM_EXTRA_DEFINES="-A WITH_MARK_ON_FAILURE"
+fi
+export KAM_EXTRA_DEFINES
+
+mkdir -p "$ART_DIR"
+
+dc() {
+  env ${DOCKER_PATH} docker compose ${COMPOSE_PROJECT:+-p "$COMPOSE_PROJECT"} -f "$COMPOSE_BASE" -f "$COMPOSE_CALLS" -f "$COMPOSE_FAILOVER" "$@"
+}
+
+# See run_call_cutover_sim.sh: a fresh local port per SIPp run keeps
+# Kamailio from matching a previous run's transactions.
+reserve_uac_port() {
+  UAC_PORT=$((UAC_PORT_BASE + UAC_RUNS))
+  UAC_RUNS=$((UAC_RUNS + 1))
+}
+
+sipp_uac() {
+  local log="$1"
+  shift
+  local label
+  label="$(basename "$log" .uac.log)"
+  dc run --rm --no-deps "$@" sipp-uac \
+    "${SIPP_CMD} -p ${UAC_PORT} -cid_str '%u-%p-${CALL_ID_TAG}-${label}@%s'" > "$log" 2>&1
+}
+
+kam_ctl() {
+  python3 "${SCRIPTS_DIR}/kamailio_ctl.py" --socket "$KAM_CTL_SOCKET" "$@"
+}
+
+container_running() {
+  [[ "$(env ${DOCKER_PATH} docker inspect -f '{{.State.Running}} {{.State.Paused}}' "$1" 2>/dev/null || echo false)" == "true false" ]]
+}
+
+wait_for_uas() {
+  local svc i
+  for svc in "$UAS_OLD_CONTAINER" "$UAS_NEW_CONTAINER"; do
+    for i in {1..30}; do
+      container_running "$svc" && break
+      if (( i == 30 )); then
+        echo "SIPp UAS not ready: ${svc}" >&2
+        env ${DOCKER_PATH} docker logs "$svc" 2>&1 | tail -n 40 >&2 || true
+        return 1
+      fi
+      sleep 1
+    done
+  done
+}
+
+# restore_new_backend brings sipp-uas-new back after a run, whichever way it
+# was taken down.
+restore_new_backend() {
+  if [[ "$(env ${DOCKER_PATH} docker inspect -f '{{.State.Paused}}' "$UAS_NEW_CONTAINER" 2>/dev/null || echo false)" == "true" ]]; then
+    env ${DOCKER_PATH} docker unpause "$UAS_NEW_CONTAINER" > /dev/null || return
+  fi
+  if ! container_running "$UAS_NEW_CONTAINER"; then
+    dc up -d sipp-uas-new || return
+  fi
+}
+
+take_down_new_backend() {
+  case "$FAILOVER_MODE" in
+    pause) env ${DOCKER_PATH} docker pause "$UAS_NEW_CONTAINER" > /dev/null ;;
+    kill) env ${DOCKER_PATH} docker kill "$UAS_NEW_CONTAINER" > /dev/null ;;
+  esac
+}
+
+# start_kamailio INTERVAL recreates Kamailio with ds_ping_interval=INTERVAL.
+# Both backends must be up first: dispatcher resolves them when it loads the
+# list.
+start_kamailio() {
+  DS_PING_INTERVAL="$1" dc up -d --force-recreate --no-deps kamailio-real || return
+  if ! kam_ctl --ready-timeout 45 wait-ready; then
+    echo "Kamailio control socket not ready" >&2
+    return 1
+  fi
+}
+
+# run_interval INTERVAL: one load run with sipp-uas-new taken down after
+# FAILOVER_WARMUP_SECONDS, analysed into <run dir>/failover.json.
+run_interval() {
+  local interval="$1"
+  local run_dir="${ART_DIR}/interval-${interval}"
+  local total_calls=$((FAILOVER_RATE * (FAILOVER_WARMUP_SECONDS + FAILOVER_DOWN_SECONDS)))
+  local load_pid load_rc=0 since
+  mkdir -p "${run_dir}/load"
+
+  # Called as an if condition, so errexit is off here: fail explicitly.
+  restore_new_backend || return
+  wait_for_uas || return
+  start_kamailio "$interval" || return
+  kam_ctl call dispatcher.list > "${run_dir}/dispatcher-before.json" 2>&1 || true
+  since="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
+
+  echo "Interval ${interval}s: ${FAILOVER_RATE} cps for $((FAILOVER_WARMUP_SECONDS + FAILOVER_DOWN_SECONDS))s, ${FAILOVER_MODE} ${UAS_NEW_CONTAINER} after ${FAILOVER_WARMUP_SECONDS}s..."
+  echo "$(now_ms),start" > "${run_dir}/events.csv"
+  reserve_uac_port
+  SIPP_CMD="cd /out && sipp -sf /scenarios/uac_load.xml -s 6000 kamailio-real:5060 -m ${total_calls} -r ${FAILOVER_RATE} -l ${FAILOVER_MAX_CONCURRENT} -d ${FAILOVER_CALL_MS} -trace_stat -stf /out/load.stat.csv -fd 1 -trace_rtt -rtt_freq 1 -trace_err" \
+    sipp_uac "${run_dir}/load.uac.log" -v "${run_dir}/load:/out" &
+  load_pid=$!
+
+  sleep "$FAILOVER_WARMUP_SECONDS"
+  echo "$(now_ms),down" >> "${run_dir}/events.csv"
+  take_down_new_backend || { wait "$load_pid" || true; return 1; }
+
+  wait "$load_pid" || load_rc=$?
+  echo "$(now_ms),end" >> "${run_dir}/events.csv"
+  # SIPp exits 1 when some calls failed, which is expected here.
+  if (( load_rc != 0 && load_rc != 1 )); then
+    tail -n 40 "${run_dir}/load.uac.log" >&2 || true
+    echo "SIPp load failed to run (exit ${load_rc})" >&2
+    return 1
+  fi
+
+  kam_ctl call dispatcher.list > "${run_dir}/dispatcher-after.json" 2>&1 || true
+  env ${DOCKER_PATH} docker logs --since "$since" "$KAM_CONTAINER" > "${run_dir}/kamailio.log" 2>&1 || true
+  restore_new_backend || return
+
+  python3 "${SCRIPTS_DIR}/failover_report.py" analyze "$run_dir" \
+    --interval "$interval" \
+    --mode "$FAILOVER_MODE" \
+    --down-dst "$DOWN_DST" \
+    --output "${run_dir}/failover.json"
+}
+
+intervals=(${FAILOVER_INTERVALS//,/ })
+if (( ${#intervals[@]} == 0 )); then
+  echo "FAILOVER_INTERVALS is empty" >&2
+  exit 1
+fi
+
+echo "[1/3] Starting Kamailio (failover config) and SIPp backends..."
+dc up -d sipp-uas-old sipp-uas-new
+wait_for_uas
+
+echo "[2/3] Failover runs (${FAILOVER_MODE}, probe intervals: ${intervals[*]}s, branch timeout ${FR_TIMER_MS} ms)..."
+failed=0
+results=()
+for interval in "${intervals[@]}"; do
+  if run_interval "$interval"; then
+    results+=("${ART_DIR}/interval-${interval}/failover.json")
+  else
+    echo "Failover run for interval ${interval}s failed" >&2
+    failed=1
+    if [[ -f "${ART_DIR}/interval-${interval}/failover.json" ]]; then
+      results+=("${ART_DIR}/interval-${interval}/failover.json")
+    fi
+  fi
+done
+
+echo "[3/3] Report..."
+if (( ${#results[@]} > 0 )); then
+  python3 "${SCRIPTS_DIR}/failover_report.py" summary "${results[@]}" \
+    --label "$FAILOVER_LABEL" \
+    --output "${ART_DIR}/failover-report.json" | tee "${ART_DIR}/failover-report.txt"
+fi
+if [[ -n "$FAILOVER_BASELINE" && -f "${ART_DIR}/failover-report.json" ]]; then
+  python3 "${SCRIPTS_DIR}/failover_report.py" compare "$FAILOVER_BASELINE" "${ART_DIR}/failover-report.json" \
+    --max-regression "$FAILOVER_MAX_REGRESSION" \
+    --min-delta-ms "$FAILOVER_MIN_DELTA_MS" \
+    --min-delta-calls "$FAILOVER_MIN_DELTA_CALLS" 2>&1 | tee "${ART_DIR}/failover-compare.txt" || failed=1
+fi
+
+echo "Artifacts: ${ART_DIR}"
+echo "Stop with: env ${DOCKER_PATH} docker compose${COMPOSE_PROJECT:+ -p ${COMPOSE_PROJECT}} -f ${COMPOSE_BASE} -f ${COMPOSE_CALLS} -f ${COMPOSE_FAILOVER} down -v"
+if (( failed )); then
+  echo "Failover benchmark FAILED" >&2
+  exit 1
+fi
+echo "Failover benchmark succeeded."
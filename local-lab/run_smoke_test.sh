@@ -42,10 +42,10 @@ chmod +x "${FAKE_HELPER_DIR}/docker-credential-desktop"
 
 DOCKER_PATH="PATH=${FAKE_HELPER_DIR}:/opt/homebrew/bin:/usr/bin:/bin:/usr/sbin:/sbin"
 
-echo "[1/5] Building and starting lab containers..."
+echo "[1/6] Building and starting lab containers..."
 env ${DOCKER_PATH} docker compose -f "${LAB_DIR}/docker-compose.yml" up -d --build
 
-echo "[2/5] Waiting for SSH services..."
+echo "[2/6] Waiting for SSH services..."
 for port in 2221 2222 2223; do
   n=0
   until nc -z 127.0.0.1 "$port" >/dev/null 2>&1; do
@@ -58,28 +58,53 @@ for port in 2221 2222 2223; do
   done
 done
 
-echo "[3/5] Running orchestration smoke test..."
-"${SCRIPTS_DIR}/orchestrate_migration_over_ssh.sh" \
-  --mode both \
-  --kamailio-host 127.0.0.1 \
-  --kamailio-user root \
-  --kamailio-ssh-port 2221 \
-  --old-pbx-ip old-pbx.local \
-  --new-pbx-ip new-pbx.local \
-  --old-pbx-host 127.0.0.1 \
-  --old-pbx-user root \
-  --old-pbx-ssh-port 2222 \
-  --new-pbx-host 127.0.0.1 \
-  --new-pbx-user root \
-  --new-pbx-ssh-port 2223 \
-  --ssh-key "${KEY_FILE}" \
-  --capture-snapshots \
-  --confirm \
-  --local-artifacts-dir "${LAB_DIR}/artifacts"
+run_orchestrator() {
+  "${SCRIPTS_DIR}/orchestrate_migration_over_ssh.sh" \
+    --mode both \
+    --kamailio-host 127.0.0.1 \
+    --kamailio-user root \
+    --kamailio-ssh-port 2221 \
+    --old-pbx-ip old-pbx.local \
+    --new-pbx-ip new-pbx.local \
+    --old-pbx-host 127.0.0.1 \
+    --old-pbx-user root \
+    --old-pbx-ssh-port 2222 \
+    --new-pbx-host 127.0.0.1 \
+    --new-pbx-user root \
+    --new-pbx-ssh-port 2223 \
+    --ssh-key "${KEY_FILE}" \
+    --capture-snapshots \
+    --ctl-socket unix:/run/kamailio/kamailio_ctl \
+    --readiness-gate \
+    --readiness-target new-pbx:5060 \
+    --readiness-burst 20 \
+    --readiness-rate 20 \
+    --readiness-invite-user 1000 \
+    --readiness-min-registrations 1 \
+    --auto-rollback \
+    --watchdog 6 \
+    --watchdog-interval 2 \
+    --confirm \
+    --local-artifacts-dir "${LAB_DIR}/artifacts" \
+    "$@"
+}
 
-echo "[4/5] Verifying dispatcher file in kamailio..."
+echo "[3/6] Running orchestration baseline without SSH multiplexing..."
+BASELINE_LOG="$(mktemp)"
+run_orchestrator --no-ssh-mux | tee "$BASELINE_LOG"
+
+echo "[4/6] Running orchestration smoke test..."
+MUX_LOG="$(mktemp)"
+run_orchestrator | tee "$MUX_LOG"
+
+echo "SSH handshake comparison:"
+echo "  before: $(grep '^SSH sessions:' "$BASELINE_LOG" | tail -n 1)"
+echo "  after:  $(grep '^SSH sessions:' "$MUX_LOG" | tail -n 1)"
+rm -f "$BASELINE_LOG" "$MUX_LOG"
+
+echo "[5/6] Verifying dispatcher file in kamailio..."
 env ${DOCKER_PATH} docker compose -f "${LAB_DIR}/docker-compose.yml" exec -T kamailio cat /etc/kamailio/dispatcher.list
 
-echo "[5/5] Smoke test complete."
+echo "[6/6] Smoke test complete."
 echo "Artifacts: ${LAB_DIR}/artifacts"
 echo "To stop lab: env ${DOCKER_PATH} docker compose -f ${LAB_DIR}/docker-compose.yml down -v"
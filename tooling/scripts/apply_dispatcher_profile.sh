@@ -5,12 +5,43 @@ usage() {
   cat <<'USAGE'
 Usage:
   apply_dispatcher_profile.sh --profile FILE [--target /etc/kamailio/dispatcher.list] [--reload-cmd 'kamcmd dispatcher.reload']
+                             [--sha256 HEX] [--keep-pin]
+                             [--ctl-socket unix:/run/kamailio/kamailio_ctl] [--ctl-ready-timeout SEC]
+  apply_dispatcher_profile.sh --stage-only --profile FILE [--target ...] [--sha256 HEX] [--keep-pin]
+  apply_dispatcher_profile.sh --commit [--commit-at EPOCH_MS] [--target ...] [--sha256 HEX] [--reload-cmd ... | --ctl-socket ...]
+  apply_dispatcher_profile.sh --rollback [--target ...] [--reload-cmd ... | --ctl-socket ...]
 
 Description:
   Backs up existing dispatcher file, applies a generated profile, and reloads dispatcher.
 
+  The profile is staged next to the target and renamed into place, so a reload
+  never reads a half-written file. --sha256 is checked against the uploaded
+  profile before staging and against the target after the rename.
+
+  Before replacing the target, the current file is pinned as TARGET.pinned
+  (with TARGET.pinned.sha256). --keep-pin leaves an existing pin untouched, so a
+  sequence of applies (ramp steps) keeps the state from before the first one.
+  --rollback verifies the pin and renames it back over the target, then reloads:
+  no upload and a single remote command.
+
+  With --ctl-socket the reload goes straight to Kamailio's ctl (BINRPC) socket via
+  kamailio_ctl.py (next to this script) instead of running --reload-cmd: it waits
+  for the socket to answer, runs dispatcher.reload and dispatcher.list in one
+  session, prints the reload latency, and fails if the in-memory sets do not
+  match the applied file.
+
+  --stage-only does everything up to the rename (pin, backup, checksum) and
+  leaves the profile as TARGET.staged; --commit later renames it into place and
+  reloads. Splitting the two lets a coordinator stage on several Kamailio nodes
+  first and then switch them together: --commit-at waits until that wall-clock
+  instant (epoch milliseconds) before the rename. A commit prints when the
+  rename and the reload finished ("... at epoch ms: N") so the coordinator can
+  report the skew between nodes.
+
 Example:
   sudo apply_dispatcher_profile.sh --profile ./dispatcher.profile.new.list --target /etc/kamailio/dispatcher.list
+  sudo apply_dispatcher_profile.sh --profile ./dispatcher.profile.new.list --ctl-socket unix:/run/kamailio/kamailio_ctl
+  sudo apply_dispatcher_profile.sh --rollback --target /etc/kamailio/dispatcher.list
 USAGE
 }
 
@@ -18,6 +49,15 @@ PROFILE=""
 TARGET="/etc/kamailio/dispatcher.list"
 RELOAD_CMD="kamcmd dispatcher.reload"
 BACKUP_DIR="/var/backups/kamailio-dispatcher"
+CTL_SOCKET=""
+CTL_READY_TIMEOUT="10"
+EXPECTED_SHA256=""
+KEEP_PIN="false"
+ROLLBACK="false"
+STAGE_ONLY="false"
+COMMIT="false"
+COMMIT_AT=""
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -25,11 +65,123 @@ while [[ $# -gt 0 ]]; do
     --target) TARGET="${2:-}"; shift 2 ;;
     --reload-cmd) RELOAD_CMD="${2:-}"; shift 2 ;;
     --backup-dir) BACKUP_DIR="${2:-}"; shift 2 ;;
+    --ctl-socket) CTL_SOCKET="${2:-}"; shift 2 ;;
+    --ctl-ready-timeout) CTL_READY_TIMEOUT="${2:-}"; shift 2 ;;
+    --sha256) EXPECTED_SHA256="${2:-}"; shift 2 ;;
+    --keep-pin) KEEP_PIN="true"; shift ;;
+    --rollback) ROLLBACK="true"; shift ;;
+    --stage-only) STAGE_ONLY="true"; shift ;;
+    --commit) COMMIT="true"; shift ;;
+    --commit-at) COMMIT_AT="${2:-}"; shift 2 ;;
     --help|-h) usage; exit 0 ;;
     *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
   esac
 done
 
+PIN="${TARGET}.pinned"
+STAGED="${TARGET}.staged"
+
+if [[ "$ROLLBACK$STAGE_ONLY$COMMIT" == *true*true* ]]; then
+  echo "--rollback, --stage-only and --commit are mutually exclusive" >&2
+  exit 1
+fi
+if [[ -n "$COMMIT_AT" && ! "$COMMIT_AT" =~ ^[0-9]+$ ]]; then
+  echo "--commit-at must be epoch milliseconds" >&2
+  exit 1
+fi
+
+sha256_of() {
+  if command -v sha256sum >/dev/null 2>&1; then
+    sha256sum "$1" | awk '{print $1}'
+  else
+    shasum -a 256 "$1" | awk '{print $1}'
+  fi
+}
+
+# now_ms is trace_events.sh's, repeated because this script runs on its own
+# on Kamailio hosts. Stock bash 4 (RHEL/CentOS 7) has no EPOCHREALTIME, and
+# whole seconds would make --commit-at up to 999 ms late, so ask python3.
+now_ms() {
+  if [[ -n "${EPOCHREALTIME:-}" ]]; then
+    local us="${EPOCHREALTIME/[.,]/}"
+    echo $(( us / 1000 ))
+  elif command -v python3 >/dev/null 2>&1; then
+    python3 -c 'import time; print(int(time.time() * 1000))'
+  else
+    echo $(( $(date +%s) * 1000 ))
+  fi
+}
+
+# reload_dispatcher prints "Reload completed in N ms"; the orchestrator turns
+# that line into the run trace's reload span.
+reload_dispatcher() {
+  local started
+  started="$(now_ms)"
+  if [[ -n "$CTL_SOCKET" ]]; then
+    python3 "${SCRIPT_DIR}/kamailio_ctl.py" --socket "$CTL_SOCKET" --ready-timeout "$CTL_READY_TIMEOUT" \
+      reload-verify --list-file "$TARGET"
+    echo "Dispatcher reloaded via ctl socket: $CTL_SOCKET"
+  else
+    bash -lc "$RELOAD_CMD"
+    echo "Reload command executed: $RELOAD_CMD"
+  fi
+  local finished
+  finished="$(now_ms)"
+  echo "Reload completed in $(( finished - started )) ms"
+  echo "Reload finished at epoch ms: ${finished}"
+}
+
+verify_target() {
+  if [[ -n "$EXPECTED_SHA256" ]]; then
+    if [[ "$(sha256_of "$TARGET")" != "$EXPECTED_SHA256" ]]; then
+      echo "Applied file checksum mismatch: $TARGET" >&2
+      exit 1
+    fi
+    echo "Checksum verified: sha256=${EXPECTED_SHA256}"
+  fi
+  echo "Applied profile to: $TARGET"
+}
+
+if [[ "$ROLLBACK" == "true" ]]; then
+  if [[ ! -f "$PIN" || ! -f "${PIN}.sha256" ]]; then
+    echo "No pinned profile to roll back to: $PIN" >&2
+    exit 1
+  fi
+  if [[ "$(sha256_of "$PIN")" != "$(cat "${PIN}.sha256")" ]]; then
+    echo "Pinned profile checksum mismatch, refusing rollback: $PIN" >&2
+    exit 1
+  fi
+  mv -f "$PIN" "$TARGET"
+  rm -f "${PIN}.sha256"
+  echo "Rolled back to pinned profile: $TARGET"
+  reload_dispatcher
+  exit 0
+fi
+
+if [[ "$COMMIT" == "true" ]]; then
+  if [[ ! -f "$STAGED" ]]; then
+    echo "No staged profile to commit: $STAGED" >&2
+    exit 1
+  fi
+  if [[ -n "$EXPECTED_SHA256" && "$(sha256_of "$STAGED")" != "$EXPECTED_SHA256" ]]; then
+    echo "Staged profile checksum mismatch: $STAGED" >&2
+    exit 1
+  fi
+  if [[ -n "$COMMIT_AT" ]]; then
+    wait_ms=$(( COMMIT_AT - $(now_ms) ))
+    if (( wait_ms > 0 )); then
+      sleep "$(printf '%d.%03d' $(( wait_ms / 1000 )) $(( wait_ms % 1000 )))"
+    else
+      echo "Commit instant passed $(( -wait_ms )) ms before this node was ready"
+    fi
+  fi
+  mv -f "$STAGED" "$TARGET"
+  echo "Renamed into place at epoch ms: $(now_ms)"
+  verify_target
+  reload_dispatcher
+  exit 0
+fi
+
 if [[ -z "$PROFILE" ]]; then
   usage
   exit 1
@@ -40,6 +192,23 @@ if [[ ! -f "$PROFILE" ]]; then
   exit 1
 fi
 
+# Pin the current file first: whatever fails below, rollback restores exactly
+# the state this apply started from.
+if [[ "$KEEP_PIN" != "true" || ! -f "$PIN" ]]; then
+  rm -f "$PIN" "${PIN}.sha256"
+  if [[ -f "$TARGET" ]]; then
+    cp -p "$TARGET" "${PIN}.tmp.$$"
+    sha256_of "${PIN}.tmp.$$" > "${PIN}.sha256"
+    mv -f "${PIN}.tmp.$$" "$PIN"
+    echo "Pinned previous profile: $PIN"
+  fi
+fi
+
+if [[ -n "$EXPECTED_SHA256" && "$(sha256_of "$PROFILE")" != "$EXPECTED_SHA256" ]]; then
+  echo "Uploaded profile checksum mismatch: $PROFILE" >&2
+  exit 1
+fi
+
 mkdir -p "$BACKUP_DIR"
 TS="$(date +%Y%m%d_%H%M%S)"
 
@@ -48,8 +217,29 @@ if [[ -f "$TARGET" ]]; then
   echo "Backup created: $BACKUP_DIR/dispatcher.list.${TS}.bak"
 fi
 
-cp "$PROFILE" "$TARGET"
-echo "Applied profile to: $TARGET"
+# Stage in the target directory so the rename is atomic (same filesystem).
+# --stage-only keeps the staged file for a later --commit.
+if [[ "$STAGE_ONLY" != "true" ]]; then
+  STAGED="${TARGET}.staged.$$"
+  trap 'rm -f "$STAGED"' EXIT
+fi
+if [[ -f "$TARGET" ]]; then
+  # Start from a copy of the target to keep its mode and ownership.
+  cp -p "$TARGET" "$STAGED"
+  cat "$PROFILE" > "$STAGED"
+else
+  cp "$PROFILE" "$STAGED"
+fi
+
+if [[ "$STAGE_ONLY" == "true" ]]; then
+  if [[ -n "$EXPECTED_SHA256" && "$(sha256_of "$STAGED")" != "$EXPECTED_SHA256" ]]; then
+    echo "Staged profile checksum mismatch: $STAGED" >&2
+    exit 1
+  fi
+  echo "Staged profile: $STAGED"
+  exit 0
+fi
 
-bash -lc "$RELOAD_CMD"
-echo "Reload command executed: $RELOAD_CMD"
+mv -f "$STAGED" "$TARGET"
+verify_target
+reload_dispatcher
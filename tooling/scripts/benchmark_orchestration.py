@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""Orchestration latency benchmark.
+
+``run`` executes the orchestrator (or the wizard's non-interactive fleet path)
+repeatedly, collects each run's ``phase_timings.csv``, and writes a report with
+per-phase percentiles:
+
+    report.json   runs + summary (count/min/p50/p90/p95/p99/max/mean per phase)
+    summary.csv   the summary table
+    runs.csv      one row per run and phase
+
+``compare`` prints the per-phase p50/p95 deltas between two reports and can fail
+on regressions, so a change can be shown to shorten (or not lengthen) the
+cutover window.
+
+Examples:
+  benchmark_orchestration.py run --runs 10 --label baseline -- \\
+      --mode both --kamailio-host 127.0.0.1 ... --confirm
+  benchmark_orchestration.py run --runs 5 --label wizard --wizard-input ./lab-inputs.json
+  benchmark_orchestration.py compare baseline/report.json candidate/report.json --max-regression 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import re
+import shlex
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from report_utils import percentile, print_table
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ORCHESTRATOR = SCRIPT_DIR / "orchestrate_migration_over_ssh.sh"
+WIZARD = SCRIPT_DIR / "orchestrate_migration_wizard.py"
+
+PHASE_ORDER = [
+    "pre_apply",
+    "profile_build",
+    "snapshot_pre_old",
+    "snapshot_pre_new",
+    "precheck_kamailio",
+    "precheck_old",
+    "precheck_new",
+    "readiness",
+    "remote_dir",
+    "upload",
+    "apply",
+    "watchdog",
+    "registrations",
+    "drain",
+    "snapshots_post",
+    "total",
+    "harness_wall",
+]
+PERCENTILES = [50, 90, 95, 99]
+RUN_DIR_RE = re.compile(r"^Run directory: (.+)$", re.MULTILINE)
+
+
+def summarize(runs: list[dict[str, Any]]) -> dict[str, dict[str, float]]:
+    samples: dict[str, list[float]] = {}
+    for run in runs:
+        if run["status"] != "ok":
+            continue
+        for phase, ms in run["phases"].items():
+            samples.setdefault(phase, []).append(ms)
+    summary = {}
+    for phase in sorted(samples, key=phase_sort_key):
+        values = samples[phase]
+        stats = {"count": len(values), "min": min(values), "max": max(values), "mean": sum(values) / len(values)}
+        for pct in PERCENTILES:
+            stats[f"p{pct}"] = percentile(values, pct)
+        summary[phase] = stats
+    return summary
+
+
+def phase_sort_key(phase: str) -> tuple[int, str]:
+    group = "upload" if phase.startswith("upload_") else phase
+    return (PHASE_ORDER.index(group) if group in PHASE_ORDER else len(PHASE_ORDER), phase)
+
+
+def read_phase_timings(run_dir: Path) -> tuple[dict[str, float], str]:
+    phases: dict[str, float] = {}
+    status = "missing"
+    path = run_dir / "phase_timings.csv"
+    if not path.is_file():
+        return phases, status
+    with path.open(encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            phases[row["phase"]] = phases.get(row["phase"], 0.0) + float(row["duration_ms"])
+            if row["phase"] == "total":
+                status = row["status"]
+    return phases, status
+
+
+def build_command(args: argparse.Namespace, out_dir: Path, iteration: int) -> list[str]:
+    if not args.wizard_input:
+        return [str(ORCHESTRATOR), *args.orchestrator_args, "--local-artifacts-dir", str(out_dir / "runs")]
+    cmd = [
+        sys.executable,
+        str(WIZARD),
+        "--fleet",
+        str(Path(args.wizard_input).resolve()),
+        "--max-parallel",
+        "1",
+        "--fleet-log-dir",
+        str(out_dir / f"iter-{iteration:03d}-fleet"),
+    ]
+    if not args.wizard_dry_run:
+        cmd.append("--live")
+    return cmd
+
+
+def find_run_dirs(args: argparse.Namespace, out_dir: Path, iteration: int) -> list[Path]:
+    if args.wizard_input:
+        # The wizard logs every orchestrator invocation on its own; time the
+        # live runs (or the dry-runs with --wizard-dry-run).
+        pattern = "*.dry-run.log" if args.wizard_dry_run else "*.live.log"
+        logs = sorted((out_dir / f"iter-{iteration:03d}-fleet").rglob(pattern))
+    else:
+        logs = [out_dir / f"iter-{iteration:03d}.log"]
+    texts = [p.read_text(encoding="utf-8", errors="replace") for p in logs if p.is_file()]
+    return [Path(m) for text in texts for m in RUN_DIR_RE.findall(text)]
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    wizard = bool(args.wizard_input)
+    if wizard and args.orchestrator_args:
+        print("ERROR: --wizard-input takes its settings from the input file; drop the orchestrator arguments", file=sys.stderr)
+        return 2
+    if not wizard and not args.orchestrator_args:
+        print("ERROR: pass orchestrator arguments after '--', or --wizard-input FILE", file=sys.stderr)
+        return 2
+    label = args.label or ("wizard" if wizard else "orchestrator")
+    out_dir = Path(args.output_dir or f"./artifacts/benchmark/{label}-{datetime.now():%Y%m%d_%H%M%S}").resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    runs: list[dict[str, Any]] = []
+    cmd: list[str] = []
+    for iteration in range(1, args.runs + 1):
+        cmd = build_command(args, out_dir, iteration)
+        log_path = out_dir / f"iter-{iteration:03d}.log"
+        started = time.perf_counter()
+        with log_path.open("w", encoding="utf-8") as log:
+            log.write(f"$ {shlex.join(cmd)}\n\n")
+            log.flush()
+            rc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, check=False).returncode
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        run_dirs = find_run_dirs(args, out_dir, iteration)
+        phases: dict[str, float] = {}
+        statuses = []
+        for run_dir in run_dirs:
+            run_phases, run_status = read_phase_timings(run_dir)
+            statuses.append(run_status)
+            for phase, ms in run_phases.items():
+                phases[phase] = phases.get(phase, 0.0) + ms
+        phases["harness_wall"] = wall_ms
+        if rc != 0:
+            status = "failed"
+        elif not run_dirs or "missing" in statuses:
+            status = "missing"
+        else:
+            status = "ok"
+
+        runs.append({"iteration": iteration, "rc": rc, "status": status, "wall_ms": wall_ms, "run_dirs": [str(d) for d in run_dirs], "phases": phases})
+        total = phases.get("total")
+        total_text = f"{total:.0f} ms" if total is not None else "n/a"
+        print(f"[{label}] run {iteration}/{args.runs}: rc={rc} status={status} total={total_text} wall={wall_ms:.0f} ms", flush=True)
+        if args.pause and iteration < args.runs:
+            time.sleep(args.pause)
+
+    report = {
+        "label": label,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "target": "wizard" if wizard else "orchestrator",
+        "command": cmd,
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+    write_report(report, out_dir)
+    print_summary(report)
+    print(f"\nReport: {out_dir / 'report.json'}")
+    failed = [r for r in runs if r["status"] != "ok"]
+    if failed:
+        print(f"{len(failed)} of {len(runs)} runs failed; they are excluded from the summary.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def write_report(report: dict[str, Any], out_dir: Path) -> None:
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    stat_cols = ["count", "min", *[f"p{p}" for p in PERCENTILES], "max", "mean"]
+    with (out_dir / "summary.csv").open("w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["phase", *[c if c == "count" else f"{c}_ms" for c in stat_cols]])
+        for phase, stats in report["summary"].items():
+            writer.writerow([phase, *[stats[c] if c == "count" else f"{stats[c]:.1f}" for c in stat_cols]])
+    with (out_dir / "runs.csv").open("w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["iteration", "rc", "status", "phase", "duration_ms"])
+        for run in report["runs"]:
+            for phase in sorted(run["phases"], key=phase_sort_key):
+                writer.writerow([run["iteration"], run["rc"], run["status"], phase, f"{run['phases'][phase]:.1f}"])
+
+
+def print_summary(report: dict[str, Any]) -> None:
+    print(f"\nPhase timings: {report['label']} (ms)")
+    rows = [
+        [phase, str(s["count"]), *[f"{s[k]:.0f}" for k in ("min", "p50", "p90", "p95", "p99", "max")]]
+        for phase, s in report["summary"].items()
+    ]
+    print_table(["Phase", "N", "min", "p50", "p90", "p95", "p99", "max"], rows)
+
+
+def load_report(path: str) -> dict[str, Any]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ValueError(f"Cannot read benchmark report {path}: {exc}") from exc
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    try:
+        base = load_report(args.base)
+        new = load_report(args.new)
+    except ValueError as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 2
+
+    def delta(b: float | None, n: float | None) -> tuple[str, str, float | None]:
+        if b is None or n is None:
+            return "-", "-", None
+        pct = (n - b) / b * 100 if b else 0.0
+        return f"{n - b:+.0f}", f"{pct:+.1f}%", pct
+
+    regressions = []
+    rows = []
+    phases = sorted(set(base["summary"]) | set(new["summary"]), key=phase_sort_key)
+    for phase in phases:
+        b = base["summary"].get(phase, {})
+        n = new["summary"].get(phase, {})
+        d50, p50, pct50 = delta(b.get("p50"), n.get("p50"))
+        d95, p95, _ = delta(b.get("p95"), n.get("p95"))
+        rows.append([phase, fmt(b.get("p50")), fmt(n.get("p50")), d50, p50, fmt(b.get("p95")), fmt(n.get("p95")), d95, p95])
+        if (
+            args.max_regression is not None
+            and pct50 is not None
+            and pct50 > args.max_regression
+            and n["p50"] - b["p50"] > args.min_delta_ms
+        ):
+            regressions.append(f"{phase}: p50 {b['p50']:.0f} -> {n['p50']:.0f} ms ({pct50:+.1f}%)")
+
+    print(f"Benchmark comparison: {base['label']} -> {new['label']} (ms)")
+    print_table(["Phase", "base p50", "new p50", "delta", "delta %", "base p95", "new p95", "delta", "delta %"], rows)
+    if regressions:
+        print(f"\nRegressions over {args.max_regression:g}% (and {args.min_delta_ms:g} ms):", file=sys.stderr)
+        for line in regressions:
+            print(f"- {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark orchestration latency per phase.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Run the orchestrator (or wizard) repeatedly and write a percentile report.")
+    run_p.add_argument("--runs", type=int, default=5, help="Number of runs. Default: 5")
+    run_p.add_argument("--label", help="Report label. Default: orchestrator or wizard")
+    run_p.add_argument("--output-dir", help="Report directory. Default: ./artifacts/benchmark/<label>-<ts>")
+    run_p.add_argument("--pause", type=float, default=0, help="Seconds to wait between runs. Default: 0")
+    run_p.add_argument("--wizard-input", help="Benchmark the wizard's non-interactive fleet path with this input JSON.")
+    run_p.add_argument("--wizard-dry-run", action="store_true", help="With --wizard-input: time dry-runs only (no --live).")
+    run_p.add_argument("orchestrator_args", nargs=argparse.REMAINDER, help="Orchestrator arguments after '--'.")
+    run_p.set_defaults(func=cmd_run)
+
+    cmp_p = sub.add_parser("compare", help="Compare two benchmark reports.")
+    cmp_p.add_argument("base", help="Baseline report.json")
+    cmp_p.add_argument("new", help="Candidate report.json")
+    cmp_p.add_argument("--max-regression", type=float, help="Exit 1 if any phase p50 grows by more than PCT percent.")
+    cmp_p.add_argument("--min-delta-ms", type=float, default=10, help="Ignore p50 growth below this many ms. Default: 10")
+    cmp_p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.orchestrator_args[:1] == ["--"]:
+            args.orchestrator_args = args.orchestrator_args[1:]
+        if args.runs < 1:
+            parser.error("--runs must be >= 1")
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
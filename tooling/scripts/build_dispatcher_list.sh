@@ -4,12 +4,24 @@ set -euo pipefail
 usage() {
   cat <<'USAGE'
 Usage:
-  build_dispatcher_list.sh --mode old|both|new --old SIP_URI --new SIP_URI --output FILE [--set-id N]
+  build_dispatcher_list.sh --mode old|both|new|ramp --old SIP_URI --new SIP_URI --output FILE [--set-id N] [--new-weight PCT]
+
+Single old/new backend wrapper around dispatcher_profiles.py. Use that script
+directly for several backends per side, several set IDs, or per-destination
+flags/priority/attrs (--spec), or to emit several profiles in one call (--emit).
+
+Modes:
+  old, both, new  Unweighted entries (0 0 flags/priority).
+  ramp            Weighted canary: new-pbx gets --new-weight percent (1-100) and
+                  old-pbx the remainder via the dispatcher "weight" attribute.
+                  Weights only take effect with ds_select_dst algorithm 9
+                  (weight based); 100 writes a new-only list.
 
 Examples:
   build_dispatcher_list.sh --mode old  --old sip:198.51.100.10:5060 --new sip:198.51.100.20:5060 --output ./dispatcher.profile.old.list
   build_dispatcher_list.sh --mode both --old sip:198.51.100.10:5060 --new sip:198.51.100.20:5060 --output ./dispatcher.profile.both.list
   build_dispatcher_list.sh --mode new  --old sip:198.51.100.10:5060 --new sip:198.51.100.20:5060 --output ./dispatcher.profile.new.list
+  build_dispatcher_list.sh --mode ramp --new-weight 25 --old sip:198.51.100.10:5060 --new sip:198.51.100.20:5060 --output ./dispatcher.profile.ramp-025.list
 USAGE
 }
 
@@ -18,6 +30,7 @@ OLD_URI=""
 NEW_URI=""
 OUTPUT=""
 SET_ID="1"
+NEW_WEIGHT=""
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -26,6 +39,7 @@ while [[ $# -gt 0 ]]; do
     --new) NEW_URI="${2:-}"; shift 2 ;;
     --output) OUTPUT="${2:-}"; shift 2 ;;
     --set-id) SET_ID="${2:-}"; shift 2 ;;
+    --new-weight) NEW_WEIGHT="${2:-}"; shift 2 ;;
     --help|-h) usage; exit 0 ;;
     *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
   esac
@@ -36,39 +50,12 @@ if [[ -z "$MODE" || -z "$OLD_URI" || -z "$NEW_URI" || -z "$OUTPUT" ]]; then
   exit 1
 fi
 
-if [[ "$MODE" != "old" && "$MODE" != "both" && "$MODE" != "new" ]]; then
-  echo "--mode must be one of: old, both, new" >&2
-  exit 1
-fi
-
-if [[ "$OLD_URI" != sip:* && "$OLD_URI" != sips:* ]]; then
-  echo "--old must be SIP URI (sip:... or sips:...)" >&2
-  exit 1
-fi
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
-if [[ "$NEW_URI" != sip:* && "$NEW_URI" != sips:* ]]; then
-  echo "--new must be SIP URI (sip:... or sips:...)" >&2
-  exit 1
+# Generation (validation, per-mode entries, ramp weights) lives in
+# dispatcher_profiles.py; this wrapper keeps the single-backend CLI.
+gen_args=(--mode "$MODE" --old "$OLD_URI" --new "$NEW_URI" --set-id "$SET_ID" --output "$OUTPUT")
+if [[ -n "$NEW_WEIGHT" ]]; then
+  gen_args+=(--new-weight "$NEW_WEIGHT")
 fi
-
-mkdir -p "$(dirname "$OUTPUT")"
-
-{
-  echo "# Generated by build_dispatcher_list.sh on $(date -u +'%Y-%m-%dT%H:%M:%SZ')"
-  echo "# Mode: ${MODE}"
-  echo "# Format: setid destination flags priority attrs"
-  case "$MODE" in
-    old)
-      echo "${SET_ID} ${OLD_URI} 0 0 old-pbx"
-      ;;
-    both)
-      echo "${SET_ID} ${OLD_URI} 0 0 old-pbx"
-      echo "${SET_ID} ${NEW_URI} 0 0 new-pbx"
-      ;;
-    new)
-      echo "${SET_ID} ${NEW_URI} 0 0 new-pbx"
-      ;;
-  esac
-} > "$OUTPUT"
-
-echo "Dispatcher profile written: $OUTPUT"
+exec python3 "${SCRIPT_DIR}/dispatcher_profiles.py" "${gen_args[@]}"
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""Columnar index of Kamailio CUTOVER_DST routing lines.
+
+kamailio.cfg logs one line per relayed request (onsend_route):
+
+    CUTOVER_DST ts=<sec.usec> method=<m> ci=<Call-ID> dst=<ip:port> du=<du> ruri=<ru>
+
+``index`` streams any number of logs (plain, .gz, or ``-`` for stdin, e.g.
+``docker logs real-kamailio 2>&1``) in one pass and appends the matching
+lines to a store directory with one fixed-width binary column per field:
+
+    ts.i64     microseconds since the epoch
+    method.u8  code into meta.json "methods"
+    dst.u16    code into meta.json "destinations"
+    cid.u64    64-bit BLAKE2b hash of the Call-ID
+    callids.txt  "<hash hex> <Call-ID>" for INVITE rows, to name calls in reports
+
+Memory stays flat regardless of log size; ~19 bytes per request on disk.
+Lines without ``ts=`` (older configs) take the timestamp from a leading
+RFC 3339 stamp (``docker logs -t``) or syslog stamp (``--year``); ``dst``
+falls back to ``du`` and then the R-URI host:port.
+
+Queries:
+
+    info STORE                      rows, time range, per-method/destination counts
+    split STORE --at TS|--events F  destination split per second around a change
+    moved STORE [--fail-on-moved]   calls whose requests changed destination
+
+``moved`` groups rows by Call-ID hash in ``--partitions`` passes over the
+columns, so memory is bounded by calls per partition, not by log size.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+
+from report_utils import print_table
+
+STORE_VERSION = 1
+MARKER = b"CUTOVER_DST "
+# column name -> (file name, array typecode)
+COLUMNS = {
+    "ts": ("ts.i64", "q"),
+    "method": ("method.u8", "B"),
+    "dst": ("dst.u16", "H"),
+    "cid": ("cid.u64", "Q"),
+}
+WRITE_ROWS = 1 << 16
+READ_ROWS = 1 << 20
+ROWS_PER_PARTITION = 5_000_000
+
+FIELD_RE = re.compile(rb"(\w+)=(\S*)")
+RFC3339_RE = re.compile(rb"^(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?\s")
+SYSLOG_RE = re.compile(rb"^([A-Z][a-z]{2}\s+\d{1,2} \d{2}:\d{2}:\d{2})\s")
+URI_HOSTPORT_RE = re.compile(r"^(?:sips?:)?(?:[^@;>]*@)?(\[[^\]]+\]|[^:;>]+)(?::(\d+))?")
+
+
+def call_hash(call_id: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(call_id, digest_size=8).digest(), "little")
+
+
+def hostport(uri: str) -> str:
+    match = URI_HOSTPORT_RE.match(uri)
+    if not match:
+        return uri
+    return f"{match.group(1)}:{match.group(2) or '5060'}"
+
+
+def parse_ts(fields: dict[bytes, bytes], line: bytes, year: int) -> int | None:
+    """Microseconds since the epoch, or None when the line carries no time."""
+    raw = fields.get(b"ts")
+    if raw:
+        sec, _, frac = raw.partition(b".")
+        if sec.isdigit() and (not frac or frac.isdigit()):
+            return int(sec) * 1_000_000 + int((frac + b"000000")[:6])
+    match = RFC3339_RE.match(line)
+    if match:
+        date, clock, frac, zone = (g.decode() if g else "" for g in match.groups())
+        zone = "+00:00" if zone in ("", "Z") else zone
+        parsed = datetime.fromisoformat(f"{date}T{clock}{zone}")
+        return int(parsed.timestamp()) * 1_000_000 + int((frac + "000000")[:6])
+    match = SYSLOG_RE.match(line)
+    if match:
+        stamp = " ".join(match.group(1).decode().split())
+        parsed = datetime.strptime(f"{year} {stamp}", "%Y %b %d %H:%M:%S").replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp()) * 1_000_000
+    return None
+
+
+def destination(fields: dict[bytes, bytes]) -> str:
+    for key in (b"dst", b"du", b"ruri"):
+        value = fields.get(key, b"").decode(errors="replace")
+        if value and value not in ("<null>", ":") and not value.startswith("<null>"):
+            return value if key == b"dst" else hostport(value)
+    return "-"
+
+
+def parse_time_arg(value: str) -> float:
+    """Epoch seconds, or an ISO 8601 timestamp (UTC when no zone is given)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def iso(us: int) -> str:
+    return datetime.fromtimestamp(us / 1_000_000, tz=timezone.utc).isoformat(timespec="milliseconds")
+
+
+class StoreWriter:
+    """Appends rows to a store directory; meta.json is rewritten on close."""
+
+    def __init__(self, path: Path, append: bool) -> None:
+        self.path = path
+        path.mkdir(parents=True, exist_ok=True)
+        meta_path = path / "meta.json"
+        if meta_path.exists() and not append:
+            raise ValueError(f"{path} already holds a store; pass --append or choose a new directory")
+        self.meta: dict[str, Any] = {
+            "version": STORE_VERSION,
+            "byteorder": sys.byteorder,
+            "rows": 0,
+            "methods": [],
+            "destinations": [],
+            "first_ts_us": None,
+            "last_ts_us": None,
+            "sources": [],
+        }
+        if meta_path.exists():
+            self.meta = Store(path).meta
+            if self.meta["byteorder"] != sys.byteorder:
+                raise ValueError(f"{path} was written with {self.meta['byteorder']}-endian columns; index into a new store")
+        self.methods = {name: code for code, name in enumerate(self.meta["methods"])}
+        self.dsts = {name: code for code, name in enumerate(self.meta["destinations"])}
+        self.buffers = {name: array(code) for name, (_, code) in COLUMNS.items()}
+        self.files = {name: (path / fname).open("ab") for name, (fname, _) in COLUMNS.items()}
+        self.callids = (path / "callids.txt").open("ab")
+
+    def add(self, ts_us: int, method: str, dst: str, call_id: bytes) -> None:
+        method_code = self.methods.get(method)
+        if method_code is None:
+            if len(self.methods) >= 256:
+                raise ValueError("more than 256 distinct methods; is this a CUTOVER_DST log?")
+            method_code = self.methods[method] = len(self.methods)
+            self.meta["methods"].append(method)
+        dst_code = self.dsts.get(dst)
+        if dst_code is None:
+            if len(self.dsts) >= 65536:
+                raise ValueError("more than 65536 distinct destinations")
+            dst_code = self.dsts[dst] = len(self.dsts)
+            self.meta["destinations"].append(dst)
+        cid = call_hash(call_id)
+        if method == "INVITE":
+            self.callids.write(b"%016x %s\n" % (cid, call_id))
+        self.buffers["ts"].append(ts_us)
+        self.buffers["method"].append(method_code)
+        self.buffers["dst"].append(dst_code)
+        self.buffers["cid"].append(cid)
+        first, last = self.meta["first_ts_us"], self.meta["last_ts_us"]
+        self.meta["first_ts_us"] = ts_us if first is None else min(first, ts_us)
+        self.meta["last_ts_us"] = ts_us if last is None else max(last, ts_us)
+        self.meta["rows"] += 1
+        if len(self.buffers["ts"]) >= WRITE_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        for name, buf in self.buffers.items():
+            buf.tofile(self.files[name])
+            del buf[:]
+
+    def close(self) -> None:
+        self.flush()
+        for fh in self.files.values():
+            fh.close()
+        self.callids.close()
+        tmp = self.path / ".meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta, indent=2) + "\n", encoding="utf-8")
+        os.replace(tmp, self.path / "meta.json")
+
+
+class Store:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            raise ValueError(f"{path} is not an index store (no meta.json)")
+        self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"{path}: unsupported store version {self.meta.get('version')}")
+        self.rows = int(self.meta["rows"])
+        self.swap = self.meta["byteorder"] != sys.byteorder
+
+    def chunks(self, names: list[str]) -> Iterator[dict[str, array]]:
+        """Yields aligned column slices of up to READ_ROWS rows."""
+        files = {name: (self.path / COLUMNS[name][0]).open("rb") for name in names}
+        try:
+            remaining = self.rows
+            while remaining > 0:
+                take = min(READ_ROWS, remaining)
+                chunk = {}
+                for name, fh in files.items():
+                    col = array(COLUMNS[name][1])
+                    col.fromfile(fh, take)
+                    if self.swap:
+                        col.byteswap()
+                    chunk[name] = col
+                remaining -= take
+                yield chunk
+        finally:
+            for fh in files.values():
+                fh.close()
+
+    def call_ids(self, hashes: set[int]) -> dict[int, str]:
+        found: dict[int, str] = {}
+        if not hashes:
+            return found
+        with (self.path / "callids.txt").open("rb") as fh:
+            for line in fh:
+                key, _, call_id = line.rstrip(b"\n").partition(b" ")
+                cid = int(key, 16)
+                if cid in hashes and cid not in found:
+                    found[cid] = call_id.decode(errors="replace")
+                    if len(found) == len(hashes):
+                        break
+        return found
+
+
+def open_log(name: str) -> BinaryIO:
+    if name == "-":
+        return sys.stdin.buffer
+    if name.endswith(".gz"):
+        return gzip.open(name, "rb")
+    return open(name, "rb")
+
+
+def cmd_index(args: argparse.Namespace) -> int:
+    writer = StoreWriter(Path(args.store), args.append)
+    scanned = matched = untimed = malformed = 0
+    try:
+        for name in args.logs:
+            fh = open_log(name)
+            try:
+                for line in fh:
+                    scanned += 1
+                    idx = line.find(MARKER)
+                    if idx < 0:
+                        continue
+                    fields = dict(FIELD_RE.findall(line, idx + len(MARKER)))
+                    method, call_id = fields.get(b"method"), fields.get(b"ci")
+                    if not method or not call_id:
+                        malformed += 1
+                        continue
+                    ts_us = parse_ts(fields, line, args.year)
+                    if ts_us is None:
+                        untimed += 1
+                        continue
+                    writer.add(ts_us, method.decode(errors="replace"), destination(fields), call_id)
+                    matched += 1
+            finally:
+                if fh is not sys.stdin.buffer:
+                    fh.close()
+            writer.meta["sources"].append(name)
+    finally:
+        writer.close()
+    print(f"Indexed {matched} CUTOVER_DST rows from {scanned} lines into {args.store} ({writer.meta['rows']} rows total)")
+    if untimed or malformed:
+        print(f"WARNING: skipped {untimed} lines without a timestamp and {malformed} malformed lines", file=sys.stderr)
+    return 0
+
+
+def cmd_info(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    meta = store.meta
+    methods = [0] * len(meta["methods"])
+    dsts = [0] * len(meta["destinations"])
+    for chunk in store.chunks(["method", "dst"]):
+        for code in chunk["method"]:
+            methods[code] += 1
+        for code in chunk["dst"]:
+            dsts[code] += 1
+    print(f"Store: {store.path} ({store.rows} rows)")
+    if store.rows:
+        print(f"Time range: {iso(meta['first_ts_us'])} .. {iso(meta['last_ts_us'])}")
+    print_table(["method", "rows"], [[name, methods[code]] for code, name in enumerate(meta["methods"])])
+    print_table(["destination", "rows"], [[name, dsts[code]] for code, name in enumerate(meta["destinations"])])
+    return 0
+
+
+def read_anchors(args: argparse.Namespace) -> list[tuple[str, float]]:
+    anchors = [(value, parse_time_arg(value)) for value in args.at]
+    if args.events:
+        with open(args.events, encoding="utf-8") as fh:
+            for line in fh:
+                stamp, _, label = line.strip().partition(",")
+                if stamp.isdigit() and label != "end":
+                    anchors.append((label, int(stamp) / 1000.0))
+    return anchors
+
+
+def cmd_split(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    dst_names = store.meta["destinations"]
+    anchors = read_anchors(args)
+    if not anchors:
+        if not store.rows:
+            raise ValueError("store is empty")
+        anchors = [("start", store.meta["first_ts_us"] / 1_000_000)]
+        windows = [(store.meta["first_ts_us"], store.meta["last_ts_us"] + 1)]
+    else:
+        windows = [(int((t - args.before) * 1_000_000), int((t + args.after) * 1_000_000)) for _, t in anchors]
+    methods = {code for code, name in enumerate(store.meta["methods"]) if not args.method or name in args.method}
+    bucket_us = int(args.bucket * 1_000_000)
+    counts: list[dict[tuple[int, int], int]] = [{} for _ in anchors]
+
+    for chunk in store.chunks(["ts", "method", "dst"]):
+        ts_col, method_col, dst_col = chunk["ts"], chunk["method"], chunk["dst"]
+        for i, ts in enumerate(ts_col):
+            if method_col[i] not in methods:
+                continue
+            for w, (lo, hi) in enumerate(windows):
+                if lo <= ts < hi:
+                    anchor_us = int(anchors[w][1] * 1_000_000)
+                    key = ((ts - anchor_us) // bucket_us, dst_col[i])
+                    counts[w][key] = counts[w].get(key, 0) + 1
+
+    report = []
+    for (label, at), window_counts in zip(anchors, counts):
+        used = sorted({dst for _, dst in window_counts})
+        buckets = sorted({b for b, _ in window_counts})
+        rows = []
+        for b in buckets:
+            per_dst = [window_counts.get((b, dst), 0) for dst in used]
+            total = sum(per_dst)
+            rows.append({"offset_s": b * args.bucket, "total": total, "by_destination": {dst_names[d]: n for d, n in zip(used, per_dst)}})
+        report.append({"anchor": label, "at": at, "buckets": rows})
+        print(f"Destination split around {label} ({datetime.fromtimestamp(at, tz=timezone.utc).isoformat(timespec='milliseconds')}), {args.bucket:g}s buckets")
+        if not rows:
+            print("  (no matching requests)")
+            continue
+        print_table(
+            ["offset_s", "total", *[dst_names[d] for d in used]],
+            [
+                [f"{row['offset_s']:+g}", row["total"], *[f"{n} ({100.0 * n / row['total']:.0f}%)" for n in row["by_destination"].values()]]
+                for row in rows
+            ],
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+def cmd_moved(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    dst_names = store.meta["destinations"]
+    method_names = store.meta["methods"]
+    since = int(parse_time_arg(args.since) * 1_000_000) if args.since else None
+    until = int(parse_time_arg(args.until) * 1_000_000) if args.until else None
+    partitions = args.partitions or max(1, math.ceil(store.rows / ROWS_PER_PARTITION))
+
+    calls = 0
+    moved: dict[int, dict[str, Any]] = {}
+    for part in range(partitions):
+        first_dst: dict[int, int] = {}
+        for chunk in store.chunks(["ts", "method", "dst", "cid"]):
+            ts_col, method_col, dst_col, cid_col = chunk["ts"], chunk["method"], chunk["dst"], chunk["cid"]
+            for i, cid in enumerate(cid_col):
+                if cid % partitions != part:
+                    continue
+                ts = ts_col[i]
+                if (since is not None and ts < since) or (until is not None and ts >= until):
+                    continue
+                dst = dst_col[i]
+                seen = first_dst.setdefault(cid, dst)
+                if seen != dst and cid not in moved:
+                    moved[cid] = {
+                        "from": dst_names[seen],
+                        "to": dst_names[dst],
+                        "method": method_names[method_col[i]],
+                        "at": iso(ts),
+                    }
+        calls += len(first_dst)
+
+    names = store.call_ids(set(list(moved)[: args.limit]))
+    print(f"Calls: {calls}; calls whose requests changed destination: {len(moved)} ({partitions} partition pass(es))")
+    if moved:
+        print_table(
+            ["call_id", "from", "to", "first_moved_method", "at"],
+            [[names.get(cid, f"#{cid:016x}"), m["from"], m["to"], m["method"], m["at"]] for cid, m in list(moved.items())[: args.limit]],
+        )
+    if args.output:
+        report = {
+            "calls": calls,
+            "moved": len(moved),
+            "examples": [{"call_id": names.get(cid, f"#{cid:016x}"), **m} for cid, m in list(moved.items())[: args.limit]],
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if moved and args.fail_on_moved:
+        print(f"ERROR: {len(moved)} in-flight dialog(s) changed destination", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Index Kamailio CUTOVER_DST lines into a columnar store and query routing around cutovers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index = sub.add_parser("index", help="Stream logs into a store.")
+    index.add_argument("logs", nargs="+", help="Kamailio logs (.gz ok); '-' reads stdin.")
+    index.add_argument("--store", required=True, help="Store directory.")
+    index.add_argument("--append", action="store_true", help="Add to an existing store.")
+    index.add_argument("--year", type=int, default=datetime.now(timezone.utc).year, help="Year for syslog timestamps. Default: current year")
+
+    info = sub.add_parser("info", help="Row counts and time range.")
+    info.add_argument("store")
+
+    split = sub.add_parser("split", help="Destination split per time bucket around cutover instants.")
+    split.add_argument("store")
+    split.add_argument("--at", action="append", default=[], help="Cutover instant (epoch seconds or ISO 8601); repeatable.")
+    split.add_argument("--events", help="CSV epoch_ms,label of cutover instants (e.g. profile-events.csv).")
+    split.add_argument("--before", type=float, default=10.0, help="Seconds before each instant. Default: 10")
+    split.add_argument("--after", type=float, default=10.0, help="Seconds after each instant. Default: 10")
+    split.add_argument("--bucket", type=float, default=1.0, help="Bucket width in seconds. Default: 1")
+    split.add_argument("--method", action="append", default=[], help="Only this method (repeatable). Default: all")
+    split.add_argument("--output", help="Write the JSON report here.")
+
+    moved = sub.add_parser("moved", help="Calls whose requests went to more than one destination.")
+    moved.add_argument("store")
+    moved.add_argument("--since", help="Only rows at or after this time.")
+    moved.add_argument("--until", help="Only rows before this time.")
+    moved.add_argument("--partitions", type=int, default=0, help=f"Call-ID hash passes. Default: rows / {ROWS_PER_PARTITION}")
+    moved.add_argument("--limit", type=int, default=20, help="Examples to print. Default: 20")
+    moved.add_argument("--fail-on-moved", action="store_true", help="Exit 1 if any call changed destination.")
+    moved.add_argument("--output", help="Write the JSON report here.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    handlers = {"index": cmd_index, "info": cmd_info, "split": cmd_split, "moved": cmd_moved}
+    try:
+        return handlers[args.command](args)
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env bash
+# Dependency-graph step runner.
+#
+# Source this file; do not execute it. Steps are declared with their
+# dependencies and dag_run starts every step whose dependencies have finished,
+# each in a background subshell, so independent steps run concurrently:
+#
+#   dag_reset
+#   dag_step upload_old "precheck_kam" upload_profile old
+#   dag_step apply "upload_old upload_new" apply_profile
+#   dag_run || die "failed steps: ${DAG_FAILED}"
+#
+# A step fails when its command returns non-zero (or calls die/exit). Callers
+# usually run dag_run under || or if, which turns errexit off inside every
+# step, so a step must return non-zero itself on each failing command that
+# matters (cmd || return 1); a bare failing command is ignored. After a
+# failure no new step starts; running steps are waited for and dag_run
+# returns 1 with the failed step names in DAG_FAILED. Steps cannot change the
+# caller's variables; record results in files.
+#
+# Optional hooks, defined by the caller:
+#   dag_on_start NAME                    in the step's subshell, before it runs
+#   dag_on_done NAME START_MS END_MS RC  in the caller, once the step is reaped
+#
+# DAG_JOBS limits concurrent steps (0 = unlimited, 1 = declaration order).
+# Needs now_ms (trace_events.sh).
+
+DAG_JOBS="${DAG_JOBS:-0}"
+DAG_FAILED=""
+DAG_NAMES=()
+DAG_DEPS=()
+DAG_CMDS=()
+DAG_STATE=()
+DAG_PIDS=()
+DAG_STARTED=()
+DAG_DIR=""
+
+dag_reset() {
+  DAG_NAMES=()
+  DAG_DEPS=()
+  DAG_CMDS=()
+  DAG_STATE=()
+  DAG_PIDS=()
+  DAG_STARTED=()
+  DAG_FAILED=""
+}
+
+# dag_step NAME "DEP..." COMMAND [ARG...]
+dag_step() {
+  local name="$1"
+  local deps="$2"
+  shift 2
+  DAG_NAMES+=("$name")
+  DAG_DEPS+=("$deps")
+  DAG_CMDS+=("$(printf '%q ' "$@")")
+  DAG_STATE+=("pending")
+  DAG_PIDS+=("")
+  DAG_STARTED+=("")
+}
+
+dag_index() {
+  local i
+  for i in "${!DAG_NAMES[@]}"; do
+    if [[ "${DAG_NAMES[$i]}" == "$1" ]]; then
+      echo "$i"
+      return 0
+    fi
+  done
+  return 1
+}
+
+# dag_ready I succeeds when every dependency of step I is done.
+dag_ready() {
+  local dep j
+  for dep in ${DAG_DEPS[$1]}; do
+    j="$(dag_index "$dep")" || return 1
+    [[ "${DAG_STATE[$j]}" == "done" ]] || return 1
+  done
+}
+
+dag_launch() {
+  local i="$1"
+  local name="${DAG_NAMES[$i]}"
+  DAG_STARTED[$i]="$(now_ms)"
+  (
+    trap 'echo "$(now_ms)" > "${DAG_DIR}/${name}.end"' EXIT
+    if declare -F dag_on_start >/dev/null; then
+      dag_on_start "$name"
+    fi
+    eval "${DAG_CMDS[$i]}"
+  ) &
+  DAG_PIDS[$i]=$!
+  DAG_STATE[$i]="running"
+}
+
+# dag_reap marks finished steps; returns 1 if one of them failed.
+dag_reap() {
+  local i rc end failed=0
+  for i in "${!DAG_NAMES[@]}"; do
+    [[ "${DAG_STATE[$i]}" == "running" ]] || continue
+    kill -0 "${DAG_PIDS[$i]}" 2>/dev/null && continue
+    rc=0
+    wait "${DAG_PIDS[$i]}" || rc=$?
+    end="$(cat "${DAG_DIR}/${DAG_NAMES[$i]}.end" 2>/dev/null || now_ms)"
+    if (( rc == 0 )); then
+      DAG_STATE[$i]="done"
+    else
+      DAG_STATE[$i]="failed"
+      DAG_FAILED+="${DAG_FAILED:+ }${DAG_NAMES[$i]}"
+      echo "ERROR: step ${DAG_NAMES[$i]} failed (exit ${rc})" >&2
+      failed=1
+    fi
+    if declare -F dag_on_done >/dev/null; then
+      dag_on_done "${DAG_NAMES[$i]}" "${DAG_STARTED[$i]}" "$end" "$rc"
+    fi
+  done
+  return "$failed"
+}
+
+dag_run() {
+  local i dep running stop=0
+  for i in "${!DAG_NAMES[@]}"; do
+    for dep in ${DAG_DEPS[$i]}; do
+      dag_index "$dep" >/dev/null || { echo "ERROR: step ${DAG_NAMES[$i]} depends on unknown step ${dep}" >&2; return 1; }
+    done
+  done
+  DAG_DIR="$(mktemp -d "${TMPDIR:-/tmp}/pbx-dag.XXXXXX")"
+
+  while true; do
+    running=0
+    for i in "${!DAG_NAMES[@]}"; do
+      [[ "${DAG_STATE[$i]}" == "running" ]] && running=$((running + 1))
+    done
+    if (( ! stop )); then
+      for i in "${!DAG_NAMES[@]}"; do
+        (( DAG_JOBS == 0 || running < DAG_JOBS )) || break
+        if [[ "${DAG_STATE[$i]}" == "pending" ]] && dag_ready "$i"; then
+          dag_launch "$i"
+          running=$((running + 1))
+        fi
+      done
+    fi
+    (( running > 0 )) || break
+    # wait -n (bash 4.3+) returns when any step exits; older shells poll.
+    if (( BASH_VERSINFO[0] > 4 || (BASH_VERSINFO[0] == 4 && BASH_VERSINFO[1] >= 3) )); then
+      wait -n || true
+    else
+      sleep 0.1
+    fi
+    dag_reap || stop=1
+  done
+  rm -rf "$DAG_DIR"
+
+  [[ -z "$DAG_FAILED" ]] || return 1
+  for i in "${!DAG_NAMES[@]}"; do
+    if [[ "${DAG_STATE[$i]}" == "pending" ]]; then
+      echo "ERROR: step ${DAG_NAMES[$i]} never became ready (dependency cycle?)" >&2
+      return 1
+    fi
+  done
+}
@@ -4,14 +4,19 @@ set -euo pipefail
 usage() {
   cat <<'USAGE'
 Usage:
-  discovery_snapshot.sh [--host HOST] [--ssh-user USER] [--ssh-port PORT] [--ssh-key PATH] [--label LABEL] [--output-dir DIR]
+  discovery_snapshot.sh [--host HOST] [--ssh-user USER] [--ssh-port PORT] [--ssh-key PATH] [--ssh-control-dir DIR] [--no-ssh-mux] [--trace-file FILE] [--label LABEL] [--output-dir DIR] [--batch]
 
 Description:
   Captures a migration evidence snapshot from local host or remote host over SSH.
+  With --batch, every probe runs in a single remote invocation and the framed
+  output stream is split locally into the same NN_name.txt files.
+  With --trace-file, each SSH exec and the whole capture are appended as spans
+  to the run's JSON-lines trace (see trace_events.sh).
 
 Examples:
   discovery_snapshot.sh --label pre-cutover --output-dir ./artifacts
   discovery_snapshot.sh --host 10.10.10.20 --ssh-user root --ssh-port 2222 --ssh-key ~/.ssh/id_ed25519 --label post-shift --output-dir ./artifacts
+  discovery_snapshot.sh --host 10.10.10.20 --batch --label post-shift --output-dir ./artifacts
 USAGE
 }
 
@@ -19,8 +24,12 @@ HOST=""
 SSH_USER="root"
 SSH_PORT="22"
 SSH_KEY=""
+SSH_CONTROL_DIR=""
+SSH_MUX="true"
+TRACE_FILE_ARG=""
 LABEL="snapshot"
 OUTPUT_DIR="./artifacts"
+BATCH="false"
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -28,8 +37,12 @@ while [[ $# -gt 0 ]]; do
     --ssh-user) SSH_USER="${2:-}"; shift 2 ;;
     --ssh-port) SSH_PORT="${2:-}"; shift 2 ;;
     --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
+    --ssh-control-dir) SSH_CONTROL_DIR="${2:-}"; shift 2 ;;
+    --no-ssh-mux) SSH_MUX="false"; shift ;;
+    --trace-file) TRACE_FILE_ARG="${2:-}"; shift 2 ;;
     --label) LABEL="${2:-}"; shift 2 ;;
     --output-dir) OUTPUT_DIR="${2:-}"; shift 2 ;;
+    --batch) BATCH="true"; shift ;;
     --help|-h) usage; exit 0 ;;
     *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
   esac
@@ -44,14 +57,28 @@ TS="$(date +%Y%m%d_%H%M%S)"
 SNAP_DIR="${OUTPUT_DIR%/}/${LABEL}-${TS}"
 mkdir -p "$SNAP_DIR"
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+# shellcheck source=ssh_mux.sh
+source "${SCRIPT_DIR}/ssh_mux.sh"
+# shellcheck source=trace_events.sh
+source "${SCRIPT_DIR}/trace_events.sh"
+
+trace_init "$TRACE_FILE_ARG" discovery_snapshot
+SNAPSHOT_START_MS="$(now_ms)"
+
+if [[ -n "$HOST" ]]; then
+  ssh_opts=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new)
+  if [[ -n "$SSH_KEY" ]]; then
+    ssh_opts+=(-i "$SSH_KEY")
+  fi
+  ssh_mux_init "$SSH_CONTROL_DIR" "$SSH_MUX" "${ssh_opts[@]}"
+  trap ssh_mux_teardown EXIT
+fi
+
 run_cmd() {
   local cmd="$1"
   if [[ -n "$HOST" ]]; then
-    local ssh_args=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new -p "$SSH_PORT")
-    if [[ -n "$SSH_KEY" ]]; then
-      ssh_args+=(-i "$SSH_KEY")
-    fi
-    ssh "${ssh_args[@]}" "${SSH_USER}@${HOST}" "$cmd"
+    mux_ssh "$SSH_USER" "$HOST" "$SSH_PORT" "$cmd"
   else
     bash -lc "$cmd"
   fi
@@ -65,17 +92,86 @@ capture() {
     echo "$cmd"
     echo
     echo "# Output"
-    run_cmd "$cmd"
+    TRACE_OP="$name" run_cmd "$cmd"
   } > "${SNAP_DIR}/${name}.txt" 2>&1 || true
 }
 
-capture "00_meta" "date -u; hostname; uname -a"
-capture "01_network" "ip -brief addr 2>/dev/null || ifconfig"
-capture "02_sockets" "ss -lntu"
-capture "03_freeswitch_service" "systemctl status freeswitch --no-pager"
-capture "04_sofia_status" "fs_cli -x 'sofia status'"
-capture "05_registrations" "fs_cli -x 'show registrations'"
-capture "06_channels" "fs_cli -x 'show channels'"
-capture "07_channels_count" "fs_cli -x 'show channels count'"
+PROBE_NAMES=(
+  "00_meta"
+  "01_network"
+  "02_sockets"
+  "03_freeswitch_service"
+  "04_sofia_status"
+  "05_registrations"
+  "06_channels"
+  "07_channels_count"
+)
+PROBE_CMDS=(
+  "date -u; hostname; uname -a"
+  "ip -brief addr 2>/dev/null || ifconfig"
+  "ss -lntu"
+  "systemctl status freeswitch --no-pager"
+  "fs_cli -x 'sofia status'"
+  "fs_cli -x 'show registrations'"
+  "fs_cli -x 'show channels'"
+  "fs_cli -x 'show channels count'"
+)
+
+# capture_batch runs every probe in one remote invocation. Each probe's output
+# is preceded by a frame line "<marker> <name>"; the marker is random per run
+# so probe output cannot be mistaken for a frame.
+capture_batch() {
+  local marker="__PBX_SNAPSHOT_${RANDOM}${RANDOM}${RANDOM}__"
+  local script=""
+  local i
+
+  for i in "${!PROBE_NAMES[@]}"; do
+    script+="echo '${marker} ${PROBE_NAMES[$i]}'; ( ${PROBE_CMDS[$i]} ) 2>&1; "
+    {
+      echo "# Command"
+      echo "${PROBE_CMDS[$i]}"
+      echo
+      echo "# Output"
+    } > "${SNAP_DIR}/${PROBE_NAMES[$i]}.txt"
+  done
+
+  local stream="${SNAP_DIR}/.batch.stream"
+  TRACE_OP="batch" run_cmd "$script" > "$stream" 2>&1 || true
+
+  if ! grep -q "^${marker} " "$stream"; then
+    rm -f "$stream"
+    return 1
+  fi
+
+  awk -v marker="$marker" -v dir="$SNAP_DIR" '
+    index($0, marker " ") == 1 {
+      if (out != "") close(out)
+      out = dir "/" substr($0, length(marker) + 2) ".txt"
+      next
+    }
+    out != "" { print >> out }
+  ' "$stream"
+  rm -f "$stream"
+}
+
+captured="false"
+capture_mode="per-probe"
+if [[ "$BATCH" == "true" ]]; then
+  if capture_batch; then
+    captured="true"
+    capture_mode="batch"
+  else
+    echo "Batched capture returned no framed output; falling back to per-probe capture." >&2
+  fi
+fi
+
+if [[ "$captured" == "false" ]]; then
+  for i in "${!PROBE_NAMES[@]}"; do
+    capture "${PROBE_NAMES[$i]}" "${PROBE_CMDS[$i]}"
+  done
+fi
 
+snapshot_host="local"
+[[ -z "$HOST" ]] || snapshot_host="${SSH_USER}@${HOST}:${SSH_PORT}"
+trace_span snapshot "$SNAPSHOT_START_MS" "$(now_ms)" ok label="$LABEL" host="$snapshot_host" mode="$capture_mode"
 printf 'Snapshot written to: %s\n' "$SNAP_DIR"
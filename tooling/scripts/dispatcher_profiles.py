@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Kamailio dispatcher profile generator.
+
+Builds dispatcher.list content for any number of old/new backends per side and
+any number of set IDs, with per-destination flags, priority, and attrs. Usable
+as a CLI (one invocation can emit every profile a run needs) and as a module
+(the wizard imports it to emit a whole fleet's profiles in one pass).
+
+Backend spec file (``--spec``), JSON:
+
+    {
+      "sets": [
+        {
+          "set_id": 1,
+          "old": ["sip:198.51.100.10:5060", {"uri": "sip:198.51.100.11:5060", "priority": 5}],
+          "new": [{"uri": "sip:198.51.100.20:5060", "flags": 0, "priority": 0, "attrs": "duid=fs-a"}]
+        }
+      ]
+    }
+
+Entry attrs default to ``old-pbx`` / ``new-pbx`` (``old-pbx-N`` when a side has
+several backends). Ramp profiles split the side's percentage across its
+backends in a ``weight=`` attribute, which Kamailio only honours with
+``ds_select_dst`` algorithm 9; backends whose share rounds to 0 are left out.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+MODES = ["old", "both", "new", "ramp"]
+SIDES = ["old", "new"]
+
+
+def ramp_label(weight: int) -> str:
+    return f"ramp-{weight:03d}"
+
+
+def parse_label(label: str) -> tuple[str, int | None]:
+    """Map a profile label (old, both, new, ramp-NNN) to (mode, new_weight)."""
+    if label in ("old", "both", "new"):
+        return label, None
+    if label.startswith("ramp-") and label[5:].isdigit():
+        weight = int(label[5:])
+        if 1 <= weight <= 100:
+            return "ramp", weight
+    raise ValueError(f"Invalid profile label: {label!r} (expected old, both, new, or ramp-NNN with NNN in 1..100)")
+
+
+def labels_for_mode(mode: str, ramp_schedule: list[int] | None = None) -> list[str]:
+    """Profile labels an orchestrator run needs: the selected one(s) plus old for rollback."""
+    if mode == "ramp":
+        labels = [ramp_label(w) for w in ramp_schedule or []]
+    else:
+        labels = [mode]
+    if "old" not in labels:
+        labels.append("old")
+    return labels
+
+
+def make_destination(raw: Any, side: str) -> dict[str, Any]:
+    if isinstance(raw, str):
+        raw = {"uri": raw}
+    if not isinstance(raw, dict):
+        raise ValueError(f"{side} backend must be a URI string or object, got {raw!r}")
+    uri = str(raw.get("uri", "")).strip()
+    if not (uri.startswith("sip:") or uri.startswith("sips:")):
+        raise ValueError(f"{side} backend must be SIP URI (sip:... or sips:...): {uri!r}")
+    dest = {"uri": uri, "flags": raw.get("flags", 0), "priority": raw.get("priority", 0), "attrs": raw.get("attrs")}
+    for key in ("flags", "priority"):
+        if isinstance(dest[key], bool) or not isinstance(dest[key], int) or dest[key] < 0:
+            raise ValueError(f"{side} backend {uri}: {key} must be a non-negative integer")
+    if dest["attrs"] is not None:
+        dest["attrs"] = str(dest["attrs"]).strip()
+        if not dest["attrs"] or any(ch.isspace() for ch in dest["attrs"]):
+            raise ValueError(f"{side} backend {uri}: attrs must be non-empty without whitespace")
+    return dest
+
+
+def make_set(set_id: Any, old: list[Any], new: list[Any]) -> dict[str, Any]:
+    if isinstance(set_id, bool) or not isinstance(set_id, int) or set_id < 0:
+        raise ValueError(f"set_id must be a non-negative integer, got {set_id!r}")
+    out = {
+        "set_id": set_id,
+        "old": [make_destination(d, "old") for d in old],
+        "new": [make_destination(d, "new") for d in new],
+    }
+    for side in SIDES:
+        if not out[side]:
+            raise ValueError(f"set {set_id}: at least one {side} backend is required")
+    return out
+
+
+def load_spec(path: Path) -> list[dict[str, Any]]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError as exc:
+        raise ValueError(f"Profile spec not found: {path}") from exc
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Profile spec is not valid JSON: {path}: {exc}") from exc
+    raw_sets = data.get("sets") if isinstance(data, dict) else None
+    if not isinstance(raw_sets, list) or not raw_sets:
+        raise ValueError(f"Profile spec must contain a non-empty 'sets' list: {path}")
+    sets = []
+    for raw in raw_sets:
+        if not isinstance(raw, dict):
+            raise ValueError(f"Profile spec set entries must be objects: {path}")
+        sets.append(make_set(raw.get("set_id", 1), list(raw.get("old") or []), list(raw.get("new") or [])))
+    return sets
+
+
+def simple_sets(old_uris: list[str], new_uris: list[str], set_ids: list[int]) -> list[dict[str, Any]]:
+    return [make_set(set_id, old_uris, new_uris) for set_id in set_ids or [1]]
+
+
+def split_weight(total: int, count: int) -> list[int]:
+    base, extra = divmod(total, count)
+    return [base + (1 if i < extra else 0) for i in range(count)]
+
+
+def side_lines(dset: dict[str, Any], side: str, weight: int | None) -> list[str]:
+    dests = dset[side]
+    shares = split_weight(weight, len(dests)) if weight is not None else [None] * len(dests)
+    lines = []
+    for idx, (dest, share) in enumerate(zip(dests, shares), start=1):
+        if share == 0:
+            continue
+        name = f"{side}-pbx" if len(dests) == 1 else f"{side}-pbx-{idx}"
+        if share is None:
+            attrs = dest["attrs"] or name
+        else:
+            attrs = f"{dest['attrs'] or f'duid={name}'};weight={share}"
+        lines.append(f"{dset['set_id']} {dest['uri']} {dest['flags']} {dest['priority']} {attrs}")
+    return lines
+
+
+def render_profile(mode: str, sets: list[dict[str, Any]], new_weight: int | None = None, generated_at: str | None = None) -> str:
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+    if mode == "ramp":
+        if isinstance(new_weight, bool) or not isinstance(new_weight, int) or not 1 <= new_weight <= 100:
+            raise ValueError("new_weight must be an integer percentage between 1 and 100 for mode ramp")
+    elif new_weight is not None:
+        raise ValueError("new_weight is only valid with mode ramp")
+
+    stamp = generated_at or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    out = [f"# Generated by dispatcher_profiles.py on {stamp}", f"# Mode: {mode}"]
+    if mode == "ramp":
+        out.append(f"# Ramp: new-pbx {new_weight}% / old-pbx {100 - new_weight}% (requires ds_select_dst algorithm 9)")
+    out.append("# Format: setid destination flags priority attrs")
+    for dset in sets:
+        if mode in ("old", "both"):
+            out.extend(side_lines(dset, "old", None))
+        if mode in ("both", "new"):
+            out.extend(side_lines(dset, "new", None))
+        if mode == "ramp":
+            if new_weight < 100:
+                out.extend(side_lines(dset, "old", 100 - new_weight))
+            out.extend(side_lines(dset, "new", new_weight))
+    return "\n".join(out) + "\n"
+
+
+def write_profiles(sets: list[dict[str, Any]], labels: list[str], output_dir: Path) -> dict[str, Path]:
+    """Write dispatcher.profile.<label>.list for every label; returns label -> path."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    written: dict[str, Path] = {}
+    for label in labels:
+        mode, weight = parse_label(label)
+        path = output_dir / f"dispatcher.profile.{label}.list"
+        path.write_text(render_profile(mode, sets, weight, stamp), encoding="utf-8")
+        written[label] = path
+    return written
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate Kamailio dispatcher profiles for N old/new backends and multiple set IDs.",
+    )
+    parser.add_argument("--old", action="append", default=[], metavar="SIP_URI", help="Old PBX backend URI (repeatable).")
+    parser.add_argument("--new", action="append", default=[], metavar="SIP_URI", help="New PBX backend URI (repeatable).")
+    parser.add_argument("--set-id", action="append", type=int, default=[], help="Dispatcher set ID (repeatable). Default: 1")
+    parser.add_argument("--spec", help="JSON backend spec with per-set destinations, flags, priority, and attrs (replaces --old/--new/--set-id).")
+    parser.add_argument("--mode", choices=MODES, help="Single profile mode (with --output).")
+    parser.add_argument("--new-weight", type=int, help="New PBX percentage for --mode ramp (1-100).")
+    parser.add_argument("--output", help="Output file for --mode.")
+    parser.add_argument(
+        "--emit",
+        action="append",
+        default=[],
+        metavar="LABEL",
+        help="Profile to write into --output-dir as dispatcher.profile.<LABEL>.list: old, both, new, or ramp-NNN (repeatable).",
+    )
+    parser.add_argument("--output-dir", help="Directory for --emit profiles.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        if args.spec:
+            sets = load_spec(Path(args.spec))
+        else:
+            if not args.old or not args.new:
+                raise ValueError("--old and --new (or --spec) are required")
+            sets = simple_sets(args.old, args.new, args.set_id)
+
+        if args.mode:
+            if not args.output or args.emit:
+                raise ValueError("--mode requires --output and cannot be combined with --emit")
+            path = Path(args.output)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(render_profile(args.mode, sets, args.new_weight), encoding="utf-8")
+            print(f"Dispatcher profile written: {path}")
+            return 0
+
+        if not args.emit or not args.output_dir:
+            raise ValueError("either --mode with --output, or --emit with --output-dir is required")
+        for path in write_profiles(sets, args.emit, Path(args.output_dir)).values():
+            print(f"Dispatcher profile written: {path}")
+        return 0
+    except (ValueError, OSError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
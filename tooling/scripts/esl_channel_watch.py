@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Event-driven FreeSWITCH channel drain watcher over the event socket (ESL).
+
+Keeps one inbound ESL connection open, seeds the channel count with
+``api show channels count`` and then tracks it incrementally from
+CHANNEL_CREATE / CHANNEL_DESTROY events. CHANNEL_DESTROY (rather than
+CHANNEL_HANGUP) is used because it is the point where a channel stops being
+counted by ``show channels count``. The count is re-seeded on the same
+connection every ``--resync`` seconds to correct for any missed event.
+
+The script only uses the standard library so it can be streamed to a PBX host
+and run there (``ssh host python3 - --threshold 0 < esl_channel_watch.py``).
+The event socket password is read from ``ESL_PASSWORD`` so it never shows in
+the process list; ``--esl-password`` is for local use only.
+
+Exit codes: 0 drain complete, 3 timeout, 2 ESL unavailable or protocol error.
+Anything other than 0 and 3 (including 1 from an interpreter that cannot run
+the script) means callers fall back to polling.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import socket
+import sys
+import time
+from datetime import datetime
+from urllib.parse import unquote
+
+EXIT_DRAINED = 0
+EXIT_TIMEOUT = 3
+EXIT_ESL_ERROR = 2
+
+
+class EslError(Exception):
+    pass
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Wait for FreeSWITCH channel drain using ESL events.")
+    parser.add_argument("--esl-host", default="127.0.0.1", help="Event socket host. Default: 127.0.0.1")
+    parser.add_argument("--esl-port", type=int, default=8021, help="Event socket port. Default: 8021")
+    parser.add_argument("--esl-password", default=os.environ.get("ESL_PASSWORD", "ClueCon"), help="Event socket password. Default: $ESL_PASSWORD or ClueCon")
+    parser.add_argument("--threshold", type=int, default=0, help="Target channel count. Default: 0")
+    parser.add_argument("--timeout", type=float, default=14400, help="Maximum wait in seconds. Default: 14400")
+    parser.add_argument("--resync", type=float, default=60, help="Re-seed count from 'show channels count' every N seconds. Default: 60")
+    return parser.parse_args()
+
+
+class EslConnection:
+    def __init__(self, host: str, port: int, timeout: float = 10.0) -> None:
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.buf = b""
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _fill(self) -> None:
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise EslError("event socket closed by peer")
+        self.buf += chunk
+
+    def read_message(self) -> tuple[dict[str, str], str]:
+        # Nothing is consumed from the buffer until a whole message (headers and
+        # Content-Length body) is present, so a socket timeout never splits one.
+        while True:
+            head_end = self.buf.find(b"\n\n")
+            if head_end >= 0:
+                headers: dict[str, str] = {}
+                for line in self.buf[:head_end].decode("utf-8", "replace").splitlines():
+                    key, _, value = line.partition(":")
+                    headers[key.strip()] = value.strip()
+                body_start = head_end + 2
+                body_end = body_start + int(headers.get("Content-Length") or 0)
+                if len(self.buf) >= body_end:
+                    body = self.buf[body_start:body_end].decode("utf-8", "replace")
+                    self.buf = self.buf[body_end:]
+                    return headers, body
+            self._fill()
+
+    def send(self, command: str) -> None:
+        self.sock.sendall(f"{command}\n\n".encode("utf-8"))
+
+    def command(self, command: str) -> str:
+        self.send(command)
+        while True:
+            headers, _ = self.read_message()
+            if headers.get("Content-Type") == "command/reply":
+                reply = headers.get("Reply-Text", "")
+                if not reply.startswith("+OK"):
+                    raise EslError(f"{command.split()[0]} rejected: {reply}")
+                return reply
+
+
+def parse_event(body: str) -> dict[str, str]:
+    event: dict[str, str] = {}
+    for line in body.splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            event[key.strip()] = unquote(value.strip())
+    return event
+
+
+def parse_count(text: str) -> int:
+    match = re.search(r"(\d+)\s+total", text) or re.search(r"(\d+)", text)
+    if not match:
+        raise EslError(f"unexpected 'show channels count' output: {text.strip()!r}")
+    return int(match.group(1))
+
+
+def report(count: int, source: str) -> None:
+    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{stamp} channels={count} ({source})", flush=True)
+
+
+def watch(args: argparse.Namespace) -> int:
+    deadline = time.monotonic() + args.timeout
+    try:
+        conn = EslConnection(args.esl_host, args.esl_port)
+    except OSError as exc:
+        print(f"ESL connect failed: {exc}", file=sys.stderr)
+        return EXIT_ESL_ERROR
+
+    try:
+        headers, _ = conn.read_message()
+        if headers.get("Content-Type") != "auth/request":
+            raise EslError(f"unexpected greeting: {headers}")
+        conn.command(f"auth {args.esl_password}")
+        conn.command("event plain CHANNEL_CREATE CHANNEL_DESTROY")
+
+        # Subscribe before seeding so no event between the two is lost. Events
+        # queued ahead of the api reply are already reflected in its count and
+        # are skipped until the first count arrives.
+        count: int | None = None
+        conn.send("api show channels count")
+        next_resync = time.monotonic() + args.resync
+        resync_pending = True
+
+        print(f"Watching ESL events for channels <= {args.threshold} (timeout={int(args.timeout)}s)", flush=True)
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                print(f"Timeout after {int(args.timeout)}s; channel drain not complete", file=sys.stderr)
+                return EXIT_TIMEOUT
+            if not resync_pending and now >= next_resync:
+                conn.send("api show channels count")
+                resync_pending = True
+
+            conn.sock.settimeout(max(0.1, min(deadline, next_resync) - now))
+            try:
+                headers, body = conn.read_message()
+            except socket.timeout:
+                continue
+
+            content_type = headers.get("Content-Type", "")
+            if content_type == "api/response":
+                count = parse_count(body)
+                resync_pending = False
+                next_resync = time.monotonic() + args.resync
+                report(count, "resync")
+            elif content_type == "text/event-plain" and count is not None:
+                name = parse_event(body).get("Event-Name", "")
+                if name == "CHANNEL_CREATE":
+                    count += 1
+                elif name == "CHANNEL_DESTROY":
+                    count = max(0, count - 1)
+                else:
+                    continue
+                report(count, name)
+            elif content_type == "text/disconnect-notice":
+                raise EslError("event socket sent disconnect notice")
+            else:
+                continue
+
+            if count is not None and count <= args.threshold:
+                print(f"Drain complete: channels={count} <= threshold={args.threshold}", flush=True)
+                return EXIT_DRAINED
+    except (EslError, OSError, ValueError) as exc:
+        print(f"ESL watch failed: {exc}", file=sys.stderr)
+        return EXIT_ESL_ERROR
+    finally:
+        conn.close()
+
+
+def main() -> int:
+    return watch(parse_args())
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except KeyboardInterrupt:
+        raise SystemExit(130)
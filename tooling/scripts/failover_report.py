@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Dispatcher failover latency report for run_failover_benchmark.sh.
+
+Each benchmark run puts SIPp load through Kamailio (kamailio.failover.cfg:
+OPTIONS probing, ds_next_dst on failure), takes the preferred backend down
+mid-load, and writes a run directory:
+
+    events.csv     "epoch_ms,label" rows: start, down, end
+    kamailio.log   this run's Kamailio log (DS_EVENT, DS_FAILOVER, CUTOVER_DST)
+    load/          SIPp -trace_stat (load.stat.csv) and -trace_rtt output
+
+``analyze`` turns one run directory into one result:
+
+    detect_ms      down -> first DS_EVENT event=down for the failed backend
+    reroute_ms     down -> last initial INVITE Kamailio still sent to it;
+                   calls after that go straight to the backup
+    dead_invites   initial INVITEs sent to the failed backend after down; each
+                   paid the branch timeout before failing over
+    failovers      DS_FAILOVER retries to another destination (and
+                   ``failover_exhausted`` when none was left)
+    calls_lost     SIPp failed calls after down: calls up on the failed
+                   backend plus setups that could not fail over
+
+``summary`` merges run results into one report and prints the table;
+``compare`` fails when a report is slower than a baseline report:
+
+  failover_report.py analyze RUN_DIR --interval 2 --down-dst sipp-uas-new:5060 --output RUN_DIR/failover.json
+  failover_report.py summary RUN_DIR/*/failover.json --label lab --output failover-report.json
+  failover_report.py compare baseline.json failover-report.json --max-regression 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+from report_utils import percentile, print_table
+from cutover_log_index import FIELD_RE, hostport, parse_ts
+from sipp_load_report import read_events, read_rtt, read_stat
+
+# (result key, unit) gated by compare, in report order.
+GATED = [
+    ("detect_ms", "ms"),
+    ("reroute_ms", "ms"),
+    ("dead_invites", "calls"),
+    ("calls_lost", "calls"),
+]
+
+
+def scan_log(path: Path, down_dst: str, down_us: int) -> dict[str, Any]:
+    """Failover evidence from DS_EVENT / DS_FAILOVER / CUTOVER_DST lines after down."""
+    detect_us = None
+    last_dead_us = None
+    dead_invites = 0
+    failovers = 0
+    exhausted = 0
+    with path.open("rb") as fh:
+        for line in fh:
+            if b"DS_EVENT " in line:
+                kind = "event"
+            elif b"DS_FAILOVER " in line:
+                kind = "failover"
+            elif b"CUTOVER_DST " in line:
+                kind = "dst"
+            else:
+                continue
+            fields = dict(FIELD_RE.findall(line))
+            ts = parse_ts(fields, line, 0)
+            if ts is None or ts < down_us:
+                continue
+            if kind == "event":
+                uri = fields.get(b"uri", b"").decode(errors="replace")
+                if fields.get(b"event") == b"down" and hostport(uri) == down_dst and detect_us is None:
+                    detect_us = ts
+            elif kind == "failover":
+                if fields.get(b"to") == b"none":
+                    exhausted += 1
+                else:
+                    failovers += 1
+            elif fields.get(b"method") == b"INVITE":
+                du = fields.get(b"du", b"").decode(errors="replace")
+                dst = fields.get(b"dst", b"").decode(errors="replace")
+                if hostport(du) == down_dst or dst == down_dst:
+                    dead_invites += 1
+                    last_dead_us = ts
+    return {
+        "detect_us": detect_us,
+        "last_dead_us": last_dead_us,
+        "dead_invites": dead_invites,
+        "failovers": failovers,
+        "failover_exhausted": exhausted,
+    }
+
+
+def cmd_analyze(args: argparse.Namespace) -> int:
+    run_dir = Path(args.run_dir)
+    load_dir = run_dir / "load"
+    rtt_files = sorted(load_dir.glob("*_rtt.csv"))
+    try:
+        events = dict((label, t) for t, label in read_events(run_dir / "events.csv"))
+        for label in ("down", "end"):
+            if label not in events:
+                raise ValueError(f"{run_dir / 'events.csv'}: no '{label}' event")
+        down = events["down"]
+        end = events["end"]
+        start, stat_rows = read_stat(load_dir / "load.stat.csv")
+        scan = scan_log(run_dir / "kamailio.log", args.down_dst, int(down * 1_000_000))
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 2
+
+    samples = read_rtt(rtt_files[0], start) if rtt_files else []
+    setup = [rtt for t, rtt, rtd in samples if rtd == 1 and down <= t < end]
+
+    before = [r for r in stat_rows if r["t"] < down]
+    failed_before = before[-1]["failed_total"] if before else 0.0
+    failed_end = stat_rows[-1]["failed_total"] if stat_rows else 0.0
+
+    def since_down(us: int | None) -> float | None:
+        return None if us is None else round(us / 1000 - down * 1000, 1)
+
+    result = {
+        "interval_s": args.interval,
+        "mode": args.mode,
+        "down_dst": args.down_dst,
+        "down_epoch_ms": int(down * 1000),
+        "detect_ms": since_down(scan["detect_us"]),
+        # Nothing sent to the failed backend after down means calls were
+        # rerouted from the first call on.
+        "reroute_ms": since_down(scan["last_dead_us"]) if scan["last_dead_us"] is not None else 0.0,
+        "dead_invites": scan["dead_invites"],
+        "failovers": scan["failovers"],
+        "failover_exhausted": scan["failover_exhausted"],
+        "calls_lost": int(failed_end - failed_before),
+        "attempted": int(sum(r["attempted"] for r in stat_rows)),
+        "setup_p99_ms": percentile(setup, 99) if setup else None,
+        "setup_max_ms": max(setup) if setup else None,
+    }
+
+    print(
+        f"Probe interval {args.interval:g} s ({args.mode}): detected in {fmt(result['detect_ms'])} ms, "
+        f"rerouted in {fmt(result['reroute_ms'])} ms, {result['dead_invites']} INVITE(s) to the dead backend, "
+        f"{result['failovers']} failover(s), {result['calls_lost']} call(s) lost"
+    )
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+    if result["detect_ms"] is None:
+        print(f"ERROR: no DS_EVENT event=down for {args.down_dst} after the failure", file=sys.stderr)
+        return 1
+    return 0
+
+
+def load_report(path: str) -> dict[str, Any]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ValueError(f"Cannot read failover report {path}: {exc}") from exc
+
+
+def result_key(result: dict[str, Any]) -> tuple[float, str]:
+    return float(result["interval_s"]), str(result.get("mode", "-"))
+
+
+def print_results(results: list[dict[str, Any]]) -> None:
+    print_table(
+        ["interval s", "mode", "detect ms", "reroute ms", "dead INVITEs", "failovers", "lost calls", "setup p99", "setup max"],
+        [
+            [
+                f"{r['interval_s']:g}",
+                r.get("mode", "-"),
+                fmt(r.get("detect_ms")),
+                fmt(r.get("reroute_ms")),
+                str(r.get("dead_invites", "-")),
+                str(r.get("failovers", "-")),
+                str(r.get("calls_lost", "-")),
+                fmt(r.get("setup_p99_ms")),
+                fmt(r.get("setup_max_ms")),
+            ]
+            for r in results
+        ],
+    )
+
+
+def cmd_summary(args: argparse.Namespace) -> int:
+    results = []
+    for name in args.results:
+        try:
+            results.append(load_report(name))
+        except ValueError as exc:
+            print(f"ERROR: {exc}", file=sys.stderr)
+            return 2
+    results.sort(key=result_key)
+    report = {"label": args.label, "results": results}
+    print(f"Failover benchmark: {args.label}")
+    print_results(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    try:
+        base = load_report(args.base)
+        new = load_report(args.new)
+    except ValueError as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 2
+
+    base_rows = {result_key(r): r for r in base["results"]}
+    regressions = []
+    rows = []
+    for r in sorted(new["results"], key=result_key):
+        b = base_rows.get(result_key(r))
+        if b is None:
+            continue
+        for key, unit in GATED:
+            bv, nv = b.get(key), r.get(key)
+            floor = args.min_delta_ms if unit == "ms" else args.min_delta_calls
+            if bv is None or nv is None:
+                rows.append([f"{r['interval_s']:g}", r.get("mode", "-"), key, fmt(bv), fmt(nv), "-", "-"])
+                if nv is None and bv is not None:
+                    regressions.append(f"interval {r['interval_s']:g} s: {key} missing (base {fmt(bv)} {unit})")
+                continue
+            pct = (nv - bv) / bv * 100 if bv else 0.0
+            rows.append([f"{r['interval_s']:g}", r.get("mode", "-"), key, fmt(bv), fmt(nv), f"{nv - bv:+.0f}", f"{pct:+.1f}%"])
+            if nv - bv > floor and (not bv or pct > args.max_regression):
+                regressions.append(f"interval {r['interval_s']:g} s: {key} {fmt(bv)} -> {fmt(nv)} {unit} ({pct:+.1f}%)")
+
+    if not rows:
+        print("ERROR: no probe interval in common with the baseline", file=sys.stderr)
+        return 2
+    print(f"Failover comparison: {base.get('label', args.base)} -> {new.get('label', args.new)}")
+    print_table(["interval s", "mode", "metric", "base", "new", "delta", "delta %"], rows)
+    if regressions:
+        print(
+            f"\nFailover regressions over {args.max_regression:g}% "
+            f"(and {args.min_delta_ms:g} ms / {args.min_delta_calls} calls):",
+            file=sys.stderr,
+        )
+        for line in regressions:
+            print(f"- {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Dispatcher failover latency report.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    an_p = sub.add_parser("analyze", help="Measure detection, reroute and lost calls for one benchmark run.")
+    an_p.add_argument("run_dir", help="Run directory with events.csv, kamailio.log and load/")
+    an_p.add_argument("--interval", type=float, required=True, help="ds_ping_interval of the run, in seconds.")
+    an_p.add_argument("--down-dst", required=True, help="host:port of the backend taken down (as in dispatcher.list).")
+    an_p.add_argument("--mode", default="pause", help="How the backend was taken down. Default: pause")
+    an_p.add_argument("--output", help="Write the result as JSON here.")
+    an_p.set_defaults(func=cmd_analyze)
+
+    sum_p = sub.add_parser("summary", help="Merge run results into one report.")
+    sum_p.add_argument("results", nargs="+", help="failover.json files written by analyze")
+    sum_p.add_argument("--label", default="failover", help="Report label. Default: failover")
+    sum_p.add_argument("--output", help="Write the report as JSON here.")
+    sum_p.set_defaults(func=cmd_summary)
+
+    cmp_p = sub.add_parser("compare", help="Compare a report with a baseline report.")
+    cmp_p.add_argument("base", help="Baseline failover report")
+    cmp_p.add_argument("new", help="Candidate failover report")
+    cmp_p.add_argument("--max-regression", type=float, default=20, help="Exit 1 if a gated metric grows by more than PCT percent. Default: 20")
+    cmp_p.add_argument("--min-delta-ms", type=float, default=250, help="Ignore detect/reroute growth below this many ms. Default: 250")
+    cmp_p.add_argument("--min-delta-calls", type=int, default=5, help="Ignore dead-INVITE/lost-call growth below this many calls. Default: 5")
+    cmp_p.set_defaults(func=cmd_compare)
+
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
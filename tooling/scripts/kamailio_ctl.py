@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""Minimal Kamailio ctl (BINRPC) client.
+
+Talks to the ctl module's control socket directly (``modparam("ctl",
+"binrpc", ...)``), so a dispatcher reload needs neither a login shell nor a
+``kamcmd`` process. ``reload-verify`` waits for the socket to answer, runs
+``dispatcher.reload`` and ``dispatcher.list`` on the same connection, reports
+the reload latency, and checks that the in-memory sets match the list file.
+
+Sockets: ``unix:/run/kamailio/kamailio_ctl`` (stream) or ``tcp:HOST:PORT``.
+Standard library only, so it can run on the Kamailio host or next to it.
+
+Exit codes: 0 ok, 2 ctl unavailable or RPC fault, 3 in-memory sets differ
+from the list file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+EXIT_OK = 0
+EXIT_CTL_ERROR = 2
+EXIT_MISMATCH = 3
+
+BINRPC_MAGIC = 0xA
+BINRPC_VERS = 1
+BINRPC_REQ = 0
+BINRPC_REPL = 1
+BINRPC_FAULT = 3
+
+T_INT = 0
+T_STR = 1
+T_DOUBLE = 2
+T_STRUCT = 3
+T_ARRAY = 4
+T_AVP = 5
+T_BYTES = 6
+T_LONG = 7
+
+
+class CtlError(Exception):
+    pass
+
+
+class Struct(list):
+    """BINRPC struct: ordered (name, value) pairs; names may repeat (e.g. SET)."""
+
+
+def int_len(value: int) -> int:
+    size = 0
+    while value >> (size * 8) and size < 8:
+        size += 1
+    return size
+
+
+def encode_str(value: str, rtype: int = T_STR) -> bytes:
+    data = value.encode("utf-8") + b"\0"
+    if len(data) < 8:
+        return bytes([(len(data) << 4) | rtype]) + data
+    size = max(1, int_len(len(data)))
+    return bytes([((size | 8) << 4) | rtype]) + len(data).to_bytes(size, "big") + data
+
+
+def encode_int(value: int) -> bytes:
+    raw = value & 0xFFFFFFFF
+    size = int_len(raw)
+    return bytes([(size << 4) | T_INT]) + (raw.to_bytes(size, "big") if size else b"")
+
+
+def encode_request(method: str, params: list[Any], cookie: int) -> bytes:
+    body = encode_str(method)
+    for param in params:
+        if isinstance(param, int) and not isinstance(param, bool):
+            body += encode_int(param)
+        else:
+            body += encode_str(str(param))
+    len_len = max(1, int_len(len(body)))
+    c_len = max(1, int_len(cookie))
+    header = bytes([(BINRPC_MAGIC << 4) | BINRPC_VERS, (BINRPC_REQ << 4) | ((len_len - 1) << 2) | (c_len - 1)])
+    return header + len(body).to_bytes(len_len, "big") + cookie.to_bytes(c_len, "big") + body
+
+
+def decode_value(buf: bytes, pos: int) -> tuple[Any, int, int, bool]:
+    """Decode one record at pos; returns (value, next_pos, type, is_end_marker)."""
+    tag = buf[pos]
+    rtype = tag & 0x0F
+    size = tag >> 4
+    pos += 1
+    if rtype in (T_STRUCT, T_ARRAY):
+        if size & 8:
+            return None, pos, rtype, True
+        close = 0x80 | rtype
+        if rtype == T_ARRAY:
+            items: list[Any] = []
+            while buf[pos] != close:
+                value, pos, _, _ = decode_value(buf, pos)
+                items.append(value)
+            return items, pos + 1, rtype, False
+        members = Struct()
+        while buf[pos] != close:
+            name, pos, _, _ = decode_value(buf, pos)
+            value, pos, _, _ = decode_value(buf, pos)
+            members.append((name, value))
+        return members, pos + 1, rtype, False
+
+    if size & 8:
+        len_len = size & 7
+        length = int.from_bytes(buf[pos : pos + len_len], "big")
+        pos += len_len
+    else:
+        length = size
+    raw = buf[pos : pos + length]
+    pos += length
+    if rtype in (T_STR, T_AVP):
+        return raw.rstrip(b"\0").decode("utf-8", "replace"), pos, rtype, False
+    if rtype == T_BYTES:
+        return raw, pos, rtype, False
+    number = int.from_bytes(raw, "big", signed=length in (4, 8)) if raw else 0
+    if rtype == T_DOUBLE:
+        return number / 1000.0, pos, rtype, False
+    return number, pos, rtype, False
+
+
+def decode_body(body: bytes) -> list[Any]:
+    values = []
+    pos = 0
+    while pos < len(body):
+        value, pos, _, _ = decode_value(body, pos)
+        values.append(value)
+    return values
+
+
+def parse_socket(spec: str) -> tuple[int, Any]:
+    if spec.startswith("unix:"):
+        return socket.AF_UNIX, spec[5:]
+    if spec.startswith("tcp:"):
+        host, _, port = spec[4:].rpartition(":")
+        if not host or not port.isdigit():
+            raise CtlError(f"invalid tcp ctl socket: {spec!r} (expected tcp:HOST:PORT)")
+        return socket.AF_INET, (host.strip("[]"), int(port))
+    raise CtlError(f"unsupported ctl socket: {spec!r} (expected unix:PATH or tcp:HOST:PORT)")
+
+
+class CtlConnection:
+    def __init__(self, spec: str, timeout: float = 5.0) -> None:
+        family, address = parse_socket(spec)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(address)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _recv_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise CtlError("ctl socket closed by peer")
+            data += chunk
+        return data
+
+    def call(self, method: str, *params: Any) -> list[Any]:
+        cookie = random.getrandbits(31)
+        self.sock.sendall(encode_request(method, list(params), cookie))
+        fixed = self._recv_exact(2)
+        if fixed[0] >> 4 != BINRPC_MAGIC:
+            raise CtlError(f"bad BINRPC magic in reply to {method}")
+        rtype = fixed[1] >> 4
+        len_len = ((fixed[1] >> 2) & 3) + 1
+        c_len = (fixed[1] & 3) + 1
+        body_len = int.from_bytes(self._recv_exact(len_len), "big")
+        reply_cookie = int.from_bytes(self._recv_exact(c_len), "big")
+        body = self._recv_exact(body_len)
+        if reply_cookie != cookie:
+            raise CtlError(f"reply cookie mismatch for {method}")
+        values = decode_body(body)
+        if rtype == BINRPC_FAULT:
+            code = values[0] if values else "?"
+            message = values[1] if len(values) > 1 else ""
+            raise CtlError(f"{method} fault {code}: {message}")
+        if rtype != BINRPC_REPL:
+            raise CtlError(f"unexpected BINRPC message type {rtype} for {method}")
+        return values
+
+
+def wait_ready(spec: str, ready_timeout: float, timeout: float) -> tuple[CtlConnection, float]:
+    """Connect and answer core.uptime, retrying with short backoff until ready_timeout."""
+    started = time.monotonic()
+    delay = 0.05
+    while True:
+        conn = None
+        try:
+            conn = CtlConnection(spec, timeout)
+            conn.call("core.uptime")
+            return conn, time.monotonic() - started
+        except (OSError, CtlError) as exc:
+            if conn is not None:
+                conn.close()
+            if time.monotonic() - started + delay > ready_timeout:
+                raise CtlError(f"ctl socket {spec} not ready after {ready_timeout:g}s: {exc}") from exc
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def memory_destinations(node: Any, set_id: int | None = None, out: set[tuple[int | None, str]] | None = None) -> set[tuple[int | None, str]]:
+    if out is None:
+        out = set()
+    if isinstance(node, Struct):
+        keys = [k for k, _ in node]
+        if "ID" in keys and "TARGETS" in keys:
+            set_id = int(dict(node)["ID"])
+        for key, value in node:
+            if key == "URI" and isinstance(value, str):
+                out.add((set_id, value))
+            else:
+                memory_destinations(value, set_id, out)
+    elif isinstance(node, list):
+        for value in node:
+            memory_destinations(value, set_id, out)
+    return out
+
+
+def file_destinations(path: Path) -> set[tuple[int | None, str]]:
+    out: set[tuple[int | None, str]] = set()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and not fields[0].startswith("#"):
+            out.add((int(fields[0]), fields[1]))
+    return out
+
+
+def to_json(value: Any) -> Any:
+    """Struct -> dict; repeated member names (SET, DEST) become lists."""
+    repeated: set[str] = set()
+    if isinstance(value, Struct):
+        out: dict[str, Any] = {}
+        for key, member in value:
+            member = to_json(member)
+            if key not in out:
+                out[key] = member
+            elif isinstance(out[key], list) and key in repeated:
+                out[key].append(member)
+            else:
+                out[key] = [out[key], member]
+                repeated.add(key)
+        return out
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def cmd_reload_verify(args: argparse.Namespace) -> int:
+    conn, ready_s = wait_ready(args.socket, args.ready_timeout, args.timeout)
+    try:
+        started = time.perf_counter()
+        conn.call("dispatcher.reload")
+        reload_ms = (time.perf_counter() - started) * 1000
+        listing = conn.call("dispatcher.list")
+    finally:
+        conn.close()
+
+    in_memory = memory_destinations(listing)
+    print(f"ctl ready after {ready_s * 1000:.0f} ms; dispatcher.reload {reload_ms:.1f} ms; in-memory destinations={len(in_memory)}")
+    if not args.list_file:
+        return EXIT_OK
+
+    expected = file_destinations(Path(args.list_file))
+    missing = sorted(expected - in_memory, key=str)
+    extra = sorted(in_memory - expected, key=str)
+    if missing or extra:
+        for set_id, uri in missing:
+            print(f"missing in memory: set {set_id} {uri}", file=sys.stderr)
+        for set_id, uri in extra:
+            print(f"unexpected in memory: set {set_id} {uri}", file=sys.stderr)
+        print(f"Dispatcher verification FAILED against {args.list_file}", file=sys.stderr)
+        return EXIT_MISMATCH
+    print(f"Dispatcher verified: in-memory sets match {args.list_file} ({len(expected)} destinations)")
+    return EXIT_OK
+
+
+def cmd_wait_ready(args: argparse.Namespace) -> int:
+    conn, ready_s = wait_ready(args.socket, args.ready_timeout, args.timeout)
+    conn.close()
+    print(f"ctl ready after {ready_s * 1000:.0f} ms")
+    return EXIT_OK
+
+
+def cmd_call(args: argparse.Namespace) -> int:
+    params: list[Any] = [int(p) if p.lstrip("-").isdigit() else p for p in args.params]
+    conn, _ = wait_ready(args.socket, args.ready_timeout, args.timeout)
+    try:
+        values = conn.call(args.method, *params)
+    finally:
+        conn.close()
+    print(json.dumps(to_json(values), indent=2))
+    return EXIT_OK
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Kamailio ctl (BINRPC) client.")
+    parser.add_argument("--socket", default="unix:/run/kamailio/kamailio_ctl", help="ctl socket. Default: unix:/run/kamailio/kamailio_ctl")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Per-request socket timeout in seconds. Default: 5")
+    parser.add_argument("--ready-timeout", type=float, default=10.0, help="Wait up to N seconds for the ctl socket to answer. Default: 10")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    reload_p = sub.add_parser("reload-verify", help="dispatcher.reload + dispatcher.list in one session, compared with --list-file.")
+    reload_p.add_argument("--list-file", help="Dispatcher list file the in-memory sets must match.")
+    reload_p.set_defaults(func=cmd_reload_verify)
+
+    ready_p = sub.add_parser("wait-ready", help="Wait until the ctl socket answers core.uptime.")
+    ready_p.set_defaults(func=cmd_wait_ready)
+
+    call_p = sub.add_parser("call", help="Run one RPC command and print the result as JSON.")
+    call_p.add_argument("method")
+    call_p.add_argument("params", nargs="*")
+    call_p.set_defaults(func=cmd_call)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        return args.func(args)
+    except (CtlError, OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return EXIT_CTL_ERROR
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
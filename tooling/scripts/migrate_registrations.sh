@@ -0,0 +1,374 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+usage() {
+  cat <<'USAGE'
+Usage:
+  migrate_registrations.sh [--old-pbx-host HOST] [--old-pbx-user USER] [--old-pbx-ssh-port PORT]
+                           [--new-pbx-host HOST] [--new-pbx-user USER] [--new-pbx-ssh-port PORT]
+                           [--kamailio-host HOST] [--kamailio-user USER] [--kamailio-ssh-port PORT]
+                           [--ssh-key PATH] [--ssh-control-dir DIR] [--no-ssh-mux] [--trace-file FILE]
+                           [--registrations-file FILE] [--trigger-cmd TEMPLATE]
+                           [--rate N] [--min-rate N] [--max-rate N] [--rate-step N] [--interval SEC]
+                           [--probe-target HOST[:PORT]] [--probe-script PATH] [--probe-count N]
+                           [--target-p95-ms MS] [--settle SEC]
+                           [--progress-file CSV] [--done-file FILE]
+
+Description:
+  Moves registrations from the old PBX to the new one at a controlled rate
+  once Kamailio routes REGISTER to the new PBX. Reads the old PBX's
+  registration list ("show registrations", or --registrations-file: a
+  discovery snapshot 05_registrations.txt or saved fs_cli output) and, in one
+  batch every --interval seconds, asks the old PBX to make each phone
+  re-register (--trigger-cmd, default a check-sync NOTIFY:
+  "fs_cli -x 'sofia profile {profile} check_sync {user}'", where {user} is
+  user@realm). A batch is one script fed to bash over stdin (one SSH exec)
+  and sleeps between slices of users so the triggers are spread over the
+  interval at the current rate.
+
+  The rate (registrations per second, starting at --rate) adapts to the new
+  PBX after every batch (additive increase, multiplicative decrease):
+
+    With --probe-target, a short OPTIONS burst (--probe-count) from the
+    Kamailio host with sip_probe.py (--probe-script, a path on that host).
+    p95 at or below --target-p95-ms with no errors raises the rate by
+    --rate-step up to --max-rate; a slower p95 or any error halves it, down
+    to --min-rate. Without --probe-target the rate stays fixed.
+
+  Registration counts on both PBXes (fs_cli 'show registrations count') are
+  sampled after every batch and for --settle seconds after the last one.
+  Progress goes to --progress-file (CSV) and, with --trace-file, to the run
+  trace. Users already listed in --done-file are skipped and every user whose
+  trigger command exited 0 is appended to it, so a rerun continues where it
+  stopped. Users whose trigger failed are listed at the end and the script
+  exits 1, so a rerun retries them. Without
+  --old-pbx-host / --new-pbx-host / --kamailio-host the commands run locally.
+
+Examples:
+  migrate_registrations.sh --old-pbx-host 10.10.10.10 --new-pbx-host 10.10.10.20 \
+    --kamailio-host 10.10.10.30 --probe-target 10.10.10.20:5060 \
+    --probe-script /opt/pbx-migration/scripts/sip_probe.py --rate 20 --max-rate 200
+  migrate_registrations.sh --registrations-file ./run-X/old-pre-new-X/05_registrations.txt --rate 5
+USAGE
+}
+
+OLD_PBX_HOST=""
+OLD_PBX_USER="root"
+OLD_PBX_SSH_PORT="22"
+NEW_PBX_HOST=""
+NEW_PBX_USER="root"
+NEW_PBX_SSH_PORT="22"
+KAMAILIO_HOST=""
+KAMAILIO_USER="root"
+KAMAILIO_SSH_PORT="22"
+SSH_KEY=""
+SSH_CONTROL_DIR=""
+SSH_MUX="true"
+TRACE_FILE_ARG=""
+REGISTRATIONS_FILE=""
+TRIGGER_CMD="fs_cli -x 'sofia profile {profile} check_sync {user}'"
+RATE=20
+MIN_RATE=1
+MAX_RATE=200
+RATE_STEP=10
+INTERVAL=5
+PROBE_TARGET=""
+PROBE_SCRIPT="/opt/pbx-migration/scripts/sip_probe.py"
+PROBE_COUNT=5
+TARGET_P95_MS=100
+SETTLE=0
+PROGRESS_FILE=""
+DONE_FILE=""
+
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --old-pbx-host) OLD_PBX_HOST="${2:-}"; shift 2 ;;
+    --old-pbx-user) OLD_PBX_USER="${2:-}"; shift 2 ;;
+    --old-pbx-ssh-port) OLD_PBX_SSH_PORT="${2:-}"; shift 2 ;;
+    --new-pbx-host) NEW_PBX_HOST="${2:-}"; shift 2 ;;
+    --new-pbx-user) NEW_PBX_USER="${2:-}"; shift 2 ;;
+    --new-pbx-ssh-port) NEW_PBX_SSH_PORT="${2:-}"; shift 2 ;;
+    --kamailio-host) KAMAILIO_HOST="${2:-}"; shift 2 ;;
+    --kamailio-user) KAMAILIO_USER="${2:-}"; shift 2 ;;
+    --kamailio-ssh-port) KAMAILIO_SSH_PORT="${2:-}"; shift 2 ;;
+    --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
+    --ssh-control-dir) SSH_CONTROL_DIR="${2:-}"; shift 2 ;;
+    --no-ssh-mux) SSH_MUX="false"; shift ;;
+    --trace-file) TRACE_FILE_ARG="${2:-}"; shift 2 ;;
+    --registrations-file) REGISTRATIONS_FILE="${2:-}"; shift 2 ;;
+    --trigger-cmd) TRIGGER_CMD="${2:-}"; shift 2 ;;
+    --rate) RATE="${2:-}"; shift 2 ;;
+    --min-rate) MIN_RATE="${2:-}"; shift 2 ;;
+    --max-rate) MAX_RATE="${2:-}"; shift 2 ;;
+    --rate-step) RATE_STEP="${2:-}"; shift 2 ;;
+    --interval) INTERVAL="${2:-}"; shift 2 ;;
+    --probe-target) PROBE_TARGET="${2:-}"; shift 2 ;;
+    --probe-script) PROBE_SCRIPT="${2:-}"; shift 2 ;;
+    --probe-count) PROBE_COUNT="${2:-}"; shift 2 ;;
+    --target-p95-ms) TARGET_P95_MS="${2:-}"; shift 2 ;;
+    --settle) SETTLE="${2:-}"; shift 2 ;;
+    --progress-file) PROGRESS_FILE="${2:-}"; shift 2 ;;
+    --done-file) DONE_FILE="${2:-}"; shift 2 ;;
+    --help|-h) usage; exit 0 ;;
+    *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
+  esac
+done
+
+for value in "$RATE" "$MIN_RATE" "$MAX_RATE" "$RATE_STEP" "$INTERVAL" "$PROBE_COUNT" "$TARGET_P95_MS" "$SETTLE"; do
+  if [[ ! "$value" =~ ^[0-9]+$ ]]; then
+    echo "Numeric options must be non-negative integers (got: ${value})" >&2
+    exit 1
+  fi
+done
+if (( MIN_RATE < 1 )); then MIN_RATE=1; fi
+if (( MAX_RATE < MIN_RATE )); then MAX_RATE="$MIN_RATE"; fi
+if (( RATE < MIN_RATE )); then RATE="$MIN_RATE"; fi
+if (( RATE > MAX_RATE )); then RATE="$MAX_RATE"; fi
+if (( INTERVAL < 1 )); then INTERVAL=1; fi
+if [[ -n "$REGISTRATIONS_FILE" && ! -f "$REGISTRATIONS_FILE" ]]; then
+  echo "--registrations-file not found: ${REGISTRATIONS_FILE}" >&2
+  exit 1
+fi
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# shellcheck source=ssh_mux.sh
+source "${SCRIPT_DIR}/ssh_mux.sh"
+# shellcheck source=trace_events.sh
+source "${SCRIPT_DIR}/trace_events.sh"
+
+trace_init "$TRACE_FILE_ARG" migrate_registrations
+
+if [[ -n "$OLD_PBX_HOST" || -n "$NEW_PBX_HOST" || -n "$KAMAILIO_HOST" ]]; then
+  ssh_opts=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new)
+  if [[ -n "$SSH_KEY" ]]; then
+    ssh_opts+=(-i "$SSH_KEY")
+  fi
+  ssh_mux_init "$SSH_CONTROL_DIR" "$SSH_MUX" "${ssh_opts[@]}"
+fi
+
+run_old() {
+  if [[ -n "$OLD_PBX_HOST" ]]; then
+    mux_ssh "$OLD_PBX_USER" "$OLD_PBX_HOST" "$OLD_PBX_SSH_PORT" "$1"
+  else
+    bash -lc "$1"
+  fi
+}
+
+# run_old_script feeds a script to bash on the old PBX over stdin: a trigger
+# batch holds up to --max-rate * --interval commands, more than fits in one
+# command-line argument.
+run_old_script() {
+  if [[ -n "$OLD_PBX_HOST" ]]; then
+    mux_ssh "$OLD_PBX_USER" "$OLD_PBX_HOST" "$OLD_PBX_SSH_PORT" "bash -s" <<< "$1"
+  else
+    bash -ls <<< "$1"
+  fi
+}
+
+run_new() {
+  if [[ -n "$NEW_PBX_HOST" ]]; then
+    mux_ssh "$NEW_PBX_USER" "$NEW_PBX_HOST" "$NEW_PBX_SSH_PORT" "$1"
+  else
+    bash -lc "$1"
+  fi
+}
+
+run_kam() {
+  if [[ -n "$KAMAILIO_HOST" ]]; then
+    mux_ssh "$KAMAILIO_USER" "$KAMAILIO_HOST" "$KAMAILIO_SSH_PORT" "$1"
+  else
+    bash -lc "$1"
+  fi
+}
+
+# registration_rows reads "show registrations" output (optionally a snapshot
+# file with "# Command"/"# Output" sections) and prints "profile user@realm"
+# per distinct registration. With the FreeSWITCH header the user is
+# reg_user@realm and the profile comes from the url column; without it the
+# first field is the user and the profile is the first "sofia/<profile>" seen.
+registration_rows() {
+  awk -F',' '
+    /^# Command/ { skip = 1; next }
+    /^# Output/ { skip = 0; next }
+    skip { next }
+    /^[0-9]+ total\./ || NF < 2 { next }
+    $1 == "reg_user" { for (i = 1; i <= NF; i++) col[$i] = i; header = 1; next }
+    {
+      if (header) {
+        user = $col["reg_user"]
+        if ("realm" in col && $col["realm"] != "") user = user "@" $col["realm"]
+      } else {
+        user = $1
+      }
+      profile = "-"
+      if (match($0, /sofia\/[^\/,[:space:]]+/)) profile = substr($0, RSTART + 6, RLENGTH - 6)
+      # Only plain SIP identities are put into a remote command line.
+      if (user !~ /^[A-Za-z0-9@._+-]+$/ || profile !~ /^[A-Za-z0-9._-]+$/) { bad++; next }
+      if (!seen[user]++) print profile, user
+    }
+    END { if (bad) printf "WARNING: skipped %d registration(s) with unexpected characters\n", bad > "/dev/stderr" }'
+}
+
+registration_count() {
+  "$1" "fs_cli -x 'show registrations count'" 2>/dev/null | grep -Eo '^[0-9]+' | head -n 1 || true
+}
+
+# probe_summary reads sip_probe.py JSON on stdin and prints "<p95 ms or -> <errors>".
+probe_summary() {
+  python3 -c '
+import json, sys
+try:
+    report = json.load(sys.stdin)
+except ValueError:
+    print("- -1")
+    raise SystemExit(0)
+p95 = (report.get("kinds", {}).get("OPTIONS") or {}).get("p95_ms")
+print("-" if p95 is None else f"{p95:.1f}", report.get("errors", 0))
+'
+}
+
+work_dir="$(mktemp -d "${TMPDIR:-/tmp}/pbx-regmig.XXXXXX")"
+trap 'rm -rf "$work_dir"; ssh_mux_teardown' EXIT
+plan="${work_dir}/plan"
+
+if [[ -n "$REGISTRATIONS_FILE" ]]; then
+  registration_rows < "$REGISTRATIONS_FILE" > "$plan"
+else
+  TRACE_OP=registrations_list run_old "fs_cli -x 'show registrations'" | registration_rows > "$plan"
+fi
+total="$(wc -l < "$plan" | tr -d ' ')"
+skipped=0
+if [[ -n "$DONE_FILE" && -s "$DONE_FILE" ]]; then
+  awk 'NR == FNR { done[$0] = 1; next } !($2 in done)' "$DONE_FILE" "$plan" > "${plan}.todo"
+  skipped=$(( total - $(wc -l < "${plan}.todo" | tr -d ' ') ))
+  mv "${plan}.todo" "$plan"
+fi
+pending="$(wc -l < "$plan" | tr -d ' ')"
+
+if [[ -n "$PROGRESS_FILE" && ! -s "$PROGRESS_FILE" ]]; then
+  echo "elapsed_s,batch,sent,pending,rate_per_s,probe_p95_ms,probe_errors,old_registrations,new_registrations" > "$PROGRESS_FILE"
+fi
+
+echo "Migrating ${pending} registration(s) (${skipped} already done) starting at ${RATE}/s (max ${MAX_RATE}/s, interval ${INTERVAL}s${PROBE_TARGET:+, target p95 ${TARGET_P95_MS}ms on ${PROBE_TARGET}})"
+
+run_start_ms="$(now_ms)"
+start_ts=$SECONDS
+batch_no=0
+sent=0
+line_no=0
+failed_users=()
+
+sample() {
+  local old_regs new_regs p95="-" probe_errors="-" elapsed=$((SECONDS - start_ts))
+  old_regs="$(TRACE_OP=registrations_count registration_count run_old)"
+  new_regs="$(TRACE_OP=registrations_count registration_count run_new)"
+  if [[ -n "$PROBE_TARGET" ]] && (( PROBE_COUNT > 0 )); then
+    read -r p95 probe_errors <<< "$(TRACE_OP=registrations_probe run_kam "python3 '${PROBE_SCRIPT}' --target '${PROBE_TARGET}' --count ${PROBE_COUNT} --rate ${PROBE_COUNT} --json" 2>/dev/null | probe_summary)"
+  fi
+  SAMPLE_P95="$p95"
+  SAMPLE_ERRORS="$probe_errors"
+  if [[ -n "$PROGRESS_FILE" ]]; then
+    echo "${elapsed},${batch_no},${sent},$((pending - sent)),${RATE},${p95},${probe_errors},${old_regs:--},${new_regs:--}" >> "$PROGRESS_FILE"
+  fi
+  echo "[$(date +'%Y-%m-%d %H:%M:%S')] t=${elapsed}s batch=${batch_no} sent=${sent}/${pending} rate=${RATE}/s probe_p95=${p95}ms probe_errors=${probe_errors} old_regs=${old_regs:--} new_regs=${new_regs:--}"
+}
+
+while (( line_no < pending )); do
+  batch_start_ms="$(now_ms)"
+  batch_started=$SECONDS
+  batch_no=$((batch_no + 1))
+  size=$(( RATE * INTERVAL ))
+  # The batch is spread over the interval: a sleep after every slice of
+  # about a tenth of a second's worth of users keeps the new PBX at RATE/s
+  # (at most; triggers run one after another) instead of one burst.
+  slice=$(( (RATE + 9) / 10 ))
+  slice_ms=$(( slice * 1000 / RATE ))
+  slice_sleep="$(printf '%d.%03d' $((slice_ms / 1000)) $((slice_ms % 1000)))"
+  batch_cmd=""
+  batch_users=()
+  while read -r profile user; do
+    if (( ${#batch_users[@]} > 0 && ${#batch_users[@]} % slice == 0 )); then
+      batch_cmd+="sleep ${slice_sleep}"$'\n'
+    fi
+    cmd="${TRIGGER_CMD//\{profile\}/$profile}"
+    # One "TRIGGER <index> <rc>" line per user, so a failed trigger is not
+    # counted as sent nor recorded in --done-file. stdin is the batch script
+    # itself, so triggers must not read it.
+    batch_cmd+="{ ${cmd//\{user\}/$user}; } </dev/null >/dev/null 2>&1; echo \"TRIGGER ${#batch_users[@]} \$?\""$'\n'
+    batch_users+=("$user")
+  done < <(sed -n "$((line_no + 1)),$((line_no + size))p" "$plan")
+  line_no=$((line_no + ${#batch_users[@]}))
+
+  batch_rc=0
+  batch_out="$(TRACE_OP=registrations_trigger run_old_script "${batch_cmd}true")" || batch_rc=$?
+  ok_users=()
+  batch_failed=()
+  trigger_rc=()
+  while read -r tag idx rc; do
+    if [[ "$tag" == "TRIGGER" && "$idx" =~ ^[0-9]+$ ]]; then
+      trigger_rc[$idx]="$rc"
+    fi
+  done <<< "$batch_out"
+  for idx in "${!batch_users[@]}"; do
+    case "${trigger_rc[$idx]:-}" in
+      0) ok_users+=("${batch_users[$idx]}") ;;
+      "") ;;
+      *) batch_failed+=("${batch_users[$idx]}") ;;
+    esac
+  done
+  sent=$((sent + ${#ok_users[@]}))
+  if [[ -n "$DONE_FILE" ]] && (( ${#ok_users[@]} > 0 )); then
+    printf '%s\n' "${ok_users[@]}" >> "$DONE_FILE"
+  fi
+  if (( ${#batch_failed[@]} > 0 )); then
+    echo "WARNING: trigger failed for ${#batch_failed[@]} user(s) in batch ${batch_no}: ${batch_failed[*]}" >&2
+    failed_users+=("${batch_failed[@]}")
+  fi
+  if (( batch_rc != 0 )); then
+    echo "ERROR: trigger batch ${batch_no} failed on the old PBX (exit ${batch_rc}); ${#ok_users[@]} of ${#batch_users[@]} user(s) triggered" >&2
+    trace_span registration_batch "$batch_start_ms" "$(now_ms)" error batch="$batch_no" size="${#batch_users[@]}" rc="$batch_rc"
+    trace_span registrations "$run_start_ms" "$(now_ms)" error sent="$sent" pending="$pending" batches="$batch_no" failed="${#failed_users[@]}"
+    exit 1
+  fi
+
+  sample
+  old_rate="$RATE"
+  if [[ -n "$PROBE_TARGET" ]] && (( PROBE_COUNT > 0 )); then
+    if [[ "$SAMPLE_P95" == "-" || "$SAMPLE_ERRORS" != "0" ]] || awk -v p="$SAMPLE_P95" -v t="$TARGET_P95_MS" 'BEGIN { exit !(p > t) }'; then
+      RATE=$(( RATE / 2 ))
+      (( RATE >= MIN_RATE )) || RATE="$MIN_RATE"
+    else
+      RATE=$(( RATE + RATE_STEP ))
+      (( RATE <= MAX_RATE )) || RATE="$MAX_RATE"
+    fi
+    if (( RATE != old_rate )); then
+      echo "Rate ${old_rate}/s -> ${RATE}/s (probe p95 ${SAMPLE_P95}ms, errors ${SAMPLE_ERRORS})"
+    fi
+  fi
+  trace_span registration_batch "$batch_start_ms" "$(now_ms)" "$(trace_status "${#batch_failed[@]}")" batch="$batch_no" size="${#batch_users[@]}" \
+    failed="${#batch_failed[@]}" rate="$old_rate" next_rate="$RATE" probe_p95_ms="$SAMPLE_P95"
+
+  if (( line_no < pending )); then
+    wait_s=$(( INTERVAL - (SECONDS - batch_started) ))
+    (( wait_s <= 0 )) || sleep "$wait_s"
+  fi
+done
+
+if (( batch_no == 0 )); then
+  sample
+fi
+
+settle_end=$((SECONDS + SETTLE))
+while (( SECONDS < settle_end )); do
+  sleep $(( settle_end - SECONDS < INTERVAL ? settle_end - SECONDS : INTERVAL ))
+  sample
+done
+
+trace_span registrations "$run_start_ms" "$(now_ms)" "$(trace_status "${#failed_users[@]}")" sent="$sent" pending="$pending" batches="$batch_no" \
+  failed="${#failed_users[@]}" final_rate="$RATE"
+echo "Registration migration triggered ${sent} re-registration(s) in ${batch_no} batch(es) over $((SECONDS - start_ts))s."
+if (( ${#failed_users[@]} > 0 )); then
+  echo "ERROR: trigger command failed for ${#failed_users[@]} user(s), not recorded as done (a rerun retries them): ${failed_users[*]}" >&2
+  exit 1
+fi
@@ -5,15 +5,20 @@ usage() {
   cat <<'USAGE'
 Usage:
   orchestrate_migration_over_ssh.sh \
-    --mode old|both|new \
+    --mode old|both|new|ramp \
     --kamailio-host HOST \
     --old-pbx-ip IP \
     --new-pbx-ip IP \
     [options]
 
 Required:
-  --mode MODE                  Dispatcher mode to apply: old, both, or new.
-  --kamailio-host HOST         SSH hostname/IP for Kamailio.
+  --mode MODE                  Dispatcher mode to apply: old, both, new, or ramp.
+  --kamailio-host HOST         SSH hostname/IP for Kamailio. Repeat for an edge of
+                               several Kamailio nodes (same user, port, and paths):
+                               profiles are uploaded and staged on every node in
+                               parallel, then all nodes rename and reload at one
+                               instant (see --commit-lead-ms). Readiness, watchdog,
+                               and registration probes run from the first node.
   --old-pbx-ip IP              Old PBX signaling IP/FQDN used in dispatcher URI.
   --new-pbx-ip IP              New PBX signaling IP/FQDN used in dispatcher URI.
 
@@ -27,22 +32,147 @@ Core options:
   --new-pbx-user USER          SSH user for new PBX. Default: root
   --new-pbx-ssh-port PORT      SSH port for new PBX. Default: 22
   --ssh-key PATH               Private key path used for SSH/SCP.
+  --no-ssh-mux                 Open a new SSH connection for every ssh/scp call
+                               instead of sharing one master connection per host.
   --sip-port PORT              SIP port for URIs. Default: 5060
   --sip-scheme sip|sips        URI scheme. Default: sip
   --set-id N                   Dispatcher set id. Default: 1
   --dispatcher-target PATH     Kamailio dispatcher file. Default: /etc/kamailio/dispatcher.list
   --reload-cmd CMD             Reload command on Kamailio. Default: kamcmd dispatcher.reload
+  --ctl-socket SOCK            Reload through Kamailio's ctl (BINRPC) socket instead of
+                               --reload-cmd, e.g. unix:/run/kamailio/kamailio_ctl.
+                               Verifies the in-memory sets against the applied file
+                               and reports reload latency (needs python3 on Kamailio).
+  --profile-spec FILE          JSON backend spec for dispatcher_profiles.py: several
+                               backends per side, several set IDs, per-destination
+                               flags/priority/attrs. Replaces the single
+                               --old/--new-pbx-ip URI and --set-id in profiles.
+  --profile-dir DIR            Use prebuilt dispatcher.profile.<label>.list files from
+                               DIR (for example from a wizard fleet run) instead of
+                               generating them.
+
+Ramp mode (--mode ramp):
+  --ramp-schedule LIST         Comma-separated new-pbx weight percentages, ascending,
+                               1-100. Default: 5,25,50,100
+  --ramp-hold SEC              Hold time between ramp steps. Default: 300
+  --ramp-health-cmd CMD        Health gate run on the new PBX before each step;
+                               a non-zero exit stops the ramp (and rolls back with
+                               --auto-rollback).
+                               Default: fs_cli -x 'sofia status' | grep -q RUNNING
+  Ramp profiles use the dispatcher "weight" attribute, which Kamailio only
+  honours with ds_select_dst algorithm 9.
+
+Readiness gate (before any profile is applied):
+  --readiness-gate             Snapshot the new PBX and check it (sofia profiles
+                               RUNNING, registrations, SIP listener), then send a
+                               synthetic OPTIONS/INVITE burst with sip_probe.py.
+                               Any failure aborts the run before apply.
+  --readiness-target HOST[:PORT]
+                               SIP address to probe. Default: --new-pbx-ip:--sip-port
+  --readiness-from WHERE       kamailio (run sip_probe.py from --remote-script-dir on
+                               Kamailio, whose address the PBX trusts) or local.
+                               Default: kamailio
+  --readiness-burst N          OPTIONS requests in the burst. Default: 50
+  --readiness-rate N           Requests per second. Default: 10
+  --readiness-invite-user EXT  Also INVITE (then CANCEL) this extension.
+  --readiness-invites N        INVITEs with --readiness-invite-user. Default: 5
+  --readiness-max-p95-ms MS    p95 response latency limit. Default: 200
+  --readiness-max-error-pct P  Timeouts plus 5xx/6xx limit, percent. Default: 1
+  --readiness-min-registrations N
+                               Minimum registrations on the new PBX. Default: 0
+  --readiness-profiles LIST    Comma-separated sofia profiles that must be RUNNING.
+                               Default: any profile RUNNING
+
+Post-cutover watchdog (after apply; needs --auto-rollback):
+  --watchdog SEC               Watch the cutover for SEC seconds after apply with
+                               post_cutover_watchdog.sh and roll back to the pre-run
+                               profile when an SLO is breached. Default: 0 (off)
+  --watchdog-interval SEC      Sample interval. Default: 15
+  --watchdog-max-error-pct P   Limit for the 5xx+6xx share of Kamailio's final
+                               replies per interval, and for probe errors. Default: 5
+  --watchdog-min-transactions N
+                               Intervals with fewer final replies are not judged.
+                               Default: 20
+  --watchdog-stats-cmd CMD     Kamailio tm counters. Default: kamcmd
+                               stats.get_statistics tm: (the ctl socket with --ctl-socket)
+  --watchdog-probe-count N     OPTIONS per sample from Kamailio to --readiness-target
+                               with sip_probe.py (0 disables). Default: 10
+  --watchdog-max-p95-ms MS     Probe p95 latency limit. Default: 500
+  --watchdog-min-new-channels N
+                               New PBX channel count must reach N during the window.
+                               Default: 0
+  --watchdog-breaches N        Consecutive breached samples that trigger the
+                               rollback. Default: 2
+
+Registration migration (after apply and watchdog; --mode new or ramp):
+  --migrate-registrations      Make the old PBX's registered phones re-register (via
+                               Kamailio, now routing to the new PBX) in rate-limited
+                               batches with migrate_registrations.sh. Progress is
+                               written to registrations-progress.csv; a resumed run
+                               skips users listed in registrations-done.txt.
+  --reg-rate N                 Starting re-registrations per second. Default: 20
+  --reg-max-rate N             Rate ceiling. Default: 200
+  --reg-interval SEC           Seconds between batches. Default: 5
+  --reg-target-p95-ms MS       The rate grows while the new PBX's OPTIONS p95 (probed
+                               from Kamailio at --readiness-target) stays at or below
+                               MS with no errors, and halves otherwise. Default: 100
+  --reg-probe-count N          OPTIONS per probe (0 keeps the rate fixed). Default: 5
+  --reg-trigger-cmd TEMPLATE   Command run on the old PBX per registration; {profile}
+                               and {user} (user@realm) are substituted. Default:
+                               fs_cli -x 'sofia profile {profile} check_sync {user}'
+  --reg-settle SEC             Keep sampling both PBXes' registration counts after
+                               the last batch. Default: 0
 
 Safety and behavior:
-  --capture-snapshots          Capture pre/post snapshots from old/new PBX.
+  --capture-snapshots          Capture pre/post snapshots from old/new PBX (old and
+                               new in parallel, one batched SSH exec per host) and
+                               diff the source PBX's pre snapshot against the
+                               destination's post snapshot (snapshot-diff.json;
+                               report only).
+  --snapshot-store DIR         When the run completes or is rolled back, move its
+                               snapshot directories into the compressed,
+                               deduplicated store DIR (snapshot_store.py; use its
+                               export command for the text files).
   --wait-for-drain             Wait for old PBX channel drain after apply (use with --mode new).
   --drain-threshold N          Drain threshold. Default: 0
-  --drain-interval SEC         Drain poll interval. Default: 15
+  --drain-interval SEC         Starting drain poll interval; adapts to the
+                               projected drain time. Default: 15
   --drain-timeout SEC          Drain timeout. Default: 14400
-  --auto-rollback              On failure after apply attempt, revert dispatcher to old profile.
+  --drain-method METHOD        auto, esl, or poll. auto keeps one event socket
+                               subscription on the old PBX and falls back to
+                               polling if ESL is unavailable. Default: auto
+  --auto-rollback              On failure after apply attempt, restore the dispatcher file
+                               pinned on Kamailio before the first apply (one remote
+                               rename + reload); falls back to the uploaded old profile.
+  --metrics-file PATH          Also write the run's metrics in Prometheus text format
+                               (node_exporter textfile collector) to PATH; written
+                               atomically at exit, including failed runs.
+  --commit-lead-ms MS          With several --kamailio-host nodes: once every node has
+                               staged the profile, each is told to switch at now + MS
+                               (node wall clock), so SSH latency does not skew the
+                               cutover. Per-node timings and the reload skew go to
+                               kamailio-commits.csv. Default: 1000
+  --max-parallel-steps N       Pre-apply steps (profile build, snapshots, per-host
+                               prechecks, readiness gate, uploads) run as a dependency
+                               graph, each as soon as its dependencies finish. Limit
+                               how many run at once; 1 runs them in order. Default: 0
+                               (no limit)
   --dry-run                    Print actions without making changes.
   --confirm                    Required for non-dry-run execution.
 
+Checkpoints and resume:
+  Every run records its arguments (run-args) and completed steps (state.env) in
+  the run directory.
+  --resume RUN_DIR             Continue an interrupted run under the same run id with
+                               its saved arguments (arguments given now override, e.g.
+                               --drain-timeout). Completed steps are skipped; uploaded
+                               profiles and an interrupted apply are checked against
+                               Kamailio before anything is redone, and the drain
+                               timeout counts from the original drain start.
+  --detach-drain               With --wait-for-drain: start the drain wait on the old PBX
+                               under nohup and exit; --resume RUN_DIR later polls it and
+                               finishes the run (post snapshots).
+
 Path options:
   --remote-script-dir PATH     Directory on Kamailio containing apply script.
                                Default: /opt/pbx-migration/scripts
@@ -61,6 +191,16 @@ Examples:
     --capture-snapshots \
     --confirm
 
+  orchestrate_migration_over_ssh.sh \
+    --mode ramp \
+    --ramp-schedule 5,25,50,100 \
+    --ramp-hold 600 \
+    --kamailio-host 198.51.100.30 \
+    --old-pbx-ip 198.51.100.10 \
+    --new-pbx-ip 198.51.100.20 \
+    --auto-rollback \
+    --confirm
+
   orchestrate_migration_over_ssh.sh \
     --mode new \
     --kamailio-host 198.51.100.30 \
@@ -73,12 +213,23 @@ USAGE
 }
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-BUILD_SCRIPT="${SCRIPT_DIR}/build_dispatcher_list.sh"
+PROFILE_GEN="${SCRIPT_DIR}/dispatcher_profiles.py"
 APPLY_SCRIPT_NAME="apply_dispatcher_profile.sh"
 SNAPSHOT_SCRIPT="${SCRIPT_DIR}/discovery_snapshot.sh"
 DRAIN_SCRIPT="${SCRIPT_DIR}/wait_for_channel_drain.sh"
+WATCHDOG_SCRIPT="${SCRIPT_DIR}/post_cutover_watchdog.sh"
+REGISTRATIONS_SCRIPT="${SCRIPT_DIR}/migrate_registrations.sh"
+SSH_MUX_LIB="${SCRIPT_DIR}/ssh_mux.sh"
+TRACE_LIB="${SCRIPT_DIR}/trace_events.sh"
+DAG_LIB="${SCRIPT_DIR}/dag.sh"
+TRACE_REPORT="${SCRIPT_DIR}/trace_report.py"
+SIP_PROBE="${SCRIPT_DIR}/sip_probe.py"
+SNAPSHOT_CHECKS="${SCRIPT_DIR}/snapshot_checks.py"
+SNAPSHOT_DIFF="${SCRIPT_DIR}/snapshot_diff.py"
+SNAPSHOT_STORE_SCRIPT="${SCRIPT_DIR}/snapshot_store.py"
 
 MODE=""
+KAMAILIO_HOSTS=()
 KAMAILIO_HOST=""
 KAMAILIO_USER="root"
 KAMAILIO_SSH_PORT="22"
@@ -91,59 +242,157 @@ NEW_PBX_HOST=""
 NEW_PBX_USER="root"
 NEW_PBX_SSH_PORT="22"
 SSH_KEY=""
+SSH_MUX="true"
 SIP_PORT="5060"
 SIP_SCHEME="sip"
 SET_ID="1"
+PROFILE_SPEC=""
+PROFILE_DIR=""
 DISPATCHER_TARGET="/etc/kamailio/dispatcher.list"
 RELOAD_CMD="kamcmd dispatcher.reload"
+CTL_SOCKET=""
 REMOTE_SCRIPT_DIR="/opt/pbx-migration/scripts"
 REMOTE_PROFILE_DIR="/tmp/pbx-migration"
 LOCAL_ARTIFACTS_DIR="./artifacts/orchestration"
 
+RAMP_SCHEDULE="5,25,50,100"
+RAMP_HOLD="300"
+RAMP_HEALTH_CMD="fs_cli -x 'sofia status' | grep -q RUNNING"
+
+READINESS_GATE="false"
+READINESS_TARGET=""
+READINESS_FROM="kamailio"
+READINESS_BURST="50"
+READINESS_RATE="10"
+READINESS_INVITE_USER=""
+READINESS_INVITES="5"
+READINESS_MAX_P95_MS="200"
+READINESS_MAX_ERROR_PCT="1"
+READINESS_MIN_REGISTRATIONS="0"
+READINESS_PROFILES=""
+
+WATCHDOG="0"
+WATCHDOG_INTERVAL="15"
+WATCHDOG_MAX_ERROR_PCT="5"
+WATCHDOG_MIN_TRANSACTIONS="20"
+WATCHDOG_STATS_CMD=""
+WATCHDOG_PROBE_COUNT="10"
+WATCHDOG_MAX_P95_MS="500"
+WATCHDOG_MIN_NEW_CHANNELS="0"
+WATCHDOG_BREACHES="2"
+
+MIGRATE_REGISTRATIONS="false"
+REG_RATE="20"
+REG_MAX_RATE="200"
+REG_INTERVAL="5"
+REG_TARGET_P95_MS="100"
+REG_PROBE_COUNT="5"
+REG_TRIGGER_CMD=""
+REG_SETTLE="0"
+
 CAPTURE_SNAPSHOTS="false"
+SNAPSHOT_STORE=""
 WAIT_FOR_DRAIN="false"
 DRAIN_THRESHOLD="0"
 DRAIN_INTERVAL="15"
 DRAIN_TIMEOUT="14400"
+DRAIN_METHOD="auto"
 AUTO_ROLLBACK="false"
+METRICS_FILE=""
+MAX_PARALLEL_STEPS="0"
+COMMIT_LEAD_MS="1000"
 DRY_RUN="false"
 CONFIRM="false"
+RESUME_DIR=""
+DETACH_DRAIN="false"
 
-while [[ $# -gt 0 ]]; do
-  case "$1" in
-    --mode) MODE="${2:-}"; shift 2 ;;
-    --kamailio-host) KAMAILIO_HOST="${2:-}"; shift 2 ;;
-    --kamailio-user) KAMAILIO_USER="${2:-}"; shift 2 ;;
-    --kamailio-ssh-port) KAMAILIO_SSH_PORT="${2:-}"; shift 2 ;;
-    --old-pbx-ip) OLD_PBX_IP="${2:-}"; shift 2 ;;
-    --new-pbx-ip) NEW_PBX_IP="${2:-}"; shift 2 ;;
-    --old-pbx-host) OLD_PBX_HOST="${2:-}"; shift 2 ;;
-    --old-pbx-user) OLD_PBX_USER="${2:-}"; shift 2 ;;
-    --old-pbx-ssh-port) OLD_PBX_SSH_PORT="${2:-}"; shift 2 ;;
-    --new-pbx-host) NEW_PBX_HOST="${2:-}"; shift 2 ;;
-    --new-pbx-user) NEW_PBX_USER="${2:-}"; shift 2 ;;
-    --new-pbx-ssh-port) NEW_PBX_SSH_PORT="${2:-}"; shift 2 ;;
-    --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
-    --sip-port) SIP_PORT="${2:-}"; shift 2 ;;
-    --sip-scheme) SIP_SCHEME="${2:-}"; shift 2 ;;
-    --set-id) SET_ID="${2:-}"; shift 2 ;;
-    --dispatcher-target) DISPATCHER_TARGET="${2:-}"; shift 2 ;;
-    --reload-cmd) RELOAD_CMD="${2:-}"; shift 2 ;;
-    --remote-script-dir) REMOTE_SCRIPT_DIR="${2:-}"; shift 2 ;;
-    --remote-profile-dir) REMOTE_PROFILE_DIR="${2:-}"; shift 2 ;;
-    --local-artifacts-dir) LOCAL_ARTIFACTS_DIR="${2:-}"; shift 2 ;;
-    --capture-snapshots) CAPTURE_SNAPSHOTS="true"; shift ;;
-    --wait-for-drain) WAIT_FOR_DRAIN="true"; shift ;;
-    --drain-threshold) DRAIN_THRESHOLD="${2:-}"; shift 2 ;;
-    --drain-interval) DRAIN_INTERVAL="${2:-}"; shift 2 ;;
-    --drain-timeout) DRAIN_TIMEOUT="${2:-}"; shift 2 ;;
-    --auto-rollback) AUTO_ROLLBACK="true"; shift ;;
-    --dry-run) DRY_RUN="true"; shift ;;
-    --confirm) CONFIRM="true"; shift ;;
-    --help|-h) usage; exit 0 ;;
-    *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
-  esac
-done
+# Parsed as a function so --resume can replay the run's saved arguments.
+parse_args() {
+  while [[ $# -gt 0 ]]; do
+    case "$1" in
+      --mode) MODE="${2:-}"; shift 2 ;;
+      --kamailio-host)
+        # Repeatable; a resumed run re-parses its saved arguments, so skip repeats.
+        [[ " ${KAMAILIO_HOSTS[*]:-} " == *" ${2:-} "* ]] || KAMAILIO_HOSTS+=("${2:-}")
+        shift 2
+        ;;
+      --kamailio-user) KAMAILIO_USER="${2:-}"; shift 2 ;;
+      --kamailio-ssh-port) KAMAILIO_SSH_PORT="${2:-}"; shift 2 ;;
+      --old-pbx-ip) OLD_PBX_IP="${2:-}"; shift 2 ;;
+      --new-pbx-ip) NEW_PBX_IP="${2:-}"; shift 2 ;;
+      --old-pbx-host) OLD_PBX_HOST="${2:-}"; shift 2 ;;
+      --old-pbx-user) OLD_PBX_USER="${2:-}"; shift 2 ;;
+      --old-pbx-ssh-port) OLD_PBX_SSH_PORT="${2:-}"; shift 2 ;;
+      --new-pbx-host) NEW_PBX_HOST="${2:-}"; shift 2 ;;
+      --new-pbx-user) NEW_PBX_USER="${2:-}"; shift 2 ;;
+      --new-pbx-ssh-port) NEW_PBX_SSH_PORT="${2:-}"; shift 2 ;;
+      --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
+      --no-ssh-mux) SSH_MUX="false"; shift ;;
+      --sip-port) SIP_PORT="${2:-}"; shift 2 ;;
+      --sip-scheme) SIP_SCHEME="${2:-}"; shift 2 ;;
+      --set-id) SET_ID="${2:-}"; shift 2 ;;
+      --profile-spec) PROFILE_SPEC="${2:-}"; shift 2 ;;
+      --profile-dir) PROFILE_DIR="${2:-}"; shift 2 ;;
+      --dispatcher-target) DISPATCHER_TARGET="${2:-}"; shift 2 ;;
+      --reload-cmd) RELOAD_CMD="${2:-}"; shift 2 ;;
+      --ctl-socket) CTL_SOCKET="${2:-}"; shift 2 ;;
+      --remote-script-dir) REMOTE_SCRIPT_DIR="${2:-}"; shift 2 ;;
+      --remote-profile-dir) REMOTE_PROFILE_DIR="${2:-}"; shift 2 ;;
+      --local-artifacts-dir) LOCAL_ARTIFACTS_DIR="${2:-}"; shift 2 ;;
+      --ramp-schedule) RAMP_SCHEDULE="${2:-}"; shift 2 ;;
+      --ramp-hold) RAMP_HOLD="${2:-}"; shift 2 ;;
+      --ramp-health-cmd) RAMP_HEALTH_CMD="${2:-}"; shift 2 ;;
+      --readiness-gate) READINESS_GATE="true"; shift ;;
+      --readiness-target) READINESS_TARGET="${2:-}"; shift 2 ;;
+      --readiness-from) READINESS_FROM="${2:-}"; shift 2 ;;
+      --readiness-burst) READINESS_BURST="${2:-}"; shift 2 ;;
+      --readiness-rate) READINESS_RATE="${2:-}"; shift 2 ;;
+      --readiness-invite-user) READINESS_INVITE_USER="${2:-}"; shift 2 ;;
+      --readiness-invites) READINESS_INVITES="${2:-}"; shift 2 ;;
+      --readiness-max-p95-ms) READINESS_MAX_P95_MS="${2:-}"; shift 2 ;;
+      --readiness-max-error-pct) READINESS_MAX_ERROR_PCT="${2:-}"; shift 2 ;;
+      --readiness-min-registrations) READINESS_MIN_REGISTRATIONS="${2:-}"; shift 2 ;;
+      --readiness-profiles) READINESS_PROFILES="${2:-}"; shift 2 ;;
+      --watchdog) WATCHDOG="${2:-}"; shift 2 ;;
+      --watchdog-interval) WATCHDOG_INTERVAL="${2:-}"; shift 2 ;;
+      --watchdog-max-error-pct) WATCHDOG_MAX_ERROR_PCT="${2:-}"; shift 2 ;;
+      --watchdog-min-transactions) WATCHDOG_MIN_TRANSACTIONS="${2:-}"; shift 2 ;;
+      --watchdog-stats-cmd) WATCHDOG_STATS_CMD="${2:-}"; shift 2 ;;
+      --watchdog-probe-count) WATCHDOG_PROBE_COUNT="${2:-}"; shift 2 ;;
+      --watchdog-max-p95-ms) WATCHDOG_MAX_P95_MS="${2:-}"; shift 2 ;;
+      --watchdog-min-new-channels) WATCHDOG_MIN_NEW_CHANNELS="${2:-}"; shift 2 ;;
+      --watchdog-breaches) WATCHDOG_BREACHES="${2:-}"; shift 2 ;;
+      --migrate-registrations) MIGRATE_REGISTRATIONS="true"; shift ;;
+      --reg-rate) REG_RATE="${2:-}"; shift 2 ;;
+      --reg-max-rate) REG_MAX_RATE="${2:-}"; shift 2 ;;
+      --reg-interval) REG_INTERVAL="${2:-}"; shift 2 ;;
+      --reg-target-p95-ms) REG_TARGET_P95_MS="${2:-}"; shift 2 ;;
+      --reg-probe-count) REG_PROBE_COUNT="${2:-}"; shift 2 ;;
+      --reg-trigger-cmd) REG_TRIGGER_CMD="${2:-}"; shift 2 ;;
+      --reg-settle) REG_SETTLE="${2:-}"; shift 2 ;;
+      --capture-snapshots) CAPTURE_SNAPSHOTS="true"; shift ;;
+      --snapshot-store) SNAPSHOT_STORE="${2:-}"; shift 2 ;;
+      --wait-for-drain) WAIT_FOR_DRAIN="true"; shift ;;
+      --drain-threshold) DRAIN_THRESHOLD="${2:-}"; shift 2 ;;
+      --drain-interval) DRAIN_INTERVAL="${2:-}"; shift 2 ;;
+      --drain-timeout) DRAIN_TIMEOUT="${2:-}"; shift 2 ;;
+      --drain-method) DRAIN_METHOD="${2:-}"; shift 2 ;;
+      --auto-rollback) AUTO_ROLLBACK="true"; shift ;;
+      --metrics-file) METRICS_FILE="${2:-}"; shift 2 ;;
+      --max-parallel-steps) MAX_PARALLEL_STEPS="${2:-}"; shift 2 ;;
+      --commit-lead-ms) COMMIT_LEAD_MS="${2:-}"; shift 2 ;;
+      --dry-run) DRY_RUN="true"; shift ;;
+      --confirm) CONFIRM="true"; shift ;;
+      --resume) RESUME_DIR="${2:-}"; shift 2 ;;
+      --detach-drain) DETACH_DRAIN="true"; shift ;;
+      --help|-h) usage; exit 0 ;;
+      *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
+    esac
+  done
+}
+
+ORIG_ARGS=("$@")
+parse_args "$@"
 
 die() {
   echo "ERROR: $*" >&2
@@ -163,12 +412,25 @@ is_valid_int() {
   [[ "$1" =~ ^[0-9]+$ ]]
 }
 
+if [[ -n "$RESUME_DIR" ]]; then
+  [[ -f "${RESUME_DIR%/}/state.env" && -f "${RESUME_DIR%/}/run-args" ]] || die "--resume: no checkpointed run in ${RESUME_DIR} (state.env/run-args missing)"
+  RESUME_ARGS=()
+  while IFS= read -r -d '' arg; do
+    RESUME_ARGS+=("$arg")
+  done < "${RESUME_DIR%/}/run-args"
+  # Saved arguments first, then the ones given now, so the latter win.
+  parse_args "${RESUME_ARGS[@]}"
+  parse_args "${ORIG_ARGS[@]}"
+  [[ "$DRY_RUN" == "false" ]] || die "--resume cannot be combined with --dry-run"
+fi
+
+KAMAILIO_HOST="${KAMAILIO_HOSTS[0]:-}"
 if [[ -z "$MODE" || -z "$KAMAILIO_HOST" || -z "$OLD_PBX_IP" || -z "$NEW_PBX_IP" ]]; then
   usage
   exit 1
 fi
 
-[[ "$MODE" == "old" || "$MODE" == "both" || "$MODE" == "new" ]] || die "--mode must be old, both, or new"
+[[ "$MODE" == "old" || "$MODE" == "both" || "$MODE" == "new" || "$MODE" == "ramp" ]] || die "--mode must be old, both, new, or ramp"
 [[ "$SIP_SCHEME" == "sip" || "$SIP_SCHEME" == "sips" ]] || die "--sip-scheme must be sip or sips"
 is_valid_port "$SIP_PORT" || die "--sip-port must be a valid port number"
 is_valid_port "$KAMAILIO_SSH_PORT" || die "--kamailio-ssh-port must be a valid port number"
@@ -178,10 +440,83 @@ is_valid_int "$SET_ID" || die "--set-id must be a non-negative integer"
 is_valid_int "$DRAIN_THRESHOLD" || die "--drain-threshold must be a non-negative integer"
 is_valid_int "$DRAIN_INTERVAL" || die "--drain-interval must be a non-negative integer"
 is_valid_int "$DRAIN_TIMEOUT" || die "--drain-timeout must be a non-negative integer"
+[[ "$DRAIN_METHOD" == "auto" || "$DRAIN_METHOD" == "esl" || "$DRAIN_METHOD" == "poll" ]] || die "--drain-method must be auto, esl, or poll"
+is_valid_int "$RAMP_HOLD" || die "--ramp-hold must be a non-negative integer"
+is_valid_int "$WATCHDOG" || die "--watchdog must be a non-negative integer"
+if (( WATCHDOG > 0 )); then
+  [[ "$AUTO_ROLLBACK" == "true" ]] || die "--watchdog needs --auto-rollback"
+  [[ "$MODE" != "old" ]] || die "--watchdog is not used with --mode old (nothing to roll back)"
+  for value in "$WATCHDOG_INTERVAL" "$WATCHDOG_MIN_TRANSACTIONS" "$WATCHDOG_PROBE_COUNT" "$WATCHDOG_MAX_P95_MS" "$WATCHDOG_MIN_NEW_CHANNELS" "$WATCHDOG_BREACHES"; do
+    is_valid_int "$value" || die "--watchdog-* counts and durations must be non-negative integers (got: ${value})"
+  done
+  [[ "$WATCHDOG_MAX_ERROR_PCT" =~ ^[0-9]+(\.[0-9]+)?$ ]] || die "--watchdog-max-error-pct must be a non-negative number"
+  [[ -x "$WATCHDOG_SCRIPT" ]] || die "Missing executable watchdog script: $WATCHDOG_SCRIPT"
+  command -v python3 >/dev/null 2>&1 || die "python3 is required for --watchdog"
+fi
+if [[ "$MIGRATE_REGISTRATIONS" == "true" ]]; then
+  [[ "$MODE" == "new" || "$MODE" == "ramp" ]] || die "--migrate-registrations needs --mode new or ramp (REGISTER must route to the new PBX)"
+  for value in "$REG_RATE" "$REG_MAX_RATE" "$REG_INTERVAL" "$REG_TARGET_P95_MS" "$REG_PROBE_COUNT" "$REG_SETTLE"; do
+    is_valid_int "$value" || die "--reg-* rates, counts and durations must be non-negative integers (got: ${value})"
+  done
+  (( REG_RATE >= 1 )) || die "--reg-rate must be at least 1"
+  [[ -x "$REGISTRATIONS_SCRIPT" ]] || die "Missing executable registration migration script: $REGISTRATIONS_SCRIPT"
+  command -v python3 >/dev/null 2>&1 || die "python3 is required for --migrate-registrations"
+fi
+if [[ "$READINESS_GATE" == "true" ]]; then
+  [[ "$READINESS_FROM" == "kamailio" || "$READINESS_FROM" == "local" ]] || die "--readiness-from must be kamailio or local"
+  is_valid_int "$READINESS_BURST" && (( READINESS_BURST >= 1 )) || die "--readiness-burst must be a positive integer"
+  is_valid_int "$READINESS_RATE" && (( READINESS_RATE >= 1 )) || die "--readiness-rate must be a positive integer"
+  is_valid_int "$READINESS_INVITES" || die "--readiness-invites must be a non-negative integer"
+  is_valid_int "$READINESS_MAX_P95_MS" || die "--readiness-max-p95-ms must be a non-negative integer"
+  [[ "$READINESS_MAX_ERROR_PCT" =~ ^[0-9]+(\.[0-9]+)?$ ]] || die "--readiness-max-error-pct must be a non-negative number"
+  is_valid_int "$READINESS_MIN_REGISTRATIONS" || die "--readiness-min-registrations must be a non-negative integer"
+  command -v python3 >/dev/null 2>&1 || die "python3 is required for --readiness-gate"
+  [[ -f "$SNAPSHOT_CHECKS" ]] || die "Missing snapshot checks: $SNAPSHOT_CHECKS"
+  [[ "$READINESS_FROM" == "kamailio" || -f "$SIP_PROBE" ]] || die "Missing SIP probe: $SIP_PROBE"
+fi
+
+RAMP_STEPS=()
+if [[ "$MODE" == "ramp" ]]; then
+  IFS=',' read -r -a RAMP_STEPS <<< "$RAMP_SCHEDULE"
+  (( ${#RAMP_STEPS[@]} > 0 )) || die "--ramp-schedule must list at least one step"
+  prev_step=0
+  for step in "${RAMP_STEPS[@]}"; do
+    is_valid_int "$step" && (( step >= 1 && step <= 100 )) || die "--ramp-schedule steps must be integers between 1 and 100"
+    (( step > prev_step )) || die "--ramp-schedule steps must be strictly ascending"
+    prev_step="$step"
+  done
+fi
 
-[[ -x "$BUILD_SCRIPT" ]] || die "Missing executable build script: $BUILD_SCRIPT"
+if [[ -n "$PROFILE_DIR" ]]; then
+  [[ -d "$PROFILE_DIR" ]] || die "--profile-dir not found: $PROFILE_DIR"
+  [[ -z "$PROFILE_SPEC" ]] || die "--profile-spec and --profile-dir are mutually exclusive"
+else
+  [[ -f "$PROFILE_GEN" ]] || die "Missing profile generator: $PROFILE_GEN"
+  command -v python3 >/dev/null 2>&1 || die "python3 is required to generate dispatcher profiles"
+  [[ -z "$PROFILE_SPEC" || -f "$PROFILE_SPEC" ]] || die "--profile-spec not found: $PROFILE_SPEC"
+fi
 [[ -x "$SNAPSHOT_SCRIPT" ]] || die "Missing executable snapshot script: $SNAPSHOT_SCRIPT"
 [[ -x "$DRAIN_SCRIPT" ]] || die "Missing executable drain script: $DRAIN_SCRIPT"
+[[ -f "$SSH_MUX_LIB" ]] || die "Missing SSH multiplexing library: $SSH_MUX_LIB"
+[[ -f "$TRACE_LIB" ]] || die "Missing trace library: $TRACE_LIB"
+[[ -f "$DAG_LIB" ]] || die "Missing step graph library: $DAG_LIB"
+is_valid_int "$MAX_PARALLEL_STEPS" || die "--max-parallel-steps must be a non-negative integer"
+is_valid_int "$COMMIT_LEAD_MS" || die "--commit-lead-ms must be a non-negative integer"
+if [[ -n "$METRICS_FILE" ]]; then
+  command -v python3 >/dev/null 2>&1 || die "python3 is required for --metrics-file"
+fi
+if [[ -n "$SNAPSHOT_STORE" ]]; then
+  command -v python3 >/dev/null 2>&1 || die "python3 is required for --snapshot-store"
+  [[ -f "$SNAPSHOT_STORE_SCRIPT" ]] || die "Missing snapshot store: $SNAPSHOT_STORE_SCRIPT"
+fi
+
+# shellcheck source=ssh_mux.sh
+source "$SSH_MUX_LIB"
+# shellcheck source=trace_events.sh
+source "$TRACE_LIB"
+# shellcheck source=dag.sh
+source "$DAG_LIB"
+DAG_JOBS="$MAX_PARALLEL_STEPS"
 
 require_cmd ssh
 require_cmd scp
@@ -193,20 +528,125 @@ fi
 
 if [[ -z "$OLD_PBX_HOST" ]]; then OLD_PBX_HOST="$OLD_PBX_IP"; fi
 if [[ -z "$NEW_PBX_HOST" ]]; then NEW_PBX_HOST="$NEW_PBX_IP"; fi
+if [[ -z "$READINESS_TARGET" ]]; then READINESS_TARGET="${NEW_PBX_IP}:${SIP_PORT}"; fi
 
 if [[ "$WAIT_FOR_DRAIN" == "true" && "$MODE" != "new" ]]; then
   die "--wait-for-drain is only valid with --mode new"
 fi
+if [[ "$DETACH_DRAIN" == "true" && "$WAIT_FOR_DRAIN" != "true" ]]; then
+  die "--detach-drain needs --wait-for-drain"
+fi
+
+RUN_START_MS="$(now_ms)"
+if [[ -n "$RESUME_DIR" ]]; then
+  RUN_DIR="${RESUME_DIR%/}"
+  RUN_TS="$(sed -n 's/^run_ts=//p' "${RUN_DIR}/state.env" | tail -n 1)"
+  [[ -n "$RUN_TS" ]] || die "--resume: run_ts missing from ${RUN_DIR}/state.env"
+  case "$(sed -n 's/^status=//p' "${RUN_DIR}/state.env" | tail -n 1)" in
+    ok) die "Run ${RUN_TS} already completed; nothing to resume" ;;
+    dry-run) die "Run ${RUN_TS} was a dry run; nothing to resume" ;;
+  esac
+  if grep -q '^rolled_back=' "${RUN_DIR}/state.env"; then
+    die "Run ${RUN_TS} was rolled back ($(sed -n 's/^rolled_back=//p' "${RUN_DIR}/state.env" | tail -n 1)); start a new run instead"
+  fi
+else
+  RUN_TS="$(date +%Y%m%d_%H%M%S)"
+  mkdir -p "${LOCAL_ARTIFACTS_DIR%/}"
+  # Concurrent runs (wizard fleet mode) can start within the same second; claim a
+  # unique run directory with an atomic mkdir and suffix the run id on collision.
+  run_seq=1
+  until mkdir "${LOCAL_ARTIFACTS_DIR%/}/run-${RUN_TS}" 2>/dev/null; do
+    run_seq=$((run_seq + 1))
+    (( run_seq <= 100 )) || die "Unable to create a unique run directory under ${LOCAL_ARTIFACTS_DIR}"
+    RUN_TS="${RUN_TS%%-*}-${run_seq}"
+  done
+  RUN_DIR="${LOCAL_ARTIFACTS_DIR%/}/run-${RUN_TS}"
+fi
+
+# Checkpoints: state.env is an append-only list of key=value lines (the last
+# value of a key wins), so an interruption mid-write never loses earlier steps.
+STATE_FILE="${RUN_DIR}/state.env"
+
+state_get() {
+  sed -n "s/^${1}=//p" "$STATE_FILE" 2>/dev/null | tail -n 1
+}
+
+state_set() {
+  printf '%s=%s\n' "$1" "$2" >> "$STATE_FILE"
+}
+
+# checkpoint STEP [VALUE] marks STEP done (or started/detached).
+checkpoint() {
+  state_set "step_$1" "${2:-done}"
+}
+
+step_done() {
+  [[ "$(state_get "step_$1")" == "done" ]]
+}
+
+if [[ -z "$RESUME_DIR" ]]; then
+  printf '%s\0' "${ORIG_ARGS[@]}" > "${RUN_DIR}/run-args"
+  state_set run_ts "$RUN_TS"
+  state_set mode "$MODE"
+else
+  echo "Resuming run ${RUN_TS} from ${STATE_FILE}"
+  state_set resumed_at "$(date +%Y-%m-%dT%H:%M:%S%z)"
+fi
+
+# Span per phase and per sub-step (SSH exec, SCP, reload, drain poll, snapshot)
+# as JSON lines; child scripts append to the same file via --trace-file.
+trace_init "${RUN_DIR}/trace.jsonl" orchestrate_migration_over_ssh
+CHILD_TRACE_ARGS=(--trace-file "$TRACE_FILE")
+
+# Per-phase wall time, one CSV row per phase (read by benchmark_orchestration.py).
+TIMINGS_FILE="${RUN_DIR}/phase_timings.csv"
+[[ -f "$TIMINGS_FILE" ]] || echo "phase,start_ms,end_ms,duration_ms,status" > "$TIMINGS_FILE"
+PHASE_NAME=""
+PHASE_START_MS=""
+PHASE_SUMMARY=""
 
-RUN_TS="$(date +%Y%m%d_%H%M%S)"
-RUN_DIR="${LOCAL_ARTIFACTS_DIR%/}/run-${RUN_TS}"
-mkdir -p "$RUN_DIR"
+# record_phase NAME START_MS STATUS [END_MS]
+record_phase() {
+  local name="$1"
+  local start="$2"
+  local status="$3"
+  local end="${4:-}"
+  [[ -n "$end" ]] || end="$(now_ms)"
+  echo "${name},${start},${end},$((end - start)),${status}" >> "$TIMINGS_FILE"
+  PHASE_SUMMARY+="${PHASE_SUMMARY:+ }${name}=$((end - start))"
+  if [[ "$name" != "total" ]]; then
+    trace_span phase "$start" "$end" "$status"
+  fi
+}
+
+phase_end() {
+  if [[ -n "$PHASE_NAME" ]]; then
+    record_phase "$PHASE_NAME" "$PHASE_START_MS" "${1:-ok}"
+    PHASE_NAME=""
+    export TRACE_PHASE=""
+  fi
+}
+
+phase_begin() {
+  phase_end
+  PHASE_NAME="$1"
+  PHASE_START_MS="$(now_ms)"
+  export TRACE_PHASE="$1"
+}
 
 OLD_URI="${SIP_SCHEME}:${OLD_PBX_IP}:${SIP_PORT}"
 NEW_URI="${SIP_SCHEME}:${NEW_PBX_IP}:${SIP_PORT}"
-PROFILE_SELECTED="${RUN_DIR}/dispatcher.profile.${MODE}.list"
+ramp_label() {
+  printf 'ramp-%03d' "$1"
+}
+
+SELECTED_LABEL="$MODE"
+if [[ "$MODE" == "ramp" ]]; then
+  SELECTED_LABEL="$(ramp_label "${RAMP_STEPS[${#RAMP_STEPS[@]}-1]}")"
+fi
+PROFILE_SELECTED="${RUN_DIR}/dispatcher.profile.${SELECTED_LABEL}.list"
 PROFILE_OLD="${RUN_DIR}/dispatcher.profile.old.list"
-REMOTE_SELECTED="${REMOTE_PROFILE_DIR%/}/dispatcher.profile.${MODE}.${RUN_TS}.list"
+REMOTE_SELECTED="${REMOTE_PROFILE_DIR%/}/dispatcher.profile.${SELECTED_LABEL}.${RUN_TS}.list"
 REMOTE_OLD="${REMOTE_PROFILE_DIR%/}/dispatcher.profile.old.${RUN_TS}.list"
 
 SSH_OPTS=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new -o ConnectTimeout=10)
@@ -214,9 +654,92 @@ if [[ -n "$SSH_KEY" ]]; then
   SSH_OPTS+=(-i "$SSH_KEY")
 fi
 
+ssh_mux_init "" "$SSH_MUX" "${SSH_OPTS[@]}"
+CHILD_SSH_ARGS=(--ssh-control-dir "$SSH_MUX_DIR")
+if [[ "$SSH_MUX" != "true" ]]; then
+  CHILD_SSH_ARGS+=(--no-ssh-mux)
+fi
+
+RUN_DETACHED="false"
+
+finish_run() {
+  local rc=$?
+  local status="ok"
+  if (( rc != 0 )); then
+    status="failed"
+  elif [[ "$DRY_RUN" == "true" ]]; then
+    status="dry-run"
+  elif [[ "$RUN_DETACHED" == "true" ]]; then
+    status="detached"
+  fi
+  state_set status "$status"
+  phase_end "$status"
+  record_phase total "$RUN_START_MS" "$status"
+  trace_span run "$RUN_START_MS" "$(now_ms)" "$status" rc="$rc" mode="$MODE" kamailio="$(IFS=,; echo "${KAMAILIO_HOSTS[*]}")" \
+    ssh_sessions="$(ssh_mux_count sessions.log)" ssh_handshakes="$(ssh_mux_count handshakes.log)"
+  echo "Phase timings (ms): ${PHASE_SUMMARY}"
+  ssh_mux_report | tee "${RUN_DIR}/ssh-stats.txt"
+  ssh_mux_teardown
+  if [[ -n "$METRICS_FILE" ]]; then
+    python3 "$TRACE_REPORT" metrics "$TRACE_FILE" --output "$METRICS_FILE" \
+      || echo "WARNING: failed to write metrics file: $METRICS_FILE" >&2
+  fi
+  # Runs that can still be resumed keep their text snapshots for the post diff.
+  if [[ -n "$SNAPSHOT_STORE" && "$DRY_RUN" != "true" ]] && [[ "$status" == "ok" || -n "$(state_get rolled_back)" ]]; then
+    python3 "$SNAPSHOT_STORE_SCRIPT" add "$SNAPSHOT_STORE" "$RUN_DIR" --run-id "$(basename "$RUN_DIR")" --remove \
+      || echo "WARNING: failed to store snapshots in: $SNAPSHOT_STORE" >&2
+  fi
+}
+
+trap finish_run EXIT
+
+# remote_kam runs on the first Kamailio node; remote_kam_on HOST CMD on any.
 remote_kam() {
+  remote_kam_on "$KAMAILIO_HOST" "$1"
+}
+
+remote_kam_on() {
+  local host="$1"
+  local cmd="$2"
+  mux_ssh "$KAMAILIO_USER" "$host" "$KAMAILIO_SSH_PORT" "$cmd"
+}
+
+# on_kamailio_nodes "HOST..." FUNC [ARG...] runs "FUNC HOST ARG..." for every
+# listed node concurrently and fails if any of them failed.
+on_kamailio_nodes() {
+  local hosts="$1"
+  shift
+  local host pid rc=0
+  local pids=()
+  for host in $hosts; do
+    "$1" "$host" "${@:2}" &
+    pids+=("$!")
+  done
+  for pid in "${pids[@]}"; do
+    wait "$pid" || rc=1
+  done
+  return "$rc"
+}
+
+remote_new() {
+  local cmd="$1"
+  mux_ssh "$NEW_PBX_USER" "$NEW_PBX_HOST" "$NEW_PBX_SSH_PORT" "$cmd"
+}
+
+remote_old() {
   local cmd="$1"
-  ssh "${SSH_OPTS[@]}" -p "$KAMAILIO_SSH_PORT" "${KAMAILIO_USER}@${KAMAILIO_HOST}" "$cmd"
+  mux_ssh "$OLD_PBX_USER" "$OLD_PBX_HOST" "$OLD_PBX_SSH_PORT" "$cmd"
+}
+
+# remote_sha256 HOST PATH... prints "<sha256> <path>" per readable file on a Kamailio node.
+remote_sha256() {
+  local host="$1"
+  shift
+  local paths="" path
+  for path in "$@"; do
+    paths+=" '${path}'"
+  done
+  TRACE_OP=verify remote_kam_on "$host" "sha256sum${paths} 2>/dev/null || shasum -a 256${paths} 2>/dev/null" | awk '{print $1, $2}' || true
 }
 
 kam_sudo_prefix=""
@@ -224,17 +747,63 @@ if [[ "$KAMAILIO_USER" != "root" ]]; then
   kam_sudo_prefix="sudo "
 fi
 
+apply_reload_args="--reload-cmd '${RELOAD_CMD}'"
+if [[ -n "$CTL_SOCKET" ]]; then
+  apply_reload_args="--ctl-socket '${CTL_SOCKET}'"
+fi
+
+if [[ -z "$WATCHDOG_STATS_CMD" ]]; then
+  WATCHDOG_STATS_CMD="${kam_sudo_prefix}kamcmd stats.get_statistics tm:"
+  if [[ -n "$CTL_SOCKET" ]]; then
+    WATCHDOG_STATS_CMD="${kam_sudo_prefix}python3 '${REMOTE_SCRIPT_DIR%/}/kamailio_ctl.py' --socket '${CTL_SOCKET}' call stats.get_statistics tm:"
+  fi
+fi
+
 applied="false"
 
+sha256_of() {
+  if command -v sha256sum >/dev/null 2>&1; then
+    sha256sum "$1" | awk '{print $1}'
+  else
+    shasum -a 256 "$1" | awk '{print $1}'
+  fi
+}
+
+# rollback_node HOST REASON restores one node. The apply script pinned the
+# pre-run dispatcher file there, so this is one remote rename + reload; the
+# uploaded old profile is only a fallback for a node whose pin is missing or
+# fails its checksum.
+rollback_node() {
+  local host="$1"
+  local reason="$2"
+  local rc=0
+  local source="pin"
+  local started_ms
+  started_ms="$(now_ms)"
+  TRACE_OP=rollback remote_kam_on "$host" "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --rollback --target '${DISPATCHER_TARGET}' ${apply_reload_args}" || rc=$?
+  if (( rc != 0 )); then
+    echo "Pinned rollback failed on ${host}; applying uploaded old profile instead..." >&2
+    rc=0
+    TRACE_OP=rollback remote_kam_on "$host" "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${REMOTE_OLD}' --target '${DISPATCHER_TARGET}' --sha256 '$(sha256_of "$PROFILE_OLD")' ${apply_reload_args}" || rc=$?
+    source="uploaded-old"
+  fi
+  trace_span rollback "$started_ms" "$(now_ms)" "$(trace_status "$rc")" rc="$rc" source="$source" reason="$reason" \
+    host="${KAMAILIO_USER}@${host}:${KAMAILIO_SSH_PORT}"
+  return "$rc"
+}
+
 rollback_if_needed() {
+  local reason="${1:-command failed}"
   if [[ "$AUTO_ROLLBACK" == "true" && "$MODE" != "old" && "$applied" == "true" ]]; then
-    echo "Attempting auto-rollback to old dispatcher profile..."
-    set +e
-    remote_kam "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${REMOTE_OLD}' --target '${DISPATCHER_TARGET}' --reload-cmd '${RELOAD_CMD}'"
-    local rc=$?
-    set -e
+    # Every node goes back, including those the failure did not touch, so the
+    # edge never keeps routing two ways.
+    echo "Attempting auto-rollback to pinned pre-run dispatcher profile..."
+    local started=$SECONDS
+    local rc=0
+    on_kamailio_nodes "${KAMAILIO_HOSTS[*]}" rollback_node "$reason" || rc=$?
     if (( rc == 0 )); then
-      echo "Auto-rollback succeeded."
+      state_set rolled_back "$reason"
+      echo "Auto-rollback succeeded in $((SECONDS - started))s."
     else
       echo "Auto-rollback failed. Manual intervention required." >&2
     fi
@@ -243,72 +812,681 @@ rollback_if_needed() {
 
 trap rollback_if_needed ERR
 
+# capture_snapshot SIDE PHASE captures one PBX (old or new) in a single
+# batched remote invocation.
+capture_snapshot() {
+  local side="$1"
+  local phase="$2"
+  if [[ "$side" == "old" ]]; then
+    "$SNAPSHOT_SCRIPT" --host "$OLD_PBX_HOST" --ssh-user "$OLD_PBX_USER" --ssh-port "$OLD_PBX_SSH_PORT" --ssh-key "$SSH_KEY" "${CHILD_SSH_ARGS[@]}" "${CHILD_TRACE_ARGS[@]}" --batch --label "old-${phase}-${MODE}" --output-dir "$RUN_DIR"
+  else
+    "$SNAPSHOT_SCRIPT" --host "$NEW_PBX_HOST" --ssh-user "$NEW_PBX_USER" --ssh-port "$NEW_PBX_SSH_PORT" --ssh-key "$SSH_KEY" "${CHILD_SSH_ARGS[@]}" "${CHILD_TRACE_ARGS[@]}" --batch --label "new-${phase}-${MODE}" --output-dir "$RUN_DIR"
+  fi
+}
+
+# capture_snapshot_pair PHASE captures old and new PBX snapshots concurrently.
+capture_snapshot_pair() {
+  local phase="$1"
+  local old_pid new_pid
+  local rc=0
+
+  capture_snapshot old "$phase" &
+  old_pid=$!
+  capture_snapshot new "$phase" &
+  new_pid=$!
+
+  wait "$old_pid" || rc=$?
+  wait "$new_pid" || rc=$?
+  return "$rc"
+}
+
+# diff_snapshot_pair compares the pre snapshot of the PBX traffic moves away
+# from with the post snapshot of the one it moves to. Report only.
+diff_snapshot_pair() {
+  local src dst base other
+  if [[ "$MODE" == "old" ]]; then
+    src="new"; dst="old"
+  else
+    src="old"; dst="new"
+  fi
+  base="$(ls -d "${RUN_DIR}/${src}-pre-${MODE}-"* 2>/dev/null | tail -n 1)"
+  other="$(ls -d "${RUN_DIR}/${dst}-post-${MODE}-"* 2>/dev/null | tail -n 1)"
+  if [[ -z "$base" || -z "$other" ]]; then
+    echo "WARNING: ${src}-pre or ${dst}-post snapshot not found; skipping snapshot diff." >&2
+    return 0
+  fi
+  echo "Diffing ${src}-pre against ${dst}-post snapshot..."
+  python3 "$SNAPSHOT_DIFF" "$base" "$other" --output "${RUN_DIR}/snapshot-diff.json" --details "${RUN_DIR}/snapshot-diff" \
+    || echo "WARNING: snapshot diff failed." >&2
+}
+
+READINESS_PROBE_ARGS=(--target "$READINESS_TARGET" --count "$READINESS_BURST" --rate "$READINESS_RATE" --max-p95-ms "$READINESS_MAX_P95_MS" --max-error-pct "$READINESS_MAX_ERROR_PCT" --json)
+if [[ -n "$READINESS_INVITE_USER" ]]; then
+  READINESS_PROBE_ARGS+=(--invite-user "$READINESS_INVITE_USER" --invites "$READINESS_INVITES")
+fi
+
+# readiness_probe_args prints the probe arguments single-quoted for a remote shell.
+readiness_probe_args() {
+  local arg
+  for arg in "${READINESS_PROBE_ARGS[@]}"; do
+    printf " '%s'" "$arg"
+  done
+}
+
+# run_readiness_gate snapshots the new PBX, checks the snapshot, and sends the
+# synthetic SIP burst; returns non-zero if any check or threshold fails.
+run_readiness_gate() {
+  local started_ms snap_out snap_dir rc=0
+  local checks_rc=0 probe_rc=0
+  started_ms="$(now_ms)"
+
+  echo "Capturing new PBX readiness snapshot..."
+  snap_out="$("$SNAPSHOT_SCRIPT" --host "$NEW_PBX_HOST" --ssh-user "$NEW_PBX_USER" --ssh-port "$NEW_PBX_SSH_PORT" --ssh-key "$SSH_KEY" "${CHILD_SSH_ARGS[@]}" "${CHILD_TRACE_ARGS[@]}" --batch --label "new-readiness-${MODE}" --output-dir "$RUN_DIR")" || rc=$?
+  echo "$snap_out"
+  snap_dir="$(sed -n 's/^Snapshot written to: //p' <<< "$snap_out" | tail -n 1)"
+  if (( rc != 0 )) || [[ -z "$snap_dir" ]]; then
+    echo "Readiness snapshot of ${NEW_PBX_HOST} failed." >&2
+    trace_span readiness "$started_ms" "$(now_ms)" error step=snapshot
+    return 1
+  fi
+
+  local check_args=(--listen-port "$SIP_PORT" --min-registrations "$READINESS_MIN_REGISTRATIONS" --output "${RUN_DIR}/readiness-checks.json")
+  local profile
+  if [[ -n "$READINESS_PROFILES" ]]; then
+    IFS=',' read -r -a readiness_profiles <<< "$READINESS_PROFILES"
+    for profile in "${readiness_profiles[@]}"; do
+      check_args+=(--profile "$profile")
+    done
+  fi
+  python3 "$SNAPSHOT_CHECKS" "$snap_dir" "${check_args[@]}" || checks_rc=$?
+
+  echo "Probing ${READINESS_TARGET} from ${READINESS_FROM} (${READINESS_BURST} OPTIONS at ${READINESS_RATE}/s${READINESS_INVITE_USER:+, ${READINESS_INVITES} INVITEs to ${READINESS_INVITE_USER}})..."
+  if [[ "$READINESS_FROM" == "kamailio" ]]; then
+    TRACE_OP=readiness_probe remote_kam "python3 '${REMOTE_SCRIPT_DIR%/}/sip_probe.py'$(readiness_probe_args)" > "${RUN_DIR}/readiness-sip.json" || probe_rc=$?
+  else
+    python3 "$SIP_PROBE" "${READINESS_PROBE_ARGS[@]}" > "${RUN_DIR}/readiness-sip.json" || probe_rc=$?
+  fi
+
+  rc=0
+  (( checks_rc == 0 && probe_rc == 0 )) || rc=1
+  trace_span readiness "$started_ms" "$(now_ms)" "$(trace_status "$rc")" checks_rc="$checks_rc" probe_rc="$probe_rc" target="$READINESS_TARGET"
+  return "$rc"
+}
+
 echo "Run directory: ${RUN_DIR}"
-echo "Generating dispatcher profiles..."
-"$BUILD_SCRIPT" --mode "$MODE" --old "$OLD_URI" --new "$NEW_URI" --set-id "$SET_ID" --output "$PROFILE_SELECTED"
-"$BUILD_SCRIPT" --mode "old" --old "$OLD_URI" --new "$NEW_URI" --set-id "$SET_ID" --output "$PROFILE_OLD"
+PROFILE_LABELS=()
+if [[ "$MODE" == "ramp" ]]; then
+  for step in "${RAMP_STEPS[@]}"; do
+    PROFILE_LABELS+=("$(ramp_label "$step")")
+  done
+elif [[ "$MODE" != "old" ]]; then
+  PROFILE_LABELS+=("$MODE")
+fi
+PROFILE_LABELS+=("old")
+
+# Pre-apply steps run as a dependency graph (dag.sh): each starts as soon as
+# its dependencies finish, so the phase takes as long as its slowest host.
+# Every step checkpoints itself; apply starts only after all of them succeed.
+# dag_run is called under ||, so errexit is off inside the steps: each command
+# whose failure must fail the step returns non-zero explicitly, before any
+# checkpoint is written.
+
+step_profile_build() {
+  local label src gen_args=()
+  if step_done profiles; then
+    echo "Checkpoint: reusing dispatcher profiles in ${RUN_DIR}"
+    for label in "${PROFILE_LABELS[@]}"; do
+      [[ -f "${RUN_DIR}/dispatcher.profile.${label}.list" ]] || die "Checkpointed profile missing: ${RUN_DIR}/dispatcher.profile.${label}.list"
+    done
+  elif [[ -n "$PROFILE_DIR" ]]; then
+    echo "Copying prebuilt dispatcher profiles from ${PROFILE_DIR}..."
+    for label in "${PROFILE_LABELS[@]}"; do
+      src="${PROFILE_DIR%/}/dispatcher.profile.${label}.list"
+      [[ -f "$src" ]] || die "Missing prebuilt profile: $src"
+      cp "$src" "${RUN_DIR}/" || return 1
+    done
+  else
+    echo "Generating dispatcher profiles..."
+    if [[ -n "$PROFILE_SPEC" ]]; then
+      gen_args+=(--spec "$PROFILE_SPEC")
+    else
+      gen_args+=(--old "$OLD_URI" --new "$NEW_URI" --set-id "$SET_ID")
+    fi
+    for label in "${PROFILE_LABELS[@]}"; do
+      gen_args+=(--emit "$label")
+    done
+    python3 "$PROFILE_GEN" "${gen_args[@]}" --output-dir "$RUN_DIR" || return 1
+  fi
+  checkpoint profiles
+}
+
+# step_snapshot_pre SIDE
+step_snapshot_pre() {
+  step_done "snapshots_pre_$1" && return 0
+  echo "Capturing pre-change snapshot of the $1 PBX..."
+  capture_snapshot "$1" pre || return 1
+  checkpoint "snapshots_pre_$1"
+}
+
+precheck_kamailio_node() {
+  remote_kam_on "$1" "echo ok >/dev/null" || return 1
+  if [[ -n "$CTL_SOCKET" ]]; then
+    remote_kam_on "$1" "command -v python3 >/dev/null" || die "--ctl-socket needs python3 on Kamailio ($1)"
+  fi
+}
+
+step_precheck_kamailio() {
+  echo "Precheck: Kamailio ${KAMAILIO_HOSTS[*]}"
+  export TRACE_OP=precheck
+  on_kamailio_nodes "${KAMAILIO_HOSTS[*]}" precheck_kamailio_node || return 1
+  if [[ "$READINESS_GATE" == "true" && "$READINESS_FROM" == "kamailio" ]] || (( WATCHDOG > 0 && WATCHDOG_PROBE_COUNT > 0 )) \
+    || { [[ "$MIGRATE_REGISTRATIONS" == "true" ]] && (( REG_PROBE_COUNT > 0 )); }; then
+    remote_kam "python3 -c 'import sys; sys.exit(sys.version_info < (3, 7))' && test -f '${REMOTE_SCRIPT_DIR%/}/sip_probe.py' && test -f '${REMOTE_SCRIPT_DIR%/}/report_utils.py'" \
+      || die "--readiness-gate and the --watchdog and --migrate-registrations probes need python3 and ${REMOTE_SCRIPT_DIR%/}/sip_probe.py (with report_utils.py) on Kamailio (${KAMAILIO_HOST}); use --readiness-from local / --watchdog-probe-count 0 / --reg-probe-count 0 otherwise"
+  fi
+}
 
+step_precheck_old() {
+  echo "Precheck: old PBX ${OLD_PBX_HOST}"
+  TRACE_OP=precheck remote_old "echo ok >/dev/null"
+}
+
+step_precheck_new() {
+  echo "Precheck: new PBX ${NEW_PBX_HOST}"
+  TRACE_OP=precheck remote_new "echo ok >/dev/null"
+}
+
+step_readiness() {
+  step_done readiness && return 0
+  echo "Running readiness gate on the new PBX..."
+  # Nothing is applied before every step has passed, so a failed gate leaves Kamailio untouched.
+  run_readiness_gate || die "Readiness gate failed for the new PBX; nothing was applied (see ${RUN_DIR}/readiness-checks.json and readiness-sip.json)"
+  echo "Readiness gate passed."
+  checkpoint readiness
+}
+
+remote_dir_node() {
+  TRACE_OP=mkdir remote_kam_on "$1" "mkdir -p '${REMOTE_PROFILE_DIR}'"
+}
+
+step_remote_dir() {
+  on_kamailio_nodes "${KAMAILIO_HOSTS[*]}" remote_dir_node
+}
+
+# upload_node HOST LABEL LOCAL REMOTE skips a profile a resumed run finds on the
+# node with its local checksum (/tmp may have been cleaned by a reboot).
+upload_node() {
+  local host="$1" label="$2" local_path="$3" remote_path="$4"
+  if step_done "upload_${label}" && [[ "$(remote_sha256 "$host" "$remote_path")" == "$(sha256_of "$local_path") ${remote_path}" ]]; then
+    echo "Checkpoint: ${label} profile already uploaded and verified on Kamailio ${host}."
+    return 0
+  fi
+  echo "Uploading ${label} profile to Kamailio ${host}..."
+  TRACE_OP="$label" mux_scp "$KAMAILIO_USER" "$host" "$KAMAILIO_SSH_PORT" "$local_path" "$remote_path"
+}
+
+# step_upload LABEL LOCAL REMOTE uploads one profile to every node in parallel.
+step_upload() {
+  on_kamailio_nodes "${KAMAILIO_HOSTS[*]}" upload_node "$@" || return 1
+  checkpoint "upload_$1"
+}
+
+# Each step becomes a phase in phase_timings.csv and the trace; steps overlap.
+dag_on_start() {
+  export TRACE_PHASE="$1"
+}
+
+dag_on_done() {
+  local status="ok"
+  (( $4 == 0 )) || status="error"
+  TRACE_PHASE="$1" record_phase "$1" "$2" "$status" "$3"
+}
+
+# run_pre_apply runs the declared steps and records their wall time as the
+# pre_apply phase.
+run_pre_apply() {
+  local started rc=0 status="ok"
+  started="$(now_ms)"
+  dag_run || rc=$?
+  (( rc == 0 )) || status="error"
+  TRACE_PHASE=pre_apply record_phase pre_apply "$started" "$status"
+  (( rc == 0 )) || die "Pre-apply step(s) failed: ${DAG_FAILED}; nothing was applied"
+}
+
+dag_reset
+dag_step profile_build "" step_profile_build
 if [[ "$CAPTURE_SNAPSHOTS" == "true" ]]; then
-  echo "Capturing pre-change snapshots..."
-  "$SNAPSHOT_SCRIPT" --host "$OLD_PBX_HOST" --ssh-user "$OLD_PBX_USER" --ssh-port "$OLD_PBX_SSH_PORT" --ssh-key "$SSH_KEY" --label "old-pre-${MODE}" --output-dir "$RUN_DIR"
-  "$SNAPSHOT_SCRIPT" --host "$NEW_PBX_HOST" --ssh-user "$NEW_PBX_USER" --ssh-port "$NEW_PBX_SSH_PORT" --ssh-key "$SSH_KEY" --label "new-pre-${MODE}" --output-dir "$RUN_DIR"
+  dag_step snapshot_pre_old "" step_snapshot_pre old
+  dag_step snapshot_pre_new "" step_snapshot_pre new
 fi
 
-echo "Planned apply target: ${KAMAILIO_USER}@${KAMAILIO_HOST}:${DISPATCHER_TARGET}"
+if (( ${#KAMAILIO_HOSTS[@]} > 1 )); then
+  echo "Planned apply target: ${DISPATCHER_TARGET} on ${#KAMAILIO_HOSTS[@]} Kamailio nodes (${KAMAILIO_HOSTS[*]}), switched together"
+else
+  echo "Planned apply target: ${KAMAILIO_USER}@${KAMAILIO_HOST}:${DISPATCHER_TARGET}"
+fi
 echo "Selected profile: $PROFILE_SELECTED"
 echo "Rollback profile: $PROFILE_OLD"
 
 if [[ "$DRY_RUN" == "true" ]]; then
+  run_pre_apply
   cat <<EOF
 DRY RUN ONLY - no changes applied.
 Would execute:
   1) ssh ${KAMAILIO_USER}@${KAMAILIO_HOST} "mkdir -p '${REMOTE_PROFILE_DIR}'"
   2) scp -P ${KAMAILIO_SSH_PORT} ${PROFILE_SELECTED} ${KAMAILIO_USER}@${KAMAILIO_HOST}:${REMOTE_SELECTED}
   3) scp -P ${KAMAILIO_SSH_PORT} ${PROFILE_OLD} ${KAMAILIO_USER}@${KAMAILIO_HOST}:${REMOTE_OLD}
-  4) ssh ${KAMAILIO_USER}@${KAMAILIO_HOST} "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${REMOTE_SELECTED}' --target '${DISPATCHER_TARGET}' --reload-cmd '${RELOAD_CMD}'"
+  4) ssh ${KAMAILIO_USER}@${KAMAILIO_HOST} "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${REMOTE_SELECTED}' --target '${DISPATCHER_TARGET}' --sha256 '$(sha256_of "$PROFILE_SELECTED")' ${apply_reload_args}"
 EOF
-  if [[ "$WAIT_FOR_DRAIN" == "true" ]]; then
+  if (( ${#KAMAILIO_HOSTS[@]} > 1 )); then
+    echo "  Kamailio nodes: ${KAMAILIO_HOSTS[*]}; steps 1-3 run on every node in parallel, step 4 runs with --stage-only on every node, then --commit --commit-at <now + ${COMMIT_LEAD_MS} ms> on all nodes at once"
+  fi
+  if [[ "$MODE" == "ramp" ]]; then
+    echo "  Ramp schedule (new-pbx weight): ${RAMP_SCHEDULE}; hold ${RAMP_HOLD}s between steps"
+    for step in "${RAMP_STEPS[@]}"; do
+      echo "    - gate on ${NEW_PBX_USER}@${NEW_PBX_HOST}: ${RAMP_HEALTH_CMD}"
+      echo "    - upload + apply ${RUN_DIR}/dispatcher.profile.$(ramp_label "$step").list (${step}% new)"
+    done
+  fi
+  if [[ "$READINESS_GATE" == "true" ]]; then
+    echo "  Readiness gate before step 1: snapshot ${NEW_PBX_USER}@${NEW_PBX_HOST} + snapshot_checks.py; sip_probe.py ${READINESS_PROBE_ARGS[*]} (from ${READINESS_FROM})"
+  fi
+  if (( WATCHDOG > 0 )); then
+    echo "  Watchdog after apply: ${WATCHDOG_SCRIPT} --duration ${WATCHDOG} --interval ${WATCHDOG_INTERVAL} --stats-cmd \"${WATCHDOG_STATS_CMD}\" --max-error-pct ${WATCHDOG_MAX_ERROR_PCT}$( (( WATCHDOG_PROBE_COUNT > 0 )) && echo " --probe-target ${READINESS_TARGET} --max-p95-ms ${WATCHDOG_MAX_P95_MS}") (rollback on ${WATCHDOG_BREACHES} consecutive breached samples)"
+  fi
+  if [[ "$MIGRATE_REGISTRATIONS" == "true" ]]; then
+    echo "  Registration migration after apply: ${REGISTRATIONS_SCRIPT} on ${OLD_PBX_USER}@${OLD_PBX_HOST} at ${REG_RATE}/s (max ${REG_MAX_RATE}/s every ${REG_INTERVAL}s$( (( REG_PROBE_COUNT > 0 )) && echo ", target p95 ${REG_TARGET_P95_MS}ms on ${READINESS_TARGET}"))"
+  fi
+  if [[ "$DETACH_DRAIN" == "true" ]]; then
+    echo "  5) copy ${DRAIN_SCRIPT##*/} to ${OLD_PBX_USER}@${OLD_PBX_HOST}:${REMOTE_PROFILE_DIR%/}/drain-${RUN_TS}/, start it under nohup, and exit (finish with --resume ${RUN_DIR})"
+  elif [[ "$WAIT_FOR_DRAIN" == "true" ]]; then
     cat <<EOF
-  5) ${DRAIN_SCRIPT} --host ${OLD_PBX_HOST} --ssh-user ${OLD_PBX_USER} --ssh-port ${OLD_PBX_SSH_PORT} --ssh-key ${SSH_KEY} --threshold ${DRAIN_THRESHOLD} --interval ${DRAIN_INTERVAL} --timeout ${DRAIN_TIMEOUT}
+  5) ${DRAIN_SCRIPT} --host ${OLD_PBX_HOST} --ssh-user ${OLD_PBX_USER} --ssh-port ${OLD_PBX_SSH_PORT} --ssh-key ${SSH_KEY} --threshold ${DRAIN_THRESHOLD} --interval ${DRAIN_INTERVAL} --timeout ${DRAIN_TIMEOUT} --method ${DRAIN_METHOD}
 EOF
   fi
   exit 0
 fi
 
-echo "Running connectivity prechecks..."
-remote_kam "echo ok >/dev/null"
-ssh "${SSH_OPTS[@]}" -p "$OLD_PBX_SSH_PORT" "${OLD_PBX_USER}@${OLD_PBX_HOST}" "echo ok >/dev/null"
-if [[ "$CAPTURE_SNAPSHOTS" == "true" ]]; then
-  ssh "${SSH_OPTS[@]}" -p "$NEW_PBX_SSH_PORT" "${NEW_PBX_USER}@${NEW_PBX_HOST}" "echo ok >/dev/null"
+# Uploads as "label local remote" triples.
+UPLOADS=()
+if [[ "$MODE" == "ramp" ]]; then
+  for step in "${RAMP_STEPS[@]}"; do
+    label="$(ramp_label "$step")"
+    UPLOADS+=("${label} ${RUN_DIR}/dispatcher.profile.${label}.list ${REMOTE_PROFILE_DIR%/}/dispatcher.profile.${label}.${RUN_TS}.list")
+  done
+else
+  UPLOADS+=("${SELECTED_LABEL} ${PROFILE_SELECTED} ${REMOTE_SELECTED}")
 fi
+UPLOADS+=("old ${PROFILE_OLD} ${REMOTE_OLD}")
 
-echo "Uploading profiles to Kamailio..."
-remote_kam "mkdir -p '${REMOTE_PROFILE_DIR}'"
-scp "${SSH_OPTS[@]}" -P "$KAMAILIO_SSH_PORT" "$PROFILE_SELECTED" "${KAMAILIO_USER}@${KAMAILIO_HOST}:${REMOTE_SELECTED}"
-scp "${SSH_OPTS[@]}" -P "$KAMAILIO_SSH_PORT" "$PROFILE_OLD" "${KAMAILIO_USER}@${KAMAILIO_HOST}:${REMOTE_OLD}"
+echo "Running connectivity prechecks and pre-apply steps..."
+dag_step precheck_kamailio "" step_precheck_kamailio
+dag_step precheck_old "" step_precheck_old
+if [[ "$CAPTURE_SNAPSHOTS" == "true" || "$MODE" == "ramp" || "$READINESS_GATE" == "true" ]]; then
+  dag_step precheck_new "" step_precheck_new
+fi
+if [[ "$READINESS_GATE" == "true" ]]; then
+  readiness_deps="precheck_new"
+  [[ "$READINESS_FROM" != "kamailio" ]] || readiness_deps+=" precheck_kamailio"
+  dag_step readiness "$readiness_deps" step_readiness
+fi
+dag_step remote_dir "precheck_kamailio" step_remote_dir
+for entry in "${UPLOADS[@]}"; do
+  read -r label local_path remote_path <<< "$entry"
+  dag_step "upload_${label}" "profile_build remote_dir" step_upload "$label" "$local_path" "$remote_path"
+done
+run_pre_apply
 
-echo "Applying dispatcher profile on Kamailio..."
-applied="true"
-remote_kam "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${REMOTE_SELECTED}' --target '${DISPATCHER_TARGET}' --reload-cmd '${RELOAD_CMD}'"
-applied="false"
+# stage_node HOST LOCAL_PROFILE REMOTE_PROFILE EXTRA pins, backs up, and stages
+# the profile next to the node's dispatcher file without switching to it.
+stage_node() {
+  local host="$1" local_profile="$2" remote_profile="$3" extra="$4"
+  local out rc=0
+  out="$(TRACE_OP=stage remote_kam_on "$host" "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --stage-only --profile '${remote_profile}' --target '${DISPATCHER_TARGET}' --sha256 '$(sha256_of "$local_profile")' ${extra}")" || rc=$?
+  [[ -z "$out" ]] || sed "s/^/[${host}] /" <<< "$out"
+  return "$rc"
+}
+
+# commit_node HOST LOCAL_PROFILE AT_MS switches the node to its staged profile at
+# AT_MS and leaves "host,rc,renamed_ms,reload_ms,reload_finished_ms" in COMMIT_DIR.
+commit_node() {
+  local host="$1" local_profile="$2" at_ms="$3"
+  local out rc=0
+  out="$(TRACE_OP=commit remote_kam_on "$host" "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --commit --commit-at ${at_ms} --target '${DISPATCHER_TARGET}' --sha256 '$(sha256_of "$local_profile")' ${apply_reload_args}")" || rc=$?
+  [[ -z "$out" ]] || sed "s/^/[${host}] /" <<< "$out"
+  printf '%s,%s,%s,%s,%s\n' "$host" "$rc" \
+    "$(sed -n 's/^Renamed into place at epoch ms: \([0-9]*\)$/\1/p' <<< "$out")" \
+    "$(sed -n 's/^Reload completed in \([0-9]*\) ms$/\1/p' <<< "$out" | tail -n 1)" \
+    "$(sed -n 's/^Reload finished at epoch ms: \([0-9]*\)$/\1/p' <<< "$out")" > "${COMMIT_DIR}/${host}.csv"
+  return "$rc"
+}
+
+# apply_on_nodes LOCAL_PROFILE REMOTE_PROFILE EXTRA "HOST..." stages the profile
+# on every node in parallel, then has all of them rename and reload at one
+# instant --commit-lead-ms ahead, instead of one node after the other. Reload
+# times come from the nodes' clocks, so the reported skew assumes NTP.
+apply_on_nodes() {
+  local local_profile="$1" remote_profile="$2" extra="$3" nodes="$4"
+  local rc=0 at_ms host node_rc renamed reload_ms finished
+  local label count=0 skew_ms="" rename_skew_ms=""
+  local first_finished="" last_finished="" first_renamed="" last_renamed=""
+  local method="reload-cmd"
+  [[ -z "$CTL_SOCKET" ]] || method="ctl"
+  label="$(basename "$remote_profile")"
+  echo "Staging ${label} on Kamailio nodes: ${nodes}"
+  if ! on_kamailio_nodes "$nodes" stage_node "$local_profile" "$remote_profile" "$extra"; then
+    echo "ERROR: staging failed; no Kamailio node was switched" >&2
+    # Nothing to roll back unless earlier ramp steps (--keep-pin) or, on resume,
+    # nodes outside this list are already live.
+    local live_nodes=$(( ${#KAMAILIO_HOSTS[@]} - $(wc -w <<< "$nodes") ))
+    [[ "$extra" == *--keep-pin* ]] || (( live_nodes > 0 )) || applied="false"
+    return 1
+  fi
+
+  at_ms=$(( $(now_ms) + COMMIT_LEAD_MS ))
+  COMMIT_DIR="$(mktemp -d "${TMPDIR:-/tmp}/pbx-commit.XXXXXX")"
+  echo "Switching Kamailio nodes at epoch ms ${at_ms}..."
+  on_kamailio_nodes "$nodes" commit_node "$local_profile" "$at_ms" || rc=$?
+
+  local csv="${RUN_DIR}/kamailio-commits.csv"
+  [[ -f "$csv" ]] || echo "profile,host,rc,commit_at_ms,renamed_ms,reload_ms,reload_finished_ms" > "$csv"
+  for host in $nodes; do
+    IFS=, read -r _ node_rc renamed reload_ms finished 2>/dev/null < "${COMMIT_DIR}/${host}.csv" \
+      || { node_rc=1; renamed=""; reload_ms=""; finished=""; }
+    echo "${label},${host},${node_rc},${at_ms},${renamed},${reload_ms},${finished}" >> "$csv"
+    if [[ -n "$renamed" ]]; then
+      [[ -n "$first_renamed" ]] && (( first_renamed <= renamed )) || first_renamed="$renamed"
+      [[ -n "$last_renamed" ]] && (( last_renamed >= renamed )) || last_renamed="$renamed"
+    fi
+    [[ -n "$finished" && -n "$reload_ms" ]] || continue
+    trace_span reload "$((finished - reload_ms))" "$finished" ok host="${KAMAILIO_USER}@${host}:${KAMAILIO_SSH_PORT}" \
+      profile="$label" method="$method" commit_at_ms="$at_ms"
+    count=$((count + 1))
+    [[ -n "$first_finished" ]] && (( first_finished <= finished )) || first_finished="$finished"
+    [[ -n "$last_finished" ]] && (( last_finished >= finished )) || last_finished="$finished"
+  done
+  rm -rf "$COMMIT_DIR"
+
+  if (( count > 0 )); then
+    skew_ms=$((last_finished - first_finished))
+    rename_skew_ms=$((last_renamed - first_renamed))
+    echo "Reload skew across ${count} Kamailio node(s): ${skew_ms} ms (renames within ${rename_skew_ms} ms; per node: ${csv})"
+  fi
+  trace_span commit "$at_ms" "${last_finished:-$(now_ms)}" "$(trace_status "$rc")" rc="$rc" profile="$label" \
+    nodes="$(wc -w <<< "$nodes" | tr -d ' ')" reloaded="$count" skew_ms="${skew_ms:--1}" rename_skew_ms="${rename_skew_ms:--1}"
+  return "$rc"
+}
 
-if [[ "$WAIT_FOR_DRAIN" == "true" ]]; then
-  echo "Waiting for old PBX channel drain..."
-  "$DRAIN_SCRIPT" \
-    --host "$OLD_PBX_HOST" \
-    --ssh-user "$OLD_PBX_USER" \
-    --ssh-port "$OLD_PBX_SSH_PORT" \
-    --ssh-key "$SSH_KEY" \
-    --threshold "$DRAIN_THRESHOLD" \
-    --interval "$DRAIN_INTERVAL" \
-    --timeout "$DRAIN_TIMEOUT"
+# apply_remote_profile LOCAL_PROFILE REMOTE_PROFILE [extra apply args] ["HOST..."]
+#   The local checksum is verified on Kamailio before staging and after the rename.
+#   The apply script's "Reload completed in N ms" line becomes a reload span.
+#   With several nodes the profile goes to the listed ones (default: all) via
+#   apply_on_nodes.
+apply_remote_profile() {
+  local local_profile="$1"
+  local remote_profile="$2"
+  local extra="${3:-}"
+  local nodes="${4:-${KAMAILIO_HOSTS[*]}}"
+  if (( ${#KAMAILIO_HOSTS[@]} > 1 )); then
+    # Return the failure rather than letting errexit stop inside the function,
+    # so the caller's ERR trap still rolls back.
+    apply_on_nodes "$local_profile" "$remote_profile" "$extra" "$nodes" || return
+    return 0
+  fi
+  local out rc=0 reload_ms end_ms
+  local method="reload-cmd"
+  [[ -z "$CTL_SOCKET" ]] || method="ctl"
+  out="$(TRACE_OP=apply remote_kam "${kam_sudo_prefix}${REMOTE_SCRIPT_DIR%/}/${APPLY_SCRIPT_NAME} --profile '${remote_profile}' --target '${DISPATCHER_TARGET}' --sha256 '$(sha256_of "$local_profile")' ${extra}${apply_reload_args}")" || rc=$?
+  [[ -z "$out" ]] || printf '%s\n' "$out"
+  reload_ms="$(sed -n 's/^Reload completed in \([0-9]*\) ms$/\1/p' <<< "$out" | tail -n 1)"
+  if [[ -n "$reload_ms" ]]; then
+    end_ms="$(now_ms)"
+    trace_span reload "$((end_ms - reload_ms))" "$end_ms" ok host="${KAMAILIO_USER}@${KAMAILIO_HOST}:${KAMAILIO_SSH_PORT}" \
+      profile="$(basename "$remote_profile")" method="$method"
+  fi
+  return "$rc"
+}
+
+# nodes_pending LOCAL_PROFILE prints the Kamailio nodes whose dispatcher file
+# does not have the profile's content yet: an apply interrupted after its rename
+# is not redone on a node (re-applying would re-pin the new profile over the
+# pre-run pin), and one interrupted between nodes only finishes the rest.
+nodes_pending() {
+  local want host
+  want="$(sha256_of "$1")"
+  for host in "${KAMAILIO_HOSTS[@]}"; do
+    [[ "$(remote_sha256 "$host" "$DISPATCHER_TARGET" | awk '{print $1}')" == "$want" ]] || printf '%s ' "$host"
+  done
+}
+
+phase_begin apply
+if step_done apply; then
+  echo "Checkpoint: ${SELECTED_LABEL} profile already applied."
+elif [[ "$MODE" == "ramp" ]]; then
+  # The ramp stays "applied" until the last step so a failed gate or apply at
+  # any step rolls all the way back to the old profile.
+  step_no=0
+  pin_args=""
+  ramp_done="$(state_get ramp_done)"
+  ramp_done="${ramp_done:-0}"
+  if (( ramp_done > 0 )); then
+    # Resumed mid-ramp: keep the pre-ramp pin and finish the interrupted hold.
+    applied="true"
+    pin_args="--keep-pin "
+    hold_left=$(( $(state_get ramp_hold_until) - $(date +%s) ))
+    if (( hold_left > 0 && ramp_done < ${#RAMP_STEPS[@]} )); then
+      echo "Checkpoint: ${ramp_done}/${#RAMP_STEPS[@]} ramp steps applied; holding the remaining ${hold_left}s..."
+      sleep "$hold_left"
+    fi
+  fi
+  for step in "${RAMP_STEPS[@]}"; do
+    step_no=$((step_no + 1))
+    label="$(ramp_label "$step")"
+    if (( step_no <= ramp_done )); then
+      echo "Checkpoint: ramp step ${step_no}/${#RAMP_STEPS[@]} (${step}% new) already applied."
+      continue
+    fi
+    pending="${KAMAILIO_HOSTS[*]}"
+    if [[ "$(state_get ramp_started)" == "$step_no" ]]; then
+      pending="$(nodes_pending "${RUN_DIR}/dispatcher.profile.${label}.list")"
+    fi
+    if [[ -z "$pending" ]]; then
+      echo "Checkpoint: interrupted ramp step ${step_no} had completed on Kamailio."
+      applied="true"
+    else
+      echo "Ramp step ${step_no}/${#RAMP_STEPS[@]} (${step}% new): health gate on new PBX..."
+      if ! TRACE_OP=health_gate remote_new "$RAMP_HEALTH_CMD"; then
+        echo "ERROR: new PBX health gate failed before ${step}% step" >&2
+        rollback_if_needed "health gate failed before ${step}% step"
+        exit 1
+      fi
+      echo "Applying ${step}% ramp profile on Kamailio..."
+      applied="true"
+      state_set ramp_started "$step_no"
+      apply_remote_profile "${RUN_DIR}/dispatcher.profile.${label}.list" "${REMOTE_PROFILE_DIR%/}/dispatcher.profile.${label}.${RUN_TS}.list" "$pin_args" "$pending"
+    fi
+    state_set ramp_done "$step_no"
+    # Later steps keep the pin from the first step: rollback restores the pre-ramp state.
+    pin_args="--keep-pin "
+    if (( step_no < ${#RAMP_STEPS[@]} && RAMP_HOLD > 0 )); then
+      state_set ramp_hold_until "$(( $(date +%s) + RAMP_HOLD ))"
+      echo "Holding ${RAMP_HOLD}s at ${step}% before next step..."
+      sleep "$RAMP_HOLD"
+    fi
+  done
+  applied="false"
+  checkpoint apply
+else
+  pending="${KAMAILIO_HOSTS[*]}"
+  if [[ "$(state_get step_apply)" == "started" ]]; then
+    pending="$(nodes_pending "$PROFILE_SELECTED")"
+  fi
+  if [[ -z "$pending" ]]; then
+    echo "Checkpoint: interrupted apply had completed on Kamailio."
+  else
+    echo "Applying dispatcher profile on Kamailio..."
+    applied="true"
+    checkpoint apply started
+    apply_remote_profile "$PROFILE_SELECTED" "$REMOTE_SELECTED" "" "$pending"
+    applied="false"
+  fi
+  checkpoint apply
 fi
 
-if [[ "$CAPTURE_SNAPSHOTS" == "true" ]]; then
+phase_end
+
+if (( WATCHDOG > 0 )) && ! step_done watchdog; then
+  phase_begin watchdog
+  echo "Watching the cutover for ${WATCHDOG}s..."
+  watchdog_args=(
+    --duration "$WATCHDOG"
+    --interval "$WATCHDOG_INTERVAL"
+    --kamailio-host "$KAMAILIO_HOST" --kamailio-user "$KAMAILIO_USER" --kamailio-ssh-port "$KAMAILIO_SSH_PORT"
+    --pbx-host "$NEW_PBX_HOST" --pbx-user "$NEW_PBX_USER" --pbx-ssh-port "$NEW_PBX_SSH_PORT"
+    --ssh-key "$SSH_KEY"
+    "${CHILD_SSH_ARGS[@]}"
+    "${CHILD_TRACE_ARGS[@]}"
+    --stats-cmd "$WATCHDOG_STATS_CMD"
+    --max-error-pct "$WATCHDOG_MAX_ERROR_PCT"
+    --min-transactions "$WATCHDOG_MIN_TRANSACTIONS"
+    --max-p95-ms "$WATCHDOG_MAX_P95_MS"
+    --min-new-channels "$WATCHDOG_MIN_NEW_CHANNELS"
+    --breaches "$WATCHDOG_BREACHES"
+    --samples-file "${RUN_DIR}/watchdog.csv"
+    --reason-file "${RUN_DIR}/watchdog-breach.txt"
+  )
+  if (( WATCHDOG_PROBE_COUNT > 0 )); then
+    watchdog_args+=(--probe-target "$READINESS_TARGET" --probe-script "${REMOTE_SCRIPT_DIR%/}/sip_probe.py" --probe-count "$WATCHDOG_PROBE_COUNT")
+  fi
+  # The profile is live again for the length of the window: any breach (or a
+  # watchdog failure) rolls back to the pinned pre-run profile.
+  applied="true"
+  watchdog_rc=0
+  "$WATCHDOG_SCRIPT" "${watchdog_args[@]}" || watchdog_rc=$?
+  if (( watchdog_rc != 0 )); then
+    reason="$(cat "${RUN_DIR}/watchdog-breach.txt" 2>/dev/null || echo "watchdog exited ${watchdog_rc}")"
+    echo "ERROR: post-cutover watchdog: ${reason}" >&2
+    rollback_if_needed "watchdog: ${reason}"
+    die "Cutover rolled back by the watchdog (samples: ${RUN_DIR}/watchdog.csv)"
+  fi
+  applied="false"
+  checkpoint watchdog
+fi
+
+if [[ "$MIGRATE_REGISTRATIONS" == "true" ]] && ! step_done registrations; then
+  phase_begin registrations
+  echo "Migrating registrations to the new PBX..."
+  registration_args=(
+    --old-pbx-host "$OLD_PBX_HOST" --old-pbx-user "$OLD_PBX_USER" --old-pbx-ssh-port "$OLD_PBX_SSH_PORT"
+    --new-pbx-host "$NEW_PBX_HOST" --new-pbx-user "$NEW_PBX_USER" --new-pbx-ssh-port "$NEW_PBX_SSH_PORT"
+    --kamailio-host "$KAMAILIO_HOST" --kamailio-user "$KAMAILIO_USER" --kamailio-ssh-port "$KAMAILIO_SSH_PORT"
+    --ssh-key "$SSH_KEY"
+    "${CHILD_SSH_ARGS[@]}"
+    "${CHILD_TRACE_ARGS[@]}"
+    --rate "$REG_RATE"
+    --max-rate "$REG_MAX_RATE"
+    --interval "$REG_INTERVAL"
+    --target-p95-ms "$REG_TARGET_P95_MS"
+    --settle "$REG_SETTLE"
+    --progress-file "${RUN_DIR}/registrations-progress.csv"
+    --done-file "${RUN_DIR}/registrations-done.txt"
+  )
+  if [[ -n "$REG_TRIGGER_CMD" ]]; then
+    registration_args+=(--trigger-cmd "$REG_TRIGGER_CMD")
+  fi
+  if (( REG_PROBE_COUNT > 0 )); then
+    registration_args+=(--probe-target "$READINESS_TARGET" --probe-script "${REMOTE_SCRIPT_DIR%/}/sip_probe.py" --probe-count "$REG_PROBE_COUNT")
+  fi
+  # Routing is already on the new PBX; a failed batch stops the stage without a
+  # rollback and --resume continues after the last triggered user.
+  "$REGISTRATIONS_SCRIPT" "${registration_args[@]}" \
+    || die "Registration migration stopped (progress: ${RUN_DIR}/registrations-progress.csv); --resume ${RUN_DIR} continues it"
+  checkpoint registrations
+fi
+
+# start_detached_drain copies the drain helper to the old PBX and starts it
+# there under nohup (channel counts are local to that host), then records where
+# its log and exit code will appear.
+start_detached_drain() {
+  local dir="${REMOTE_PROFILE_DIR%/}/drain-${RUN_TS}"
+  local file
+  TRACE_OP=drain_detach remote_old "mkdir -p '${dir}'"
+  for file in wait_for_channel_drain.sh esl_channel_watch.py ssh_mux.sh trace_events.sh; do
+    TRACE_OP=drain_detach mux_scp "$OLD_PBX_USER" "$OLD_PBX_HOST" "$OLD_PBX_SSH_PORT" "${SCRIPT_DIR}/${file}" "${dir}/${file}"
+  done
+  TRACE_OP=drain_detach remote_old "cd '${dir}' && rm -f drain.rc && { nohup sh -c 'bash ./wait_for_channel_drain.sh --threshold ${DRAIN_THRESHOLD} --interval ${DRAIN_INTERVAL} --timeout ${DRAIN_TIMEOUT} --method ${DRAIN_METHOD}; echo \$? > drain.rc' > drain.log 2>&1 < /dev/null & }"
+  state_set drain_remote_dir "$dir"
+  state_set drain_started "$(date +%s)"
+  checkpoint drain detached
+}
+
+# poll_detached_drain waits for the detached drain's exit code, polling every
+# --drain-interval seconds and printing the drain log's latest line when it changes.
+poll_detached_drain() {
+  local dir out rc_line line last_line=""
+  dir="$(state_get drain_remote_dir)"
+  echo "Polling detached drain on ${OLD_PBX_HOST} (${dir})..."
+  while true; do
+    out="$(TRACE_OP=drain_poll remote_old "cat '${dir}/drain.rc' 2>/dev/null || echo running; tail -n 1 '${dir}/drain.log' 2>/dev/null")" || return 1
+    rc_line="${out%%$'\n'*}"
+    line=""
+    [[ "$out" != *$'\n'* ]] || line="${out#*$'\n'}"
+    if [[ -n "$line" && "$line" != "$last_line" ]]; then
+      echo "  ${line}"
+      last_line="$line"
+    fi
+    case "$rc_line" in
+      running) sleep "$(( DRAIN_INTERVAL > 0 ? DRAIN_INTERVAL : 1 ))" ;;
+      0) return 0 ;;
+      *) echo "Detached drain exited ${rc_line}; log: ${OLD_PBX_HOST}:${dir}/drain.log" >&2; return 1 ;;
+    esac
+  done
+}
+
+if [[ "$WAIT_FOR_DRAIN" == "true" ]] && ! step_done drain; then
+  phase_begin drain
+  if [[ "$(state_get step_drain)" == "detached" ]]; then
+    poll_detached_drain || die "Old PBX drain did not complete"
+  elif [[ "$DETACH_DRAIN" == "true" ]]; then
+    echo "Starting detached drain wait on the old PBX..."
+    start_detached_drain
+    RUN_DETACHED="true"
+    echo "Drain detached on ${OLD_PBX_HOST}. Poll and finish the run with:"
+    echo "  $0 --resume ${RUN_DIR}"
+    exit 0
+  else
+    # A resumed drain keeps the original deadline.
+    drain_started="$(state_get drain_started)"
+    if [[ -z "$drain_started" ]]; then
+      drain_started="$(date +%s)"
+      state_set drain_started "$drain_started"
+    fi
+    drain_timeout=$(( DRAIN_TIMEOUT - ($(date +%s) - drain_started) ))
+    (( drain_timeout > 0 )) || drain_timeout=0
+    echo "Waiting for old PBX channel drain..."
+    "$DRAIN_SCRIPT" \
+      --host "$OLD_PBX_HOST" \
+      --ssh-user "$OLD_PBX_USER" \
+      --ssh-port "$OLD_PBX_SSH_PORT" \
+      --ssh-key "$SSH_KEY" \
+      "${CHILD_SSH_ARGS[@]}" \
+      "${CHILD_TRACE_ARGS[@]}" \
+      --threshold "$DRAIN_THRESHOLD" \
+      --interval "$DRAIN_INTERVAL" \
+      --timeout "$drain_timeout" \
+      --method "$DRAIN_METHOD"
+  fi
+  checkpoint drain
+fi
+
+if [[ "$CAPTURE_SNAPSHOTS" == "true" ]] && ! step_done snapshots_post; then
+  phase_begin snapshots_post
   echo "Capturing post-change snapshots..."
-  "$SNAPSHOT_SCRIPT" --host "$OLD_PBX_HOST" --ssh-user "$OLD_PBX_USER" --ssh-port "$OLD_PBX_SSH_PORT" --ssh-key "$SSH_KEY" --label "old-post-${MODE}" --output-dir "$RUN_DIR"
-  "$SNAPSHOT_SCRIPT" --host "$NEW_PBX_HOST" --ssh-user "$NEW_PBX_USER" --ssh-port "$NEW_PBX_SSH_PORT" --ssh-key "$SSH_KEY" --label "new-post-${MODE}" --output-dir "$RUN_DIR"
+  capture_snapshot_pair post
+  diff_snapshot_pair
+  checkpoint snapshots_post
 fi
+phase_end
 
 echo "Migration orchestration completed successfully."
 echo "Artifacts: ${RUN_DIR}"
@@ -8,13 +8,22 @@ import json
 import shlex
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import dispatcher_profiles
+from report_utils import print_table
+
 CONFIG_VERSION = 1
 
 DEFAULT_VALUES: dict[str, Any] = {
     "mode": "both",
+    "ramp_schedule": "5,25,50,100",
+    "ramp_hold": 300,
     "kamailio_host": "",
     "kamailio_user": "root",
     "kamailio_ssh_port": 22,
@@ -30,8 +39,10 @@ DEFAULT_VALUES: dict[str, Any] = {
     "sip_scheme": "sip",
     "sip_port": 5060,
     "set_id": 1,
+    "profile_spec": "",
     "dispatcher_target": "/etc/kamailio/dispatcher.list",
     "reload_cmd": "kamcmd dispatcher.reload",
+    "ctl_socket": "",
     "remote_script_dir": "/opt/pbx-migration/scripts",
     "remote_profile_dir": "/tmp/pbx-migration",
     "local_artifacts_dir": "./artifacts/orchestration",
@@ -40,11 +51,14 @@ DEFAULT_VALUES: dict[str, Any] = {
     "drain_threshold": 0,
     "drain_interval": 15,
     "drain_timeout": 14400,
+    "drain_method": "auto",
     "auto_rollback": True,
 }
 
 FIELD_ORDER = [
     "mode",
+    "ramp_schedule",
+    "ramp_hold",
     "kamailio_host",
     "kamailio_user",
     "kamailio_ssh_port",
@@ -60,8 +74,10 @@ FIELD_ORDER = [
     "sip_scheme",
     "sip_port",
     "set_id",
+    "profile_spec",
     "dispatcher_target",
     "reload_cmd",
+    "ctl_socket",
     "remote_script_dir",
     "remote_profile_dir",
     "local_artifacts_dir",
@@ -70,15 +86,32 @@ FIELD_ORDER = [
     "drain_threshold",
     "drain_interval",
     "drain_timeout",
+    "drain_method",
     "auto_rollback",
 ]
 
 FIELD_META: dict[str, dict[str, Any]] = {
     "mode": {
         "label": "Migration mode",
-        "desc": "old routes all new traffic to OLD PBX, both enables dual backend, new routes all new traffic to NEW PBX.",
+        "desc": (
+            "old routes all new traffic to OLD PBX, both enables dual backend, new routes all new traffic to NEW PBX, "
+            "ramp shifts weighted traffic to NEW PBX step by step (requires ds_select_dst algorithm 9)."
+        ),
         "type": "choice",
-        "choices": ["old", "both", "new"],
+        "choices": ["old", "both", "new", "ramp"],
+    },
+    "ramp_schedule": {
+        "label": "Ramp schedule (new PBX weight %)",
+        "desc": "Comma-separated ascending percentages of new traffic sent to NEW PBX, e.g. 5,25,50,100.",
+        "type": "int_list",
+        "min": 1,
+        "max": 100,
+    },
+    "ramp_hold": {
+        "label": "Ramp hold between steps (seconds)",
+        "desc": "Time each ramp step is held before the NEW PBX health gate and the next step.",
+        "type": "int",
+        "min": 0,
     },
     "kamailio_host": {
         "label": "Kamailio host (IP or DNS)",
@@ -174,6 +207,14 @@ FIELD_META: dict[str, dict[str, Any]] = {
         "type": "int",
         "min": 0,
     },
+    "profile_spec": {
+        "label": "Dispatcher backend spec file (optional)",
+        "desc": (
+            "JSON spec for several backends per side, several set IDs, and per-destination flags/priority/attrs "
+            "(see dispatcher_profiles.py). Leave empty to use the old/new PBX IP, SIP port, and set ID above."
+        ),
+        "type": "text",
+    },
     "dispatcher_target": {
         "label": "Dispatcher target path",
         "desc": "Path to active dispatcher file on Kamailio host.",
@@ -186,6 +227,14 @@ FIELD_META: dict[str, dict[str, Any]] = {
         "type": "text",
         "required": True,
     },
+    "ctl_socket": {
+        "label": "Kamailio ctl socket (optional)",
+        "desc": (
+            "e.g. unix:/run/kamailio/kamailio_ctl. When set, reload goes through the ctl socket instead of the reload "
+            "command and the in-memory dispatcher sets are verified against the applied file (needs python3 on Kamailio)."
+        ),
+        "type": "text",
+    },
     "remote_script_dir": {
         "label": "Remote script directory on Kamailio",
         "desc": "Directory where apply_dispatcher_profile.sh is expected on Kamailio.",
@@ -222,7 +271,7 @@ FIELD_META: dict[str, dict[str, Any]] = {
     },
     "drain_interval": {
         "label": "Drain poll interval (seconds)",
-        "desc": "How often to poll channel count while draining.",
+        "desc": "Starting poll interval while draining; polling adapts to the projected drain time (poll method or ESL fallback).",
         "type": "int",
         "min": 1,
     },
@@ -232,6 +281,12 @@ FIELD_META: dict[str, dict[str, Any]] = {
         "type": "int",
         "min": 1,
     },
+    "drain_method": {
+        "label": "Drain detection method",
+        "desc": "esl keeps one event socket subscription on the old PBX, poll runs fs_cli every interval, auto tries esl and falls back to poll.",
+        "type": "choice",
+        "choices": ["auto", "esl", "poll"],
+    },
     "auto_rollback": {
         "label": "Enable auto rollback on failure",
         "desc": "If apply fails after profile upload, attempt rollback to old profile automatically.",
@@ -259,7 +314,36 @@ def parse_args() -> argparse.Namespace:
         dest="output_file",
         help="Write final wizard inputs to JSON file before execution.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--fleet",
+        dest="fleet_files",
+        nargs="+",
+        metavar="FILE",
+        help=(
+            "Non-interactive fleet mode: run every listed input profile concurrently "
+            "(dry-run first, then live with --live)."
+        ),
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=4,
+        help="Fleet mode: maximum number of profiles processed at once. Default: 4",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Fleet mode: execute live runs (--confirm) for profiles whose dry-run succeeded.",
+    )
+    parser.add_argument(
+        "--fleet-log-dir",
+        default="./artifacts/fleet",
+        help="Fleet mode: directory for per-profile orchestrator logs. Default: ./artifacts/fleet",
+    )
+    args = parser.parse_args()
+    if args.max_parallel < 1:
+        parser.error("--max-parallel must be >= 1")
+    return args
 
 
 def prompt_text(label: str, default: str | None = None, required: bool = False) -> str:
@@ -361,6 +445,23 @@ def coerce_field_value(key: str, value: Any) -> Any:
     if field_type == "bool":
         return parse_bool_like(value, key)
 
+    if field_type == "int_list":
+        items = value if isinstance(value, list) else str(value).split(",")
+        out_list: list[int] = []
+        for item in items:
+            text = str(item).strip()
+            if isinstance(item, bool) or not text.isdigit():
+                raise ValueError(f"{key} must be a comma-separated list of integers")
+            number = int(text)
+            if number < meta["min"] or number > meta["max"]:
+                raise ValueError(f"{key} values must be between {meta['min']} and {meta['max']}")
+            if out_list and number <= out_list[-1]:
+                raise ValueError(f"{key} values must be strictly ascending")
+            out_list.append(number)
+        if not out_list:
+            raise ValueError(f"{key} must list at least one value")
+        return ",".join(str(n) for n in out_list)
+
     raise ValueError(f"Unsupported field type for {key}: {field_type}")
 
 
@@ -407,6 +508,11 @@ def enforce_rules(values: dict[str, Any]) -> dict[str, Any]:
         values["drain_threshold"] = 0
         values["drain_interval"] = 15
         values["drain_timeout"] = 14400
+        values["drain_method"] = "auto"
+
+    if values["mode"] != "ramp":
+        values["ramp_schedule"] = DEFAULT_VALUES["ramp_schedule"]
+        values["ramp_hold"] = DEFAULT_VALUES["ramp_hold"]
 
     if values["mode"] == "old":
         values["auto_rollback"] = False
@@ -415,7 +521,9 @@ def enforce_rules(values: dict[str, Any]) -> dict[str, Any]:
 
 
 def should_prompt_field(key: str, values: dict[str, Any]) -> bool:
-    if key in {"drain_threshold", "drain_interval", "drain_timeout"}:
+    if key in {"ramp_schedule", "ramp_hold"}:
+        return values["mode"] == "ramp"
+    if key in {"drain_threshold", "drain_interval", "drain_timeout", "drain_method"}:
         return values["mode"] == "new" and values["wait_for_drain"]
     if key == "wait_for_drain":
         return values["mode"] == "new"
@@ -446,6 +554,13 @@ def prompt_field(key: str, values: dict[str, Any]) -> None:
     if field_type == "bool":
         values[key] = prompt_yes_no(meta["label"], default_yes=bool(current))
         return
+    if field_type == "int_list":
+        while True:
+            try:
+                values[key] = coerce_field_value(key, prompt_text(meta["label"], str(current), required=True))
+                return
+            except ValueError as exc:
+                print(exc)
     raise ValueError(f"Unsupported field type for {key}: {field_type}")
 
 
@@ -517,7 +632,7 @@ def validate_values(values: dict[str, Any]) -> list[str]:
     return errors
 
 
-def build_base_command(orchestrator_path: Path, values: dict[str, Any]) -> list[str]:
+def build_base_command(orchestrator_path: Path, values: dict[str, Any], profile_dir: Path | None = None) -> list[str]:
     cmd = [
         str(orchestrator_path),
         "--mode",
@@ -564,7 +679,15 @@ def build_base_command(orchestrator_path: Path, values: dict[str, Any]) -> list[
 
     if str(values["ssh_key"]).strip():
         cmd.extend(["--ssh-key", str(values["ssh_key"]).strip()])
-
+    if str(values["ctl_socket"]).strip():
+        cmd.extend(["--ctl-socket", str(values["ctl_socket"]).strip()])
+    if profile_dir is not None:
+        cmd.extend(["--profile-dir", str(profile_dir)])
+    elif str(values["profile_spec"]).strip():
+        cmd.extend(["--profile-spec", str(values["profile_spec"]).strip()])
+
+    if values["mode"] == "ramp":
+        cmd.extend(["--ramp-schedule", str(values["ramp_schedule"]), "--ramp-hold", str(values["ramp_hold"])])
     if values["capture_snapshots"]:
         cmd.append("--capture-snapshots")
     if values["wait_for_drain"]:
@@ -577,6 +700,8 @@ def build_base_command(orchestrator_path: Path, values: dict[str, Any]) -> list[
                 str(values["drain_interval"]),
                 "--drain-timeout",
                 str(values["drain_timeout"]),
+                "--drain-method",
+                str(values["drain_method"]),
             ]
         )
     if values["auto_rollback"]:
@@ -592,6 +717,190 @@ def run_command(cmd: list[str]) -> int:
     return proc.returncode
 
 
+def run_logged(cmd: list[str], log_path: Path) -> int:
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("w", encoding="utf-8") as log:
+        log.write(f"$ {shlex.join(cmd)}\n\n")
+        log.flush()
+        proc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, check=False)
+    return proc.returncode
+
+
+def load_fleet_profiles(paths: list[str]) -> tuple[list[dict[str, Any]], list[str]]:
+    profiles: list[dict[str, Any]] = []
+    errors: list[str] = []
+    seen: dict[str, int] = {}
+    for raw in paths:
+        path = Path(raw).expanduser().resolve()
+        try:
+            values = load_input_file(path)
+        except ValueError as exc:
+            errors.append(f"{path}: {exc}")
+            continue
+        for err in validate_values(values):
+            errors.append(f"{path}: {err}")
+        name = path.stem
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}-{seen[name]}"
+        profiles.append({"name": name, "path": path, "values": values})
+    return profiles, errors
+
+
+def build_fleet_dispatcher_profiles(profiles: list[dict[str, Any]], log_dir: Path) -> list[str]:
+    """Generate every fleet profile's dispatcher lists in-process, before any run starts."""
+    errors: list[str] = []
+    for profile in profiles:
+        values = profile["values"]
+        try:
+            if str(values["profile_spec"]).strip():
+                sets = dispatcher_profiles.load_spec(Path(str(values["profile_spec"]).strip()).expanduser())
+            else:
+                uri = f"{values['sip_scheme']}:{{}}:{values['sip_port']}"
+                sets = dispatcher_profiles.simple_sets(
+                    [uri.format(values["old_pbx_ip"])], [uri.format(values["new_pbx_ip"])], [values["set_id"]]
+                )
+            schedule = [int(w) for w in str(values["ramp_schedule"]).split(",")]
+            labels = dispatcher_profiles.labels_for_mode(values["mode"], schedule)
+            profile_dir = log_dir / "profiles" / profile["name"]
+            dispatcher_profiles.write_profiles(sets, labels, profile_dir)
+            profile["profile_dir"] = profile_dir
+        except (ValueError, OSError) as exc:
+            errors.append(f"{profile['path']}: {exc}")
+    return errors
+
+
+def run_fleet_profile(
+    profile: dict[str, Any],
+    orchestrator: Path,
+    log_dir: Path,
+    live: bool,
+    kam_locks: dict[tuple[str, int], threading.Lock],
+) -> dict[str, Any]:
+    values = profile["values"]
+    name = profile["name"]
+    base_cmd = build_base_command(orchestrator, values, profile.get("profile_dir"))
+    result: dict[str, Any] = {
+        "name": name,
+        "kamailio": f"{values['kamailio_host']}:{values['kamailio_ssh_port']}",
+        "mode": values["mode"],
+        "dry_rc": None,
+        "live_rc": None,
+        "seconds": 0.0,
+        "log": "",
+    }
+    started = time.monotonic()
+
+    dry_log = log_dir / f"{name}.dry-run.log"
+    result["log"] = str(dry_log)
+    result["dry_rc"] = run_logged([*base_cmd, "--dry-run"], dry_log)
+
+    if live and result["dry_rc"] == 0:
+        # Dispatcher state is one file per Kamailio host; live applies to the same
+        # host must not interleave even when they belong to different profiles.
+        lock = kam_locks[(values["kamailio_host"], values["kamailio_ssh_port"])]
+        live_log = log_dir / f"{name}.live.log"
+        with lock:
+            result["live_rc"] = run_logged([*base_cmd, "--confirm"], live_log)
+        result["log"] = str(live_log)
+
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+def print_fleet_results(results: list[dict[str, Any]]) -> None:
+    def rc_text(rc: int | None) -> str:
+        if rc is None:
+            return "-"
+        return "ok" if rc == 0 else f"rc={rc}"
+
+    headers = ["Profile", "Kamailio", "Mode", "Dry-run", "Live", "Seconds", "Log"]
+    rows = [
+        [
+            r["name"],
+            r["kamailio"],
+            r["mode"],
+            rc_text(r["dry_rc"]),
+            rc_text(r["live_rc"]),
+            f"{r['seconds']:.1f}",
+            r["log"],
+        ]
+        for r in results
+    ]
+    print("\nFleet results")
+    print("-------------")
+    print_table(headers, rows)
+
+
+def run_fleet(args: argparse.Namespace, orchestrator: Path) -> int:
+    profiles, errors = load_fleet_profiles(args.fleet_files)
+    if errors:
+        print("Fleet input validation failed:", file=sys.stderr)
+        for err in errors:
+            print(f"- {err}", file=sys.stderr)
+        return 1
+
+    log_dir = Path(args.fleet_log_dir).expanduser().resolve() / f"fleet-{datetime.now():%Y%m%d_%H%M%S}"
+    gen_started = time.monotonic()
+    errors = build_fleet_dispatcher_profiles(profiles, log_dir)
+    if errors:
+        print("Fleet dispatcher profile generation failed:", file=sys.stderr)
+        for err in errors:
+            print(f"- {err}", file=sys.stderr)
+        return 1
+    gen_ms = (time.monotonic() - gen_started) * 1000
+    kam_locks: dict[tuple[str, int], threading.Lock] = {
+        (p["values"]["kamailio_host"], p["values"]["kamailio_ssh_port"]): threading.Lock() for p in profiles
+    }
+
+    print("PBX Migration Fleet Run")
+    print("-----------------------")
+    print(f"Profiles: {len(profiles)}  max-parallel: {args.max_parallel}  live: {'yes' if args.live else 'no'}")
+    print(f"Logs: {log_dir}")
+    print(f"Dispatcher profiles: generated for {len(profiles)} profiles in {gen_ms:.1f} ms ({log_dir / 'profiles'})")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.max_parallel) as pool:
+        futures = {
+            pool.submit(run_fleet_profile, profile, orchestrator, log_dir, args.live, kam_locks): idx
+            for idx, profile in enumerate(profiles)
+        }
+        results: list[dict[str, Any]] = [{} for _ in profiles]
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                # One broken worker (e.g. a log that cannot be created) must not
+                # lose the other profiles' results while their runs go on.
+                values = profiles[idx]["values"]
+                result = {
+                    "name": profiles[idx]["name"],
+                    "kamailio": f"{values['kamailio_host']}:{values['kamailio_ssh_port']}",
+                    "mode": values["mode"],
+                    "dry_rc": None,
+                    "live_rc": None,
+                    "seconds": 0.0,
+                    "log": f"error: {exc}",
+                }
+                print(f"[{result['name']}] failed: {exc}", file=sys.stderr)
+            else:
+                print(
+                    f"[{result['name']}] dry-run={result['dry_rc']} live={result['live_rc']} "
+                    f"({result['seconds']:.1f}s)"
+                )
+            results[idx] = result
+
+    print_fleet_results(results)
+    print(f"\nFleet wall time: {time.monotonic() - started:.1f}s")
+
+    failed = [r for r in results if r["dry_rc"] != 0 or (args.live and r["live_rc"] != 0)]
+    if failed:
+        print(f"{len(failed)} of {len(results)} profiles failed.", file=sys.stderr)
+        return 1
+    return 0
+
+
 def main() -> int:
     args = parse_args()
 
@@ -602,6 +911,9 @@ def main() -> int:
         print(f"Missing orchestrator script: {orchestrator}", file=sys.stderr)
         return 1
 
+    if args.fleet_files:
+        return run_fleet(args, orchestrator)
+
     print("PBX Migration SSH Wizard")
     print("------------------------")
 
@@ -0,0 +1,293 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+usage() {
+  cat <<'USAGE'
+Usage:
+  post_cutover_watchdog.sh --duration SEC [--interval SEC]
+                           [--kamailio-host HOST] [--kamailio-user USER] [--kamailio-ssh-port PORT]
+                           [--pbx-host HOST] [--pbx-user USER] [--pbx-ssh-port PORT]
+                           [--ssh-key PATH] [--ssh-control-dir DIR] [--no-ssh-mux] [--trace-file FILE]
+                           [--stats-cmd CMD] [--max-error-pct P] [--min-transactions N]
+                           [--probe-target HOST[:PORT]] [--probe-script PATH] [--probe-count N] [--probe-rate N]
+                           [--max-p95-ms MS] [--min-new-channels N] [--breaches N]
+                           [--samples-file CSV] [--reason-file FILE]
+
+Description:
+  Watches a cutover for --duration seconds after the dispatcher change and
+  exits 3 as soon as an SLO is breached, so the caller can roll back. Every
+  --interval seconds it samples:
+
+    errors      Kamailio tm statistics (--stats-cmd, default
+                "kamcmd stats.get_statistics tm:"): the share of 5xx and 6xx
+                among the final replies since the previous sample must stay at
+                or below --max-error-pct. Intervals with fewer than
+                --min-transactions final replies are recorded but not judged.
+    latency     With --probe-target, a short OPTIONS burst (--probe-count at
+                --probe-rate/s) from the Kamailio host with sip_probe.py
+                (--probe-script, a path on that host): p95 must stay at or below
+                --max-p95-ms and probe timeouts plus 5xx/6xx within
+                --max-error-pct.
+    throughput  New PBX channel count (fs_cli 'show channels count' on
+                --pbx-host); with --min-new-channels N, the peak over the window
+                must reach N or the window ends in a breach.
+
+  A sample breaches when any of its checks fails; --breaches consecutive
+  breached samples (default 2) end the watch. Samples go to --samples-file
+  (CSV) and, with --trace-file, to the run trace; the breach reason is printed
+  and written to --reason-file. Without --kamailio-host or --pbx-host the
+  commands run locally.
+
+Exit codes:
+  0  window completed within the SLOs
+  3  SLO breach
+  1  usage error
+
+Examples:
+  post_cutover_watchdog.sh --duration 600 --kamailio-host 10.10.10.30 --pbx-host 10.10.10.20 \
+    --probe-target 10.10.10.20:5060 --probe-script /opt/pbx-migration/scripts/sip_probe.py
+  post_cutover_watchdog.sh --duration 300 --interval 10 --max-error-pct 2 --min-new-channels 5
+USAGE
+}
+
+KAMAILIO_HOST=""
+KAMAILIO_USER="root"
+KAMAILIO_SSH_PORT="22"
+PBX_HOST=""
+PBX_USER="root"
+PBX_SSH_PORT="22"
+SSH_KEY=""
+SSH_CONTROL_DIR=""
+SSH_MUX="true"
+TRACE_FILE_ARG=""
+DURATION=""
+INTERVAL=15
+STATS_CMD="kamcmd stats.get_statistics tm:"
+MAX_ERROR_PCT="5"
+MIN_TRANSACTIONS=20
+PROBE_TARGET=""
+PROBE_SCRIPT="/opt/pbx-migration/scripts/sip_probe.py"
+PROBE_COUNT=10
+PROBE_RATE=10
+MAX_P95_MS=500
+MIN_NEW_CHANNELS=0
+BREACHES=2
+SAMPLES_FILE=""
+REASON_FILE=""
+
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --kamailio-host) KAMAILIO_HOST="${2:-}"; shift 2 ;;
+    --kamailio-user) KAMAILIO_USER="${2:-}"; shift 2 ;;
+    --kamailio-ssh-port) KAMAILIO_SSH_PORT="${2:-}"; shift 2 ;;
+    --pbx-host) PBX_HOST="${2:-}"; shift 2 ;;
+    --pbx-user) PBX_USER="${2:-}"; shift 2 ;;
+    --pbx-ssh-port) PBX_SSH_PORT="${2:-}"; shift 2 ;;
+    --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
+    --ssh-control-dir) SSH_CONTROL_DIR="${2:-}"; shift 2 ;;
+    --no-ssh-mux) SSH_MUX="false"; shift ;;
+    --trace-file) TRACE_FILE_ARG="${2:-}"; shift 2 ;;
+    --duration) DURATION="${2:-}"; shift 2 ;;
+    --interval) INTERVAL="${2:-}"; shift 2 ;;
+    --stats-cmd) STATS_CMD="${2:-}"; shift 2 ;;
+    --max-error-pct) MAX_ERROR_PCT="${2:-}"; shift 2 ;;
+    --min-transactions) MIN_TRANSACTIONS="${2:-}"; shift 2 ;;
+    --probe-target) PROBE_TARGET="${2:-}"; shift 2 ;;
+    --probe-script) PROBE_SCRIPT="${2:-}"; shift 2 ;;
+    --probe-count) PROBE_COUNT="${2:-}"; shift 2 ;;
+    --probe-rate) PROBE_RATE="${2:-}"; shift 2 ;;
+    --max-p95-ms) MAX_P95_MS="${2:-}"; shift 2 ;;
+    --min-new-channels) MIN_NEW_CHANNELS="${2:-}"; shift 2 ;;
+    --breaches) BREACHES="${2:-}"; shift 2 ;;
+    --samples-file) SAMPLES_FILE="${2:-}"; shift 2 ;;
+    --reason-file) REASON_FILE="${2:-}"; shift 2 ;;
+    --help|-h) usage; exit 0 ;;
+    *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
+  esac
+done
+
+if [[ -z "$DURATION" ]]; then
+  usage
+  exit 1
+fi
+for value in "$DURATION" "$INTERVAL" "$MIN_TRANSACTIONS" "$PROBE_COUNT" "$PROBE_RATE" "$MAX_P95_MS" "$MIN_NEW_CHANNELS" "$BREACHES"; do
+  if [[ ! "$value" =~ ^[0-9]+$ ]]; then
+    echo "Numeric options must be non-negative integers (got: ${value})" >&2
+    exit 1
+  fi
+done
+if [[ ! "$MAX_ERROR_PCT" =~ ^[0-9]+(\.[0-9]+)?$ ]]; then
+  echo "--max-error-pct must be a non-negative number (got: ${MAX_ERROR_PCT})" >&2
+  exit 1
+fi
+if (( INTERVAL < 1 )); then INTERVAL=1; fi
+if (( BREACHES < 1 )); then BREACHES=1; fi
+if (( PROBE_RATE < 1 )); then PROBE_RATE=1; fi
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# shellcheck source=ssh_mux.sh
+source "${SCRIPT_DIR}/ssh_mux.sh"
+# shellcheck source=trace_events.sh
+source "${SCRIPT_DIR}/trace_events.sh"
+
+trace_init "$TRACE_FILE_ARG" post_cutover_watchdog
+
+if [[ -n "$KAMAILIO_HOST" || -n "$PBX_HOST" ]]; then
+  ssh_opts=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new)
+  if [[ -n "$SSH_KEY" ]]; then
+    ssh_opts+=(-i "$SSH_KEY")
+  fi
+  ssh_mux_init "$SSH_CONTROL_DIR" "$SSH_MUX" "${ssh_opts[@]}"
+  trap ssh_mux_teardown EXIT
+fi
+
+run_kam() {
+  if [[ -n "$KAMAILIO_HOST" ]]; then
+    mux_ssh "$KAMAILIO_USER" "$KAMAILIO_HOST" "$KAMAILIO_SSH_PORT" "$1"
+  else
+    bash -lc "$1"
+  fi
+}
+
+run_pbx() {
+  if [[ -n "$PBX_HOST" ]]; then
+    mux_ssh "$PBX_USER" "$PBX_HOST" "$PBX_SSH_PORT" "$1"
+  else
+    bash -lc "$1"
+  fi
+}
+
+# tm_counters prints "<final replies> <5xx+6xx>" summed over the
+# <N>xx_transactions counters in kamcmd or kamailio_ctl.py (JSON) output, or
+# nothing when the counters are missing.
+tm_counters() {
+  awk '
+    {
+      line = $0
+      while (match(line, /[2-6]xx_transactions[^0-9]*[0-9]+/)) {
+        hit = substr(line, RSTART, RLENGTH)
+        cls = substr(hit, 1, 1)
+        n = hit; sub(/.*[^0-9]/, "", n)
+        total += n; seen = 1
+        if (cls >= 5) errors += n
+        line = substr(line, RSTART + RLENGTH)
+      }
+    }
+    END { if (seen) printf "%d %d\n", total, errors }'
+}
+
+# probe_summary reads sip_probe.py JSON on stdin and prints
+# "<p95 ms or -> <errors> <breaches joined by '; '>".
+probe_summary() {
+  python3 -c '
+import json, sys
+try:
+    report = json.load(sys.stdin)
+except ValueError:
+    print("- - probe produced no report")
+    raise SystemExit(0)
+p95 = (report.get("kinds", {}).get("OPTIONS") or {}).get("p95_ms")
+print("-" if p95 is None else f"{p95:.1f}", report.get("errors", 0), "; ".join(report.get("breaches", [])))
+'
+}
+
+if [[ -n "$SAMPLES_FILE" ]]; then
+  echo "elapsed_s,final_replies,errors,error_pct,probe_p95_ms,probe_errors,new_channels,breach" > "$SAMPLES_FILE"
+fi
+
+breach_out() {
+  local reason="$1"
+  echo "WATCHDOG BREACH: ${reason}" >&2
+  if [[ -n "$REASON_FILE" ]]; then
+    printf '%s\n' "$reason" > "$REASON_FILE"
+  fi
+  trace_span watchdog "$watch_start_ms" "$(now_ms)" breach samples="$sample_no" peak_new_channels="$peak_channels" reason="$reason"
+  exit 3
+}
+
+echo "Watching cutover for ${DURATION}s (interval=${INTERVAL}s, max-error=${MAX_ERROR_PCT}%, min-transactions=${MIN_TRANSACTIONS}${PROBE_TARGET:+, probe ${PROBE_TARGET} p95<=${MAX_P95_MS}ms}$( (( MIN_NEW_CHANNELS > 0 )) && echo ", min-new-channels=${MIN_NEW_CHANNELS}"), breaches=${BREACHES})"
+
+watch_start_ms="$(now_ms)"
+start_ts=$SECONDS
+sample_no=0
+consecutive=0
+peak_channels=-1
+prev_total=""
+prev_errors=""
+
+while true; do
+  sample_start_ms="$(now_ms)"
+  elapsed=$((SECONDS - start_ts))
+  sample_no=$((sample_no + 1))
+  reasons=()
+
+  total="-"; errors="-"; error_pct="-"
+  counters="$(TRACE_OP=watchdog_stats run_kam "$STATS_CMD" 2>/dev/null | tm_counters || true)"
+  if [[ -n "$counters" ]]; then
+    read -r cur_total cur_errors <<< "$counters"
+    if [[ -n "$prev_total" ]] && (( cur_total >= prev_total && cur_errors >= prev_errors )); then
+      total=$((cur_total - prev_total))
+      errors=$((cur_errors - prev_errors))
+      if (( total > 0 )); then
+        error_pct="$(awk -v e="$errors" -v t="$total" 'BEGIN { printf "%.2f", 100 * e / t }')"
+      fi
+      if (( total >= MIN_TRANSACTIONS )) && awk -v p="$error_pct" -v m="$MAX_ERROR_PCT" 'BEGIN { exit !(p > m) }'; then
+        reasons+=("Kamailio 5xx/6xx ${error_pct}% (${errors}/${total} final replies) > ${MAX_ERROR_PCT}%")
+      fi
+    fi
+    prev_total="$cur_total"
+    prev_errors="$cur_errors"
+  else
+    echo "WARNING: no tm counters from '${STATS_CMD}'" >&2
+  fi
+
+  probe_p95="-"; probe_errors="-"
+  if [[ -n "$PROBE_TARGET" ]] && (( PROBE_COUNT > 0 )); then
+    probe_rc=0
+    probe_json="$(TRACE_OP=watchdog_probe run_kam "python3 '${PROBE_SCRIPT}' --target '${PROBE_TARGET}' --count ${PROBE_COUNT} --rate ${PROBE_RATE} --max-p95-ms ${MAX_P95_MS} --max-error-pct ${MAX_ERROR_PCT} --json" 2>/dev/null)" || probe_rc=$?
+    read -r probe_p95 probe_errors probe_breaches <<< "$(probe_summary <<< "$probe_json")"
+    if (( probe_rc != 0 )); then
+      reasons+=("probe ${PROBE_TARGET}: ${probe_breaches:-sip_probe.py exited ${probe_rc}}")
+    fi
+  fi
+
+  channels="$(TRACE_OP=watchdog_channels run_pbx "fs_cli -x 'show channels count'" 2>/dev/null | grep -Eo '[0-9]+' | head -n 1 || true)"
+  channels="${channels:--1}"
+  if (( channels > peak_channels )); then
+    peak_channels="$channels"
+  fi
+
+  breach="0"
+  if (( ${#reasons[@]} > 0 )); then
+    breach="1"
+    consecutive=$((consecutive + 1))
+  else
+    consecutive=0
+  fi
+  if [[ -n "$SAMPLES_FILE" ]]; then
+    echo "${elapsed},${total},${errors},${error_pct},${probe_p95},${probe_errors},${channels},${breach}" >> "$SAMPLES_FILE"
+  fi
+  trace_span watchdog_sample "$sample_start_ms" "$(now_ms)" "$([[ "$breach" == "0" ]] && echo ok || echo breach)" \
+    elapsed_s="$elapsed" final_replies="$total" errors="$errors" probe_p95_ms="$probe_p95" new_channels="$channels"
+  echo "[$(date +'%Y-%m-%d %H:%M:%S')] t=${elapsed}s replies=${total} errors=${errors} (${error_pct}%) probe_p95=${probe_p95}ms new_channels=${channels}$( (( ${#reasons[@]} > 0 )) && printf ' BREACH %d/%d: %s' "$consecutive" "$BREACHES" "${reasons[*]}")"
+
+  if (( consecutive >= BREACHES )); then
+    joined="$(printf '%s; ' "${reasons[@]}")"
+    breach_out "${joined%; } (${consecutive} consecutive samples)"
+  fi
+
+  elapsed=$((SECONDS - start_ts))
+  if (( elapsed >= DURATION )); then
+    break
+  fi
+  remaining=$((DURATION - elapsed))
+  sleep $(( remaining < INTERVAL ? remaining : INTERVAL ))
+done
+
+if (( MIN_NEW_CHANNELS > 0 && peak_channels < MIN_NEW_CHANNELS )); then
+  breach_out "new PBX peaked at ${peak_channels} channels in ${DURATION}s, below --min-new-channels ${MIN_NEW_CHANNELS}"
+fi
+
+trace_span watchdog "$watch_start_ms" "$(now_ms)" ok samples="$sample_no" peak_new_channels="$peak_channels"
+echo "Watchdog window completed within SLOs (${sample_no} samples, peak new PBX channels ${peak_channels})."
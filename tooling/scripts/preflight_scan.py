@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""Concurrent reachability preflight for every host in wizard input profiles.
+
+Reads any number of wizard input files (the tooling/config/lab-inputs.sample.json
+schema) and probes each distinct host once, all of them at the same time:
+
+  ssh      one non-interactive SSH exec per user@host:port (auth, round trip),
+           which also runs that host's checks:
+  fs_cli   old/new PBX: fs_cli is installed and answers ``status``
+  reload   Kamailio: the reload_cmd binary is on PATH, or with ctl_socket,
+           python3 is installed and the socket exists
+  apply    Kamailio: apply_dispatcher_profile.sh is executable in remote_script_dir
+  sudo     Kamailio with a non-root user: passwordless sudo works
+  sip      SIP OPTIONS over UDP from this machine to every old/new backend
+           (old_pbx_ip/new_pbx_ip on sip_port, or the profile spec's URIs);
+           any response below 500 counts, since a 4xx still proves the stack
+           is up. A PBX that silently drops untrusted sources times out here
+           and needs the orchestrator's readiness probe from Kamailio instead.
+
+Healthy results are cached per probe in --cache for --cache-ttl seconds, so a
+repeat scan only re-probes hosts that failed, changed, or expired; --refresh
+ignores the cache.
+
+  preflight_scan.py tooling/config/*.json --output preflight.json
+
+Exit 1 when any probe fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shlex
+import sys
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+import dispatcher_profiles
+from report_utils import print_table
+from orchestrate_migration_wizard import load_fleet_profiles
+from sip_probe import parse_target, token
+
+CACHE_VERSION = 1
+T1 = 0.5
+USER_AGENT = "pbx-migration-preflight"
+MARK = "PREFLIGHT"
+CHECK_COLUMNS = ["fs_cli", "reload", "apply", "sudo"]
+
+
+def pbx_checks() -> list[tuple[str, str, str]]:
+    """(column, shell test, failure detail) run on an old/new PBX."""
+    return [("fs_cli", "command -v fs_cli && fs_cli -x status", "fs_cli missing or no answer to status")]
+
+
+def kamailio_checks(values: dict[str, Any]) -> list[tuple[str, str, str]]:
+    script = f"{str(values['remote_script_dir']).rstrip('/')}/apply_dispatcher_profile.sh"
+    checks = [("apply", f"test -x {shlex.quote(script)}", f"{script} not executable")]
+    ctl = str(values["ctl_socket"]).strip()
+    if ctl:
+        test = "command -v python3"
+        if ctl.startswith("unix:"):
+            test += f" && test -S {shlex.quote(ctl[len('unix:'):])}"
+        checks.append(("reload", test, f"python3 or ctl socket {ctl} missing"))
+    else:
+        words = shlex.split(str(values["reload_cmd"]))
+        binary = words[0] if words else "kamcmd"
+        checks.append(("reload", f"command -v {shlex.quote(binary)}", f"{binary} not on PATH"))
+    if values["kamailio_user"] != "root":
+        checks.append(("sudo", "sudo -n true", "passwordless sudo unavailable"))
+    return checks
+
+
+def uri_target(uri: str) -> tuple[str, int]:
+    """Host and port of a dispatcher URI such as sip:10.0.0.1:5060;transport=udp."""
+    rest = uri.split(":", 1)[1].split(";", 1)[0]
+    return parse_target(rest.rsplit("@", 1)[-1])
+
+
+def sip_targets(values: dict[str, Any]) -> list[tuple[str, str, int]]:
+    """(side, host, port) per backend the profile routes to."""
+    spec = str(values["profile_spec"]).strip()
+    if spec:
+        sets = dispatcher_profiles.load_spec(Path(spec).expanduser())
+        return [(side, *uri_target(dest["uri"])) for dset in sets for side in ("old", "new") for dest in dset[side]]
+    return [(side, str(values[f"{side}_pbx_ip"]), int(values["sip_port"])) for side in ("old", "new")]
+
+
+def build_inventory(profiles: list[dict[str, Any]]) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, Any]]]:
+    """Distinct SSH and SIP targets across all profiles, each with the profiles using it."""
+    ssh: dict[str, dict[str, Any]] = {}
+    sip: dict[str, dict[str, Any]] = {}
+    for profile in profiles:
+        values = profile["values"]
+        hosts = [
+            ("kamailio", "kamailio_host", "kamailio_user", "kamailio_ssh_port", kamailio_checks(values)),
+            ("old", "old_pbx_host", "old_pbx_user", "old_pbx_ssh_port", pbx_checks()),
+            ("new", "new_pbx_host", "new_pbx_user", "new_pbx_ssh_port", pbx_checks()),
+        ]
+        for role, host_key, user_key, port_key, checks in hosts:
+            name = f"{values[user_key]}@{values[host_key]}:{values[port_key]}"
+            entry = ssh.setdefault(
+                name,
+                {
+                    "user": values[user_key],
+                    "host": values[host_key],
+                    "port": int(values[port_key]),
+                    "key": str(values["ssh_key"]),
+                    "roles": set(),
+                    "profiles": set(),
+                    "checks": [],
+                },
+            )
+            entry["roles"].add(role)
+            entry["profiles"].add(profile["name"])
+            for check in checks:
+                if check not in entry["checks"]:
+                    entry["checks"].append(check)
+        for side, host, port in sip_targets(values):
+            name = f"{host}:{port}" if ":" not in host else f"[{host}]:{port}"
+            entry = sip.setdefault(name, {"host": host, "port": port, "sides": set(), "profiles": set(), "scheme": values["sip_scheme"]})
+            entry["sides"].add(side)
+            entry["profiles"].add(profile["name"])
+    return ssh, sip
+
+
+def remote_script(checks: list[tuple[str, str, str]]) -> str:
+    """One shell line that reports every check's exit code as "PREFLIGHT <index> <rc>"."""
+    parts = [f"echo {MARK} ssh 0"]
+    for idx, (_, test, _) in enumerate(checks):
+        parts.append(f"( {test} ) </dev/null >/dev/null 2>&1; echo {MARK} {idx} $?")
+    return "; ".join(parts)
+
+
+def ssh_cache_key(name: str, entry: dict[str, Any]) -> str:
+    digest = hashlib.sha256(remote_script(entry["checks"]).encode()).hexdigest()[:16]
+    return f"ssh {name} {entry['key']} {digest}"
+
+
+async def probe_ssh(entry: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    cmd = ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=accept-new", "-o", f"ConnectTimeout={args.ssh_timeout}"]
+    cmd += ["-p", str(entry["port"])]
+    if entry["key"]:
+        cmd += ["-i", str(Path(entry["key"]).expanduser())]
+    cmd += [f"{entry['user']}@{entry['host']}", remote_script(entry["checks"])]
+    result: dict[str, Any] = {"status": "fail", "detail": "", "ms": None, "checks": {}}
+    started = time.monotonic()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+    except OSError as exc:
+        result["detail"] = str(exc)
+        return result
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), args.ssh_timeout + args.command_timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        result["detail"] = f"timed out after {args.ssh_timeout + args.command_timeout}s"
+        return result
+    result["ms"] = round((time.monotonic() - started) * 1000, 1)
+
+    codes: dict[str, int] = {}
+    for line in out.decode(errors="replace").splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == MARK and parts[2].isdigit():
+            codes[parts[1]] = int(parts[2])
+    if "ssh" not in codes:
+        lines = [line.strip() for line in err.decode(errors="replace").splitlines() if line.strip()]
+        result["detail"] = lines[-1][:80] if lines else f"ssh exited {proc.returncode}"
+        return result
+    result["status"] = "ok"
+    for idx, (column, _, detail) in enumerate(entry["checks"]):
+        rc = codes.get(str(idx))
+        if rc == 0:
+            check = {"status": "ok", "detail": ""}
+        else:
+            check = {"status": "fail", "detail": detail if rc is not None else "check did not run"}
+        # A column with several variants (profiles with different reload
+        # commands on one host) is only ok when all of them are.
+        if result["checks"].get(column, {}).get("status") != "fail":
+            result["checks"][column] = check
+    return result
+
+
+class OptionsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, loop: asyncio.AbstractEventLoop, branch: str) -> None:
+        self.branch = branch
+        self.reply: asyncio.Future[int] = loop.create_future()
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        msg = data.decode(errors="replace")
+        if self.reply.done() or not msg.startswith("SIP/2.0 ") or self.branch not in msg:
+            return
+        try:
+            code = int(msg.split(" ", 2)[1])
+        except (IndexError, ValueError):
+            return
+        if code >= 200:
+            self.reply.set_result(code)
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP port unreachable: nothing listens, no need to wait for the timeout.
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
+def options_request(target: str, local: str, branch: str) -> bytes:
+    ruri = f"sip:{target}"
+    lines = [
+        f"OPTIONS {ruri} SIP/2.0",
+        f"Via: SIP/2.0/UDP {local};branch={branch};rport",
+        "Max-Forwards: 70",
+        f"From: <sip:preflight@{local}>;tag={token()}",
+        f"To: <{ruri}>",
+        f"Call-ID: {token()}@{USER_AGENT}",
+        "CSeq: 1 OPTIONS",
+        f"Contact: <sip:preflight@{local}>",
+        f"User-Agent: {USER_AGENT}",
+        "Content-Length: 0",
+    ]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+async def probe_sip(name: str, entry: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    result: dict[str, Any] = {"status": "fail", "detail": "", "ms": None}
+    if entry["scheme"] != "sip":
+        return {"status": "skip", "detail": f"{entry['scheme']} (TLS) not probed", "ms": None}
+    loop = asyncio.get_running_loop()
+    branch = f"z9hG4bK-{token()}"
+    started = time.monotonic()
+    try:
+        transport, proto = await asyncio.wait_for(
+            loop.create_datagram_endpoint(lambda: OptionsProtocol(loop, branch), remote_addr=(entry["host"], entry["port"])),
+            args.sip_timeout,
+        )
+    except (OSError, asyncio.TimeoutError) as exc:
+        result["detail"] = str(exc) or "resolution timed out"
+        return result
+    try:
+        local_ip, local_port = transport.get_extra_info("sockname")[:2]
+        local = f"{local_ip}:{local_port}" if ":" not in local_ip else f"[{local_ip}]:{local_port}"
+        data = options_request(name, local, branch)
+        deadline = started + args.sip_timeout
+        interval = T1
+        while True:
+            transport.sendto(data)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                result["detail"] = f"no response in {args.sip_timeout}s"
+                return result
+            try:
+                code = await asyncio.wait_for(asyncio.shield(proto.reply), min(interval, remaining))
+            except asyncio.TimeoutError:
+                interval = min(interval * 2, 4.0)
+                continue
+            except OSError as exc:
+                result["detail"] = exc.strerror or str(exc)
+                return result
+            result["ms"] = round((time.monotonic() - started) * 1000, 1)
+            result["detail"] = str(code)
+            if code < 500:
+                result["status"] = "ok"
+            return result
+    finally:
+        transport.close()
+
+
+def load_cache(path: Path | None) -> dict[str, Any]:
+    if path is None or not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if data.get("version") != CACHE_VERSION:
+        return {}
+    return data.get("entries", {})
+
+
+def save_cache(path: Path, entries: dict[str, Any], ttl: int) -> None:
+    now = time.time()
+    fresh = {key: entry for key, entry in entries.items() if now - entry["time"] < ttl}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "entries": fresh}, indent=1) + "\n", encoding="utf-8")
+    tmp.replace(path)
+
+
+async def scan(
+    ssh: dict[str, dict[str, Any]], sip: dict[str, dict[str, Any]], cache: dict[str, Any], args: argparse.Namespace
+) -> None:
+    """Fill in each inventory entry's "result" and "cached" flag, probing everything not cached."""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    now = time.time()
+
+    async def run(entry: dict[str, Any], key: str, probe: Any) -> None:
+        hit = cache.get(key)
+        if hit and not args.refresh and now - hit["time"] < args.cache_ttl:
+            entry["result"], entry["cached"] = hit["result"], True
+            return
+        async with semaphore:
+            entry["result"], entry["cached"] = await probe(), False
+        result = entry["result"]
+        if result["status"] == "ok" and all(c["status"] == "ok" for c in result.get("checks", {}).values()):
+            cache[key] = {"time": time.time(), "result": result}
+        else:
+            cache.pop(key, None)
+
+    tasks = [run(entry, ssh_cache_key(name, entry), partial(probe_ssh, entry, args)) for name, entry in ssh.items()]
+    tasks += [run(entry, f"sip {name}", partial(probe_sip, name, entry, args)) for name, entry in sip.items()]
+    await asyncio.gather(*tasks)
+
+
+def cell(result: dict[str, Any]) -> str:
+    if result["status"] == "ok":
+        return f"ok {result['ms']:.0f}ms" if result.get("ms") is not None else "ok"
+    if result["status"] == "skip":
+        return f"skip: {result['detail']}"
+    return f"FAIL: {result['detail']}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Probe every host referenced by wizard input profiles, concurrently.")
+    parser.add_argument("inputs", nargs="+", help="Wizard input JSON files (lab-inputs.sample.json schema).")
+    parser.add_argument("--concurrency", type=int, default=128, help="Probes in flight at once. Default: 128")
+    parser.add_argument("--ssh-timeout", type=int, default=5, help="SSH connect timeout in seconds. Default: 5")
+    parser.add_argument("--command-timeout", type=int, default=10, help="Seconds the remote checks may take after connecting. Default: 10")
+    parser.add_argument("--sip-timeout", type=float, default=2.0, help="Seconds to wait for an OPTIONS response. Default: 2")
+    parser.add_argument("--cache", default="./artifacts/preflight/cache.json", help="Result cache file. Default: ./artifacts/preflight/cache.json")
+    parser.add_argument("--cache-ttl", type=int, default=300, help="Seconds a healthy result is reused. Default: 300")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the cache.")
+    parser.add_argument("--refresh", action="store_true", help="Probe everything, then update the cache.")
+    parser.add_argument("--output", help="Write the matrix as JSON here.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.concurrency < 1 or args.ssh_timeout < 1 or args.command_timeout < 0 or args.sip_timeout <= 0 or args.cache_ttl < 0:
+        print("ERROR: --concurrency, --ssh-timeout and --sip-timeout must be positive, timeouts and --cache-ttl non-negative", file=sys.stderr)
+        return 1
+
+    profiles, errors = load_fleet_profiles(args.inputs)
+    try:
+        ssh, sip = build_inventory(profiles)
+    except (ValueError, OSError) as exc:
+        errors.append(str(exc))
+    if errors:
+        print("Input validation failed:", file=sys.stderr)
+        for err in errors:
+            print(f"- {err}", file=sys.stderr)
+        return 1
+
+    cache_path = None if args.no_cache else Path(args.cache).expanduser()
+    cache = load_cache(cache_path)
+    started = time.monotonic()
+    asyncio.run(scan(ssh, sip, cache, args))
+    elapsed = time.monotonic() - started
+    if cache_path is not None:
+        try:
+            save_cache(cache_path, cache, args.cache_ttl)
+        except OSError as exc:
+            print(f"WARNING: could not write cache {cache_path}: {exc}", file=sys.stderr)
+
+    failed: dict[str, list[str]] = {profile["name"]: [] for profile in profiles}
+    host_rows = []
+    for name, entry in sorted(ssh.items()):
+        result = entry["result"]
+        checks = result.get("checks", {})
+        row = [name, ",".join(sorted(entry["roles"])), cell(result)]
+        for column in CHECK_COLUMNS:
+            if column in checks:
+                row.append(cell(checks[column]))
+            elif result["status"] != "ok" and any(c[0] == column for c in entry["checks"]):
+                row.append("skip: no ssh")
+            else:
+                row.append("-")
+        row.append("cache" if entry["cached"] else "probe")
+        host_rows.append(row)
+        bad = [f"{column}@{name}" for column, check in checks.items() if check["status"] == "fail"]
+        if result["status"] != "ok":
+            bad = [f"ssh@{name}"]
+        for profile in entry["profiles"]:
+            failed[profile].extend(bad)
+
+    sip_rows = []
+    for name, entry in sorted(sip.items()):
+        result = entry["result"]
+        sip_rows.append([name, ",".join(sorted(entry["sides"])), cell(result), "cache" if entry["cached"] else "probe"])
+        if result["status"] == "fail":
+            for profile in entry["profiles"]:
+                failed[profile].append(f"sip@{name}")
+
+    print("SSH targets")
+    print_table(["target", "roles", "ssh", *CHECK_COLUMNS, "source"], host_rows)
+    print("\nSIP OPTIONS")
+    print_table(["target", "sides", "sip", "source"], sip_rows)
+    print("\nProfiles")
+    print_table(["profile", "status", "failed probes"], [[p, "FAIL" if bad else "ok", ", ".join(bad) or "-"] for p, bad in failed.items()])
+    cached = sum(1 for entry in [*ssh.values(), *sip.values()] if entry["cached"])
+    print(f"\nScanned {len(ssh)} SSH and {len(sip)} SIP targets for {len(profiles)} profile(s) in {elapsed:.1f}s ({cached} from cache).")
+
+    if args.output:
+        report = {
+            "scanned_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seconds": round(elapsed, 2),
+            "ssh": {
+                name: {"roles": sorted(e["roles"]), "profiles": sorted(e["profiles"]), "cached": e["cached"], **e["result"]}
+                for name, e in ssh.items()
+            },
+            "sip": {
+                name: {"sides": sorted(e["sides"]), "profiles": sorted(e["profiles"]), "cached": e["cached"], **e["result"]}
+                for name, e in sip.items()
+            },
+            "profiles": {p: {"ok": not bad, "failed": bad} for p, bad in failed.items()},
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    failures = sum(1 for bad in failed.values() if bad)
+    if failures:
+        print(f"Preflight FAILED for {failures} of {len(profiles)} profile(s).", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,28 @@
+"""Helpers shared by the report and benchmark tools.
+
+``percentile`` is the one percentile definition every report uses, so p95 in
+a readiness probe, a trace summary, and a benchmark mean the same thing.
+``print_table`` prints left-aligned text tables. Standard library only:
+sip_probe.py imports it on the Kamailio host.
+"""
+
+from __future__ import annotations
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def print_table(headers: list[str], rows: list[list[str]]) -> None:
+    widths = [max(len(str(row[i])) for row in [headers, *rows]) for i in range(len(headers))]
+    print("  ".join(h.ljust(widths[i]) for i, h in enumerate(headers)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(v).ljust(widths[i]) for i, v in enumerate(row)))
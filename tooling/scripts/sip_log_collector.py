@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Incremental SIP message log collector.
+
+Follows a SIPp ``-trace_msg`` message log (locally, or inside a container with
+``--docker``) through ``tail -F`` started at the last consumed byte offset,
+and keeps running counts of INVITE requests and responses by class. Work per
+update is proportional to the new bytes only, so the call-cutover dashboard
+stays cheap on multi-hour soak runs.
+
+Counts are written atomically to ``--state`` as key=value lines:
+
+    offset=<bytes consumed, always at a line boundary>
+    invites=<lines starting with "INVITE ">
+    responses_1xx=... responses_6xx=<lines starting with "SIP/2.0 Nxx">
+    updated_at=<unix time of the last write>
+
+If the state file already exists the collector resumes from its offset and
+counts, and if the tail stream ends (container not up yet, restarted) it is
+reopened from the saved offset with backoff. A log shorter than the saved
+offset (container recreated, log rotated) is read again from the start while
+the counts keep accumulating, so totals never go backwards. SIGTERM/SIGINT
+write a final state and exit.
+
+Example:
+  sip_log_collector.py --docker real-sipp-uas-old --log /tmp/old_messages.log \\
+      --state ./artifacts/old-messages.state
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import select
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+RESPONSE_CLASSES = "123456"
+
+
+class LogCounter:
+    def __init__(self) -> None:
+        self.offset = 0
+        self.invites = 0
+        self.responses = {cls: 0 for cls in RESPONSE_CLASSES}
+        self.pending = b""
+
+    def feed(self, data: bytes) -> bool:
+        """Count complete lines in pending + data; returns True if anything was consumed."""
+        buf = self.pending + data
+        cut = buf.rfind(b"\n") + 1
+        if cut == 0:
+            self.pending = buf
+            return False
+        # Prefixing a newline turns "starts with" into a substring count over
+        # the whole block, so counting runs at bytes.count speed.
+        block = b"\n" + buf[:cut]
+        self.pending = buf[cut:]
+        self.offset += cut
+        self.invites += block.count(b"\nINVITE ")
+        for cls in RESPONSE_CLASSES:
+            self.responses[cls] += block.count(b"\nSIP/2.0 " + cls.encode())
+        return True
+
+    def load(self, path: Path) -> None:
+        values = {}
+        for line in path.read_text(encoding="utf-8").splitlines():
+            key, _, value = line.partition("=")
+            if value.isdigit():
+                values[key] = int(value)
+        self.offset = values.get("offset", 0)
+        self.invites = values.get("invites", 0)
+        for cls in RESPONSE_CLASSES:
+            self.responses[cls] = values.get(f"responses_{cls}xx", 0)
+
+    def dump(self) -> str:
+        lines = [f"offset={self.offset}", f"invites={self.invites}"]
+        lines.extend(f"responses_{cls}xx={self.responses[cls]}" for cls in RESPONSE_CLASSES)
+        lines.append(f"updated_at={int(time.time())}")
+        return "\n".join(lines) + "\n"
+
+
+def write_state(path: Path, counter: LogCounter) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(counter.dump(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def log_size(args: argparse.Namespace) -> int | None:
+    cmd = ["sh", "-c", 'wc -c < "$0"', args.log]
+    if args.docker:
+        cmd = ["docker", "exec", args.docker, *cmd]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return int(out) if out.isdigit() else None
+
+
+def tail_command(args: argparse.Namespace, offset: int) -> list[str]:
+    tail = ["tail", "-c", f"+{offset + 1}", "-F", args.log]
+    if args.docker:
+        return ["docker", "exec", args.docker, *tail]
+    return tail
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Incrementally count INVITEs and responses in a SIPp message log.")
+    parser.add_argument("--log", required=True, help="Message log path (inside the container with --docker).")
+    parser.add_argument("--docker", help="Container to read the log from via docker exec.")
+    parser.add_argument("--state", required=True, help="Counts file, rewritten atomically.")
+    parser.add_argument("--flush-interval", type=float, default=0.5, help="Minimum seconds between state writes. Default: 0.5")
+    parser.add_argument("--max-backoff", type=float, default=5.0, help="Maximum seconds between tail restarts. Default: 5")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    state = Path(args.state)
+    state.parent.mkdir(parents=True, exist_ok=True)
+    counter = LogCounter()
+    if state.exists():
+        counter.load(state)
+    write_state(state, counter)
+
+    stopping = False
+
+    def stop(_signum: int, _frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    backoff = 0.2
+    while not stopping:
+        counter.pending = b""
+        size = log_size(args)
+        if size is not None and size < counter.offset:
+            counter.offset = 0
+        proc = subprocess.Popen(tail_command(args, counter.offset), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        fd = proc.stdout.fileno()
+        dirty = False
+        last_flush = time.monotonic()
+        try:
+            while not stopping:
+                ready, _, _ = select.select([fd], [], [], args.flush_interval)
+                if ready:
+                    data = os.read(fd, 65536)
+                    if not data:
+                        break
+                    dirty = counter.feed(data) or dirty
+                    backoff = 0.2
+                if dirty and time.monotonic() - last_flush >= args.flush_interval:
+                    write_state(state, counter)
+                    dirty = False
+                    last_flush = time.monotonic()
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            write_state(state, counter)
+        if not stopping:
+            time.sleep(backoff)
+            backoff = min(backoff * 2, args.max_backoff)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
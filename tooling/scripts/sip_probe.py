@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Synthetic SIP burst against a PBX, with latency and error-rate gates.
+
+Sends ``--count`` OPTIONS requests at ``--rate`` per second over UDP and,
+with ``--invite-user``, ``--invites`` INVITEs to that extension. Each INVITE
+is cancelled as soon as the first provisional response arrives (ACK + BYE if
+it is answered first), so no call stays up. Requests are retransmitted on the
+RFC 3261 timer A schedule until ``--timeout``.
+
+Measured per request kind: final-response latency (INVITE: first response,
+usually 100 Trying, which is when the PBX has accepted the transaction),
+responses by status code, and timeouts. Timeouts and 5xx/6xx responses count
+as errors; 4xx responses (e.g. 407 from an auth-protected PBX, 480/486 for a
+test extension) still prove the stack is processing requests.
+
+Exit 1 when the p95 latency of any kind exceeds ``--max-p95-ms`` or the error
+rate exceeds ``--max-error-pct``. Standard library only (plus report_utils.py
+beside it), so the orchestrator can run it on the Kamailio host (whose
+source address the PBX trusts); with
+``--json`` the report goes to stdout and the human summary to stderr.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import selectors
+import socket
+import sys
+import time
+from typing import Any
+
+from report_utils import percentile
+
+T1 = 0.5
+USER_AGENT = "pbx-migration-readiness-probe"
+
+
+def token() -> str:
+    return os.urandom(6).hex()
+
+
+def parse_target(spec: str) -> tuple[str, int]:
+    """HOST, HOST:PORT, or [IPv6]:PORT; a bare IPv6 address keeps port 5060."""
+    if spec.startswith("["):
+        host, _, rest = spec[1:].partition("]")
+        port = rest.lstrip(":")
+    elif spec.count(":") == 1:
+        host, _, port = spec.partition(":")
+    else:
+        host, port = spec, ""
+    return host, int(port) if port else 5060
+
+
+def param(value: str, name: str) -> str:
+    for item in value.split(";")[1:]:
+        key, _, val = item.partition("=")
+        if key.strip().lower() == name:
+            return val.strip()
+    return ""
+
+
+def header(msg: str, name: str) -> str:
+    for line in msg.split("\r\n")[1:]:
+        if not line:
+            break
+        key, _, value = line.partition(":")
+        if key.strip().lower() == name:
+            return value.strip()
+    return ""
+
+
+class Transaction:
+    def __init__(self, kind: str, branch: str, data: bytes, sent: float) -> None:
+        self.kind = kind
+        self.branch = branch
+        self.data = data
+        self.first_sent = sent
+        self.next_retransmit = sent + T1
+        self.interval = T1
+        self.first_response_ms: float | None = None
+        self.final_code: int | None = None
+        self.final_ms: float | None = None
+        self.cancelled = False
+        self.call: dict[str, str] = {}
+
+
+class Prober:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        host, port = parse_target(args.target)
+        family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+        self.target = f"{host}:{port}" if ":" not in host else f"[{host}]:{port}"
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.connect(addr)
+        self.sock.setblocking(False)
+        local = self.sock.getsockname()
+        self.local_ip, self.local_port = local[0], local[1]
+        self.local = f"{self.local_ip}:{self.local_port}" if ":" not in self.local_ip else f"[{self.local_ip}]:{self.local_port}"
+        self.transactions: dict[str, Transaction] = {}
+        self.done: list[Transaction] = []
+
+    def build(self, method: str, ruri: str, call: dict[str, str], branch: str, cseq: int, to_tag: str = "", body: str = "") -> bytes:
+        lines = [
+            f"{method} {ruri} SIP/2.0",
+            f"Via: SIP/2.0/UDP {self.local};branch={branch};rport",
+            "Max-Forwards: 70",
+            f"From: <sip:readiness@{self.local}>;tag={call['from_tag']}",
+            f"To: <{call['to_uri']}>" + (f";tag={to_tag}" if to_tag else ""),
+            f"Call-ID: {call['call_id']}",
+            f"CSeq: {cseq} {method}",
+            f"Contact: <sip:readiness@{self.local}>",
+            f"User-Agent: {USER_AGENT}",
+        ]
+        if body:
+            lines.append("Content-Type: application/sdp")
+        lines.append(f"Content-Length: {len(body.encode())}")
+        return ("\r\n".join(lines) + "\r\n\r\n" + body).encode()
+
+    def sdp(self) -> str:
+        ip_kind = "IP6" if ":" in self.local_ip else "IP4"
+        return (
+            f"v=0\r\no=readiness 1 1 IN {ip_kind} {self.local_ip}\r\ns=readiness\r\n"
+            f"c=IN {ip_kind} {self.local_ip}\r\nt=0 0\r\nm=audio 9 RTP/AVP 0 8\r\na=sendrecv\r\n"
+        )
+
+    def send(self, data: bytes) -> None:
+        try:
+            self.sock.send(data)
+        except OSError:
+            # ICMP unreachable from an earlier send surfaces here; the
+            # request simply times out.
+            pass
+
+    def start(self, kind: str, now: float) -> None:
+        branch = f"z9hG4bK-{token()}"
+        ruri = f"sip:{self.target}" if kind == "OPTIONS" else f"sip:{self.args.invite_user}@{self.target}"
+        call = {"ruri": ruri, "to_uri": ruri, "call_id": f"{token()}@{USER_AGENT}", "from_tag": token()}
+        data = self.build(kind, ruri, call, branch, 1, body=self.sdp() if kind == "INVITE" else "")
+        txn = Transaction(kind, branch, data, now)
+        txn.call = call
+        self.transactions[branch] = txn
+        self.send(data)
+
+    def finish(self, txn: Transaction) -> None:
+        self.transactions.pop(txn.branch, None)
+        if txn.kind != "aux":
+            self.done.append(txn)
+
+    def on_response(self, msg: str, now: float) -> None:
+        try:
+            code = int(msg.split(" ", 2)[1])
+        except (IndexError, ValueError):
+            return
+        txn = self.transactions.get(param(header(msg, "via") or header(msg, "v"), "branch"))
+        if txn is None:
+            return
+        cseq_method = header(msg, "cseq").rsplit(" ", 1)[-1]
+        elapsed_ms = (now - txn.first_sent) * 1000.0
+        if txn.kind == "aux":
+            if code >= 200:
+                self.finish(txn)
+            return
+        if cseq_method == "CANCEL":
+            return
+        if txn.first_response_ms is None:
+            txn.first_response_ms = elapsed_ms
+        if code < 200:
+            # Stop retransmitting once the transaction is proceeding.
+            txn.next_retransmit = math.inf
+            if txn.kind == "INVITE" and not txn.cancelled:
+                # CANCEL reuses the INVITE's branch, Call-ID, tags, and CSeq number.
+                txn.cancelled = True
+                self.send(self.build("CANCEL", txn.call["ruri"], txn.call, txn.branch, 1))
+            return
+        txn.final_code = code
+        txn.final_ms = elapsed_ms
+        if txn.kind == "INVITE":
+            to_tag = param(header(msg, "to") or header(msg, "t"), "tag")
+            call = txn.call
+            if code < 300:
+                # Answered before the CANCEL landed: ACK and hang up.
+                contact = header(msg, "contact") or header(msg, "m")
+                target = contact[contact.find("<") + 1 : contact.find(">")] if "<" in contact else call["ruri"]
+                self.send(self.build("ACK", target, call, f"z9hG4bK-{token()}", 1, to_tag))
+                bye_branch = f"z9hG4bK-{token()}"
+                bye = self.build("BYE", target, call, bye_branch, 2, to_tag)
+                aux = Transaction("aux", bye_branch, bye, now)
+                self.transactions[bye_branch] = aux
+                self.send(bye)
+            else:
+                # ACK for a non-2xx final response belongs to the INVITE transaction.
+                self.send(self.build("ACK", call["ruri"], call, txn.branch, 1, to_tag))
+        self.finish(txn)
+
+    def run(self) -> None:
+        args = self.args
+        plan = ["OPTIONS"] * args.count + (["INVITE"] * args.invites if args.invite_user else [])
+        if args.invite_user:
+            random.Random(0).shuffle(plan)
+        interval = 1.0 / args.rate if args.rate > 0 else 0.0
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        start = time.monotonic()
+        sent = 0
+        while sent < len(plan) or self.transactions:
+            now = time.monotonic()
+            while sent < len(plan) and now >= start + sent * interval:
+                self.start(plan[sent], now)
+                sent += 1
+            for txn in list(self.transactions.values()):
+                if now - txn.first_sent >= args.timeout:
+                    self.finish(txn)
+                elif now >= txn.next_retransmit:
+                    self.send(txn.data)
+                    txn.interval = min(txn.interval * 2, 4.0)
+                    txn.next_retransmit = now + txn.interval
+            next_send = start + sent * interval if sent < len(plan) else math.inf
+            next_timer = min([t.next_retransmit for t in self.transactions.values()] + [t.first_sent + args.timeout for t in self.transactions.values()] + [next_send])
+            wait = max(0.0, min(next_timer - time.monotonic(), 0.2))
+            for _ in selector.select(wait):
+                while True:
+                    try:
+                        data = self.sock.recv(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+                    self.on_response(data.decode(errors="replace"), time.monotonic())
+        selector.close()
+        self.sock.close()
+
+
+def summarize(done: list[Transaction], args: argparse.Namespace) -> dict[str, Any]:
+    kinds: dict[str, Any] = {}
+    errors = 0
+    for kind in ("OPTIONS", "INVITE"):
+        members = [t for t in done if t.kind == kind]
+        if not members:
+            continue
+        latencies = [t.first_response_ms if kind == "INVITE" else t.final_ms for t in members]
+        latencies = [v for v in latencies if v is not None]
+        codes: dict[str, int] = {}
+        for t in members:
+            key = str(t.final_code) if t.final_code is not None else "timeout"
+            codes[key] = codes.get(key, 0) + 1
+        kind_errors = sum(1 for t in members if t.final_code is None or t.final_code >= 500)
+        errors += kind_errors
+        kinds[kind] = {
+            "sent": len(members),
+            "answered": len(latencies),
+            "errors": kind_errors,
+            "codes": dict(sorted(codes.items())),
+            "p50_ms": percentile(latencies, 50) if latencies else None,
+            "p95_ms": percentile(latencies, 95) if latencies else None,
+            "p99_ms": percentile(latencies, 99) if latencies else None,
+            "max_ms": max(latencies) if latencies else None,
+        }
+    total = len(done)
+    error_pct = 100.0 * errors / total if total else 0.0
+    breaches = []
+    for kind, stats in kinds.items():
+        if stats["p95_ms"] is None:
+            breaches.append(f"{kind}: no responses from {args.target}")
+        elif stats["p95_ms"] > args.max_p95_ms:
+            breaches.append(f"{kind}: p95 {stats['p95_ms']:.1f} ms > {args.max_p95_ms:g} ms")
+    if error_pct > args.max_error_pct:
+        breaches.append(f"error rate {error_pct:.2f}% ({errors}/{total}) > {args.max_error_pct:g}%")
+    return {
+        "target": args.target,
+        "requests": total,
+        "errors": errors,
+        "error_pct": round(error_pct, 3),
+        "kinds": kinds,
+        "thresholds": {"max_p95_ms": args.max_p95_ms, "max_error_pct": args.max_error_pct},
+        "breaches": breaches,
+        "passed": not breaches,
+    }
+
+
+def fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Send a synthetic SIP OPTIONS/INVITE burst and gate on latency and errors.")
+    parser.add_argument("--target", required=True, help="PBX signaling address HOST[:PORT] (default port 5060).")
+    parser.add_argument("--count", type=int, default=50, help="OPTIONS requests to send. Default: 50")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second. Default: 10")
+    parser.add_argument("--invite-user", default="", help="Extension to INVITE (then CANCEL); no INVITEs when empty.")
+    parser.add_argument("--invites", type=int, default=5, help="INVITEs to send with --invite-user. Default: 5")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds before a request counts as timed out. Default: 2")
+    parser.add_argument("--max-p95-ms", type=float, default=200.0, help="p95 response latency limit per kind. Default: 200")
+    parser.add_argument("--max-error-pct", type=float, default=1.0, help="Timeouts plus 5xx/6xx, percent of requests. Default: 1")
+    parser.add_argument("--json", action="store_true", help="Print the JSON report on stdout (summary on stderr).")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.count < 0 or args.invites < 0 or args.rate <= 0 or args.timeout <= 0:
+        print("ERROR: --count/--invites must be >= 0 and --rate/--timeout > 0", file=sys.stderr)
+        return 1
+    try:
+        prober = Prober(args)
+        prober.run()
+    except OSError as exc:
+        print(f"ERROR: SIP probe to {args.target} failed: {exc}", file=sys.stderr)
+        return 1
+
+    report = summarize(prober.done, args)
+    out = sys.stderr if args.json else sys.stdout
+    print(f"SIP probe {args.target} from {prober.local}: {report['requests']} requests, error rate {report['error_pct']:.2f}%", file=out)
+    for kind, stats in report["kinds"].items():
+        codes = " ".join(f"{code}x{n}" for code, n in stats["codes"].items())
+        print(
+            f"  {kind:<7} sent={stats['sent']} p50={fmt(stats['p50_ms'])} p95={fmt(stats['p95_ms'])} "
+            f"p99={fmt(stats['p99_ms'])} max={fmt(stats['max_ms'])} ms codes: {codes}",
+            file=out,
+        )
+    for breach in report["breaches"]:
+        print(f"  BREACH: {breach}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps(report, indent=2) + "\n")
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
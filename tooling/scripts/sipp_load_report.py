@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Pass/fail report for a SIPp load run across dispatcher cutovers.
+
+Inputs (written by run_call_cutover_sim.sh with LOAD_MODE=1):
+
+    --rtt FILE     SIPp -trace_rtt output (Date_ms;response_time_ms;rtd_no).
+                   rtd 1 = call setup (INVITE -> 200), rtd 2 = teardown (BYE -> 200).
+    --stat FILE    SIPp -trace_stat output (-fd 1): per-second OutgoingCall(P),
+                   SuccessfulCall(P), FailedCall(P) rows.
+    --events FILE  CSV "epoch_ms,label": one row per applied dispatcher mode
+                   (old, both, new) and a final "end" row.
+
+The run is split at each event into steady phase windows
+[event + W, next event - W) and cutover windows [event - W, event + W) around
+every mode change after the first. Each window reports setup-time
+percentiles, a setup-time histogram, teardown p95, and attempted/failed calls.
+
+Gates (exit 1 on any breach):
+  - every window: setup p95/p99 within --max-p95-ms/--max-p99-ms and failed
+    calls within --error-budget (fraction of attempted calls);
+  - every cutover window: setup p95 at most --spike-ratio times the preceding
+    phase's p95 (ignored while the difference is below --spike-floor-ms);
+  - whole run: failed calls at most --max-failed-calls (default 0, so a call
+    dropped by a reload fails the run even if it fails long after the cutover).
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+from report_utils import percentile, print_table
+
+HISTOGRAM_BOUNDS_MS = [10, 20, 50, 100, 200, 500, 1000, 2000]
+
+
+def stat_epoch(value: str) -> float:
+    """SIPp time columns are "date<TAB>time<TAB>epoch"; the epoch is last."""
+    return float(value.split()[-1])
+
+
+def read_stat(path: Path) -> tuple[float | None, list[dict[str, float]]]:
+    start = None
+    rows = []
+    with path.open(encoding="utf-8", errors="replace") as fh:
+        for raw in csv.DictReader(fh, delimiter=";"):
+            try:
+                if start is None:
+                    start = stat_epoch(raw["StartTime"])
+                rows.append(
+                    {
+                        "t": stat_epoch(raw["CurrentTime"]),
+                        "attempted": float(raw.get("OutgoingCall(P)") or 0),
+                        "successful": float(raw.get("SuccessfulCall(P)") or 0),
+                        "failed": float(raw.get("FailedCall(P)") or 0),
+                        "failed_total": float(raw.get("FailedCall(C)") or 0),
+                        "concurrent": float(raw.get("CurrentCall") or 0),
+                    }
+                )
+            except (KeyError, ValueError, IndexError):
+                continue
+    return start, rows
+
+
+def read_rtt(path: Path, sipp_start: float | None) -> list[tuple[float, float, int]]:
+    """Returns (epoch seconds, response time ms, rtd number) per sample.
+
+    SIPp stamps Date_ms relative to its own start; values that already look
+    like epoch milliseconds are used as is.
+    """
+    samples = []
+    with path.open(encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            parts = line.strip().split(";")
+            if len(parts) < 3:
+                continue
+            try:
+                date_ms, rtt_ms, rtd = float(parts[0]), float(parts[1]), int(float(parts[2]))
+            except ValueError:
+                continue
+            if date_ms > 1e12:
+                t = date_ms / 1000.0
+            elif sipp_start is not None:
+                t = sipp_start + date_ms / 1000.0
+            else:
+                raise ValueError(f"{path}: relative rtt timestamps need a stat file with StartTime")
+            samples.append((t, rtt_ms, rtd))
+    return samples
+
+
+def read_events(path: Path) -> list[tuple[float, str]]:
+    events = []
+    with path.open(encoding="utf-8") as fh:
+        for row in csv.reader(fh):
+            if len(row) >= 2 and row[0].strip().isdigit():
+                events.append((int(row[0]) / 1000.0, row[1].strip()))
+    if len(events) < 2 or events[-1][1] != "end":
+        raise ValueError(f"{path}: need at least one mode event and a final 'end' event")
+    return events
+
+
+def histogram(values: list[float]) -> dict[str, int]:
+    out = {f"le_{b}": 0 for b in HISTOGRAM_BOUNDS_MS}
+    out["gt_max"] = 0
+    for v in values:
+        for b in HISTOGRAM_BOUNDS_MS:
+            if v <= b:
+                out[f"le_{b}"] += 1
+                break
+        else:
+            out["gt_max"] += 1
+    return out
+
+
+def window_stats(name: str, kind: str, lo: float, hi: float, samples: list[tuple[float, float, int]], stat_rows: list[dict[str, float]]) -> dict[str, Any]:
+    setup = [rtt for t, rtt, rtd in samples if rtd == 1 and lo <= t < hi]
+    teardown = [rtt for t, rtt, rtd in samples if rtd == 2 and lo <= t < hi]
+    rows = [r for r in stat_rows if lo <= r["t"] < hi]
+    attempted = sum(r["attempted"] for r in rows)
+    failed = sum(r["failed"] for r in rows)
+    return {
+        "window": name,
+        "kind": kind,
+        "start": lo,
+        "end": hi,
+        "setup_count": len(setup),
+        "setup_p50_ms": percentile(setup, 50) if setup else None,
+        "setup_p95_ms": percentile(setup, 95) if setup else None,
+        "setup_p99_ms": percentile(setup, 99) if setup else None,
+        "setup_max_ms": max(setup) if setup else None,
+        "setup_histogram": histogram(setup),
+        "teardown_count": len(teardown),
+        "teardown_p95_ms": percentile(teardown, 95) if teardown else None,
+        "attempted": int(attempted),
+        "failed": int(failed),
+        "peak_concurrent": int(max((r["concurrent"] for r in rows), default=0)),
+    }
+
+
+def build_windows(events: list[tuple[float, str]], margin: float, samples: list[tuple[float, float, int]], stat_rows: list[dict[str, float]]) -> list[dict[str, Any]]:
+    windows = []
+    for idx, (t, label) in enumerate(events[:-1]):
+        nxt = events[idx + 1][0]
+        if idx > 0:
+            prev = events[idx - 1][1]
+            windows.append(window_stats(f"{prev}->{label}", "cutover", t - margin, t + margin, samples, stat_rows))
+        lo = t + margin if idx > 0 else t
+        hi = nxt - margin if events[idx + 1][1] != "end" else nxt
+        if hi > lo:
+            windows.append(window_stats(label, "phase", lo, hi, samples, stat_rows))
+    return windows
+
+
+def evaluate(windows: list[dict[str, Any]], args: argparse.Namespace) -> list[str]:
+    breaches = []
+    last_phase_p95: float | None = None
+    for w in windows:
+        name = f"{w['kind']} {w['window']}"
+        if w["setup_count"] == 0:
+            breaches.append(f"{name}: no completed call setups")
+            continue
+        if w["setup_p95_ms"] > args.max_p95_ms:
+            breaches.append(f"{name}: setup p95 {w['setup_p95_ms']:.1f} ms > {args.max_p95_ms} ms")
+        if w["setup_p99_ms"] > args.max_p99_ms:
+            breaches.append(f"{name}: setup p99 {w['setup_p99_ms']:.1f} ms > {args.max_p99_ms} ms")
+        if w["attempted"] and w["failed"] / w["attempted"] > args.error_budget:
+            breaches.append(f"{name}: {w['failed']}/{w['attempted']} failed calls exceeds error budget {args.error_budget:g}")
+        if w["kind"] == "cutover" and last_phase_p95 is not None:
+            delta = w["setup_p95_ms"] - last_phase_p95
+            if w["setup_p95_ms"] > args.spike_ratio * last_phase_p95 and delta > args.spike_floor_ms:
+                breaches.append(
+                    f"{name}: setup p95 {w['setup_p95_ms']:.1f} ms spikes {w['setup_p95_ms'] / last_phase_p95:.1f}x over the preceding phase ({last_phase_p95:.1f} ms)"
+                )
+        if w["kind"] == "phase":
+            last_phase_p95 = w["setup_p95_ms"]
+    return breaches
+
+
+def fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Gate a SIPp cutover load run on setup-time percentiles and failed calls.")
+    parser.add_argument("--rtt", required=True, help="SIPp -trace_rtt CSV.")
+    parser.add_argument("--stat", required=True, help="SIPp -trace_stat CSV (-fd 1).")
+    parser.add_argument("--events", required=True, help="CSV epoch_ms,label of applied modes plus a final 'end'.")
+    parser.add_argument("--window", type=float, default=5.0, help="Half-width in seconds of each cutover window. Default: 5")
+    parser.add_argument("--max-p95-ms", type=float, default=250.0, help="Setup p95 limit per window. Default: 250")
+    parser.add_argument("--max-p99-ms", type=float, default=1000.0, help="Setup p99 limit per window. Default: 1000")
+    parser.add_argument("--error-budget", type=float, default=0.001, help="Failed/attempted limit per window. Default: 0.001")
+    parser.add_argument("--spike-ratio", type=float, default=2.0, help="Cutover p95 limit relative to the preceding phase. Default: 2")
+    parser.add_argument("--spike-floor-ms", type=float, default=5.0, help="Ignore p95 spikes smaller than this. Default: 5")
+    parser.add_argument("--max-failed-calls", type=int, default=0, help="Failed calls allowed over the whole run. Default: 0")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        sipp_start, stat_rows = read_stat(Path(args.stat))
+        samples = read_rtt(Path(args.rtt), sipp_start)
+        events = read_events(Path(args.events))
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+    windows = build_windows(events, args.window, samples, stat_rows)
+    breaches = evaluate(windows, args)
+    failed_total = int(stat_rows[-1]["failed_total"]) if stat_rows else 0
+    if failed_total > args.max_failed_calls:
+        breaches.append(f"run: {failed_total} failed calls > {args.max_failed_calls} allowed")
+
+    print_table(
+        ["window", "kind", "setups", "p50", "p95", "p99", "max", "bye_p95", "attempted", "failed", "peak_calls"],
+        [
+            [
+                w["window"], w["kind"], w["setup_count"], fmt(w["setup_p50_ms"]), fmt(w["setup_p95_ms"]), fmt(w["setup_p99_ms"]),
+                fmt(w["setup_max_ms"]), fmt(w["teardown_p95_ms"]), w["attempted"], w["failed"], w["peak_concurrent"],
+            ]
+            for w in windows
+        ],
+    )
+    print(f"Setup-time histogram buckets (ms): {', '.join(str(b) for b in HISTOGRAM_BOUNDS_MS)}, >{HISTOGRAM_BOUNDS_MS[-1]}")
+    for w in windows:
+        print(f"  {w['window']:<12} {' '.join(str(v) for v in w['setup_histogram'].values())}")
+    print(f"Failed calls over the run: {failed_total}")
+
+    report = {
+        "thresholds": {k: getattr(args, k) for k in ("window", "max_p95_ms", "max_p99_ms", "error_budget", "spike_ratio", "spike_floor_ms", "max_failed_calls")},
+        "windows": windows,
+        "failed_calls_total": failed_total,
+        "breaches": breaches,
+        "passed": not breaches,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    if breaches:
+        print("Load gates FAILED:", file=sys.stderr)
+        for breach in breaches:
+            print(f"  - {breach}", file=sys.stderr)
+        return 1
+    print("Load gates passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Structured readiness checks over a discovery_snapshot.sh directory.
+
+Parses the probe files a snapshot writes (NN_name.txt with "# Command" and
+"# Output" sections) and evaluates:
+
+  sofia_profiles     every --profile is listed by ``sofia status`` and RUNNING;
+                     without --profile, at least one profile is RUNNING
+  sofia_gateways     gateways not REGED/NOREG are reported (warning only)
+  registrations      ``show registrations`` count >= --min-registrations
+  listen:<port>      a UDP or TCP socket listens on each --listen-port
+  freeswitch_service systemd reports the service active (warning only when the
+                     probe is unavailable)
+
+Exit 1 if any check fails. Example:
+
+  snapshot_checks.py ./artifacts/orchestration/run-X/new-readiness-new-20260101_000000 \\
+      --listen-port 5060 --profile internal --min-registrations 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+from report_utils import print_table
+
+REG_TOTAL_RE = re.compile(r"^(\d+) total\.", re.MULTILINE)
+LISTEN_PORT_RE = re.compile(r"[:.](\d+)$")
+
+
+def probe_output(snap_dir: Path, name: str) -> str | None:
+    path = snap_dir / f"{name}.txt"
+    if not path.exists():
+        return None
+    text = path.read_text(encoding="utf-8", errors="replace")
+    _, sep, output = text.partition("# Output\n")
+    return output if sep else text
+
+
+def probe_lines(snap_dir: Path, name: str) -> Iterator[str]:
+    """Stream the output lines of one probe file (nothing if it is missing)."""
+    path = snap_dir / f"{name}.txt"
+    if not path.exists():
+        return
+    with path.open(encoding="utf-8", errors="replace") as fh:
+        first = fh.readline()
+        if first.startswith("# Command"):
+            for line in fh:
+                if line == "# Output\n":
+                    break
+        else:
+            yield first.rstrip("\n")
+        for line in fh:
+            yield line.rstrip("\n")
+
+
+def sofia_table(output: str) -> list[tuple[str, str, str]]:
+    """(name, type, state) rows of ``sofia status``."""
+    rows = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and parts[1] in ("profile", "gateway", "alias"):
+            state = parts[3] if parts[1] != "alias" else parts[-1]
+            rows.append((parts[0], parts[1], state))
+    return rows
+
+
+def check_sofia(output: str | None, profiles: list[str]) -> list[dict[str, str]]:
+    if output is None:
+        return [{"check": "sofia_profiles", "status": "fail", "detail": "04_sofia_status missing from snapshot"}]
+    rows = sofia_table(output)
+    running = {name for name, kind, state in rows if kind == "profile" and state.startswith("RUNNING")}
+    listed = {name for name, kind, _ in rows if kind == "profile"}
+    checks = []
+    if profiles:
+        missing = [p for p in profiles if p not in listed]
+        stopped = [p for p in profiles if p in listed and p not in running]
+        ok = not missing and not stopped
+        detail = f"running: {', '.join(sorted(running)) or 'none'}"
+        if missing:
+            detail += f"; missing: {', '.join(missing)}"
+        if stopped:
+            detail += f"; not running: {', '.join(stopped)}"
+        checks.append({"check": "sofia_profiles", "status": "ok" if ok else "fail", "detail": detail})
+    elif rows:
+        checks.append(
+            {"check": "sofia_profiles", "status": "ok" if running else "fail", "detail": f"running: {', '.join(sorted(running)) or 'none'}"}
+        )
+    else:
+        # No profile table (older fs_cli output or a stub): fall back to the status line.
+        ok = "RUNNING" in output
+        checks.append({"check": "sofia_profiles", "status": "ok" if ok else "fail", "detail": output.strip().splitlines()[0] if output.strip() else "empty output"})
+
+    down = [f"{name}={state}" for name, kind, state in rows if kind == "gateway" and state not in ("REGED", "NOREG")]
+    if any(kind == "gateway" for _, kind, _ in rows):
+        checks.append({"check": "sofia_gateways", "status": "warn" if down else "ok", "detail": ", ".join(down) or "all registered or NOREG"})
+    return checks
+
+
+def registration_count(output: str) -> int:
+    match = REG_TOTAL_RE.search(output)
+    if match:
+        return int(match.group(1))
+    # Some builds omit the total line: count the CSV rows below the header.
+    return sum(1 for line in output.splitlines() if "," in line and not line.startswith("reg_user,"))
+
+
+def check_registrations(output: str | None, minimum: int) -> dict[str, str]:
+    if output is None:
+        return {"check": "registrations", "status": "fail" if minimum else "warn", "detail": "05_registrations missing from snapshot"}
+    count = registration_count(output)
+    return {"check": "registrations", "status": "ok" if count >= minimum else "fail", "detail": f"{count} registered (minimum {minimum})"}
+
+
+def listening_sockets(output: str) -> set[tuple[str, str]]:
+    """(protocol, local address:port) pairs from ``ss -lntu`` (or ``netstat -lntu``) output."""
+    sockets = set()
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 5 or parts[0].lower() not in ("udp", "tcp", "udp6", "tcp6"):
+            continue
+        # ss: Netid State Recv-Q Send-Q Local Peer; netstat: Proto Recv-Q Send-Q Local Foreign [State]
+        local = parts[4] if not parts[1].isdigit() else parts[3]
+        sockets.add((parts[0].lower().rstrip("6"), local))
+    return sockets
+
+
+def listening_ports(output: str) -> set[int]:
+    """Local ports with a listener."""
+    ports = set()
+    for _, local in listening_sockets(output):
+        match = LISTEN_PORT_RE.search(local)
+        if match:
+            ports.add(int(match.group(1)))
+    return ports
+
+
+def check_listen(output: str | None, ports: list[int]) -> list[dict[str, str]]:
+    if not ports:
+        return []
+    if output is None:
+        return [{"check": f"listen:{port}", "status": "fail", "detail": "02_sockets missing from snapshot"} for port in ports]
+    found = listening_ports(output)
+    return [{"check": f"listen:{port}", "status": "ok" if port in found else "fail", "detail": "listening" if port in found else "no listener"} for port in ports]
+
+
+def check_service(output: str | None) -> dict[str, str]:
+    if output is None or "Active:" not in output:
+        return {"check": "freeswitch_service", "status": "warn", "detail": "systemctl status unavailable"}
+    line = next(line.strip() for line in output.splitlines() if "Active:" in line)
+    return {"check": "freeswitch_service", "status": "ok" if "active (running)" in line else "fail", "detail": line}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Evaluate readiness checks over a discovery snapshot directory.")
+    parser.add_argument("snapshot_dir", help="Directory written by discovery_snapshot.sh.")
+    parser.add_argument("--profile", action="append", default=[], help="Sofia profile that must be RUNNING (repeatable).")
+    parser.add_argument("--min-registrations", type=int, default=0, help="Minimum registrations. Default: 0")
+    parser.add_argument("--listen-port", type=int, action="append", default=[], help="Port that must have a listener (repeatable).")
+    parser.add_argument("--output", help="Write the checks as JSON here.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    snap_dir = Path(args.snapshot_dir)
+    if not snap_dir.is_dir():
+        print(f"ERROR: snapshot directory not found: {snap_dir}", file=sys.stderr)
+        return 1
+
+    checks: list[dict[str, Any]] = []
+    checks.extend(check_sofia(probe_output(snap_dir, "04_sofia_status"), args.profile))
+    checks.append(check_registrations(probe_output(snap_dir, "05_registrations"), args.min_registrations))
+    checks.extend(check_listen(probe_output(snap_dir, "02_sockets"), args.listen_port))
+    checks.append(check_service(probe_output(snap_dir, "03_freeswitch_service")))
+
+    print_table(["check", "status", "detail"], [[c["check"], c["status"], c["detail"]] for c in checks])
+    failed = [c for c in checks if c["status"] == "fail"]
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps({"snapshot": str(snap_dir), "checks": checks, "passed": not failed}, indent=2) + "\n", encoding="utf-8"
+        )
+    if failed:
+        print(f"Readiness checks FAILED: {', '.join(c['check'] for c in failed)}", file=sys.stderr)
+        return 1
+    print("Readiness checks passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
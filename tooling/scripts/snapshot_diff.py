@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Structured diff of two discovery_snapshot.sh captures.
+
+Parses both snapshot directories into records and compares them:
+
+  registrations   distinct users (reg_user@realm, or the first CSV field when
+                  ``show registrations`` prints no header) per sofia profile;
+                  users only in BASE are "missing" (failed to move when BASE
+                  is old-pre and OTHER is new-post), users only in OTHER are
+                  "added", users on a different profile are "moved"
+  channels        ``show channels`` counts per (profile, state)
+  sockets         listeners from ``ss -lntu`` that disappeared or appeared
+  sofia profiles  profiles/gateways whose state changed
+
+Registration and channel files are streamed line by line, never loaded
+whole. Registrations are diffed in ``--partitions`` passes over both files,
+each pass keeping only the users whose key hash falls in that partition, so
+memory is bounded by users per partition rather than by PBX size.
+
+  snapshot_diff.py RUN_DIR/old-pre-new-20260101_000000 RUN_DIR/new-post-new-20260101_000000 \\
+      --output snapshot-diff.json --details RUN_DIR/snapshot-diff --max-missing 0
+
+Exit 1 when a gate (--max-missing, --fail-on-socket-loss) trips.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterator
+
+from report_utils import print_table
+from snapshot_checks import listening_sockets, probe_lines, probe_output, sofia_table
+
+BYTES_PER_PARTITION = 256 * 1024 * 1024
+TOTAL_RE = re.compile(r"^\d+ total\.")
+PROFILE_RE = re.compile(r"sofia/([^/,\s]+)")
+
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def row_profile(fields: list[str]) -> str:
+    for field in fields:
+        match = PROFILE_RE.search(field)
+        if match:
+            return match.group(1)
+    return "-"
+
+
+def csv_rows(lines: Iterator[str], header_prefix: str) -> Iterator[tuple[list[str], dict[str, str] | None]]:
+    """CSV data rows of an fs_cli ``show`` listing, with the header mapping when one is printed."""
+    columns: list[str] | None = None
+    for line in lines:
+        if not line or TOTAL_RE.match(line) or "," not in line:
+            continue
+        if line.startswith(header_prefix):
+            columns = line.split(",")
+            continue
+        fields = line.split(",")
+        yield fields, dict(zip(columns, fields)) if columns else None
+
+
+def registrations(snap_dir: Path) -> Iterator[tuple[str, str]]:
+    """(user key, profile) per ``show registrations`` row."""
+    for fields, row in csv_rows(probe_lines(snap_dir, "05_registrations"), "reg_user,"):
+        if row is not None:
+            user, realm = row.get("reg_user", ""), row.get("realm", "")
+            key = f"{user}@{realm}" if realm else user
+        else:
+            key = fields[0]
+        if key:
+            yield key, row_profile(fields)
+
+
+def channel_counts(snap_dir: Path) -> Counter[tuple[str, str]]:
+    """``show channels`` rows counted per (profile, state)."""
+    counts: Counter[tuple[str, str]] = Counter()
+    for fields, row in csv_rows(probe_lines(snap_dir, "06_channels"), "uuid,"):
+        if row is not None:
+            state = row.get("callstate") or row.get("state") or "-"
+            profile = row_profile([row.get("name", "")])
+        else:
+            state = fields[-1].strip() or "-"
+            profile = row_profile(fields)
+        counts[(profile, state)] += 1
+    return counts
+
+
+def diff_registrations(base: Path, other: Path, partitions: int, limit: int, details: Path | None) -> dict[str, Any]:
+    by_profile: dict[str, Counter[str]] = {}
+    totals: Counter[str] = Counter()
+    samples: dict[str, list[str]] = {"missing": [], "added": [], "moved": []}
+    handles = {}
+    if details:
+        details.mkdir(parents=True, exist_ok=True)
+        handles = {kind: (details / f"registrations-{kind}.txt").open("w", encoding="utf-8") for kind in samples}
+
+    def record(kind: str, text: str) -> None:
+        totals[kind] += 1
+        if len(samples[kind]) < limit:
+            samples[kind].append(text)
+        if kind in handles:
+            handles[kind].write(text + "\n")
+
+    try:
+        for part in range(partitions):
+            sides: dict[str, dict[str, str]] = {"base": {}, "other": {}}
+            for side, snap_dir in (("base", base), ("other", other)):
+                users = sides[side]
+                for key, profile in registrations(snap_dir):
+                    if partitions == 1 or key_hash(key) % partitions == part:
+                        users[key] = profile
+                for profile in users.values():
+                    by_profile.setdefault(profile, Counter())[side] += 1
+                totals[side] += len(users)
+            base_users, other_users = sides["base"], sides["other"]
+            for key, profile in base_users.items():
+                moved_to = other_users.get(key)
+                if moved_to is None:
+                    record("missing", f"{key} ({profile})")
+                elif moved_to != profile:
+                    record("moved", f"{key} ({profile} -> {moved_to})")
+            for key, profile in other_users.items():
+                if key not in base_users:
+                    record("added", f"{key} ({profile})")
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    return {
+        "base": totals["base"],
+        "other": totals["other"],
+        "missing": totals["missing"],
+        "added": totals["added"],
+        "moved": totals["moved"],
+        "partitions": partitions,
+        "by_profile": {p: {"base": c["base"], "other": c["other"]} for p, c in sorted(by_profile.items())},
+        "samples": {kind: sorted(rows) for kind, rows in samples.items()},
+    }
+
+
+def diff_channels(base: Path, other: Path) -> dict[str, Any]:
+    base_counts, other_counts = channel_counts(base), channel_counts(other)
+    rows = []
+    for profile, state in sorted(set(base_counts) | set(other_counts)):
+        b, o = base_counts[(profile, state)], other_counts[(profile, state)]
+        rows.append({"profile": profile, "state": state, "base": b, "other": o, "delta": o - b})
+    return {"base": sum(base_counts.values()), "other": sum(other_counts.values()), "by_profile_state": rows}
+
+
+def diff_sockets(base: Path, other: Path) -> dict[str, Any] | None:
+    base_out, other_out = probe_output(base, "02_sockets"), probe_output(other, "02_sockets")
+    if base_out is None or other_out is None:
+        return None
+    base_set, other_set = listening_sockets(base_out), listening_sockets(other_out)
+    return {
+        "removed": [f"{proto} {local}" for proto, local in sorted(base_set - other_set)],
+        "added": [f"{proto} {local}" for proto, local in sorted(other_set - base_set)],
+        "unchanged": len(base_set & other_set),
+    }
+
+
+def diff_sofia(base: Path, other: Path) -> list[dict[str, str]]:
+    base_out, other_out = probe_output(base, "04_sofia_status"), probe_output(other, "04_sofia_status")
+    base_rows = {(name, kind): state for name, kind, state in sofia_table(base_out or "")}
+    other_rows = {(name, kind): state for name, kind, state in sofia_table(other_out or "")}
+    changes = []
+    for name, kind in sorted(set(base_rows) | set(other_rows)):
+        b, o = base_rows.get((name, kind), "absent"), other_rows.get((name, kind), "absent")
+        if b != o:
+            changes.append({"name": name, "type": kind, "base": b, "other": o})
+    return changes
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Diff two discovery snapshot directories as structured records.")
+    parser.add_argument("base", help="Reference snapshot directory (e.g. old-pre-*).")
+    parser.add_argument("other", help="Snapshot to compare against it (e.g. new-post-*).")
+    parser.add_argument("--partitions", type=int, default=0, help=f"Registration hash passes. Default: largest file / {BYTES_PER_PARTITION // (1024 * 1024)} MiB")
+    parser.add_argument("--limit", type=int, default=10, help="Example users listed per registration category. Default: 10")
+    parser.add_argument("--details", help="Write the full missing/added/moved user lists into this directory.")
+    parser.add_argument("--output", help="Write the diff as JSON here.")
+    parser.add_argument("--max-missing", type=int, default=-1, help="Fail when more users are missing from OTHER. Default: -1 (report only)")
+    parser.add_argument("--fail-on-socket-loss", action="store_true", help="Fail when a listener in BASE is gone in OTHER.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    base, other = Path(args.base), Path(args.other)
+    for snap_dir in (base, other):
+        if not snap_dir.is_dir():
+            print(f"ERROR: snapshot directory not found: {snap_dir}", file=sys.stderr)
+            return 1
+    if args.partitions < 0 or args.limit < 0:
+        print("ERROR: --partitions and --limit must be >= 0", file=sys.stderr)
+        return 1
+
+    partitions = args.partitions
+    if not partitions:
+        sizes = [(d / "05_registrations.txt").stat().st_size for d in (base, other) if (d / "05_registrations.txt").exists()]
+        partitions = max(1, math.ceil(max(sizes, default=0) / BYTES_PER_PARTITION))
+
+    regs = diff_registrations(base, other, partitions, args.limit, Path(args.details) if args.details else None)
+    channels = diff_channels(base, other)
+    sockets = diff_sockets(base, other)
+    sofia = diff_sofia(base, other)
+
+    print(f"Base:  {base}")
+    print(f"Other: {other}")
+    print(
+        f"Registrations: {regs['base']} -> {regs['other']} users; missing {regs['missing']}, "
+        f"added {regs['added']}, moved profile {regs['moved']} ({partitions} partition pass(es))"
+    )
+    if regs["by_profile"]:
+        print_table(["profile", "base", "other"], [[p, c["base"], c["other"]] for p, c in regs["by_profile"].items()])
+    for kind in ("missing", "added", "moved"):
+        if regs["samples"][kind]:
+            shown = len(regs["samples"][kind])
+            print(f"{kind.capitalize()} ({shown} of {regs[kind]}): {', '.join(regs['samples'][kind])}")
+
+    print(f"\nChannels: {channels['base']} -> {channels['other']}")
+    if channels["by_profile_state"]:
+        print_table(
+            ["profile", "state", "base", "other", "delta"],
+            [[r["profile"], r["state"], r["base"], r["other"], f"{r['delta']:+d}"] for r in channels["by_profile_state"]],
+        )
+
+    if sockets is None:
+        print("\nSockets: 02_sockets missing from a snapshot")
+    else:
+        print(f"\nSockets: {sockets['unchanged']} unchanged, {len(sockets['removed'])} removed, {len(sockets['added'])} added")
+        for label in ("removed", "added"):
+            for sock in sockets[label]:
+                print(f"  {label}: {sock}")
+
+    if sofia:
+        print("\nSofia state changes:")
+        print_table(["name", "type", "base", "other"], [[c["name"], c["type"], c["base"], c["other"]] for c in sofia])
+
+    failures = []
+    if args.max_missing >= 0 and regs["missing"] > args.max_missing:
+        failures.append(f"{regs['missing']} registrations missing (max {args.max_missing})")
+    if args.fail_on_socket_loss and sockets and sockets["removed"]:
+        failures.append(f"listeners removed: {', '.join(sockets['removed'])}")
+
+    if args.output:
+        result = {
+            "base": str(base),
+            "other": str(other),
+            "registrations": regs,
+            "channels": channels,
+            "sockets": sockets,
+            "sofia": sofia,
+            "failures": failures,
+        }
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+
+    if failures:
+        print(f"Snapshot diff FAILED: {'; '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
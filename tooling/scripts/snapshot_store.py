@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Compressed, content-addressed store for discovery_snapshot.sh captures.
+
+``add`` splits every ``NN_name.txt`` of a snapshot directory into
+line-aligned, content-defined chunks (a chunk ends on a line whose CRC-32
+hits the boundary mask, between CHUNK_MIN and CHUNK_MAX bytes), so an
+inserted or removed registration only changes the chunk around it. Each
+chunk is stored once, zlib-compressed, under its SHA-256:
+
+    objects/ab/cdef...      zlib(chunk)
+    snapshots/RUN/NAME.json manifest: file -> size, sha256, chunk list
+
+RUN is the run directory name (``run-YYYYmmdd_HHMMSS``) or ``--run-id``;
+NAME is the snapshot directory name (``LABEL-TS``). Commands:
+
+    add STORE PATH...          store snapshot directories (PATH may also be a
+                               run or artifacts directory; it is searched)
+    list STORE                 stored snapshots with logical and new bytes
+    export STORE --output-dir  recreate RUN/LABEL-TS/NN_name.txt
+    cat STORE RUN/NAME FILE    stream one file to stdout
+    grep STORE PATTERN         search stored files; each distinct chunk is
+                               decompressed and searched once
+    gc STORE                   delete objects no manifest references
+
+Do not run ``gc`` while an ``add`` is in progress.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+from report_utils import print_table
+
+STORE_VERSION = 1
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 1024 * 1024
+CHUNK_MASK = 0xFF  # one line in 256 may end a chunk once CHUNK_MIN is reached
+PROBE_FILE_RE = re.compile(r"^\d\d_[\w.-]+\.txt$")
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Store:
+    def __init__(self, root: Path, create: bool = False) -> None:
+        self.root = root
+        meta = root / "store.json"
+        if create and not meta.exists():
+            write_atomic(meta, json.dumps({"version": STORE_VERSION}).encode() + b"\n")
+        if not meta.exists():
+            raise ValueError(f"not a snapshot store: {root}")
+        version = json.loads(meta.read_text(encoding="utf-8")).get("version")
+        if version != STORE_VERSION:
+            raise ValueError(f"unsupported store version {version} in {root}")
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest[2:]
+
+    def put(self, chunk: bytes, level: int) -> tuple[str, int]:
+        """Store a chunk; returns its digest and the compressed bytes written (0 if already stored)."""
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            return digest, 0
+        data = zlib.compress(chunk, level)
+        write_atomic(path, data)
+        return digest, len(data)
+
+    def get(self, digest: str) -> bytes:
+        chunk = zlib.decompress(self.object_path(digest).read_bytes())
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"corrupt object {digest}")
+        return chunk
+
+    def manifest_path(self, key: str) -> Path:
+        return self.root / "snapshots" / f"{key}.json"
+
+    def manifests(self, pattern: str = "*") -> Iterator[tuple[str, dict[str, Any]]]:
+        base = self.root / "snapshots"
+        for path in sorted(base.glob("**/*.json")):
+            key = path.relative_to(base).with_suffix("").as_posix()
+            if fnmatch.fnmatchcase(key, pattern):
+                yield key, json.loads(path.read_text(encoding="utf-8"))
+
+    def read_file(self, entry: dict[str, Any]) -> Iterator[bytes]:
+        for digest in entry["chunks"]:
+            yield self.get(digest)
+
+
+def chunks(path: Path) -> Iterator[bytes]:
+    """Line-aligned content-defined chunks of a file, streamed."""
+    buf: list[bytes] = []
+    size = 0
+    with path.open("rb") as fh:
+        for line in fh:
+            buf.append(line)
+            size += len(line)
+            if size >= CHUNK_MAX or (size >= CHUNK_MIN and zlib.crc32(line) & CHUNK_MASK == 0):
+                yield b"".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_snapshot_dir(path: Path) -> bool:
+    return (path / "00_meta.txt").is_file()
+
+
+def find_snapshot_dirs(path: Path) -> list[Path]:
+    if is_snapshot_dir(path):
+        return [path]
+    return sorted(p.parent for p in path.rglob("00_meta.txt"))
+
+
+def snapshot_key(snap_dir: Path, run_id: str | None) -> str:
+    run = run_id or (snap_dir.parent.name if snap_dir.parent.name.startswith("run-") else "")
+    return f"{run}/{snap_dir.name}" if run else snap_dir.name
+
+
+def cmd_add(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store), create=True)
+    snap_dirs: list[Path] = []
+    for raw in args.paths:
+        path = Path(raw)
+        if not path.is_dir():
+            raise ValueError(f"not a directory: {path}")
+        found = find_snapshot_dirs(path)
+        if not found:
+            print(f"WARNING: no snapshot directories under {path}", file=sys.stderr)
+        snap_dirs.extend(found)
+
+    rows = []
+    logical_total = written_total = 0
+    for snap_dir in snap_dirs:
+        key = snapshot_key(snap_dir, args.run_id)
+        manifest_path = store.manifest_path(key)
+        if manifest_path.exists():
+            known = json.loads(manifest_path.read_text(encoding="utf-8"))["files"]
+            current = {p.name: file_sha256(p) for p in snap_dir.iterdir() if p.is_file() and PROBE_FILE_RE.match(p.name)}
+            if current != {name: entry["sha256"] for name, entry in known.items()}:
+                raise ValueError(f"{key} is already stored with different content")
+            print(f"Already stored: {key}")
+            if args.remove:
+                shutil.rmtree(snap_dir)
+            continue
+        files: dict[str, Any] = {}
+        logical = written = 0
+        for path in sorted(snap_dir.iterdir()):
+            if not path.is_file() or not PROBE_FILE_RE.match(path.name):
+                continue
+            digest = hashlib.sha256()
+            entry: dict[str, Any] = {"size": 0, "chunks": []}
+            for chunk in chunks(path):
+                digest.update(chunk)
+                object_id, stored = store.put(chunk, args.level)
+                entry["chunks"].append(object_id)
+                entry["size"] += len(chunk)
+                written += stored
+            entry["sha256"] = digest.hexdigest()
+            files[path.name] = entry
+            logical += entry["size"]
+        manifest = {
+            "name": snap_dir.name,
+            "run": key.rpartition("/")[0],
+            "source": str(snap_dir.resolve()),
+            "stored_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "bytes": logical,
+            "new_bytes": written,
+            "files": files,
+        }
+        write_atomic(manifest_path, json.dumps(manifest, indent=2).encode() + b"\n")
+        if args.remove:
+            shutil.rmtree(snap_dir)
+        rows.append([key, len(files), logical, written])
+        logical_total += logical
+        written_total += written
+
+    if rows:
+        print_table(["snapshot", "files", "bytes", "new_bytes"], rows)
+    ratio = f"{logical_total / written_total:.1f}x" if written_total else "n/a"
+    print(f"Stored {len(rows)} snapshot(s): {logical_total} bytes as {written_total} new compressed bytes ({ratio}).")
+    return 0
+
+
+def cmd_list(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    rows = [[key, m["stored_at"], len(m["files"]), m["bytes"], m["new_bytes"]] for key, m in store.manifests(args.match)]
+    if rows:
+        print_table(["snapshot", "stored_at", "files", "bytes", "new_bytes"], rows)
+    objects = [p for p in (store.root / "objects").glob("*/*") if not p.name.startswith(".tmp-")]
+    on_disk = sum(p.stat().st_size for p in objects)
+    logical = sum(row[3] for row in rows)
+    print(f"{len(rows)} snapshot(s), {logical} bytes; store holds {len(objects)} objects in {on_disk} bytes.")
+    return 0
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    output_dir = Path(args.output_dir)
+    exported = 0
+    for key, manifest in store.manifests(args.match):
+        target = output_dir / key
+        target.mkdir(parents=True, exist_ok=True)
+        for name, entry in manifest["files"].items():
+            digest = hashlib.sha256()
+            with (target / name).open("wb") as fh:
+                for chunk in store.read_file(entry):
+                    digest.update(chunk)
+                    fh.write(chunk)
+            if digest.hexdigest() != entry["sha256"]:
+                raise ValueError(f"checksum mismatch exporting {key}/{name}")
+        print(f"Exported: {target}")
+        exported += 1
+    if not exported:
+        raise ValueError(f"no stored snapshot matches {args.match!r}")
+    return 0
+
+
+def cmd_cat(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    path = store.manifest_path(args.snapshot)
+    if not path.exists():
+        raise ValueError(f"snapshot not stored: {args.snapshot}")
+    files = json.loads(path.read_text(encoding="utf-8"))["files"]
+    name = args.file if args.file.endswith(".txt") else f"{args.file}.txt"
+    if name not in files:
+        raise ValueError(f"{args.snapshot} has no {name}")
+    out = sys.stdout.buffer
+    for chunk in store.read_file(files[name]):
+        out.write(chunk)
+    out.flush()
+    return 0
+
+
+def cmd_grep(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    pattern = re.compile(args.pattern.encode(), re.IGNORECASE if args.ignore_case else 0)
+    file_glob = args.file if args.file.endswith(".txt") or "*" in args.file else f"{args.file}.txt"
+    # Matching lines per chunk: a chunk shared by many snapshots is searched once.
+    cache: dict[str, list[bytes]] = {}
+    out = sys.stdout.buffer
+    matched = 0
+    for key, manifest in store.manifests(args.match):
+        for name, entry in manifest["files"].items():
+            if not fnmatch.fnmatchcase(name, file_glob):
+                continue
+            for digest in entry["chunks"]:
+                lines = cache.get(digest)
+                if lines is None:
+                    lines = [line for line in store.get(digest).splitlines() if pattern.search(line)]
+                    cache[digest] = lines
+                for line in lines:
+                    out.write(f"{key}/{name}: ".encode() + line + b"\n")
+                    matched += 1
+                    if args.max_count and matched >= args.max_count:
+                        out.flush()
+                        return 0
+    out.flush()
+    return 0 if matched else 1
+
+
+def cmd_gc(args: argparse.Namespace) -> int:
+    store = Store(Path(args.store))
+    live = {digest for _, m in store.manifests() for entry in m["files"].values() for digest in entry["chunks"]}
+    removed = freed = 0
+    for path in (store.root / "objects").glob("*/*"):
+        digest = path.parent.name + path.name
+        if digest in live:
+            continue
+        freed += path.stat().st_size
+        removed += 1
+        if not args.dry_run:
+            path.unlink()
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {removed} unreferenced object(s), {freed} bytes.")
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compressed, deduplicated store for discovery snapshot directories.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="Store snapshot directories.")
+    add.add_argument("store", help="Store directory (created if missing).")
+    add.add_argument("paths", nargs="+", help="Snapshot, run, or artifacts directories.")
+    add.add_argument("--run-id", help="Run name for the stored snapshots. Default: parent run-* directory")
+    add.add_argument("--level", type=int, default=6, choices=range(1, 10), metavar="1-9", help="zlib level. Default: 6")
+    add.add_argument("--remove", action="store_true", help="Delete each snapshot directory once stored.")
+
+    lst = sub.add_parser("list", help="Stored snapshots and store size.")
+    lst.add_argument("store")
+    lst.add_argument("--match", default="*", help="Glob over RUN/NAME. Default: *")
+
+    export = sub.add_parser("export", help="Recreate snapshot directories as text files.")
+    export.add_argument("store")
+    export.add_argument("--match", default="*", help="Glob over RUN/NAME, e.g. 'run-20260101_*/old-pre-*'. Default: *")
+    export.add_argument("--output-dir", required=True, help="Directory to write RUN/NAME/NN_name.txt into.")
+
+    cat = sub.add_parser("cat", help="Write one stored file to stdout.")
+    cat.add_argument("store")
+    cat.add_argument("snapshot", help="RUN/NAME as shown by list.")
+    cat.add_argument("file", help="Probe file, e.g. 05_registrations.")
+
+    grep = sub.add_parser("grep", help="Search stored files (exit 1 if nothing matches).")
+    grep.add_argument("store")
+    grep.add_argument("pattern", help="Regular expression.")
+    grep.add_argument("--match", default="*", help="Glob over RUN/NAME. Default: *")
+    grep.add_argument("--file", default="*", help="Probe file or glob, e.g. 05_registrations. Default: all")
+    grep.add_argument("-i", "--ignore-case", action="store_true")
+    grep.add_argument("--max-count", type=int, default=0, help="Stop after this many lines. Default: 0 (all)")
+
+    gc = sub.add_parser("gc", help="Delete unreferenced objects.")
+    gc.add_argument("store")
+    gc.add_argument("--dry-run", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    handlers = {"add": cmd_add, "list": cmd_list, "export": cmd_export, "cat": cmd_cat, "grep": cmd_grep, "gc": cmd_gc}
+    try:
+        return handlers[args.command](args)
+    except (OSError, ValueError, zlib.error) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env bash
+# Shared SSH connection multiplexing helpers.
+#
+# Source this file; do not execute it. One OpenSSH ControlMaster connection is
+# kept per user@host:port inside a control directory, and every ssh/scp call
+# made through these helpers reuses it. A run owner (the orchestrator) creates
+# the directory and tears the masters down on exit; child scripts receive the
+# directory via --ssh-control-dir and only reuse it.
+#
+# Counters are appended to files in the control directory so that child
+# scripts running in parallel contribute to the same per-run totals:
+#   sessions.log    one line per ssh/scp invocation
+#   handshakes.log  one line per new TCP connection + key exchange
+#
+# When trace_events.sh is sourced and initialised, every ssh/scp call and every
+# master connection setup is also recorded as a span (ssh, scp, ssh_handshake)
+# with host and exit code; callers can tag a call with TRACE_OP=name.
+
+SSH_MUX_DIR=""
+SSH_MUX_ENABLED="true"
+SSH_MUX_OWNER="false"
+SSH_MUX_PERSIST="${SSH_MUX_PERSIST:-600}"
+SSH_MUX_BASE_OPTS=()
+SSH_MUX_OPTS=()
+
+# ssh_mux_init DIR ENABLED [base ssh options...]
+#   DIR empty => create a private control directory owned by this process.
+ssh_mux_init() {
+  local dir="$1"
+  SSH_MUX_ENABLED="$2"
+  shift 2
+  SSH_MUX_BASE_OPTS=("$@")
+
+  if [[ -n "$dir" ]]; then
+    SSH_MUX_DIR="$dir"
+    mkdir -p "$SSH_MUX_DIR"
+  else
+    SSH_MUX_DIR="$(mktemp -d "${TMPDIR:-/tmp}/pbx-ssh-mux.XXXXXX")"
+    SSH_MUX_OWNER="true"
+  fi
+  chmod 700 "$SSH_MUX_DIR"
+
+  SSH_MUX_OPTS=()
+  if [[ "$SSH_MUX_ENABLED" == "true" ]]; then
+    # %C hashes user/host/port so the socket path stays under the unix socket limit.
+    SSH_MUX_OPTS=(-o ControlMaster=auto -o "ControlPath=${SSH_MUX_DIR}/%C" -o "ControlPersist=${SSH_MUX_PERSIST}")
+  fi
+}
+
+# ssh_mux_prepare USER HOST PORT
+#   Ensures a master connection exists for the destination and records counters.
+ssh_mux_prepare() {
+  local user="$1"
+  local host="$2"
+  local port="$3"
+  local dest="${user}@${host}:${port}"
+
+  [[ -n "$SSH_MUX_DIR" ]] || return 0
+  echo "$dest" >> "${SSH_MUX_DIR}/sessions.log"
+
+  if [[ "$SSH_MUX_ENABLED" != "true" ]]; then
+    echo "$dest" >> "${SSH_MUX_DIR}/handshakes.log"
+    return 0
+  fi
+
+  if ssh "${SSH_MUX_OPTS[@]}" -O check -p "$port" "${user}@${host}" >/dev/null 2>&1; then
+    return 0
+  fi
+
+  # Parallel callers reaching a new host at once start one master between
+  # them; a lock older than 30s is taken to be left by a killed process.
+  local lock="${SSH_MUX_DIR}/.lock-${dest//[^A-Za-z0-9@.:_-]/_}"
+  local tries=0 mtime
+  until mkdir "$lock" 2>/dev/null; do
+    tries=$((tries + 1))
+    if (( tries % 20 == 0 )); then
+      mtime="$(ssh_mux_mtime "$lock")"
+      if [[ -n "$mtime" ]] && (( $(date +%s) - mtime > 30 )); then
+        rmdir "$lock" 2>/dev/null || true
+      fi
+    fi
+    sleep 0.05
+  done
+  if ssh "${SSH_MUX_OPTS[@]}" -O check -p "$port" "${user}@${host}" >/dev/null 2>&1; then
+    rmdir "$lock" 2>/dev/null || true
+    return 0
+  fi
+
+  echo "$dest" >> "${SSH_MUX_DIR}/handshakes.log"
+  local started rc=0
+  started="$(ssh_mux_clock)"
+  # Start the master explicitly with -fN and detached stdio so command
+  # substitutions in callers never wait on the persisted master's descriptors.
+  ssh "${SSH_MUX_BASE_OPTS[@]}" -o ControlMaster=yes -o "ControlPath=${SSH_MUX_DIR}/%C" \
+    -o "ControlPersist=${SSH_MUX_PERSIST}" -fN -p "$port" "${user}@${host}" \
+    </dev/null >/dev/null 2>&1 || rc=$?
+  # Not fatal if a waiter already broke a lock we held for over 30s.
+  rmdir "$lock" 2>/dev/null || true
+  ssh_mux_trace ssh_handshake "$dest" "$started" "$rc"
+}
+
+# ssh_mux_mtime PATH prints the modification time in epoch seconds (GNU or
+# BSD stat), or nothing if PATH is gone.
+ssh_mux_mtime() {
+  stat -c %Y "$1" 2>/dev/null || stat -f %m "$1" 2>/dev/null || true
+}
+
+ssh_mux_tracing() {
+  declare -F trace_enabled >/dev/null && trace_enabled
+}
+
+ssh_mux_clock() {
+  if ssh_mux_tracing; then now_ms; else echo 0; fi
+}
+
+# ssh_mux_trace SPAN DEST START_MS RC
+ssh_mux_trace() {
+  ssh_mux_tracing || return 0
+  local status="ok"
+  (( $4 == 0 )) || status="error"
+  trace_span "$1" "$3" "$(now_ms)" "$status" host="$2" rc="$4" ${TRACE_OP:+op="$TRACE_OP"}
+}
+
+# mux_ssh USER HOST PORT CMD
+mux_ssh() {
+  local user="$1"
+  local host="$2"
+  local port="$3"
+  local cmd="$4"
+  local started rc=0
+  ssh_mux_prepare "$user" "$host" "$port"
+  started="$(ssh_mux_clock)"
+  ssh "${SSH_MUX_BASE_OPTS[@]}" "${SSH_MUX_OPTS[@]}" -p "$port" "${user}@${host}" "$cmd" || rc=$?
+  ssh_mux_trace ssh "${user}@${host}:${port}" "$started" "$rc"
+  return "$rc"
+}
+
+# mux_scp USER HOST PORT LOCAL_FILE REMOTE_PATH
+mux_scp() {
+  local user="$1"
+  local host="$2"
+  local port="$3"
+  local src="$4"
+  local dest="$5"
+  local started rc=0
+  ssh_mux_prepare "$user" "$host" "$port"
+  started="$(ssh_mux_clock)"
+  scp "${SSH_MUX_BASE_OPTS[@]}" "${SSH_MUX_OPTS[@]}" -P "$port" "$src" "${user}@${host}:${dest}" || rc=$?
+  ssh_mux_trace scp "${user}@${host}:${port}" "$started" "$rc"
+  return "$rc"
+}
+
+ssh_mux_count() {
+  local file="${SSH_MUX_DIR}/$1"
+  if [[ -f "$file" ]]; then
+    wc -l < "$file" | tr -d ' '
+  else
+    echo 0
+  fi
+}
+
+ssh_mux_report() {
+  local state="on"
+  [[ "$SSH_MUX_ENABLED" == "true" ]] || state="off"
+  echo "SSH sessions: $(ssh_mux_count sessions.log), handshakes: $(ssh_mux_count handshakes.log) (multiplexing ${state})"
+}
+
+# ssh_mux_teardown closes every master in the control directory and removes
+# it. Scripts that were handed a shared directory leave it to its owner.
+ssh_mux_teardown() {
+  [[ "$SSH_MUX_OWNER" == "true" && -n "$SSH_MUX_DIR" && -d "$SSH_MUX_DIR" ]] || return 0
+  local sock
+  for sock in "$SSH_MUX_DIR"/*; do
+    [[ -S "$sock" ]] || continue
+    ssh -o "ControlPath=${sock}" -O exit mux-teardown >/dev/null 2>&1 || true
+  done
+  rm -rf "$SSH_MUX_DIR"
+}
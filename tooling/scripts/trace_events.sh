@@ -0,0 +1,90 @@
+#!/usr/bin/env bash
+# Structured run trace helpers.
+#
+# Source this file; do not execute it. Spans are appended as JSON lines to one
+# trace file per run (trace.jsonl in the orchestrator's run directory). Child
+# scripts receive the file via --trace-file and append to the same file; each
+# span is a single short write, so parallel writers do not interleave.
+#
+# Every line carries run_id, source (script name), span, phase, start_ms,
+# end_ms, duration_ms, status, and pid, plus span-specific key=value attributes
+# (numbers stay numbers). trace_report.py summarises traces and exports
+# Prometheus textfile metrics.
+
+TRACE_FILE=""
+TRACE_SOURCE=""
+TRACE_RUN_ID=""
+# Set by the run owner and exported so child scripts' spans carry the phase.
+TRACE_PHASE="${TRACE_PHASE:-}"
+
+# now_ms prints wall-clock milliseconds without forking when bash provides
+# EPOCHREALTIME (bash 5+); older shells ask python3 (date +%N is not
+# portable).
+now_ms() {
+  if [[ -n "${EPOCHREALTIME:-}" ]]; then
+    local us="${EPOCHREALTIME/[.,]/}"
+    echo $(( us / 1000 ))
+  else
+    python3 -c 'import time; print(int(time.time() * 1000))'
+  fi
+}
+
+# trace_init FILE SOURCE
+#   FILE empty => tracing disabled. The run id is the run directory name
+#   without its "run-" prefix, so child scripts need only the file path.
+trace_init() {
+  TRACE_FILE="$1"
+  TRACE_SOURCE="$2"
+  [[ -n "$TRACE_FILE" ]] || return 0
+  local run_dir
+  run_dir="$(basename "$(dirname "$TRACE_FILE")")"
+  TRACE_RUN_ID="${run_dir#run-}"
+}
+
+trace_enabled() {
+  [[ -n "$TRACE_FILE" ]]
+}
+
+# trace_quote VAR VALUE stores VALUE as a JSON string literal in VAR.
+trace_quote() {
+  local s="$2"
+  s="${s//\\/\\\\}"
+  s="${s//\"/\\\"}"
+  s="${s//$'\n'/\\n}"
+  s="${s//$'\r'/\\r}"
+  s="${s//$'\t'/\\t}"
+  printf -v "$1" '"%s"' "$s"
+}
+
+# trace_span NAME START_MS END_MS STATUS [key=value ...]
+trace_span() {
+  trace_enabled || return 0
+  local name="$1"
+  local start="$2"
+  local end="$3"
+  local status="$4"
+  shift 4
+  local q_run q_source q_name q_phase q_status q_val key val
+  trace_quote q_run "$TRACE_RUN_ID"
+  trace_quote q_source "$TRACE_SOURCE"
+  trace_quote q_name "$name"
+  trace_quote q_phase "$TRACE_PHASE"
+  trace_quote q_status "$status"
+  local line="{\"run_id\":${q_run},\"source\":${q_source},\"span\":${q_name},\"phase\":${q_phase},\"start_ms\":${start},\"end_ms\":${end},\"duration_ms\":$((end - start)),\"status\":${q_status},\"pid\":$$"
+  for kv in "$@"; do
+    key="${kv%%=*}"
+    val="${kv#*=}"
+    if [[ "$val" =~ ^-?[0-9]+(\.[0-9]+)?$ ]]; then
+      line+=",\"${key}\":${val}"
+    else
+      trace_quote q_val "$val"
+      line+=",\"${key}\":${q_val}"
+    fi
+  done
+  printf '%s}\n' "$line" >> "$TRACE_FILE"
+}
+
+# trace_status RC prints ok for 0 and error otherwise.
+trace_status() {
+  if (( $1 == 0 )); then echo ok; else echo error; fi
+}
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Summaries and metrics from orchestration run traces.
+
+Every orchestrator run writes ``trace.jsonl`` into its run directory: one JSON
+span per phase and per sub-step (ssh, scp, ssh_handshake, reload, drain_poll,
+snapshot, rollback) plus a final ``run`` span (see trace_events.sh).
+
+``summary`` aggregates any number of traces (files or directories searched for
+``trace.jsonl``) by span, phase, and host (or by any --group-by fields), so a
+slow host or phase stands out across hundreds of runs:
+
+    trace_report.py summary ./artifacts/orchestration
+    trace_report.py summary ./artifacts/orchestration --group-by span,host --failed-only
+
+``metrics`` renders one trace as Prometheus text exposition (node_exporter
+textfile collector) or OpenMetrics; the orchestrator calls it for
+``--metrics-file``. Only the last run in the trace is exported (a --resume
+run appends to the same file). Files are written via a temp file and
+rename, so the collector never reads a partial file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from report_utils import percentile, print_table
+
+METRIC_PREFIX = "pbx_migration"
+STEP_SPANS = ["ssh", "scp", "ssh_handshake", "reload", "drain_poll", "snapshot", "rollback"]
+
+
+def trace_files(paths: list[str]) -> list[Path]:
+    found: list[Path] = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            found.extend(sorted(path.rglob("trace.jsonl")))
+        elif path.is_file():
+            found.append(path)
+        else:
+            raise ValueError(f"Trace path not found: {path}")
+    return found
+
+
+def read_spans(path: Path) -> list[dict[str, Any]]:
+    spans = []
+    with path.open(encoding="utf-8") as fh:
+        for lineno, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves at most one truncated line.
+                print(f"WARNING: skipping malformed span {path}:{lineno}", file=sys.stderr)
+    return spans
+
+
+def summarize(spans: list[dict[str, Any]], group_by: list[str]) -> list[dict[str, Any]]:
+    groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+    for span in spans:
+        key = tuple(str(span.get(field, "") or "-") for field in group_by)
+        groups.setdefault(key, []).append(span)
+    rows = []
+    for key, members in groups.items():
+        durations = [float(s.get("duration_ms", 0)) for s in members]
+        rows.append(
+            {
+                "key": key,
+                "count": len(members),
+                "failed": sum(1 for s in members if s.get("status") not in ("ok", "dry-run")),
+                "runs": len({s.get("run_id") for s in members}),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "max": max(durations),
+                "total": sum(durations),
+            }
+        )
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    return rows
+
+
+def label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labels(**pairs: Any) -> str:
+    body = ",".join(f'{k}="{label_value(v)}"' for k, v in pairs.items() if v not in (None, ""))
+    return "{" + body + "}" if body else ""
+
+
+def render_metrics(spans: list[dict[str, Any]], openmetrics: bool = False) -> str:
+    run = next((s for s in reversed(spans) if s.get("span") == "run"), None)
+    if run is None:
+        raise ValueError("trace has no run span (run still in progress or killed)")
+    # A --resume run appends to the same trace; export only the last run's
+    # spans, or earlier segments would repeat every series.
+    spans = [s for s in spans if s.get("start_ms", 0) >= run["start_ms"]]
+    base = {"mode": run.get("mode"), "kamailio": run.get("kamailio")}
+    out: list[str] = []
+
+    def family(name: str, kind: str, help_text: str, samples: list[tuple[dict[str, Any], float]]) -> None:
+        if not samples:
+            return
+        out.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        out.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        for extra, value in samples:
+            out.append(f"{METRIC_PREFIX}_{name}{labels(**base, **extra)} {value:g}")
+
+    family("run_start_timestamp_seconds", "gauge", "Start time of the orchestration run.", [({}, run["start_ms"] / 1000.0)])
+    family("run_duration_seconds", "gauge", "Wall time of the orchestration run.", [({}, run["duration_ms"] / 1000.0)])
+    family("run_success", "gauge", "1 if the run completed (or dry-ran) without error.", [({}, 1.0 if run.get("status") in ("ok", "dry-run") else 0.0)])
+    family(
+        "ssh_sessions",
+        "gauge",
+        "SSH/SCP invocations in the run.",
+        [({}, float(run.get("ssh_sessions", 0)))],
+    )
+    family(
+        "ssh_handshakes",
+        "gauge",
+        "New SSH connections (TCP + key exchange) in the run.",
+        [({}, float(run.get("ssh_handshakes", 0)))],
+    )
+    phases: dict[tuple[str, str], float] = {}
+    for span in spans:
+        if span.get("span") == "phase":
+            key = (span.get("phase", ""), span.get("status", ""))
+            phases[key] = phases.get(key, 0.0) + span["duration_ms"] / 1000.0
+    family(
+        "phase_duration_seconds",
+        "gauge",
+        "Wall time per orchestration phase.",
+        [({"phase": phase, "status": status}, value) for (phase, status), value in phases.items()],
+    )
+
+    steps: dict[tuple[str, str, str], list[dict[str, Any]]] = {}
+    for span in spans:
+        if span.get("span") in STEP_SPANS:
+            steps.setdefault((span["span"], span.get("phase", ""), span.get("host", "")), []).append(span)
+    keyed = sorted(steps.items())
+    step_labels = [({"step": k[0], "phase": k[1], "host": k[2]}, members) for k, members in keyed]
+    family("steps", "gauge", "Sub-steps per kind, phase, and host.", [(lbl, float(len(m))) for lbl, m in step_labels])
+    family(
+        "step_failures",
+        "gauge",
+        "Failed sub-steps per kind, phase, and host.",
+        [(lbl, float(sum(1 for s in m if s.get("status") != "ok"))) for lbl, m in step_labels],
+    )
+    family(
+        "step_time_seconds",
+        "gauge",
+        "Total sub-step wall time per kind, phase, and host.",
+        [(lbl, sum(s["duration_ms"] for s in m) / 1000.0) for lbl, m in step_labels],
+    )
+    family(
+        "step_slowest_seconds",
+        "gauge",
+        "Slowest sub-step per kind, phase, and host.",
+        [(lbl, max(s["duration_ms"] for s in m) / 1000.0) for lbl, m in step_labels],
+    )
+    if openmetrics:
+        out.append("# EOF")
+    return "\n".join(out) + "\n"
+
+
+def write_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def cmd_summary(args: argparse.Namespace) -> int:
+    files = trace_files(args.paths)
+    if not files:
+        raise ValueError("no trace.jsonl files found")
+    group_by = [f.strip() for f in args.group_by.split(",") if f.strip()]
+    spans = []
+    for path in files:
+        for span in read_spans(path):
+            if args.span and span.get("span") not in args.span:
+                continue
+            if args.failed_only and span.get("status") in ("ok", "dry-run"):
+                continue
+            spans.append(span)
+    if not spans:
+        print(f"No matching spans in {len(files)} trace file(s).")
+        return 0
+
+    rows = summarize(spans, group_by)[: args.top or None]
+    print(f"Spans from {len(files)} trace file(s), slowest total first (ms)")
+    print_table(
+        [*group_by, "N", "runs", "failed", "p50", "p95", "max", "total"],
+        [
+            [*row["key"], row["count"], row["runs"], row["failed"], f"{row['p50']:.0f}", f"{row['p95']:.0f}", f"{row['max']:.0f}", f"{row['total']:.0f}"]
+            for row in rows
+        ],
+    )
+    return 0
+
+
+def cmd_metrics(args: argparse.Namespace) -> int:
+    text = render_metrics(read_spans(Path(args.trace)), openmetrics=args.format == "openmetrics")
+    if args.output:
+        write_atomic(Path(args.output), text)
+        print(f"Metrics written: {args.output}")
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Summarize orchestration traces and export run metrics.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    summary = sub.add_parser("summary", help="Aggregate spans across one or more traces.")
+    summary.add_argument("paths", nargs="+", help="trace.jsonl files or directories to search.")
+    summary.add_argument("--group-by", default="span,phase,host", help="Comma-separated span fields. Default: span,phase,host")
+    summary.add_argument("--span", action="append", default=[], help="Only this span kind (repeatable), e.g. ssh or drain_poll.")
+    summary.add_argument("--failed-only", action="store_true", help="Only spans whose status is not ok.")
+    summary.add_argument("--top", type=int, default=0, help="Show only the N slowest groups.")
+
+    metrics = sub.add_parser("metrics", help="Render one trace as Prometheus/OpenMetrics text.")
+    metrics.add_argument("trace", help="trace.jsonl of one run.")
+    metrics.add_argument("--format", choices=["prometheus", "openmetrics"], default="prometheus")
+    metrics.add_argument("--output", help="Write atomically to this file instead of stdout (e.g. a textfile collector .prom).")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        if args.command == "summary":
+            return cmd_summary(args)
+        return cmd_metrics(args)
+    except (ValueError, OSError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,14 +4,38 @@ set -euo pipefail
 usage() {
   cat <<'USAGE'
 Usage:
-  wait_for_channel_drain.sh [--host HOST] [--ssh-user USER] [--ssh-port PORT] [--ssh-key PATH] [--threshold N] [--interval SEC] [--timeout SEC]
+  wait_for_channel_drain.sh [--host HOST] [--ssh-user USER] [--ssh-port PORT] [--ssh-key PATH] [--ssh-control-dir DIR] [--no-ssh-mux] [--trace-file FILE] [--threshold N] [--interval SEC] [--timeout SEC]
+                            [--method auto|esl|poll] [--esl-port PORT] [--esl-password PASS]
+                            [--min-interval SEC] [--max-interval SEC] [--history N] [--no-fail-fast]
 
 Description:
-  Polls FreeSWITCH channel count until it falls to threshold (default: 0).
+  Waits until FreeSWITCH channel count falls to threshold (default: 0).
+
+  Methods:
+    esl   One long-lived event socket subscription (CHANNEL_CREATE/CHANNEL_DESTROY)
+          via esl_channel_watch.py, run on the PBX over a single SSH session.
+          Returns as soon as the count reaches threshold.
+    poll  Runs fs_cli -x 'show channels count' starting at --interval seconds.
+          Keeps a rolling history of the last --history counts, fits an
+          exponential decay rate, and prints a projected completion time.
+          The next poll is scheduled at ~1/5 of the projected remaining time,
+          clamped to [--min-interval, --max-interval], so polling tightens as
+          the count nears threshold and relaxes while it is high and flat.
+          Fails early when the projection cannot reach threshold before
+          --timeout, or when the count is still flat or rising after half of
+          --timeout (disable with --no-fail-fast).
+    auto  esl, falling back to poll if the event socket is unavailable (default).
+
+  The event socket password defaults to $ESL_PASSWORD (or ClueCon). It is sent
+  to the PBX on the SSH session's stdin, never on a command line.
+
+  With --trace-file, the ESL watch session and every poll (with its channel
+  count and projection) are appended as spans to the run's JSON-lines trace.
 
 Examples:
   wait_for_channel_drain.sh --threshold 0 --interval 15 --timeout 14400
   wait_for_channel_drain.sh --host 10.10.10.20 --ssh-user root --ssh-port 2222 --ssh-key ~/.ssh/id_ed25519 --threshold 0
+  wait_for_channel_drain.sh --host 10.10.10.20 --method poll --interval 5
 USAGE
 }
 
@@ -19,9 +43,19 @@ HOST=""
 SSH_USER="root"
 SSH_PORT="22"
 SSH_KEY=""
+SSH_CONTROL_DIR=""
+SSH_MUX="true"
+TRACE_FILE_ARG=""
 THRESHOLD=0
 INTERVAL=15
 TIMEOUT=14400
+METHOD="auto"
+ESL_PORT="8021"
+ESL_PASSWORD="${ESL_PASSWORD:-ClueCon}"
+MIN_INTERVAL=""
+MAX_INTERVAL=""
+HISTORY=20
+FAIL_FAST="true"
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -29,22 +63,68 @@ while [[ $# -gt 0 ]]; do
     --ssh-user) SSH_USER="${2:-}"; shift 2 ;;
     --ssh-port) SSH_PORT="${2:-}"; shift 2 ;;
     --ssh-key) SSH_KEY="${2:-}"; shift 2 ;;
+    --ssh-control-dir) SSH_CONTROL_DIR="${2:-}"; shift 2 ;;
+    --no-ssh-mux) SSH_MUX="false"; shift ;;
+    --trace-file) TRACE_FILE_ARG="${2:-}"; shift 2 ;;
     --threshold) THRESHOLD="${2:-}"; shift 2 ;;
     --interval) INTERVAL="${2:-}"; shift 2 ;;
     --timeout) TIMEOUT="${2:-}"; shift 2 ;;
+    --method) METHOD="${2:-}"; shift 2 ;;
+    --esl-port) ESL_PORT="${2:-}"; shift 2 ;;
+    --esl-password) ESL_PASSWORD="${2:-}"; shift 2 ;;
+    --min-interval) MIN_INTERVAL="${2:-}"; shift 2 ;;
+    --max-interval) MAX_INTERVAL="${2:-}"; shift 2 ;;
+    --history) HISTORY="${2:-}"; shift 2 ;;
+    --no-fail-fast) FAIL_FAST="false"; shift ;;
     --help|-h) usage; exit 0 ;;
     *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
   esac
 done
 
+if [[ "$METHOD" != "auto" && "$METHOD" != "esl" && "$METHOD" != "poll" ]]; then
+  echo "--method must be one of: auto, esl, poll" >&2
+  exit 1
+fi
+
+for value in "$THRESHOLD" "$INTERVAL" "$TIMEOUT" "$HISTORY" ${MIN_INTERVAL:+"$MIN_INTERVAL"} ${MAX_INTERVAL:+"$MAX_INTERVAL"}; do
+  if [[ ! "$value" =~ ^[0-9]+$ ]]; then
+    echo "Numeric options must be non-negative integers (got: ${value})" >&2
+    exit 1
+  fi
+done
+if [[ -z "$MIN_INTERVAL" ]]; then
+  MIN_INTERVAL=$(( INTERVAL < 2 ? INTERVAL : 2 ))
+fi
+if [[ -z "$MAX_INTERVAL" ]]; then
+  MAX_INTERVAL=$(( INTERVAL * 4 ))
+fi
+if (( MIN_INTERVAL < 1 )); then MIN_INTERVAL=1; fi
+if (( MAX_INTERVAL < MIN_INTERVAL )); then MAX_INTERVAL="$MIN_INTERVAL"; fi
+if (( HISTORY < 3 )); then HISTORY=3; fi
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+ESL_WATCH_SCRIPT="${SCRIPT_DIR}/esl_channel_watch.py"
+
+# shellcheck source=ssh_mux.sh
+source "${SCRIPT_DIR}/ssh_mux.sh"
+# shellcheck source=trace_events.sh
+source "${SCRIPT_DIR}/trace_events.sh"
+
+trace_init "$TRACE_FILE_ARG" wait_for_channel_drain
+
+if [[ -n "$HOST" ]]; then
+  ssh_opts=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new)
+  if [[ -n "$SSH_KEY" ]]; then
+    ssh_opts+=(-i "$SSH_KEY")
+  fi
+  ssh_mux_init "$SSH_CONTROL_DIR" "$SSH_MUX" "${ssh_opts[@]}"
+  trap ssh_mux_teardown EXIT
+fi
+
 run_cmd() {
   local cmd="$1"
   if [[ -n "$HOST" ]]; then
-    local ssh_args=(-o BatchMode=yes -o StrictHostKeyChecking=accept-new -p "$SSH_PORT")
-    if [[ -n "$SSH_KEY" ]]; then
-      ssh_args+=(-i "$SSH_KEY")
-    fi
-    ssh "${ssh_args[@]}" "${SSH_USER}@${HOST}" "$cmd"
+    mux_ssh "$SSH_USER" "$HOST" "$SSH_PORT" "$cmd"
   else
     bash -lc "$cmd"
   fi
@@ -52,7 +132,7 @@ run_cmd() {
 
 channel_count() {
   local out
-  out="$(run_cmd "fs_cli -x 'show channels count'" 2>/dev/null || true)"
+  out="$(TRACE_OP=channel_count run_cmd "fs_cli -x 'show channels count'" 2>/dev/null || true)"
   local n
   n="$(echo "$out" | grep -Eo '[0-9]+' | head -n 1 || true)"
   if [[ -z "$n" ]]; then
@@ -62,9 +142,72 @@ channel_count() {
   fi
 }
 
+# esl_watch TIMEOUT streams esl_channel_watch.py to the PBX (or runs it locally
+# without --host). Exit codes: 0 drained, 3 timeout, anything else = ESL
+# unusable (1 is also what python3 returns when it cannot run the script).
+# The password travels as the first stdin line, read by the remote shell into
+# ESL_PASSWORD before python3 reads the script from the rest of stdin.
+esl_watch() {
+  local timeout="$1"
+  local args=(--threshold "$THRESHOLD" --timeout "$timeout" --esl-port "$ESL_PORT")
+  if [[ -n "$HOST" ]]; then
+    { printf '%s\n' "$ESL_PASSWORD"; cat "$ESL_WATCH_SCRIPT"; } \
+      | TRACE_OP=esl_watch mux_ssh "$SSH_USER" "$HOST" "$SSH_PORT" \
+        "IFS= read -r ESL_PASSWORD && export ESL_PASSWORD && exec python3 - $(printf '%q ' "${args[@]}")"
+  else
+    ESL_PASSWORD="$ESL_PASSWORD" python3 "$ESL_WATCH_SCRIPT" "${args[@]}"
+  fi
+}
+
 start_ts=$(date +%s)
 
-echo "Waiting for channels <= ${THRESHOLD} (interval=${INTERVAL}s timeout=${TIMEOUT}s)"
+if [[ "$METHOD" != "poll" ]]; then
+  esl_rc=0
+  esl_watch "$TIMEOUT" || esl_rc=$?
+  case "$esl_rc" in
+    0) exit 0 ;;
+    3) exit 1 ;;
+  esac
+  if [[ "$METHOD" == "esl" ]]; then
+    echo "ESL drain watch failed (exit ${esl_rc})" >&2
+    exit 1
+  fi
+  echo "ESL drain watch unavailable (exit ${esl_rc}); falling back to polling." >&2
+fi
+
+# drain_forecast prints "<rate> <eta_seconds> <next_interval>" from the rolling
+# history (one "elapsed count" pair per line on stdin). It fits
+# ln(count + 1) = a - rate * t by least squares; eta is the time for the fitted
+# curve to fall from the latest count to threshold, or -1 when the count is not
+# decaying or there are too few samples.
+drain_forecast() {
+  awk -v thr="$THRESHOLD" -v base="$INTERVAL" -v lo="$MIN_INTERVAL" -v hi="$MAX_INTERVAL" '
+    { t[NR] = $1; c[NR] = $2; y = log($2 + 1); sx += $1; sy += y; sxx += $1 * $1; sxy += $1 * y }
+    END {
+      n = NR; rate = 0; eta = -1
+      if (n >= 3) {
+        den = n * sxx - sx * sx
+        if (den > 0) rate = -(n * sxy - sx * sy) / den
+      }
+      last = c[n]
+      if (rate > 0) eta = log((last + 1) / (thr + 1)) / rate
+      if (eta < 0 && rate > 0) eta = 0
+
+      if (last - thr <= 2) next_iv = lo
+      else if (eta >= 0) next_iv = eta / 5
+      else if (n >= 3) next_iv = hi
+      else next_iv = base
+      if (next_iv < lo) next_iv = lo
+      if (next_iv > hi) next_iv = hi
+      printf "%.6f %d %d\n", rate, (eta < 0 ? -1 : int(eta + 0.5)), int(next_iv + 0.5)
+    }'
+}
+
+echo "Waiting for channels <= ${THRESHOLD} (interval=${INTERVAL}s adaptive ${MIN_INTERVAL}-${MAX_INTERVAL}s timeout=${TIMEOUT}s)"
+
+hist_t=()
+hist_c=()
+next_interval="$INTERVAL"
 
 while true; do
   now_ts=$(date +%s)
@@ -75,18 +218,56 @@ while true; do
     exit 1
   fi
 
+  poll_start_ms="$(now_ms)"
   current="$(channel_count)"
   stamp="$(date +'%Y-%m-%d %H:%M:%S')"
 
   if [[ "$current" == "-1" ]]; then
     echo "${stamp} channels=unknown (fs_cli parse failed), retrying..."
+    next_interval="$INTERVAL"
+    trace_span drain_poll "$poll_start_ms" "$(now_ms)" error channels=-1 next_poll="$next_interval"
   else
-    echo "${stamp} channels=${current}"
     if (( current <= THRESHOLD )); then
+      echo "${stamp} channels=${current}"
+      trace_span drain_poll "$poll_start_ms" "$(now_ms)" ok channels="$current" drained=1
       echo "Drain complete: channels=${current} <= threshold=${THRESHOLD}"
       exit 0
     fi
+
+    hist_t+=("$elapsed")
+    hist_c+=("$current")
+    if (( ${#hist_t[@]} > HISTORY )); then
+      hist_t=("${hist_t[@]:1}")
+      hist_c=("${hist_c[@]:1}")
+    fi
+
+    read -r rate eta next_interval < <(
+      for i in "${!hist_t[@]}"; do
+        echo "${hist_t[$i]} ${hist_c[$i]}"
+      done | drain_forecast
+    )
+    trace_span drain_poll "$poll_start_ms" "$(now_ms)" ok channels="$current" rate="$rate" eta_s="$eta" next_poll="$next_interval"
+
+    if (( eta >= 0 )); then
+      eta_at="$(date -d "@$((now_ts + eta))" +'%H:%M:%S' 2>/dev/null || date -r "$((now_ts + eta))" +'%H:%M:%S')"
+      echo "${stamp} channels=${current} rate=${rate}/s eta=${eta_at} (~${eta}s) next_poll=${next_interval}s"
+      if [[ "$FAIL_FAST" == "true" ]] && (( ${#hist_t[@]} >= HISTORY / 2 && ${#hist_t[@]} >= 3 )) \
+        && (( (elapsed + eta) * 4 > TIMEOUT * 5 )); then
+        echo "Projected drain completion in ~${eta}s exceeds remaining timeout ($((TIMEOUT - elapsed))s) by more than 25%; failing early" >&2
+        exit 1
+      fi
+    elif (( ${#hist_t[@]} < 3 )); then
+      echo "${stamp} channels=${current} eta=unknown (collecting samples) next_poll=${next_interval}s"
+    else
+      echo "${stamp} channels=${current} eta=unknown (count not decaying) next_poll=${next_interval}s"
+      # A flat or rising count has no projection at all; once half the
+      # timeout is gone with half a history of such samples, it will not make it.
+      if [[ "$FAIL_FAST" == "true" ]] && (( ${#hist_t[@]} >= HISTORY / 2 )) && (( elapsed * 2 > TIMEOUT )); then
+        echo "Channel count not decaying after ${elapsed}s (over half of the ${TIMEOUT}s timeout); failing early" >&2
+        exit 1
+      fi
+    fi
   fi
 
-  sleep "$INTERVAL"
+  sleep "$next_interval"
 done